@@ -0,0 +1,705 @@
+#!/usr/bin/env python
+"""
+Load test of the tag2domain API.
+
+Creates a synthetic benchmark database (see benchmarks.datagen), starts
+tag2domain_api.app.main:app with uvicorn against it and replays a weighted
+mix of requests at increasing concurrency. For every concurrency level the
+throughput, latency percentiles and error rates are reported per endpoint.
+
+Usage:
+    python -m benchmarks.api <config file> --domains 100000 \\
+        --concurrency 1,4,16,64 --duration 30 --output api.json
+
+    # compare with the results of an earlier release
+    python -m benchmarks.api <config file> --domains 100000 \\
+        --concurrency 1,4,16,64 --duration 30 --baseline api.json
+"""
+from __future__ import print_function
+import os
+import sys
+import json
+import time
+import socket
+import random
+import logging
+import argparse
+import binascii
+import datetime
+import tempfile
+import threading
+import contextlib
+import subprocess
+import http.client
+import configparser
+import urllib.parse
+from collections import OrderedDict, defaultdict
+
+from py_tag2domain.util import parse_config
+
+from benchmarks.datagen import (
+    REPO_DIR,
+    TAG_TYPE,
+    INTXN_TABLE_MAPPING,
+    DEFAULT_TAXONOMY_SHAPE,
+    TaxonomyShape,
+    MeasurementGenerator,
+    create_benchmark_db,
+    create_benchmark_glue,
+    seed_domain_filter,
+    drop_benchmark_db,
+    taxonomy_name,
+    tag_name
+)
+from benchmarks.ingest import (
+    LAYOUT_ENV_VARS,
+    git_revision,
+    server_version,
+    percentiles
+)
+
+RESULT_FORMAT_VERSION = 1
+
+N_FILTER_VALUES = 10
+
+# relative frequency of the requests in the default mix
+DEFAULT_MIX = OrderedDict([
+    ("bydomain", 40),
+    ("bydomain_history", 5),
+    ("domains_bytaxonomy", 20),
+    ("stats_taxonomies", 5),
+    ("stats_categories", 5),
+    ("stats_tags", 5),
+    ("stats_values", 5),
+    ("filters_types", 2),
+    ("filters_values", 3),
+    ("msm2tag", 10)
+])
+
+# environment variables of the API that change its behaviour
+API_ENV_VARS = [
+    "RESULT_CACHE_MAX_ENTRIES",
+    "RESULT_CACHE_TTL",
+    "STATS_OPEN_TAG_COUNTS_TAG_TYPE",
+    "MSM2TAG_UPDATE_CHANGE_WATERMARK",
+    "MSM2TAG_MAINTAIN_OPEN_TAG_COUNTS"
+]
+
+
+def parse_mix(mix_string):
+    """
+    Parses a request mix of the form "bydomain=40,msm2tag=0". Endpoints that
+    are not listed keep their default weight.
+    """
+    mix = OrderedDict(DEFAULT_MIX)
+    for _item in filter(None, mix_string.split(",")):
+        try:
+            name, weight = _item.split("=")
+            weight = float(weight)
+        except ValueError:
+            raise ValueError("invalid mix entry '%s'" % _item)
+        if name not in mix:
+            raise ValueError(
+                "unknown endpoint '%s', valid endpoints are %s" % (
+                    name, ", ".join(mix.keys())
+                )
+            )
+        if weight < 0:
+            raise ValueError("weights must not be negative")
+        mix[name] = weight
+    if sum(mix.values()) <= 0:
+        raise ValueError("at least one endpoint needs a positive weight")
+    return mix
+
+
+class RequestFactory(object):
+    """
+    Creates the requests of the mix for a database created by
+    create_benchmark_db.
+
+    Parameters
+    ----------
+    n_domains - int
+        number of domains in the benchmark database
+    n_seeded - int
+        number of domains with tags
+    shape - TaxonomyShape
+        shape of the taxonomies in the benchmark database
+    page_size - int
+        limit of the paged /domains/bytaxonomy requests
+    seed - int
+        seed of the generated measurements
+    """
+    def __init__(self, n_domains, n_seeded, shape, page_size=100, seed=0):
+        self.n_domains = n_domains
+        self.n_seeded = max(1, n_seeded)
+        self.shape = shape
+        self.page_size = page_size
+        # number of pages of domains that have a tag in a taxonomy
+        self.n_pages = max(1, self.n_seeded // page_size)
+        self._msm_lock = threading.Lock()
+        self._msm_generator = MeasurementGenerator(
+            self.n_seeded, shape, seed=seed
+        )
+
+    def _domain(self, rng):
+        return "domain-%i.at" % rng.randint(1, self.n_domains)
+
+    def _taxonomy(self, rng):
+        return taxonomy_name(rng.randrange(self.shape.n_taxonomies))
+
+    def _get(self, path, **params):
+        if len(params) > 0:
+            path += "?" + urllib.parse.urlencode(params)
+        return ("GET", "/api/v1" + path, None)
+
+    def make_request(self, endpoint, rng):
+        """
+        Return
+        ------
+        tuple - method, path and body (bytes or None) of the request
+        """
+        if endpoint == "bydomain":
+            return self._get("/bydomain/" + self._domain(rng))
+        elif endpoint == "bydomain_history":
+            return self._get("/bydomain/%s/history" % self._domain(rng))
+        elif endpoint == "domains_bytaxonomy":
+            return self._get(
+                "/domains/bytaxonomy",
+                taxonomy=self._taxonomy(rng),
+                limit=self.page_size,
+                offset=self.page_size * rng.randrange(self.n_pages)
+            )
+        elif endpoint == "stats_taxonomies":
+            return self._get("/stats/taxonomies")
+        elif endpoint == "stats_categories":
+            return self._get(
+                "/stats/categories", taxonomy=self._taxonomy(rng)
+            )
+        elif endpoint == "stats_tags":
+            params = {"taxonomy": self._taxonomy(rng)}
+            if self.shape.n_categories > 0:
+                params["category"] = "cat_%i" % (
+                    rng.randrange(self.shape.n_categories)
+                )
+            return self._get("/stats/tags", **params)
+        elif endpoint == "stats_values":
+            return self._get(
+                "/stats/values",
+                taxonomy=self._taxonomy(rng),
+                tag=tag_name(self.shape, rng.randrange(self.shape.n_tags))
+            )
+        elif endpoint == "filters_types":
+            return self._get("/filters/types")
+        elif endpoint == "filters_values":
+            return self._get("/filters/values", filter="registrar")
+        elif endpoint == "msm2tag":
+            with self._msm_lock:
+                _, msm = self._msm_generator.next_measurement()
+            return (
+                "POST",
+                "/api/v1/msm2tag/",
+                json.dumps(msm).encode("utf-8")
+            )
+        else:
+            raise ValueError("unknown endpoint '%s'" % endpoint)
+
+
+class ApiServer(object):
+    """
+    Runs tag2domain_api.app.main:app with uvicorn in a subprocess.
+    """
+    def __init__(self, bench_config, msm2tag_config_path, workers=1,
+                 logger=logging.getLogger()):
+        self.bench_config = bench_config
+        self.msm2tag_config_path = msm2tag_config_path
+        self.workers = workers
+        self.logger = logger
+        self.host = "127.0.0.1"
+        self.port = None
+        self.proc = None
+
+    def _env(self):
+        env = dict(os.environ)
+        env.update({
+            "DB": self.bench_config["DATABASE"],
+            "DBUSER": self.bench_config["DBUSER"],
+            "DBPASSWORD": self.bench_config["DBPASSWORD"],
+            "DBHOST": self.bench_config["DBHOST"],
+            "DBPORT": str(self.bench_config["DBPORT"]),
+            "DBSSLMODE": self.bench_config["DBSSLMODE"],
+            "DBTAG2DOMAIN_SCHEMA": self.bench_config["DBTAG2DOMAIN_SCHEMA"],
+            "ENABLE_MSM2TAG": "True",
+            "MSM2TAG_DB_CONFIG": self.msm2tag_config_path,
+            "LOG_LEVEL": env.get("LOG_LEVEL", "WARNING")
+        })
+        return env
+
+    def start(self, timeout=30):
+        with contextlib.closing(socket.socket()) as s:
+            s.bind((self.host, 0))
+            self.port = s.getsockname()[1]
+
+        self.logger.info(
+            "starting API on port %i with %i worker(s)" % (
+                self.port, self.workers
+            )
+        )
+        self.proc = subprocess.Popen(
+            [
+                sys.executable, "-m", "uvicorn",
+                "tag2domain_api.app.main:app",
+                "--host", self.host,
+                "--port", str(self.port),
+                "--workers", str(self.workers),
+                "--log-level", "warning",
+                "--no-access-log"
+            ],
+            cwd=REPO_DIR,
+            env=self._env(),
+            # stdout may hold the results
+            stdout=sys.stderr
+        )
+
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.proc.poll() is not None:
+                raise RuntimeError(
+                    "API exited with code %i" % self.proc.returncode
+                )
+            try:
+                conn = http.client.HTTPConnection(
+                    self.host, self.port, timeout=5
+                )
+                conn.request("GET", "/test/self-test")
+                if conn.getresponse().status == 200:
+                    conn.close()
+                    return
+                conn.close()
+            except OSError:
+                pass
+            time.sleep(0.2)
+        self.stop()
+        raise RuntimeError("API did not start within %i s" % timeout)
+
+    def stop(self):
+        if self.proc is None:
+            return
+        self.proc.terminate()
+        try:
+            self.proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+            self.proc.wait()
+        self.proc = None
+
+
+class LoadLevel(object):
+    """
+    Sends requests of the mix from concurrency threads for duration seconds.
+    Every thread uses its own keep-alive connection and sends its next
+    request as soon as the previous one is answered.
+    """
+    def __init__(self, host, port, factory, mix, concurrency, duration,
+                 seed=0, timeout=60):
+        self.host = host
+        self.port = port
+        self.factory = factory
+        self.endpoints = list(mix.keys())
+        self.weights = list(mix.values())
+        self.concurrency = concurrency
+        self.duration = duration
+        self.seed = seed
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.status_codes = defaultdict(lambda: defaultdict(int))
+
+    def _record(self, endpoint, latency, status):
+        with self._lock:
+            self.latencies[endpoint].append(latency)
+            self.status_codes[endpoint][status] += 1
+
+    def _worker(self, worker_idx, deadline):
+        rng = random.Random("%s-%i-%i" % (
+            self.seed, self.concurrency, worker_idx
+        ))
+        conn = http.client.HTTPConnection(
+            self.host, self.port, timeout=self.timeout
+        )
+        try:
+            while time.time() < deadline:
+                endpoint = rng.choices(self.endpoints, self.weights)[0]
+                method, path, body = self.factory.make_request(endpoint, rng)
+                headers = {}
+                if body is not None:
+                    headers["Content-Type"] = "application/json"
+                t_start = time.perf_counter()
+                try:
+                    conn.request(method, path, body=body, headers=headers)
+                    response = conn.getresponse()
+                    response.read()
+                    status = str(response.status)
+                except (OSError, http.client.HTTPException) as e:
+                    status = type(e).__name__
+                    conn.close()
+                self._record(endpoint, time.perf_counter() - t_start, status)
+        finally:
+            conn.close()
+
+    def run(self):
+        deadline = time.time() + self.duration
+        t_start = time.perf_counter()
+        threads = [
+            threading.Thread(target=self._worker, args=(_idx, deadline))
+            for _idx in range(self.concurrency)
+        ]
+        for _thread in threads:
+            _thread.start()
+        for _thread in threads:
+            _thread.join()
+        return self.result(time.perf_counter() - t_start)
+
+    def result(self, elapsed):
+        endpoints = OrderedDict()
+        n_requests = 0
+        n_errors = 0
+        for _endpoint in self.endpoints:
+            latencies = self.latencies.get(_endpoint, [])
+            if len(latencies) == 0:
+                continue
+            status_codes = dict(self.status_codes[_endpoint])
+            errors = sum(
+                _count for _status, _count in status_codes.items()
+                if not _status.startswith("2")
+            )
+            n_requests += len(latencies)
+            n_errors += errors
+            endpoints[_endpoint] = {
+                "requests": len(latencies),
+                "throughput_rps": len(latencies) / elapsed,
+                "errors": errors,
+                "error_rate": errors / float(len(latencies)),
+                "status_codes": status_codes,
+                "latency_ms": percentiles(latencies)
+            }
+        return {
+            "concurrency": self.concurrency,
+            "duration_s": elapsed,
+            "requests": n_requests,
+            "throughput_rps": n_requests / elapsed,
+            "errors": n_errors,
+            "error_rate": n_errors / float(max(1, n_requests)),
+            "latency_ms": percentiles([
+                _latency
+                for _latencies in self.latencies.values()
+                for _latency in _latencies
+            ]),
+            "endpoints": endpoints
+        }
+
+
+def compare_to_baseline(levels, baseline_levels, factor):
+    """
+    Flags endpoints that got slower, lost throughput or fail more often than
+    in the baseline at the same concurrency.
+    """
+    baseline_by_concurrency = {
+        _level["concurrency"]: _level for _level in baseline_levels
+    }
+    regressions = []
+    for _level in levels:
+        baseline = baseline_by_concurrency.get(_level["concurrency"])
+        if baseline is None:
+            continue
+        for _endpoint, _result in _level["endpoints"].items():
+            if _endpoint not in baseline["endpoints"]:
+                continue
+            _base = baseline["endpoints"][_endpoint]
+            _flags = []
+            if _result["latency_ms"]["p95"] > (
+                factor * _base["latency_ms"]["p95"]
+            ):
+                _flags.append("p95 %.1f ms, baseline %.1f ms" % (
+                    _result["latency_ms"]["p95"], _base["latency_ms"]["p95"]
+                ))
+            if _result["throughput_rps"] * factor < _base["throughput_rps"]:
+                _flags.append("%.1f requests/s, baseline %.1f" % (
+                    _result["throughput_rps"], _base["throughput_rps"]
+                ))
+            if _result["error_rate"] > _base["error_rate"]:
+                _flags.append("error rate %.3f, baseline %.3f" % (
+                    _result["error_rate"], _base["error_rate"]
+                ))
+            for _flag in _flags:
+                regressions.append({
+                    "concurrency": _level["concurrency"],
+                    "endpoint": _endpoint,
+                    "detail": _flag
+                })
+    return regressions
+
+
+def write_msm2tag_config(path, bench_config):
+    """
+    Writes the config file read by the msm2tag endpoint of the API.
+    """
+    config = configparser.ConfigParser()
+    config["db"] = {
+        "host": bench_config["DBHOST"],
+        "port": str(bench_config["DBPORT"]),
+        "user": bench_config["DBUSER"],
+        "password": bench_config["DBPASSWORD"],
+        "dbname": bench_config["DATABASE"],
+        "schema": bench_config["DBTAG2DOMAIN_SCHEMA"],
+        "sslmode": bench_config["DBSSLMODE"]
+    }
+    config["db.intxn_table.%s" % TAG_TYPE] = INTXN_TABLE_MAPPING
+    with open(path, "w") as f:
+        config.write(f)
+
+
+def run(args, logger):
+    # parse_config prints to stdout, which may hold the results
+    with contextlib.redirect_stdout(sys.stderr):
+        db_config, _ = parse_config(args.config)
+    if db_config is None:
+        raise ValueError("could not read DB configuration")
+
+    shape = TaxonomyShape(
+        n_taxonomies=args.taxonomies,
+        n_tags=args.tags,
+        n_values=args.values,
+        n_categories=args.categories,
+        tags_per_domain=args.tags_per_domain
+    )
+    mix = parse_mix(args.mix)
+    n_seeded = int(args.domains * args.seeded_fraction)
+
+    db_name = args.db_name
+    if db_name is None:
+        db_name = "tag2domain_benchmark_%s" % (
+            binascii.b2a_hex(os.urandom(6)).decode()
+        )
+
+    logger.info("creating benchmark database %s" % db_name)
+    t_start = time.perf_counter()
+    bench_config = create_benchmark_db(
+        db_config,
+        db_name,
+        args.domains,
+        shape=shape,
+        seeded_fraction=args.seeded_fraction,
+        intervals_per_tag=args.intervals_per_tag,
+        logger=logger
+    )
+    create_benchmark_glue(db_config, db_name, logger=logger)
+    seed_domain_filter(bench_config, N_FILTER_VALUES)
+    setup_duration = time.perf_counter() - t_start
+
+    msm2tag_config = tempfile.NamedTemporaryFile(
+        mode="w", suffix=".cfg", delete=False
+    )
+    msm2tag_config.close()
+    server = None
+    try:
+        write_msm2tag_config(msm2tag_config.name, bench_config)
+        server = ApiServer(
+            bench_config,
+            msm2tag_config.name,
+            workers=args.workers,
+            logger=logger
+        )
+        server.start()
+
+        results = {
+            "benchmark": "api",
+            "format_version": RESULT_FORMAT_VERSION,
+            "started_at": datetime.datetime.utcnow().isoformat(),
+            "git_revision": git_revision(),
+            "postgres_version": server_version(bench_config),
+            "parameters": {
+                "domains": args.domains,
+                "seeded_fraction": args.seeded_fraction,
+                "intervals_per_tag": args.intervals_per_tag,
+                "taxonomy_shape": shape._asdict(),
+                "mix": mix,
+                "page_size": args.page_size,
+                "workers": args.workers,
+                "duration_s": args.duration,
+                "warmup_s": args.warmup,
+                "seed": args.seed,
+                "environment": {
+                    _var: os.environ.get(_var)
+                    for _var in LAYOUT_ENV_VARS + API_ENV_VARS
+                }
+            },
+            "setup_duration_s": setup_duration,
+            "levels": []
+        }
+
+        factory = RequestFactory(
+            args.domains,
+            n_seeded,
+            shape,
+            page_size=args.page_size,
+            seed=args.seed
+        )
+        if args.warmup > 0:
+            logger.info("warming up for %i s" % args.warmup)
+            LoadLevel(
+                server.host, server.port, factory, mix,
+                args.concurrency[0], args.warmup, seed=args.seed
+            ).run()
+
+        for _concurrency in args.concurrency:
+            logger.info("running with concurrency %i" % _concurrency)
+            level = LoadLevel(
+                server.host, server.port, factory, mix,
+                _concurrency, args.duration, seed=args.seed
+            ).run()
+            logger.info(
+                "concurrency %i: %.1f requests/s, p95 %.1f ms, "
+                "error rate %.3f" % (
+                    _concurrency,
+                    level["throughput_rps"],
+                    level["latency_ms"].get("p95", 0.0),
+                    level["error_rate"]
+                )
+            )
+            results["levels"].append(level)
+    finally:
+        if server is not None:
+            server.stop()
+        os.unlink(msm2tag_config.name)
+        if not args.keep_db:
+            logger.info("dropping benchmark database %s" % db_name)
+            drop_benchmark_db(db_config, db_name)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        results["regressions"] = compare_to_baseline(
+            results["levels"], baseline["levels"], args.regression_factor
+        )
+        for _regression in results["regressions"]:
+            logger.warning("concurrency %i, %s: %s" % (
+                _regression["concurrency"],
+                _regression["endpoint"],
+                _regression["detail"]
+            ))
+    return results
+
+
+def _concurrency_levels(value):
+    try:
+        levels = [int(_level) for _level in value.split(",")]
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            "expected a comma separated list of integers"
+        )
+    if len(levels) == 0 or min(levels) < 1:
+        raise argparse.ArgumentTypeError("concurrency must be at least 1")
+    return levels
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="load test of the tag2domain API"
+    )
+    parser.add_argument("config", type=str, help="path of config file")
+    parser.add_argument(
+        "--domains", type=int, default=100000,
+        help="number of domains in the entity table (default: 100000)"
+    )
+    parser.add_argument(
+        "--seeded-fraction", type=float, default=1.0,
+        help="fraction of domains that have tags (default: 1.0)"
+    )
+    parser.add_argument(
+        "--intervals-per-tag", type=int, default=2,
+        help="number of intervals per tag of a domain, all but one are "
+             "closed (default: 2)"
+    )
+    parser.add_argument("--taxonomies", type=int,
+                        default=DEFAULT_TAXONOMY_SHAPE.n_taxonomies)
+    parser.add_argument("--tags", type=int,
+                        default=DEFAULT_TAXONOMY_SHAPE.n_tags,
+                        help="number of tags per taxonomy")
+    parser.add_argument("--values", type=int,
+                        default=DEFAULT_TAXONOMY_SHAPE.n_values,
+                        help="number of values per tag")
+    parser.add_argument("--categories", type=int,
+                        default=DEFAULT_TAXONOMY_SHAPE.n_categories,
+                        help="number of categories per taxonomy")
+    parser.add_argument("--tags-per-domain", type=int,
+                        default=DEFAULT_TAXONOMY_SHAPE.tags_per_domain)
+    parser.add_argument(
+        "--mix", type=str, default="",
+        help="weights of the endpoints, e.g. 'bydomain=80,msm2tag=0'. "
+             "Default: %s" % ",".join(
+                 "%s=%s" % _item for _item in DEFAULT_MIX.items()
+             )
+    )
+    parser.add_argument(
+        "--page-size", type=int, default=100,
+        help="limit of the /domains/bytaxonomy requests (default: 100)"
+    )
+    parser.add_argument(
+        "--concurrency", type=_concurrency_levels, default=[1, 4, 16],
+        help="comma separated list of concurrent clients (default: 1,4,16)"
+    )
+    parser.add_argument(
+        "--duration", type=float, default=30,
+        help="seconds per concurrency level (default: 30)"
+    )
+    parser.add_argument(
+        "--warmup", type=float, default=5,
+        help="seconds of unrecorded requests before the first level "
+             "(default: 5)"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help="number of uvicorn worker processes (default: 1)"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--baseline", type=str, default=None,
+        help="results of an earlier run to compare against"
+    )
+    parser.add_argument(
+        "--regression-factor", type=float, default=1.5,
+        help="flag endpoints whose p95 latency grew or whose throughput "
+             "dropped by this factor (default: 1.5)"
+    )
+    parser.add_argument(
+        "--db-name", type=str, default=None,
+        help="name of the benchmark database (default: random name)"
+    )
+    parser.add_argument(
+        "--keep-db", action="store_true",
+        help="do not drop the benchmark database afterwards"
+    )
+    parser.add_argument(
+        "-o", "--output", type=str, default=None,
+        help="write the results to this file instead of stdout"
+    )
+
+    args = parser.parse_args()
+    try:
+        parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+
+    logging.basicConfig(level=logging.INFO)
+    logger = logging.getLogger("benchmarks.api")
+
+    results = run(args, logger)
+
+    if args.output is None:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        logger.info("results written to %s" % args.output)
@@ -0,0 +1,707 @@
+"""
+Synthetic tag2domain databases and measurement streams for benchmarks.
+
+The database is set up with the same scripts that are used for production
+setups (db/00-tag2domain-db-init and scripts/db/create_intersection_table.sh),
+so the options of these scripts (e.g. TAG2DOMAIN_VALIDITY_RANGE or
+TAG2DOMAIN_PARTITIONED) can be benchmarked by setting them in the environment.
+"""
+import os
+import copy
+import random
+import datetime
+import logging
+import subprocess
+from collections import namedtuple
+
+import psycopg2
+import psycopg2.sql as sql
+import psycopg2.extras
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+from py_tag2domain.db import Psycopg2Adapter
+from py_tag2domain.memory_db import InMemoryAdapter
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TAG_TYPE = "domain"
+ENTITY_TABLE = "domains"
+INTXN_TABLE = "domain_tags"
+PRODUCER = "benchmark"
+
+# tags seeded by create_benchmark_db are started at SEED_TIME, generated
+# measurements start an hour later.
+SEED_TIME = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+
+# length of the closed intervals seeded before SEED_TIME
+DEFAULT_INTERVAL_LENGTH = datetime.timedelta(days=30)
+
+INTXN_TABLE_MAPPING = {
+    "table_name": INTXN_TABLE,
+    "id": "entity_id",
+    "taxonomy_id": "taxonomy_id",
+    "tag_id": "tag_id",
+    "value_id": "value_id",
+    "measured_at": "measured_at",
+    "producer": "producer",
+    "start_date": "start_date",
+    "end_date": "end_date",
+    "start_ts": "start_ts",
+    "end_ts": "end_ts"
+}
+
+# n_taxonomies - number of taxonomies
+# n_tags - number of tags per taxonomy
+# n_values - number of values per tag, 0 for tags without values
+# n_categories - number of categories the tags of a taxonomy are spread
+#   over, 0 for tags without category
+# tags_per_domain - number of tags each domain has per taxonomy
+TaxonomyShape = namedtuple(
+    "TaxonomyShape",
+    ["n_taxonomies", "n_tags", "n_values", "n_categories", "tags_per_domain"]
+)
+
+DEFAULT_TAXONOMY_SHAPE = TaxonomyShape(
+    n_taxonomies=3,
+    n_tags=50,
+    n_values=5,
+    n_categories=5,
+    tags_per_domain=2
+)
+
+
+def taxonomy_name(taxonomy_idx):
+    return "benchmark_%i" % taxonomy_idx
+
+
+def tag_name(shape, tag_idx):
+    if shape.n_categories > 0:
+        return "cat_%i::tag_%i" % (tag_idx % shape.n_categories, tag_idx)
+    else:
+        return "tag_%i" % tag_idx
+
+
+def value_name(value_idx):
+    return "value_%i" % value_idx
+
+
+def check_taxonomy_shape(shape):
+    if shape.n_taxonomies < 1:
+        raise ValueError("n_taxonomies must be at least 1")
+    if shape.tags_per_domain < 1:
+        raise ValueError("tags_per_domain must be at least 1")
+    if shape.n_tags < shape.tags_per_domain:
+        raise ValueError("n_tags must be at least tags_per_domain")
+    if shape.n_values < 0 or shape.n_categories < 0:
+        raise ValueError("n_values and n_categories must not be negative")
+
+
+def base_tags(shape, domain_id, taxonomy_idx):
+    """
+    Returns the tags a domain has in a taxonomy after create_benchmark_db.
+
+    The same assignment is computed in SQL when seeding the database, see
+    _seed_intersections.
+
+    Return
+    ------
+    list of dict - tags in the format of the tags field of a measurement
+    """
+    stride = shape.n_tags // shape.tags_per_domain
+    tags = []
+    for slot in range(shape.tags_per_domain):
+        tag_idx = (domain_id + taxonomy_idx + slot * stride) % shape.n_tags
+        _tag = {"tag": tag_name(shape, tag_idx)}
+        if shape.n_values > 0:
+            _tag["value"] = value_name(
+                (domain_id // shape.n_tags + slot) % shape.n_values
+            )
+        tags.append(_tag)
+    return tags
+
+
+def _script_env(db_config, db_name, extra=None):
+    env = dict(os.environ)
+    env.update({
+        "POSTGRES_USER": db_config["DBUSER"],
+        "POSTGRES_DB": db_name,
+        "POSTGRES_HOST": db_config["DBHOST"],
+        "POSTGRES_PORT": str(db_config["DBPORT"]),
+        "PGPASSWORD": db_config["DBPASSWORD"],
+        "PGSSLMODE": db_config["DBSSLMODE"],
+        "TAG2DOMAIN_SCHEMA": db_config["DBTAG2DOMAIN_SCHEMA"],
+        "TAG2DOMAIN_INTXN_TABLE_NAME": INTXN_TABLE,
+        "TAG2DOMAIN_ENTITY_TABLE": ENTITY_TABLE,
+        "TAG2DOMAIN_ENTITY_ID_COLUMN": "domain_id",
+        "TAG2DOMAIN_ENTITY_NAME_COLUMN": "domain_name",
+        "TAG2DOMAIN_TAG_TYPE": TAG_TYPE
+    })
+    if extra is not None:
+        env.update(extra)
+    return env
+
+
+def _run_script(path, env, logger):
+    logger.info("running %s" % path)
+    proc = subprocess.run(
+        ["bash", os.path.join(REPO_DIR, path)],
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        universal_newlines=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(
+            "script %s failed with exit code %i:\n%s" % (
+                path, proc.returncode, proc.stdout
+            )
+        )
+
+
+def create_benchmark_db(
+    db_config,
+    db_name,
+    n_domains,
+    shape=DEFAULT_TAXONOMY_SHAPE,
+    seeded_fraction=1.0,
+    intervals_per_tag=1,
+    interval_length=DEFAULT_INTERVAL_LENGTH,
+    script_env=None,
+    logger=logging.getLogger()
+):
+    """
+    Creates a new database with the tag2domain schema, a synthetic entity
+    table and taxonomies of the given shape.
+
+    The first seeded_fraction of the domains get the tags returned by
+    base_tags for every taxonomy, so that measurements that repeat these tags
+    prolong existing intersections. If intervals_per_tag is larger than 1,
+    each of these tags is preceded by intervals_per_tag - 1 closed intervals
+    of length interval_length with other tags and values.
+
+    Parameters
+    ----------
+    db_config - dict
+        database configuration as returned by py_tag2domain.util.parse_config.
+        The database named there is only used to create the new database.
+    db_name - str
+        name of the database to create
+    n_domains - int
+        number of rows in the entity table
+    shape - TaxonomyShape
+        shape of the generated taxonomies
+    seeded_fraction - float
+        fraction of the domains that start with open tags
+    intervals_per_tag - int
+        number of intervals seeded per domain, taxonomy and tag slot,
+        including the open one
+    interval_length - datetime.timedelta
+        length of the closed intervals
+    script_env - dict
+        additional environment variables passed to the setup scripts
+
+    Return
+    ------
+    dict - database configuration of the new database
+    """
+    check_taxonomy_shape(shape)
+
+    base_args = Psycopg2Adapter.to_psycopg_args(db_config)
+    base_conn = psycopg2.connect(**base_args)
+    try:
+        base_conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        base_conn.cursor().execute(sql.SQL(
+            "CREATE DATABASE {}"
+        ).format(sql.Identifier(db_name)))
+    finally:
+        base_conn.close()
+
+    bench_config = copy.deepcopy(db_config)
+    bench_config["DATABASE"] = db_name
+    env = _script_env(db_config, db_name, script_env)
+
+    _run_script(
+        os.path.join("db", "00-tag2domain-db-init", "init-tag2domain-tables.sh"),
+        env,
+        logger
+    )
+
+    conn = psycopg2.connect(**Psycopg2Adapter.to_psycopg_args(bench_config))
+    try:
+        cursor = conn.cursor()
+        logger.info("creating entity table with %i domains" % n_domains)
+        cursor.execute("""
+            CREATE TABLE domains (
+                domain_id bigint PRIMARY KEY,
+                domain_name character varying(100) NOT NULL
+            );
+            INSERT INTO domains (domain_id, domain_name)
+            SELECT i, 'domain-' || i || '.at'
+            FROM generate_series(1, %s) AS i;
+            CREATE UNIQUE INDEX ON domains (domain_name);
+        """, (n_domains,))
+        conn.commit()
+
+        _run_script(
+            os.path.join("scripts", "db", "create_intersection_table.sh"),
+            env,
+            logger
+        )
+
+        _create_taxonomies(cursor, shape)
+        n_seeded = int(n_domains * seeded_fraction)
+        logger.info("seeding open tags for %i domains" % n_seeded)
+        _seed_intersections(
+            cursor,
+            shape,
+            n_seeded,
+            intervals_per_tag=intervals_per_tag,
+            interval_length=interval_length
+        )
+        conn.commit()
+
+        conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        cursor.execute("VACUUM ANALYZE")
+    finally:
+        conn.close()
+
+    return bench_config
+
+
+def create_memory_adapter(
+    n_domains,
+    shape=DEFAULT_TAXONOMY_SHAPE,
+    seeded_fraction=1.0,
+    logger=logging.getLogger()
+):
+    """
+    Creates an InMemoryAdapter with the taxonomies and open tags of a
+    database created by create_benchmark_db with intervals_per_tag=1, so
+    that MeasurementGenerator can be used without a database.
+
+    Parameters
+    ----------
+    n_domains - int
+        number of domains the measurements refer to
+    shape - TaxonomyShape
+        shape of the generated taxonomies
+    seeded_fraction - float
+        fraction of the domains that start with open tags
+    logger - logging.Logger
+        logger passed to the adapter
+
+    Return
+    ------
+    py_tag2domain.memory_db.InMemoryAdapter
+    """
+    check_taxonomy_shape(shape)
+    adapter = InMemoryAdapter([TAG_TYPE], logger=logger)
+
+    tag_ids = {}
+    value_ids = {}
+    taxonomy_ids = []
+    for taxonomy_idx in range(shape.n_taxonomies):
+        taxonomy_id = adapter.add_taxonomy(
+            taxonomy_name(taxonomy_idx),
+            allows_auto_tags=True,
+            allows_auto_values=True,
+            description="synthetic benchmark taxonomy"
+        )
+        taxonomy_ids.append(taxonomy_id)
+        for tag_idx in range(shape.n_tags):
+            _name = tag_name(shape, tag_idx)
+            tag_id = adapter.add_tag(taxonomy_id, _name, "synthetic tag")
+            tag_ids[(taxonomy_idx, _name)] = tag_id
+            for value_idx in range(shape.n_values):
+                value_ids[(tag_id, value_name(value_idx))] = \
+                    adapter.add_value(tag_id, value_name(value_idx))
+
+    n_seeded = int(n_domains * seeded_fraction)
+    for domain_id in range(1, n_seeded + 1):
+        for taxonomy_idx, taxonomy_id in enumerate(taxonomy_ids):
+            for _tag in base_tags(shape, domain_id, taxonomy_idx):
+                tag_id = tag_ids[(taxonomy_idx, _tag["tag"])]
+                adapter.add_intersection(
+                    TAG_TYPE,
+                    domain_id,
+                    taxonomy_id,
+                    tag_id,
+                    SEED_TIME,
+                    value_id=value_ids.get((tag_id, _tag.get("value"))),
+                    producer=PRODUCER
+                )
+    return adapter
+
+
+def create_benchmark_glue(db_config, db_name, script_env=None,
+                          logger=logging.getLogger()):
+    """
+    Creates the glue view and functions for the benchmark database with
+    scripts/db/create_glue.sh.
+    """
+    _run_script(
+        os.path.join("scripts", "db", "create_glue.sh"),
+        _script_env(db_config, db_name, script_env),
+        logger
+    )
+
+
+def run_sql_file(db_config, db_name, path, script_env=None,
+                 logger=logging.getLogger()):
+    """
+    Runs the psql script at path against the benchmark database. The
+    search_path is set to the tag2domain schema and the script can refer to
+    it as :t2d_schema.
+    """
+    logger.info("running %s" % path)
+    env = _script_env(db_config, db_name, script_env)
+    env["PGOPTIONS"] = "-c search_path=%s" % env["TAG2DOMAIN_SCHEMA"]
+    proc = subprocess.run(
+        [
+            "psql",
+            "-v", "ON_ERROR_STOP=1",
+            "-v", "t2d_schema=%s" % env["TAG2DOMAIN_SCHEMA"],
+            "-h", env["POSTGRES_HOST"],
+            "-p", env["POSTGRES_PORT"],
+            "-U", env["POSTGRES_USER"],
+            "-d", db_name,
+            "-f", path
+        ],
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        universal_newlines=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(
+            "psql script %s failed with exit code %i:\n%s" % (
+                path, proc.returncode, proc.stdout
+            )
+        )
+
+
+def seed_domain_filter(bench_config, n_filter_values):
+    """
+    Fills the v_tag2domain_domain_filter placeholder table created by
+    create_benchmark_glue. Every domain gets the open filter
+    tag_name='registrar' with one of n_filter_values values
+    'registrar_<i>'.
+    """
+    conn = psycopg2.connect(**Psycopg2Adapter.to_psycopg_args(bench_config))
+    try:
+        cursor = conn.cursor()
+        # the placeholder does not allow open filter entries
+        cursor.execute("""
+            ALTER TABLE v_tag2domain_domain_filter
+                ALTER COLUMN end_ts DROP NOT NULL;
+            INSERT INTO v_tag2domain_domain_filter
+                (domain_id, tag_name, start_ts, end_ts, value)
+            SELECT
+                domain_id,
+                'registrar',
+                %s,
+                NULL,
+                'registrar_' || (domain_id %% %s)
+            FROM domains;
+            CREATE INDEX ON v_tag2domain_domain_filter (tag_name, value);
+            ANALYZE v_tag2domain_domain_filter;
+        """, (
+            datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc),
+            n_filter_values
+        ))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def drop_benchmark_db(db_config, db_name):
+    conn = psycopg2.connect(**Psycopg2Adapter.to_psycopg_args(db_config))
+    try:
+        conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        conn.cursor().execute(sql.SQL(
+            "DROP DATABASE IF EXISTS {}"
+        ).format(sql.Identifier(db_name)))
+    finally:
+        conn.close()
+
+
+def _create_taxonomies(cursor, shape):
+    cursor.execute("""
+        CREATE TEMPORARY TABLE benchmark_tag_index (
+            taxonomy_idx integer,
+            tag_idx integer,
+            tag_id integer
+        );
+        CREATE TEMPORARY TABLE benchmark_value_index (
+            tag_id integer,
+            value_idx integer,
+            value_id integer
+        );
+    """)
+    for taxonomy_idx in range(shape.n_taxonomies):
+        cursor.execute(
+            """
+            INSERT INTO taxonomy
+                (name, description, is_actionable, is_automatically_classifiable,
+                 is_stable, for_numbers, for_domains, url, allows_auto_tags,
+                 allows_auto_values)
+            VALUES (%s, 'synthetic benchmark taxonomy', 0.5, true, false,
+                    false, true, '', true, true)
+            RETURNING id
+            """,
+            (taxonomy_name(taxonomy_idx),)
+        )
+        taxonomy_id, = cursor.fetchone()
+
+        tag_rows = psycopg2.extras.execute_values(
+            cursor,
+            """
+            INSERT INTO tags (tag_name, tag_description, taxonomy_id, extras)
+            VALUES %s
+            RETURNING tag_id
+            """,
+            [
+                (tag_name(shape, _idx), "synthetic tag", taxonomy_id, "{}")
+                for _idx in range(shape.n_tags)
+            ],
+            page_size=shape.n_tags,
+            fetch=True
+        )
+        tag_ids = [_row[0] for _row in tag_rows]
+        psycopg2.extras.execute_values(
+            cursor,
+            "INSERT INTO benchmark_tag_index VALUES %s",
+            [
+                (taxonomy_idx, _idx, _tag_id)
+                for _idx, _tag_id in enumerate(tag_ids)
+            ]
+        )
+
+        if shape.n_values > 0:
+            cursor.execute(
+                """
+                WITH new_values AS (
+                    INSERT INTO taxonomy_tag_val (value, tag_id)
+                    SELECT 'value_' || value_idx, tag_id
+                    FROM unnest(%s::integer[]) AS tag_id
+                    CROSS JOIN generate_series(0, %s - 1) AS value_idx
+                    RETURNING id, value, tag_id
+                )
+                INSERT INTO benchmark_value_index (tag_id, value_idx, value_id)
+                SELECT
+                    tag_id,
+                    substring(value FROM 7)::integer,
+                    id
+                FROM new_values
+                """,
+                (tag_ids, shape.n_values)
+            )
+
+
+def _seed_intersections(
+    cursor,
+    shape,
+    n_seeded,
+    intervals_per_tag=1,
+    interval_length=DEFAULT_INTERVAL_LENGTH
+):
+    # Every (domain, taxonomy, slot) gets a chain of intervals_per_tag
+    # intervals. Interval j = 0 is the open one and carries the tag returned by
+    # base_tags, interval j > 0 is closed and ended about j - 1 interval
+    # lengths before SEED_TIME. The boundaries are shifted per domain so that
+    # not all intervals end at the same time.
+    if shape.n_values > 0:
+        value_column = "benchmark_value_index.value_id"
+        value_join = """
+            LEFT JOIN benchmark_value_index ON (
+                benchmark_value_index.tag_id = benchmark_tag_index.tag_id
+                AND benchmark_value_index.value_idx =
+                    (domains.domain_id / %(n_tags)s + %(slot)s + j) %% %(n_values)s
+            )"""
+    else:
+        value_column = "NULL::integer"
+        value_join = ""
+
+    stmt = """
+        INSERT INTO domain_tags
+            (entity_id, taxonomy_id, tag_id, value_id, start_date, end_date,
+             measured_at, start_ts, end_ts, producer)
+        SELECT
+            domains.domain_id,
+            %%(taxonomy_id)s,
+            benchmark_tag_index.tag_id,
+            %s,
+            to_char(bounds.start_ts AT TIME ZONE 'UTC', 'YYYYMMDD')::integer,
+            to_char(bounds.end_ts AT TIME ZONE 'UTC', 'YYYYMMDD')::integer,
+            COALESCE(bounds.end_ts - interval '1 second', bounds.start_ts),
+            bounds.start_ts,
+            bounds.end_ts,
+            %%(producer)s
+        FROM domains
+        CROSS JOIN generate_series(0, %%(intervals_per_tag)s - 1) AS j
+        CROSS JOIN LATERAL (
+            SELECT make_interval(
+                secs => (domains.domain_id * 7919) %%%% %%(jitter_range)s
+            ) AS jitter
+        ) AS shift
+        CROSS JOIN LATERAL (
+            SELECT
+                CASE
+                    WHEN j = 0 THEN %%(seed_time)s
+                    ELSE %%(seed_time)s - j * %%(interval_length)s + shift.jitter
+                END AS start_ts,
+                CASE
+                    WHEN j = 0 THEN NULL
+                    WHEN j = 1 THEN %%(seed_time)s
+                    ELSE %%(seed_time)s - (j - 1) * %%(interval_length)s + shift.jitter
+                END AS end_ts
+        ) AS bounds
+        JOIN benchmark_tag_index ON (
+            benchmark_tag_index.taxonomy_idx = %%(taxonomy_idx)s
+            AND benchmark_tag_index.tag_idx =
+                (domains.domain_id + %%(taxonomy_idx)s + %%(slot)s * %%(stride)s + j) %%%% %%(n_tags)s
+        )
+        %s
+        WHERE domains.domain_id <= %%(n_seeded)s
+    """ % (value_column, value_join)
+
+    cursor.execute("SELECT id, name FROM taxonomy")
+    taxonomy_ids = {_name: _id for _id, _name in cursor.fetchall()}
+
+    for taxonomy_idx in range(shape.n_taxonomies):
+        for slot in range(shape.tags_per_domain):
+            cursor.execute(stmt, {
+                "taxonomy_id": taxonomy_ids[taxonomy_name(taxonomy_idx)],
+                "taxonomy_idx": taxonomy_idx,
+                "slot": slot,
+                "stride": shape.n_tags // shape.tags_per_domain,
+                "n_tags": shape.n_tags,
+                "n_values": shape.n_values,
+                "n_seeded": n_seeded,
+                "intervals_per_tag": intervals_per_tag,
+                "interval_length": interval_length,
+                "jitter_range": max(
+                    1, int(interval_length.total_seconds()) // 2
+                ),
+                "seed_time": SEED_TIME,
+                "producer": PRODUCER
+            })
+
+
+class MeasurementGenerator(object):
+    """
+    Generates a reproducible stream of measurements for a database created by
+    create_benchmark_db.
+
+    Most measurements repeat the current tags of a domain and thus only
+    prolong intersections. A fraction churn_rate changes a tag or value, which
+    ends one intersection and opens another, and a fraction auto_tag_rate adds
+    a new tag to the taxonomy via autogenerate_tags.
+    """
+    def __init__(
+        self,
+        n_domains,
+        shape=DEFAULT_TAXONOMY_SHAPE,
+        churn_rate=0.05,
+        auto_tag_rate=0.001,
+        seed=0
+    ):
+        check_taxonomy_shape(shape)
+        if churn_rate + auto_tag_rate > 1.0:
+            raise ValueError("churn_rate + auto_tag_rate must not exceed 1")
+
+        self.n_domains = n_domains
+        self.shape = shape
+        self.churn_rate = churn_rate
+        self.auto_tag_rate = auto_tag_rate
+        self.random = random.Random(seed)
+        self.clock = SEED_TIME + datetime.timedelta(hours=1)
+        self.n_generated = 0
+        self.n_auto_tags = 0
+        # tags of domains that differ from base_tags, keyed by
+        # (domain_id, taxonomy_idx)
+        self.current_tags = {}
+
+    def get_tags(self, domain_id, taxonomy_idx):
+        try:
+            return self.current_tags[(domain_id, taxonomy_idx)]
+        except KeyError:
+            return base_tags(self.shape, domain_id, taxonomy_idx)
+
+    def _churn(self, tags):
+        tags = [dict(_tag) for _tag in tags]
+        slot = self.random.randrange(len(tags))
+        if self.shape.n_values > 1 and self.random.random() < 0.5:
+            tags[slot]["value"] = value_name(
+                self.random.randrange(self.shape.n_values)
+            )
+        else:
+            used = set(_tag["tag"] for _tag in tags)
+            candidates = [
+                tag_name(self.shape, _idx)
+                for _idx in range(self.shape.n_tags)
+                if tag_name(self.shape, _idx) not in used
+            ]
+            if len(candidates) > 0:
+                tags[slot] = {"tag": self.random.choice(candidates)}
+                if self.shape.n_values > 0:
+                    tags[slot]["value"] = value_name(
+                        self.random.randrange(self.shape.n_values)
+                    )
+        return tags
+
+    def next_measurement(self):
+        """
+        Generates the next measurement.
+
+        Return
+        ------
+        tuple (str, dict) - kind of the measurement ('prolong', 'churn' or
+            'auto_tag') and the measurement
+        """
+        domain_id = self.random.randint(1, self.n_domains)
+        taxonomy_idx = self.random.randrange(self.shape.n_taxonomies)
+        tags = self.get_tags(domain_id, taxonomy_idx)
+
+        msm = {
+            "version": "1",
+            "tag_type": TAG_TYPE,
+            "tagged_id": domain_id,
+            "taxonomy": taxonomy_name(taxonomy_idx),
+            "producer": PRODUCER,
+            "measured_at": self.clock.strftime("%Y-%m-%dT%H:%M:%S"),
+            "measurement_id": "%s/%i" % (PRODUCER, self.n_generated)
+        }
+
+        p = self.random.random()
+        if p < self.auto_tag_rate:
+            kind = "auto_tag"
+            tags = tags + [{
+                "tag": "auto::tag_%i" % self.n_auto_tags,
+                "description": "automatically generated benchmark tag"
+            }]
+            self.n_auto_tags += 1
+            msm["autogenerate_tags"] = True
+            self.current_tags[(domain_id, taxonomy_idx)] = tags
+        elif p < self.auto_tag_rate + self.churn_rate:
+            kind = "churn"
+            tags = self._churn(tags)
+            self.current_tags[(domain_id, taxonomy_idx)] = tags
+        else:
+            kind = "prolong"
+
+        msm["tags"] = [dict(_tag) for _tag in tags]
+        if kind == "auto_tag":
+            # autogenerate_tags requires a description for every tag
+            for _tag in msm["tags"]:
+                _tag.setdefault("description", "benchmark tag")
+
+        self.clock += datetime.timedelta(seconds=1)
+        self.n_generated += 1
+        return kind, msm
+
+    def generate(self, n):
+        """
+        Returns a list of n measurements, see next_measurement.
+        """
+        return [self.next_measurement() for _ in range(n)]
@@ -0,0 +1,622 @@
+#!/usr/bin/env python
+"""
+Benchmark of the glue functions created by scripts/db/create_glue.sql.
+
+Creates a synthetic benchmark database with open and closed intervals (see
+benchmarks.datagen), times every glue function for representative
+parameters and captures the EXPLAIN (ANALYZE, BUFFERS) plan of the function
+body. Sequential scans on tables that are expected to be accessed through an
+index are flagged, and so are changed plans, slower queries and more buffer
+accesses compared to the results of an earlier run.
+
+Usage:
+    python -m benchmarks.glue <config file> --domains 100000 \\
+        --intervals 2000000 --output glue.json
+
+    # after changing the schema or the glue functions
+    python -m benchmarks.glue <config file> --domains 100000 \\
+        --intervals 2000000 --setup-sql proposed_index.sql \\
+        --baseline glue.json --fail-on-regression
+"""
+from __future__ import print_function
+import os
+import sys
+import json
+import math
+import time
+import logging
+import argparse
+import binascii
+import datetime
+import contextlib
+from collections import namedtuple
+
+import psycopg2
+import psycopg2.sql as sql
+
+from py_tag2domain.db import Psycopg2Adapter
+from py_tag2domain.util import parse_config
+
+from benchmarks.datagen import (
+    SEED_TIME,
+    DEFAULT_INTERVAL_LENGTH,
+    DEFAULT_TAXONOMY_SHAPE,
+    ENTITY_TABLE,
+    INTXN_TABLE,
+    TaxonomyShape,
+    create_benchmark_db,
+    create_benchmark_glue,
+    seed_domain_filter,
+    run_sql_file,
+    drop_benchmark_db
+)
+from benchmarks.ingest import LAYOUT_ENV_VARS, git_revision, server_version
+
+RESULT_FORMAT_VERSION = 1
+
+N_FILTER_VALUES = 10
+
+# name - name of the case in the results
+# function - glue function to call
+# params - parameters of the call
+# index_expected_on - relations that must not be scanned sequentially
+GlueCase = namedtuple(
+    "GlueCase",
+    ["name", "function", "params", "index_expected_on"]
+)
+
+
+def glue_cases(n_seeded, intervals_per_tag, interval_length):
+    """
+    Returns the GlueCases for a database created by create_benchmark_db.
+    """
+    domain_name = "domain-%i.at" % max(1, n_seeded // 2)
+    # batch lookup of 100 domain names, half of them are not in the DB
+    domain_names = [
+        "domain-%i.at" % (1 + (_i * n_seeded) // 50) for _i in range(100)
+    ]
+    # the glue functions take timestamps without time zone
+    seed_time = SEED_TIME.replace(tzinfo=None)
+    # the open intervals start at SEED_TIME, closed interval j (j >= 1) ends
+    # about (j - 1) * interval_length before SEED_TIME
+    recent = seed_time + interval_length / 2
+    middle = seed_time - interval_length * (max(1, intervals_per_tag // 2) - 0.5)
+    oldest = seed_time - interval_length * (max(1, intervals_per_tag - 1) - 0.5)
+    intxn_only = (INTXN_TABLE,)
+    by_domain = (INTXN_TABLE, ENTITY_TABLE)
+
+    return [
+        GlueCase(
+            "open_tags",
+            "tag2domain_get_open_tags",
+            (),
+            intxn_only
+        ),
+        GlueCase(
+            "open_tags_filtered",
+            "tag2domain_get_open_tags_filtered",
+            ("registrar", "registrar_1"),
+            intxn_only
+        ),
+        GlueCase(
+            "tags_at_time[recent]",
+            "tag2domain_get_tags_at_time",
+            (recent,),
+            intxn_only
+        ),
+        GlueCase(
+            "tags_at_time[middle]",
+            "tag2domain_get_tags_at_time",
+            (middle,),
+            intxn_only
+        ),
+        GlueCase(
+            "tags_at_time[oldest]",
+            "tag2domain_get_tags_at_time",
+            (oldest,),
+            intxn_only
+        ),
+        GlueCase(
+            "tags_at_time_filtered",
+            "tag2domain_get_tags_at_time_filtered",
+            (middle, "registrar", "registrar_1"),
+            intxn_only
+        ),
+        GlueCase(
+            "open_tags_domain",
+            "tag2domain_get_open_tags_domain",
+            (domain_name,),
+            by_domain
+        ),
+        GlueCase(
+            "tags_at_time_domain",
+            "tag2domain_get_tags_at_time_domain",
+            (middle, domain_name),
+            by_domain
+        ),
+        GlueCase(
+            "open_tags_domains",
+            "tag2domain_get_open_tags_domains",
+            (domain_names,),
+            by_domain
+        ),
+        GlueCase(
+            "tags_at_time_domains",
+            "tag2domain_get_tags_at_time_domains",
+            (middle, domain_names),
+            by_domain
+        ),
+        GlueCase(
+            "tags_changed",
+            "tag2domain_get_tags_changed",
+            (middle - interval_length, middle),
+            intxn_only
+        ),
+        GlueCase(
+            "all_tags_domain",
+            "tag2domain_get_all_tags_domain",
+            (domain_name,),
+            by_domain
+        ),
+    ]
+
+
+def plan_nodes(plan):
+    yield plan
+    for _child in plan.get("Plans", []):
+        for _node in plan_nodes(_child):
+            yield _node
+
+
+def describe_scan(node):
+    if "Relation Name" not in node:
+        return None
+    if "Index Name" in node:
+        return "%s using %s on %s" % (
+            node["Node Type"], node["Index Name"], node["Relation Name"]
+        )
+    return "%s on %s" % (node["Node Type"], node["Relation Name"])
+
+
+def summarize_plan(explain_result):
+    """
+    Extracts the figures compared between runs from the result of
+    EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON).
+    """
+    root = explain_result[0]
+    plan = root["Plan"]
+    nodes = list(plan_nodes(plan))
+    return {
+        "execution_time_ms": root["Execution Time"],
+        "rows": plan["Actual Rows"],
+        "shared_buffers":
+            plan.get("Shared Hit Blocks", 0) + plan.get("Shared Read Blocks", 0),
+        "scans": sorted(set(filter(None, map(describe_scan, nodes)))),
+        "node_types": sorted(set(_node["Node Type"] for _node in nodes))
+    }
+
+
+def _is_relation(name, relation):
+    # partitions of a table are named <table>_<suffix>
+    return name == relation or name.startswith(relation + "_")
+
+
+def check_plan(case, plan_summary, raw_plan):
+    flags = []
+    for _node in plan_nodes(raw_plan[0]["Plan"]):
+        if _node["Node Type"] != "Seq Scan":
+            continue
+        for _relation in case.index_expected_on:
+            if _is_relation(_node["Relation Name"], _relation):
+                flags.append({
+                    "flag": "seq_scan",
+                    "relation": _node["Relation Name"],
+                    "detail": "sequential scan where an index scan is "
+                              "expected"
+                })
+    return flags
+
+
+def compare_to_baseline(result, baseline, factor):
+    flags = []
+    if set(result["plan"]["scans"]) != set(baseline["plan"]["scans"]):
+        flags.append({
+            "flag": "plan_changed",
+            "detail": "scans changed",
+            "baseline": baseline["plan"]["scans"],
+            "current": result["plan"]["scans"]
+        })
+    if result["timing_ms"]["median"] > factor * baseline["timing_ms"]["median"]:
+        flags.append({
+            "flag": "slower",
+            "detail": "median %.2f ms, baseline %.2f ms" % (
+                result["timing_ms"]["median"],
+                baseline["timing_ms"]["median"]
+            )
+        })
+    if (
+        result["plan"]["shared_buffers"]
+        > factor * max(1, baseline["plan"]["shared_buffers"])
+    ):
+        flags.append({
+            "flag": "more_buffers",
+            "detail": "%i shared buffers, baseline %i" % (
+                result["plan"]["shared_buffers"],
+                baseline["plan"]["shared_buffers"]
+            )
+        })
+    return flags
+
+
+class GlueBenchmark(object):
+    """
+    Runs GlueCases against a database with the glue functions installed.
+    """
+    def __init__(self, bench_config, repeat=5):
+        self.repeat = repeat
+        self.connection = psycopg2.connect(
+            **Psycopg2Adapter.to_psycopg_args(bench_config)
+        )
+        self.cursor = self.connection.cursor()
+        # the glue functions compare their timestamp parameters with
+        # timestamp with time zone columns
+        self.cursor.execute("SET TIME ZONE 'UTC'")
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def time_case(self, case):
+        stmt = sql.SQL("SELECT count(*) FROM {}({})").format(
+            sql.Identifier(case.function),
+            sql.SQL(", ").join(sql.Placeholder() * len(case.params))
+        )
+        # warm up the cache before timing
+        self.cursor.execute(stmt, case.params)
+        rows, = self.cursor.fetchone()
+
+        durations = []
+        for _ in range(self.repeat):
+            t_start = time.perf_counter()
+            self.cursor.execute(stmt, case.params)
+            self.cursor.fetchone()
+            durations.append(1000 * (time.perf_counter() - t_start))
+        self.connection.rollback()
+
+        durations.sort()
+        return rows, {
+            "runs": len(durations),
+            "min": durations[0],
+            "median": durations[len(durations) // 2],
+            "max": durations[-1]
+        }
+
+    def explain_case(self, case):
+        """
+        Explains the body of the glue function. Calls of the functions can
+        not be explained directly, because they are not inlined.
+        """
+        self.cursor.execute(
+            """
+            SELECT
+                pg_proc.prosrc,
+                ARRAY(
+                    SELECT format_type(_type, NULL)
+                    FROM unnest(pg_proc.proargtypes) AS _type
+                ),
+                pg_proc.proconfig
+            FROM pg_proc
+            JOIN pg_namespace ON (pg_namespace.oid = pg_proc.pronamespace)
+            WHERE
+                pg_proc.proname = %s
+                AND pg_namespace.nspname = current_schema()
+            """,
+            (case.function,)
+        )
+        rows = self.cursor.fetchall()
+        if len(rows) != 1:
+            raise ValueError(
+                "expected a single function %s, found %i" % (
+                    case.function, len(rows)
+                )
+            )
+        body, arg_types, proconfig = rows[0]
+
+        try:
+            # apply the SET clauses of the function
+            for _setting in (proconfig or []):
+                _name, _value = _setting.split("=", 1)
+                self.cursor.execute(
+                    "SELECT set_config(%s, %s, true)", (_name, _value)
+                )
+
+            if len(arg_types) > 0:
+                self.cursor.execute(
+                    "PREPARE glue_benchmark (%s) AS %s" % (
+                        ", ".join(arg_types), body
+                    )
+                )
+                execute = "EXECUTE glue_benchmark (%s)" % (
+                    ", ".join(["%s"] * len(case.params))
+                )
+            else:
+                self.cursor.execute("PREPARE glue_benchmark AS %s" % body)
+                execute = "EXECUTE glue_benchmark"
+
+            self.cursor.execute(
+                "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + execute,
+                case.params
+            )
+            raw_plan, = self.cursor.fetchone()
+        finally:
+            self.connection.rollback()
+            # prepared statements outlive the transaction
+            self.cursor.execute("DEALLOCATE ALL")
+        return raw_plan
+
+    def run_case(self, case):
+        rows, timing = self.time_case(case)
+        raw_plan = self.explain_case(case)
+        plan = summarize_plan(raw_plan)
+        return {
+            "name": case.name,
+            "function": case.function,
+            "params": [
+                _p.isoformat() if isinstance(_p, datetime.datetime) else _p
+                for _p in case.params
+            ],
+            "index_expected_on": list(case.index_expected_on),
+            "rows": rows,
+            "timing_ms": timing,
+            "plan": plan,
+            "flags": check_plan(case, plan, raw_plan),
+            "raw_plan": raw_plan
+        }
+
+    def relation_sizes(self):
+        self.cursor.execute(
+            """
+            SELECT relname, pg_total_relation_size(pg_class.oid)
+            FROM pg_class
+            JOIN pg_namespace ON (pg_namespace.oid = pg_class.relnamespace)
+            WHERE
+                pg_namespace.nspname = current_schema()
+                AND relkind IN ('r', 'p')
+            ORDER BY relname
+            """
+        )
+        sizes = dict(self.cursor.fetchall())
+        self.connection.rollback()
+        return sizes
+
+    def count_intervals(self):
+        self.cursor.execute(
+            sql.SQL("SELECT count(*) FROM {}").format(
+                sql.Identifier(INTXN_TABLE)
+            )
+        )
+        count, = self.cursor.fetchone()
+        self.connection.rollback()
+        return count
+
+
+def run(args, logger):
+    # parse_config prints to stdout, which may hold the results
+    with contextlib.redirect_stdout(sys.stderr):
+        db_config, _ = parse_config(args.config)
+    if db_config is None:
+        raise ValueError("could not read DB configuration")
+
+    shape = TaxonomyShape(
+        n_taxonomies=args.taxonomies,
+        n_tags=args.tags,
+        n_values=args.values,
+        n_categories=args.categories,
+        tags_per_domain=args.tags_per_domain
+    )
+    interval_length = datetime.timedelta(days=args.interval_days)
+    n_seeded = int(args.domains * args.seeded_fraction)
+    intervals_per_tag = max(1, int(math.ceil(
+        args.intervals
+        / float(max(1, n_seeded * shape.n_taxonomies * shape.tags_per_domain))
+    )))
+
+    db_name = args.db_name
+    if db_name is None:
+        db_name = "tag2domain_benchmark_%s" % (
+            binascii.b2a_hex(os.urandom(6)).decode()
+        )
+
+    if args.reuse_db:
+        logger.info("reusing benchmark database %s" % db_name)
+        bench_config = dict(db_config)
+        bench_config["DATABASE"] = db_name
+        setup_duration = None
+    else:
+        logger.info(
+            "creating benchmark database %s with %i intervals per tag" % (
+                db_name, intervals_per_tag
+            )
+        )
+        t_start = time.perf_counter()
+        bench_config = create_benchmark_db(
+            db_config,
+            db_name,
+            args.domains,
+            shape=shape,
+            seeded_fraction=args.seeded_fraction,
+            intervals_per_tag=intervals_per_tag,
+            interval_length=interval_length,
+            logger=logger
+        )
+        create_benchmark_glue(db_config, db_name, logger=logger)
+        seed_domain_filter(bench_config, N_FILTER_VALUES)
+        setup_duration = time.perf_counter() - t_start
+
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = {
+                _case["name"]: _case for _case in json.load(f)["cases"]
+            }
+
+    try:
+        for _path in args.setup_sql:
+            logger.info("applying %s" % _path)
+            run_sql_file(db_config, db_name, _path, logger=logger)
+
+        benchmark = GlueBenchmark(bench_config, repeat=args.repeat)
+        try:
+            results = {
+                "benchmark": "glue",
+                "format_version": RESULT_FORMAT_VERSION,
+                "started_at": datetime.datetime.utcnow().isoformat(),
+                "git_revision": git_revision(),
+                "postgres_version": server_version(bench_config),
+                "parameters": {
+                    "domains": args.domains,
+                    "seeded_fraction": args.seeded_fraction,
+                    "intervals_per_tag": intervals_per_tag,
+                    "interval_days": args.interval_days,
+                    "taxonomy_shape": shape._asdict(),
+                    "repeat": args.repeat,
+                    "setup_sql": args.setup_sql,
+                    "layout": {
+                        _var: os.environ.get(_var) for _var in LAYOUT_ENV_VARS
+                    }
+                },
+                "setup_duration_s": setup_duration,
+                "intervals": benchmark.count_intervals(),
+                "relation_sizes": benchmark.relation_sizes(),
+                "cases": []
+            }
+
+            for case in glue_cases(
+                n_seeded, intervals_per_tag, interval_length
+            ):
+                logger.info("running %s" % case.name)
+                result = benchmark.run_case(case)
+                if baseline is not None and case.name in baseline:
+                    result["flags"] += compare_to_baseline(
+                        result, baseline[case.name], args.regression_factor
+                    )
+                if not args.raw_plans:
+                    del result["raw_plan"]
+                for _flag in result["flags"]:
+                    logger.warning("%s: %s - %s" % (
+                        case.name, _flag["flag"], _flag["detail"]
+                    ))
+                results["cases"].append(result)
+        finally:
+            benchmark.close()
+    finally:
+        if not (args.keep_db or args.reuse_db):
+            logger.info("dropping benchmark database %s" % db_name)
+            drop_benchmark_db(db_config, db_name)
+
+    results["regressions"] = sum(
+        len(_case["flags"]) for _case in results["cases"]
+    )
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="benchmark of the tag2domain glue functions"
+    )
+    parser.add_argument("config", type=str, help="path of config file")
+    parser.add_argument(
+        "--domains", type=int, default=100000,
+        help="number of domains in the entity table (default: 100000)"
+    )
+    parser.add_argument(
+        "--intervals", type=int, default=1000000,
+        help="approximate number of intervals in the intersection table "
+             "(default: 1000000)"
+    )
+    parser.add_argument(
+        "--interval-days", type=float,
+        default=DEFAULT_INTERVAL_LENGTH.total_seconds() / 86400,
+        help="length of the closed intervals in days"
+    )
+    parser.add_argument(
+        "--seeded-fraction", type=float, default=1.0,
+        help="fraction of domains that have tags (default: 1.0)"
+    )
+    parser.add_argument("--taxonomies", type=int,
+                        default=DEFAULT_TAXONOMY_SHAPE.n_taxonomies)
+    parser.add_argument("--tags", type=int,
+                        default=DEFAULT_TAXONOMY_SHAPE.n_tags,
+                        help="number of tags per taxonomy")
+    parser.add_argument("--values", type=int,
+                        default=DEFAULT_TAXONOMY_SHAPE.n_values,
+                        help="number of values per tag")
+    parser.add_argument("--categories", type=int,
+                        default=DEFAULT_TAXONOMY_SHAPE.n_categories,
+                        help="number of categories per taxonomy")
+    parser.add_argument("--tags-per-domain", type=int,
+                        default=DEFAULT_TAXONOMY_SHAPE.tags_per_domain)
+    parser.add_argument(
+        "--repeat", type=int, default=5,
+        help="number of timed calls per case (default: 5)"
+    )
+    parser.add_argument(
+        "--setup-sql", action="append", default=[],
+        help="psql script applied before measuring, e.g. a proposed index. "
+             "Can be given multiple times."
+    )
+    parser.add_argument(
+        "--baseline", type=str, default=None,
+        help="results of an earlier run to compare against"
+    )
+    parser.add_argument(
+        "--regression-factor", type=float, default=1.5,
+        help="flag cases that are slower or access more buffers than the "
+             "baseline by this factor (default: 1.5)"
+    )
+    parser.add_argument(
+        "--fail-on-regression", action="store_true",
+        help="exit with status 1 if any case is flagged"
+    )
+    parser.add_argument(
+        "--raw-plans", action="store_true",
+        help="include the complete EXPLAIN output in the results"
+    )
+    parser.add_argument(
+        "--db-name", type=str, default=None,
+        help="name of the benchmark database (default: random name)"
+    )
+    parser.add_argument(
+        "--keep-db", action="store_true",
+        help="do not drop the benchmark database afterwards"
+    )
+    parser.add_argument(
+        "--reuse-db", action="store_true",
+        help="measure the existing database --db-name (kept with --keep-db) "
+             "instead of creating one. The database is not dropped. The data "
+             "parameters must match the run that created it."
+    )
+    parser.add_argument(
+        "-o", "--output", type=str, default=None,
+        help="write the results to this file instead of stdout"
+    )
+
+    args = parser.parse_args()
+    if args.reuse_db and args.db_name is None:
+        parser.error("--reuse-db requires --db-name")
+
+    logging.basicConfig(level=logging.INFO)
+    logger = logging.getLogger("benchmarks.glue")
+
+    results = run(args, logger)
+
+    if args.output is None:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        logger.info("results written to %s" % args.output)
+
+    if args.fail_on_regression and results["regressions"] > 0:
+        sys.exit(1)
@@ -0,0 +1,531 @@
+#!/usr/bin/env python
+"""
+Ingest throughput benchmark for msm2tag2domain.
+
+Creates a synthetic benchmark database (see benchmarks.datagen), replays a
+generated measurement stream through MeasurementToTags.handle_measurement and
+through the StreamLooper of msm2tag2domain and writes the results as JSON.
+
+Usage:
+    python -m benchmarks.ingest <config file> --domains 100000 \\
+        --messages 10000 --output results.json
+
+The config file uses the [db] section of the msm2tag2domain config. The
+database named there is only used to create and drop the benchmark database.
+"""
+from __future__ import print_function
+import io
+import os
+import contextlib
+import sys
+import json
+import time
+import logging
+import argparse
+import binascii
+import datetime
+import platform
+import importlib.util
+import subprocess
+
+import psycopg2
+import psycopg2.extensions
+
+from py_tag2domain.msm2tags import MeasurementToTags
+from py_tag2domain.db import Psycopg2Adapter
+from py_tag2domain.util import parse_config
+from py_tag2domain.exceptions import StaleMeasurementException
+
+from benchmarks.datagen import (
+    REPO_DIR,
+    TAG_TYPE,
+    INTXN_TABLE_MAPPING,
+    TaxonomyShape,
+    DEFAULT_TAXONOMY_SHAPE,
+    MeasurementGenerator,
+    create_benchmark_db,
+    drop_benchmark_db
+)
+
+RESULT_FORMAT_VERSION = 1
+
+STAGES = [
+    "validate",
+    "prepare_taxonomy",
+    "calculate_changes",
+    "write_changes",
+    "commit"
+]
+
+# environment variables of the setup scripts that change the database layout
+LAYOUT_ENV_VARS = [
+    "TAG2DOMAIN_VALIDITY_RANGE",
+    "TAG2DOMAIN_PARTITIONED"
+]
+
+
+def percentiles(samples):
+    """
+    Summarizes a list of durations in seconds.
+
+    Return
+    ------
+    dict - count, mean, p50, p90, p95, p99 and max in milliseconds, or only
+        the count if samples is empty
+    """
+    if len(samples) == 0:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def _rank(p):
+        # nearest-rank percentile
+        idx = max(0, int(-(-p * len(ordered) // 100)) - 1)
+        return 1000 * ordered[idx]
+
+    return {
+        "count": len(ordered),
+        "mean": 1000 * sum(ordered) / len(ordered),
+        "p50": _rank(50),
+        "p90": _rank(90),
+        "p95": _rank(95),
+        "p99": _rank(99),
+        "max": 1000 * ordered[-1]
+    }
+
+
+class CountingCursor(psycopg2.extensions.cursor):
+    """
+    Cursor that counts the statements sent to the server on its connection.
+    """
+    def execute(self, query, vars=None):
+        self.connection.n_statements += 1
+        return super(CountingCursor, self).execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        vars_list = list(vars_list)
+        self.connection.n_statements += len(vars_list)
+        return super(CountingCursor, self).executemany(query, vars_list)
+
+
+class CountingConnection(psycopg2.extensions.connection):
+    """
+    Connection that counts statements and commits and times the commits.
+
+    Only cursors created without an explicit cursor_factory are counted. This
+    covers all statements of the ingest path of Psycopg2Adapter.
+    """
+    def __init__(self, *args, **kwargs):
+        super(CountingConnection, self).__init__(*args, **kwargs)
+        self.n_statements = 0
+        self.n_commits = 0
+        self.commit_timings = []
+
+    def cursor(self, *args, **kwargs):
+        kwargs.setdefault("cursor_factory", CountingCursor)
+        return super(CountingConnection, self).cursor(*args, **kwargs)
+
+    def commit(self):
+        t_start = time.perf_counter()
+        super(CountingConnection, self).commit()
+        self.commit_timings.append(time.perf_counter() - t_start)
+        self.n_commits += 1
+
+
+class InstrumentedMeasurementToTags(MeasurementToTags):
+    """
+    MeasurementToTags that records the duration of each processing stage.
+    """
+    def __init__(self, *args, **kwargs):
+        super(InstrumentedMeasurementToTags, self).__init__(*args, **kwargs)
+        self.timings = {_stage: [] for _stage in STAGES}
+
+    def _timed(self, stage, func, *args):
+        t_start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            self.timings[stage].append(time.perf_counter() - t_start)
+
+    def validate_measurement(self, msm):
+        return self._timed(
+            "validate",
+            super(InstrumentedMeasurementToTags, self).validate_measurement,
+            msm
+        )
+
+    def prepare_tag2domain_taxonomy(self, msm):
+        return self._timed(
+            "prepare_taxonomy",
+            super(
+                InstrumentedMeasurementToTags, self
+            ).prepare_tag2domain_taxonomy,
+            msm
+        )
+
+    def calculate_changes(self, *args):
+        return self._timed(
+            "calculate_changes",
+            super(InstrumentedMeasurementToTags, self).calculate_changes,
+            *args
+        )
+
+    def write_intersection_changes(self, *args):
+        return self._timed(
+            "write_changes",
+            super(
+                InstrumentedMeasurementToTags, self
+            ).write_intersection_changes,
+            *args
+        )
+
+
+def load_stream_looper():
+    """
+    Imports StreamLooper from msm2tag2domain/app/msm2tag2domain.py, which is
+    a script and not part of a package.
+    """
+    path = os.path.join(REPO_DIR, "msm2tag2domain", "app", "msm2tag2domain.py")
+    spec = importlib.util.spec_from_file_location("msm2tag2domain", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.StreamLooper
+
+
+class IngestRun(object):
+    """
+    Collects the results of replaying measurements with a single driver.
+    """
+    def __init__(
+        self,
+        driver,
+        bench_config,
+        args,
+        logger=logging.getLogger()
+    ):
+        self.driver = driver
+        self.logger = logger
+        self.connection = psycopg2.connect(
+            connection_factory=CountingConnection,
+            **Psycopg2Adapter.to_psycopg_args(bench_config)
+        )
+        adapter = Psycopg2Adapter(
+            self.connection,
+            {TAG_TYPE: INTXN_TABLE_MAPPING},
+            logger=logger,
+            prepare_statements=args.prepare_statements,
+            pipeline_writes=args.pipeline_writes
+        )
+        self.msm2tags = InstrumentedMeasurementToTags(
+            adapter,
+            logger=logger,
+            update_change_watermark=args.update_change_watermark,
+            maintain_open_tag_counts=args.maintain_open_tag_counts
+        )
+        self.latencies = []
+        self.changes = {"insert": 0, "prolong": 0, "end": 0}
+        self.n_stale = 0
+        self.n_failed = 0
+
+    def reset(self):
+        """
+        Discards everything recorded so far, used after the warmup.
+        """
+        self.msm2tags.timings = {_stage: [] for _stage in STAGES}
+        self.connection.n_statements = 0
+        self.connection.n_commits = 0
+        self.connection.commit_timings = []
+        self.latencies = []
+        self.changes = {"insert": 0, "prolong": 0, "end": 0}
+        self.n_stale = 0
+        self.n_failed = 0
+
+    def msm_handler(self, msm):
+        try:
+            result = self.msm2tags.handle_measurement(msm)
+        except StaleMeasurementException:
+            self.n_stale += 1
+            self.connection.rollback()
+            return True, None
+        except Exception as e:
+            self.logger.warning("handling measurement failed - %s" % str(e))
+            self.n_failed += 1
+            self.connection.rollback()
+            return False, None
+
+        for _key in self.changes:
+            self.changes[_key] += len(result["tag_changes"][_key])
+        return True, result
+
+    def replay(self, msms):
+        if self.driver == "handle_measurement":
+            return self._replay_handle_measurement(msms)
+        elif self.driver == "stream_looper":
+            return self._replay_stream_looper(msms)
+        else:
+            raise ValueError("unknown driver '%s'" % self.driver)
+
+    def _replay_handle_measurement(self, msms):
+        t_start = time.perf_counter()
+        for msm in msms:
+            _t_start = time.perf_counter()
+            self.msm_handler(msm)
+            self.latencies.append(time.perf_counter() - _t_start)
+        return time.perf_counter() - t_start
+
+    def _replay_stream_looper(self, msms):
+        StreamLooper = load_stream_looper()
+        stream = io.StringIO(
+            StreamLooper.KEYSTRING.join(json.dumps(msm) for msm in msms)
+        )
+
+        # the latency of a message is measured from the end of the previous
+        # one, so that reading and parsing the stream is included
+        last = [None]
+
+        def result_handler(success, measurement, result):
+            now = time.perf_counter()
+            self.latencies.append(now - last[0])
+            last[0] = now
+
+        looper = StreamLooper(
+            stream,
+            self.msm_handler,
+            result_handler=result_handler,
+            logger=self.logger
+        )
+        t_start = time.perf_counter()
+        last[0] = t_start
+        looper.loop()
+        return time.perf_counter() - t_start
+
+    def result(self, duration):
+        n_messages = len(self.latencies)
+        timings = dict(self.msm2tags.timings)
+        timings["commit"] = self.connection.commit_timings
+        return {
+            "driver": self.driver,
+            "messages": n_messages,
+            "duration_s": duration,
+            "msgs_per_s": n_messages / duration if duration > 0 else None,
+            "statements_per_msg":
+                self.connection.n_statements / n_messages
+                if n_messages > 0 else None,
+            "commits_per_msg":
+                self.connection.n_commits / n_messages
+                if n_messages > 0 else None,
+            "latency_ms": dict(
+                [("total", percentiles(self.latencies))]
+                + [(_stage, percentiles(timings[_stage])) for _stage in STAGES]
+            ),
+            "changes": dict(self.changes),
+            "stale": self.n_stale,
+            "failed": self.n_failed
+        }
+
+    def close(self):
+        self.connection.close()
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"],
+            cwd=REPO_DIR,
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def server_version(bench_config):
+    conn = psycopg2.connect(**Psycopg2Adapter.to_psycopg_args(bench_config))
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SHOW server_version")
+        return cursor.fetchone()[0]
+    finally:
+        conn.close()
+
+
+def run(args, logger, msm_logger):
+    # parse_config prints to stdout, which may hold the results
+    with contextlib.redirect_stdout(sys.stderr):
+        db_config, _ = parse_config(args.config)
+    if db_config is None:
+        raise ValueError("could not read DB configuration")
+
+    shape = TaxonomyShape(
+        n_taxonomies=args.taxonomies,
+        n_tags=args.tags,
+        n_values=args.values,
+        n_categories=args.categories,
+        tags_per_domain=args.tags_per_domain
+    )
+
+    db_name = args.db_name
+    if db_name is None:
+        db_name = "tag2domain_benchmark_%s" % (
+            binascii.b2a_hex(os.urandom(6)).decode()
+        )
+
+    logger.info("creating benchmark database %s" % db_name)
+    t_start = time.perf_counter()
+    bench_config = create_benchmark_db(
+        db_config,
+        db_name,
+        args.domains,
+        shape=shape,
+        seeded_fraction=args.seeded_fraction,
+        logger=logger
+    )
+    setup_duration = time.perf_counter() - t_start
+
+    results = {
+        "benchmark": "ingest",
+        "format_version": RESULT_FORMAT_VERSION,
+        "started_at": datetime.datetime.utcnow().isoformat(),
+        "git_revision": git_revision(),
+        "python_version": platform.python_version(),
+        "postgres_version": server_version(bench_config),
+        "parameters": {
+            "domains": args.domains,
+            "messages": args.messages,
+            "warmup": args.warmup,
+            "seeded_fraction": args.seeded_fraction,
+            "churn_rate": args.churn_rate,
+            "auto_tag_rate": args.auto_tag_rate,
+            "seed": args.seed,
+            "taxonomy_shape": shape._asdict(),
+            "update_change_watermark": args.update_change_watermark,
+            "prepare_statements": args.prepare_statements,
+            "pipeline_writes": args.pipeline_writes,
+            "maintain_open_tag_counts": args.maintain_open_tag_counts,
+            "layout": {
+                _var: os.environ.get(_var) for _var in LAYOUT_ENV_VARS
+            }
+        },
+        "setup_duration_s": setup_duration,
+        "runs": []
+    }
+
+    # all drivers share the generator so that measured_at keeps increasing
+    generator = MeasurementGenerator(
+        args.domains,
+        shape=shape,
+        churn_rate=args.churn_rate,
+        auto_tag_rate=args.auto_tag_rate,
+        seed=args.seed
+    )
+
+    try:
+        for driver in args.drivers:
+            logger.info("running driver %s" % driver)
+            ingest_run = IngestRun(driver, bench_config, args, msm_logger)
+            try:
+                if args.warmup > 0:
+                    ingest_run.replay(
+                        [_msm for _, _msm in generator.generate(args.warmup)]
+                    )
+                    ingest_run.reset()
+
+                msms = generator.generate(args.messages)
+                duration = ingest_run.replay([_msm for _, _msm in msms])
+                result = ingest_run.result(duration)
+                result["generated"] = {
+                    _kind: sum(1 for _k, _ in msms if _k == _kind)
+                    for _kind in ["prolong", "churn", "auto_tag"]
+                }
+                results["runs"].append(result)
+                logger.info("%s: %.1f msgs/s" % (driver, result["msgs_per_s"]))
+            finally:
+                ingest_run.close()
+    finally:
+        if not args.keep_db:
+            logger.info("dropping benchmark database %s" % db_name)
+            drop_benchmark_db(db_config, db_name)
+
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="msm2tag2domain ingest benchmark"
+    )
+    parser.add_argument("config", type=str, help="path of config file")
+    parser.add_argument(
+        "--domains", type=int, default=10000,
+        help="number of domains in the entity table (default: 10000)"
+    )
+    parser.add_argument(
+        "--messages", type=int, default=5000,
+        help="number of measured messages per driver (default: 5000)"
+    )
+    parser.add_argument(
+        "--warmup", type=int, default=200,
+        help="number of unmeasured messages per driver (default: 200)"
+    )
+    parser.add_argument(
+        "--drivers", nargs="+", default=["handle_measurement", "stream_looper"],
+        choices=["handle_measurement", "stream_looper"]
+    )
+    parser.add_argument("--taxonomies", type=int,
+                        default=DEFAULT_TAXONOMY_SHAPE.n_taxonomies)
+    parser.add_argument("--tags", type=int,
+                        default=DEFAULT_TAXONOMY_SHAPE.n_tags,
+                        help="number of tags per taxonomy")
+    parser.add_argument("--values", type=int,
+                        default=DEFAULT_TAXONOMY_SHAPE.n_values,
+                        help="number of values per tag")
+    parser.add_argument("--categories", type=int,
+                        default=DEFAULT_TAXONOMY_SHAPE.n_categories,
+                        help="number of categories per taxonomy")
+    parser.add_argument("--tags-per-domain", type=int,
+                        default=DEFAULT_TAXONOMY_SHAPE.tags_per_domain)
+    parser.add_argument(
+        "--seeded-fraction", type=float, default=1.0,
+        help="fraction of domains that start with open tags (default: 1.0)"
+    )
+    parser.add_argument("--churn-rate", type=float, default=0.05)
+    parser.add_argument("--auto-tag-rate", type=float, default=0.001)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--update-change-watermark", action="store_true")
+    parser.add_argument("--maintain-open-tag-counts", action="store_true")
+    parser.add_argument(
+        "--prepare-statements", action="store_true",
+        help="execute the intersection statements as prepared statements"
+    )
+    parser.add_argument(
+        "--pipeline-writes", action="store_true",
+        help="send the writes of a measurement in a single message"
+    )
+    parser.add_argument(
+        "--db-name", type=str, default=None,
+        help="name of the benchmark database (default: random name)"
+    )
+    parser.add_argument(
+        "--keep-db", action="store_true",
+        help="do not drop the benchmark database afterwards"
+    )
+    parser.add_argument(
+        "-o", "--output", type=str, default=None,
+        help="write the results to this file instead of stdout"
+    )
+
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    logger = logging.getLogger("benchmarks.ingest")
+    # the per message logging of py_tag2domain would dominate the benchmark
+    msm_logger = logging.getLogger("benchmarks.ingest.msm2tags")
+    msm_logger.setLevel(logging.WARNING)
+
+    results = run(args, logger, msm_logger)
+
+    if args.output is None:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        logger.info("results written to %s" % args.output)
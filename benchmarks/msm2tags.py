@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+"""
+Microbenchmark of the pure-Python part of MeasurementToTags.
+
+Replays a generated measurement stream (see benchmarks.datagen) through
+MeasurementToTags.handle_measurement on an InMemoryAdapter, so that
+validation, change calculation and logging are measured without database
+round trips. No database is needed.
+
+Usage:
+    python -m benchmarks.msm2tags --domains 10000 --messages 20000 \\
+        --profile msm2tags.prof --output results.json
+
+The profile written with --profile can be inspected with pstats or
+snakeviz.
+"""
+from __future__ import print_function
+import sys
+import json
+import time
+import logging
+import argparse
+import cProfile
+import datetime
+import platform
+
+from py_tag2domain.exceptions import StaleMeasurementException
+
+from benchmarks.datagen import (
+    TaxonomyShape,
+    DEFAULT_TAXONOMY_SHAPE,
+    MeasurementGenerator,
+    create_memory_adapter
+)
+from benchmarks.ingest import (
+    STAGES,
+    InstrumentedMeasurementToTags,
+    git_revision,
+    percentiles
+)
+
+RESULT_FORMAT_VERSION = 1
+
+
+class MemoryRun(object):
+    """
+    Replays measurements on an InMemoryAdapter and collects the results.
+    """
+    def __init__(self, adapter, args, logger=logging.getLogger()):
+        self.adapter = adapter
+        self.logger = logger
+        self.msm2tags = InstrumentedMeasurementToTags(
+            adapter,
+            logger=logger,
+            update_change_watermark=args.update_change_watermark,
+            maintain_open_tag_counts=args.maintain_open_tag_counts,
+            summarize_logging=args.summarize_logging
+        )
+        self.reset()
+
+    def reset(self):
+        """
+        Discards everything recorded so far, used after the warmup.
+        """
+        self.msm2tags.timings = {_stage: [] for _stage in STAGES}
+        self.latencies = []
+        self.changes = {"insert": 0, "prolong": 0, "end": 0}
+        self.n_stale = 0
+        self.n_failed = 0
+
+    def msm_handler(self, msm):
+        try:
+            result = self.msm2tags.handle_measurement(msm)
+        except StaleMeasurementException:
+            self.n_stale += 1
+            self.adapter.rollback()
+            return
+        except Exception as e:
+            self.logger.warning("handling measurement failed - %s" % str(e))
+            self.n_failed += 1
+            self.adapter.rollback()
+            return
+
+        for _key in self.changes:
+            self.changes[_key] += len(result["tag_changes"][_key])
+
+    def replay(self, msms, profiler=None):
+        t_start = time.perf_counter()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            for msm in msms:
+                _t_start = time.perf_counter()
+                self.msm_handler(msm)
+                self.latencies.append(time.perf_counter() - _t_start)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+        return time.perf_counter() - t_start
+
+    def result(self, duration):
+        n_messages = len(self.latencies)
+        return {
+            "messages": n_messages,
+            "duration_s": duration,
+            "msgs_per_s": n_messages / duration if duration > 0 else None,
+            "latency_ms": dict(
+                [("total", percentiles(self.latencies))]
+                + [
+                    (_stage, percentiles(self.msm2tags.timings[_stage]))
+                    for _stage in STAGES
+                    if _stage != "commit"
+                ]
+            ),
+            "changes": dict(self.changes),
+            "stale": self.n_stale,
+            "failed": self.n_failed
+        }
+
+
+def run(args, logger, msm_logger):
+    shape = TaxonomyShape(
+        n_taxonomies=args.taxonomies,
+        n_tags=args.tags,
+        n_values=args.values,
+        n_categories=args.categories,
+        tags_per_domain=args.tags_per_domain
+    )
+
+    logger.info("creating in-memory adapter with %i domains" % args.domains)
+    t_start = time.perf_counter()
+    adapter = create_memory_adapter(
+        args.domains,
+        shape=shape,
+        seeded_fraction=args.seeded_fraction,
+        logger=msm_logger
+    )
+    setup_duration = time.perf_counter() - t_start
+
+    generator = MeasurementGenerator(
+        args.domains,
+        shape=shape,
+        churn_rate=args.churn_rate,
+        auto_tag_rate=args.auto_tag_rate,
+        seed=args.seed
+    )
+
+    memory_run = MemoryRun(adapter, args, msm_logger)
+    if args.warmup > 0:
+        memory_run.replay(
+            [_msm for _, _msm in generator.generate(args.warmup)]
+        )
+        memory_run.reset()
+
+    profiler = cProfile.Profile() if args.profile is not None else None
+    msms = generator.generate(args.messages)
+    duration = memory_run.replay([_msm for _, _msm in msms], profiler)
+    if profiler is not None:
+        profiler.dump_stats(args.profile)
+        logger.info("profile written to %s" % args.profile)
+
+    result = memory_run.result(duration)
+    result["generated"] = {
+        _kind: sum(1 for _k, _ in msms if _k == _kind)
+        for _kind in ["prolong", "churn", "auto_tag"]
+    }
+    logger.info("%.1f msgs/s" % result["msgs_per_s"])
+
+    return {
+        "benchmark": "msm2tags",
+        "format_version": RESULT_FORMAT_VERSION,
+        "started_at": datetime.datetime.utcnow().isoformat(),
+        "git_revision": git_revision(),
+        "python_version": platform.python_version(),
+        "parameters": {
+            "domains": args.domains,
+            "messages": args.messages,
+            "warmup": args.warmup,
+            "seeded_fraction": args.seeded_fraction,
+            "churn_rate": args.churn_rate,
+            "auto_tag_rate": args.auto_tag_rate,
+            "seed": args.seed,
+            "taxonomy_shape": shape._asdict(),
+            "update_change_watermark": args.update_change_watermark,
+            "maintain_open_tag_counts": args.maintain_open_tag_counts,
+            "summarize_logging": args.summarize_logging,
+            "msm_log_level": logging.getLevelName(msm_logger.level)
+        },
+        "setup_duration_s": setup_duration,
+        "runs": [result]
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="DB-free microbenchmark of MeasurementToTags"
+    )
+    parser.add_argument(
+        "--domains", type=int, default=10000,
+        help="number of domains (default: 10000)"
+    )
+    parser.add_argument(
+        "--messages", type=int, default=20000,
+        help="number of measured messages (default: 20000)"
+    )
+    parser.add_argument(
+        "--warmup", type=int, default=1000,
+        help="number of unmeasured messages (default: 1000)"
+    )
+    parser.add_argument("--taxonomies", type=int,
+                        default=DEFAULT_TAXONOMY_SHAPE.n_taxonomies)
+    parser.add_argument("--tags", type=int,
+                        default=DEFAULT_TAXONOMY_SHAPE.n_tags,
+                        help="number of tags per taxonomy")
+    parser.add_argument("--values", type=int,
+                        default=DEFAULT_TAXONOMY_SHAPE.n_values,
+                        help="number of values per tag")
+    parser.add_argument("--categories", type=int,
+                        default=DEFAULT_TAXONOMY_SHAPE.n_categories,
+                        help="number of categories per taxonomy")
+    parser.add_argument("--tags-per-domain", type=int,
+                        default=DEFAULT_TAXONOMY_SHAPE.tags_per_domain)
+    parser.add_argument(
+        "--seeded-fraction", type=float, default=1.0,
+        help="fraction of domains that start with open tags (default: 1.0)"
+    )
+    parser.add_argument("--churn-rate", type=float, default=0.05)
+    parser.add_argument("--auto-tag-rate", type=float, default=0.001)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--update-change-watermark", action="store_true")
+    parser.add_argument("--maintain-open-tag-counts", action="store_true")
+    parser.add_argument(
+        "--summarize-logging", action="store_true",
+        help="log one summary line per measurement instead of one per tag"
+    )
+    parser.add_argument(
+        "--msm-log-level", type=str, default="WARNING",
+        help="log level of MeasurementToTags, use DEBUG to include the cost "
+             "of the per message logging (default: WARNING)"
+    )
+    parser.add_argument(
+        "--profile", type=str, default=None,
+        help="write cProfile statistics of the measured messages to this file"
+    )
+    parser.add_argument(
+        "-o", "--output", type=str, default=None,
+        help="write the results to this file instead of stdout"
+    )
+
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    logger = logging.getLogger("benchmarks.msm2tags")
+    msm_logger = logging.getLogger("benchmarks.msm2tags.msm2tags")
+    msm_logger.setLevel(args.msm_log_level.upper())
+    # the log records are created but not written
+    msm_logger.propagate = False
+
+    results = run(args, logger, msm_logger)
+
+    if args.output is None:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        logger.info("results written to %s" % args.output)
@@ -0,0 +1,53 @@
+SET statement_timeout = 0;
+SET lock_timeout = 0;
+SET idle_in_transaction_session_timeout = 0;
+SET client_encoding = 'UTF8';
+SET standard_conforming_strings = on;
+SET check_function_bodies = false;
+SET xmloption = content;
+SET client_min_messages = warning;
+SET row_security = off;
+
+SET default_tablespace = '';
+SET default_with_oids = false;
+
+CREATE SCHEMA IF NOT EXISTS :t2d_schema;
+SET search_path TO :t2d_schema;
+
+-- This script is idempotent and can be run against an existing tag2domain
+-- schema to add the category column to the tags table.
+--
+-- The category of a tag is the part of its name before the last '::' or the
+-- empty string for tags in the root category. The column is kept up to date
+-- by a trigger so that all writers (the taxonomy loader, msm2tag2domain, ...)
+-- populate it without further changes.
+ALTER TABLE tags ADD COLUMN IF NOT EXISTS category character varying(200);
+
+CREATE OR REPLACE FUNCTION tags_category(tag_name character varying)
+  RETURNS character varying AS $$
+    SELECT CASE
+      WHEN STRPOS(tag_name, '::') = 0 THEN ''
+      ELSE REGEXP_REPLACE(tag_name, '^(.+)::.+$', '\1')
+    END
+$$ LANGUAGE SQL IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION tags_set_category()
+  RETURNS trigger AS $$
+BEGIN
+  NEW.category := tags_category(NEW.tag_name);
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS tags_set_category ON tags;
+CREATE TRIGGER tags_set_category
+  BEFORE INSERT OR UPDATE OF tag_name, category ON tags
+  FOR EACH ROW EXECUTE PROCEDURE tags_set_category();
+
+UPDATE tags SET category = tags_category(tag_name)
+  WHERE category IS DISTINCT FROM tags_category(tag_name);
+
+CREATE INDEX IF NOT EXISTS tags_taxonomy_id_category_idx
+  ON tags (taxonomy_id, category);
+
+COMMENT ON COLUMN tags.category IS 'Category of the tag (empty for tags in the root category), set by trigger';
@@ -0,0 +1,32 @@
+SET statement_timeout = 0;
+SET lock_timeout = 0;
+SET idle_in_transaction_session_timeout = 0;
+SET client_encoding = 'UTF8';
+SET standard_conforming_strings = on;
+SET check_function_bodies = false;
+SET xmloption = content;
+SET client_min_messages = warning;
+SET row_security = off;
+
+SET default_tablespace = '';
+SET default_with_oids = false;
+
+CREATE SCHEMA IF NOT EXISTS :t2d_schema;
+SET search_path TO :t2d_schema;
+
+-- This script is idempotent and can be run against an existing tag2domain
+-- schema to add the change watermark.
+CREATE TABLE IF NOT EXISTS change_watermark (
+    id boolean DEFAULT true NOT NULL,
+    counter bigint DEFAULT 0 NOT NULL,
+    changed_at timestamp with time zone DEFAULT now() NOT NULL,
+    CONSTRAINT change_watermark_pkey PRIMARY KEY (id),
+    CONSTRAINT change_watermark_single_row CHECK (id)
+);
+
+INSERT INTO change_watermark (id) VALUES (true) ON CONFLICT DO NOTHING;
+
+COMMENT ON TABLE change_watermark IS 'Single row table whose counter is increased whenever the set of open tags or the taxonomies change';
+COMMENT ON COLUMN change_watermark.id IS 'Primary Key (always true)';
+COMMENT ON COLUMN change_watermark.counter IS 'Number of changes recorded so far';
+COMMENT ON COLUMN change_watermark.changed_at IS 'Time of the last recorded change';
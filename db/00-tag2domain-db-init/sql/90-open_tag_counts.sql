@@ -0,0 +1,43 @@
+SET statement_timeout = 0;
+SET lock_timeout = 0;
+SET idle_in_transaction_session_timeout = 0;
+SET client_encoding = 'UTF8';
+SET standard_conforming_strings = on;
+SET check_function_bodies = false;
+SET xmloption = content;
+SET client_min_messages = warning;
+SET row_security = off;
+
+SET default_tablespace = '';
+SET default_with_oids = false;
+
+CREATE SCHEMA IF NOT EXISTS :t2d_schema;
+SET search_path TO :t2d_schema;
+
+-- This script is idempotent and can be run against an existing tag2domain
+-- schema to add the open tag counters. The table is only maintained if
+-- msm2tag2domain is configured with maintain_open_tag_counts=true and has to
+-- be filled initially using msm2tag2domain.py --rebuild-open-tag-counts.
+--
+-- Each row holds the number of entities of a tag type with an open tag on
+-- one of three levels:
+--   tag_id IS NULL                          - any tag in the taxonomy
+--   tag_id IS NOT NULL AND value_id IS NULL - the tag with any or no value
+--   value_id IS NOT NULL                    - the tag with this value
+CREATE TABLE IF NOT EXISTS open_tag_counts (
+    tag_type text NOT NULL,
+    taxonomy_id integer NOT NULL,
+    tag_id integer,
+    value_id integer,
+    entity_count bigint DEFAULT 0 NOT NULL
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS open_tag_counts_key_idx ON open_tag_counts
+    (tag_type, taxonomy_id, COALESCE(tag_id, -1), COALESCE(value_id, -1));
+
+COMMENT ON TABLE open_tag_counts IS 'Number of entities with open tags per tag type, taxonomy, tag and value';
+COMMENT ON COLUMN open_tag_counts.tag_type IS 'Tag type (intersection table) the entities belong to';
+COMMENT ON COLUMN open_tag_counts.taxonomy_id IS 'Taxonomy ID';
+COMMENT ON COLUMN open_tag_counts.tag_id IS 'Tag ID or NULL for the count over all tags of the taxonomy';
+COMMENT ON COLUMN open_tag_counts.value_id IS 'Value ID or NULL for the count over all values of the tag';
+COMMENT ON COLUMN open_tag_counts.entity_count IS 'Number of entities';
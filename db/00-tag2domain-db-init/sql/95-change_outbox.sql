@@ -0,0 +1,32 @@
+SET statement_timeout = 0;
+SET lock_timeout = 0;
+SET idle_in_transaction_session_timeout = 0;
+SET client_encoding = 'UTF8';
+SET standard_conforming_strings = on;
+SET check_function_bodies = false;
+SET xmloption = content;
+SET client_min_messages = warning;
+SET row_security = off;
+
+SET default_tablespace = '';
+SET default_with_oids = false;
+
+CREATE SCHEMA IF NOT EXISTS :t2d_schema;
+SET search_path TO :t2d_schema;
+
+-- This script is idempotent and can be run against an existing tag2domain
+-- schema to add the change outbox. The table is only used if msm2tag2domain
+-- is configured with a [change_feed] section. The events of a measurement are
+-- written in the same transaction as its tag changes and are deleted once
+-- they have been published.
+CREATE TABLE IF NOT EXISTS change_outbox (
+    id bigserial NOT NULL,
+    created_at timestamp with time zone DEFAULT now() NOT NULL,
+    event jsonb NOT NULL,
+    CONSTRAINT change_outbox_pkey PRIMARY KEY (id)
+);
+
+COMMENT ON TABLE change_outbox IS 'Tag change events that have not been published to the change feed yet';
+COMMENT ON COLUMN change_outbox.id IS 'Primary Key, published as event_id';
+COMMENT ON COLUMN change_outbox.created_at IS 'Time the event was written';
+COMMENT ON COLUMN change_outbox.event IS 'Event as published to the change feed';
@@ -48,3 +48,5 @@ ALTER TABLE ONLY intersections ADD CONSTRAINT intersections_fk FOREIGN KEY (valu
 ALTER TABLE ONLY intersections ADD CONSTRAINT intersections_fk_1 FOREIGN KEY (taxonomy_id) REFERENCES taxonomy(id);
 ALTER TABLE ONLY intersections ADD CONSTRAINT fk_intersections_entitys FOREIGN KEY (entity_id) REFERENCES :t2d_entity_table(:t2d_entity_id_column);
 ALTER TABLE ONLY intersections ADD CONSTRAINT fk_intersections_tags FOREIGN KEY (tag_id) REFERENCES tags(tag_id);
+CREATE INDEX idx_intersections_open ON intersections USING btree (entity_id, taxonomy_id, tag_id, value_id) WHERE (end_ts IS NULL);
+CREATE INDEX idx_intersections_at_time ON intersections USING btree ((COALESCE(end_ts, 'infinity'::timestamp with time zone)), start_ts) INCLUDE (entity_id, taxonomy_id, tag_id, value_id, measured_at, end_ts);
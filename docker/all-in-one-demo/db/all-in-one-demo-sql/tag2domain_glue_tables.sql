@@ -98,7 +98,7 @@ CREATE FUNCTION tag2domain_get_tags_at_time(at_time timestamp)
  SELECT v_unified_tags.* FROM v_unified_tags
  WHERE (
     (v_unified_tags.start_ts <= $1)
-    AND ((v_unified_tags.end_ts > $1) OR (v_unified_tags.end_ts IS NULL))
+    AND (COALESCE(v_unified_tags.end_ts, 'infinity') > $1)
   )
 $$ LANGUAGE SQL STABLE
     SET search_path TO :t2d_schema
@@ -129,7 +129,7 @@ CREATE FUNCTION tag2domain_get_tags_at_time_filtered(at_time timestamp, filter_t
  JOIN v_tag2domain_domain_filter USING (domain_id)
  WHERE (
     (v_unified_tags.start_ts <= $1)
-    AND ((v_unified_tags.end_ts > $1) OR (v_unified_tags.end_ts IS NULL))
+    AND (COALESCE(v_unified_tags.end_ts, 'infinity') > $1)
     AND (v_tag2domain_domain_filter.start_ts AT TIME ZONE 'UTC' <= $1)
     AND ((v_tag2domain_domain_filter.end_ts AT TIME ZONE 'UTC' > $1) OR (v_tag2domain_domain_filter.end_ts IS NULL))
     AND (v_tag2domain_domain_filter.tag_name = $2)
@@ -180,13 +180,63 @@ CREATE FUNCTION tag2domain_get_tags_at_time_domain(at_time timestamp, domain_nam
  SELECT * FROM v_unified_tags
  WHERE (
     (v_unified_tags.start_ts <= $1)
-    AND ((v_unified_tags.end_ts > $1) OR (v_unified_tags.end_ts IS NULL))
+    AND (COALESCE(v_unified_tags.end_ts, 'infinity') > $1)
     AND (v_unified_tags.domain_name = $2)
   )
 $$ LANGUAGE SQL STABLE
     SET search_path TO :t2d_schema
 ;
 
+DROP FUNCTION IF EXISTS tag2domain_get_open_tags_domains;
+-- function tag2domain_get_open_tags_domains(domain_names)
+--
+-- returns a table with the open tags for all domains whose name is in the
+-- array domain_names
+CREATE FUNCTION tag2domain_get_open_tags_domains(domain_names character varying[])
+  RETURNS TABLE(
+    domain_id bigint,
+    domain_name character varying(100),
+    tag_type text,
+    tag_id int,
+    value_id int,
+    start_time timestamp with time zone,
+    measured_at timestamp with time zone,
+    end_time timestamp with time zone
+  ) AS $$
+ SELECT v_unified_tags.* FROM unnest($1) AS requested(domain_name)
+ JOIN v_unified_tags ON (v_unified_tags.domain_name = requested.domain_name)
+ WHERE
+    (v_unified_tags.end_ts IS NULL)
+$$ LANGUAGE SQL STABLE
+    SET search_path TO :t2d_schema
+;
+
+DROP FUNCTION IF EXISTS tag2domain_get_tags_at_time_domains;
+-- function tag2domain_get_tags_at_time_domains(at_time, domain_names)
+--
+-- returns a table with the tags set at time at_time for all domains whose name
+-- is in the array domain_names
+CREATE FUNCTION tag2domain_get_tags_at_time_domains(at_time timestamp, domain_names character varying[])
+  RETURNS TABLE(
+    domain_id bigint,
+    domain_name character varying(100),
+    tag_type text,
+    tag_id int,
+    value_id int,
+    start_time timestamp with time zone,
+    measured_at timestamp with time zone,
+    end_time timestamp with time zone
+  ) AS $$
+ SELECT v_unified_tags.* FROM unnest($2) AS requested(domain_name)
+ JOIN v_unified_tags ON (v_unified_tags.domain_name = requested.domain_name)
+ WHERE (
+    (v_unified_tags.start_ts <= $1)
+    AND (COALESCE(v_unified_tags.end_ts, 'infinity') > $1)
+  )
+$$ LANGUAGE SQL STABLE
+    SET search_path TO :t2d_schema
+;
+
 DROP FUNCTION IF EXISTS tag2domain_get_all_tags_domain;
 -- function tag2domain_get_all_tags_domain(domain_name)
 --
@@ -208,4 +258,40 @@ CREATE FUNCTION tag2domain_get_all_tags_domain(domain_name character varying (10
   )
 $$ LANGUAGE SQL
     SET search_path TO :t2d_schema
+;
+
+DROP FUNCTION IF EXISTS tag2domain_get_tags_changed;
+-- function tag2domain_get_tags_changed(since, until)
+--
+-- returns a table with all tags that were opened or closed in the time range
+-- (since, until], i.e. whose start_ts or end_ts is in the range. A tag that
+-- was opened and closed in the range is returned once. The two branches of
+-- the UNION ALL are answered by the indexes on start_ts and end_ts, so the
+-- cost depends on the number of changes in the range and not on the total
+-- number of tags.
+CREATE FUNCTION tag2domain_get_tags_changed(since timestamp, until timestamp)
+  RETURNS TABLE(
+    domain_id bigint,
+    domain_name character varying(100),
+    tag_type text,
+    tag_id int,
+    value_id int,
+    start_time timestamp with time zone,
+    measured_at timestamp with time zone,
+    end_time timestamp with time zone
+  ) AS $$
+ SELECT v_unified_tags.* FROM v_unified_tags
+ WHERE (
+    (v_unified_tags.start_ts > $1)
+    AND (v_unified_tags.start_ts <= $2)
+  )
+ UNION ALL
+ SELECT v_unified_tags.* FROM v_unified_tags
+ WHERE (
+    (v_unified_tags.end_ts > $1)
+    AND (v_unified_tags.end_ts <= $2)
+    AND (v_unified_tags.start_ts <= $1)
+  )
+$$ LANGUAGE SQL STABLE
+    SET search_path TO :t2d_schema
 ;
\ No newline at end of file
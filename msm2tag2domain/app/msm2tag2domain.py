@@ -6,11 +6,21 @@ import argparse
 import logging
 import traceback
 import datetime
+import tempfile
 
 import json
-from kafka import KafkaConsumer
+from kafka import KafkaConsumer, TopicPartition
 
 from py_tag2domain.msm2tags import MeasurementToTags
+from py_tag2domain.metrics import IngestMetrics
+from py_tag2domain.profiling import ProfilingController
+from py_tag2domain.change_feed import (
+    ChangeFeedPublisher,
+    FileChangeSink,
+    KafkaChangeSink,
+    DEFAULT_CHANGE_TYPES
+)
+from py_tag2domain.logging_util import JsonFormatter, SamplingFilter
 from py_tag2domain.db import Psycopg2Adapter
 from py_tag2domain.util import parse_config
 import py_tag2domain.exceptions
@@ -34,11 +44,13 @@ class KafkaLooper(object):
         config,
         msm_handler,
         result_handler=None,
+        metrics=None,
         logger=logging.getLogger()
     ):
         self.logger = logger
         self.msm_handler = msm_handler
         self.result_handler = result_handler
+        self.metrics = metrics
 
         # check config
         try:
@@ -81,10 +93,25 @@ class KafkaLooper(object):
                 type(e), str(e)
             ))
 
+    def update_lag(self, msg):
+        # the highwater offset is only known after the first fetch from a
+        # partition
+        highwater = self.consumer.highwater(
+            TopicPartition(msg.topic, msg.partition)
+        )
+        if highwater is not None:
+            self.metrics.set_consumer_lag(
+                msg.topic,
+                msg.partition,
+                max(0, highwater - msg.offset - 1)
+            )
+
     def loop(self):
         self.logger.info("startup finished, waiting for kafka events")
         for msg in self.consumer:
             self.logger.info("received kafka message")
+            if self.metrics is not None:
+                self.update_lag(msg)
             if msg.value == 'json failed to parse':
                 self.logger.warning("received json failed to parse")
                 self.consumer.commit()
@@ -104,18 +131,19 @@ class KafkaLooper(object):
                 continue
 
             success, result = self.msm_handler(measurement)
+
+            # the changes of the measurement are already committed (and
+            # written to the change outbox), the result handler only acts on
+            # them
+            if self.result_handler is not None:
+                self.result_handler(success, measurement, result)
+
             if success:
                 self.logger.debug(
                     "handled measurement successfully - committing"
                 )
                 self.consumer.commit()
 
-            if self.result_handler is not None:
-                self.result_handler(success, measurement, result)
-
-            if not success:
-                continue
-
 
 class StreamLooper(object):
     KEYSTRING = "--**--SEPARATOR-52579864--**--"
@@ -141,7 +169,7 @@ class StreamLooper(object):
             if (
                 (len(read_string) >= keystring_len)
                 and (
-                    read_string[keystring_len:] == __class__.KEYSTRING
+                    read_string[-keystring_len:] == __class__.KEYSTRING
                 )
             ):
                 msm = read_string[:-len(__class__.KEYSTRING)]
@@ -173,7 +201,13 @@ class StreamLooper(object):
                 self.result_handler(success, measurement, result)
 
 
-def get_msm_looper(args, config, msm_handler, result_handler=None):
+def get_msm_looper(
+    args,
+    config,
+    msm_handler,
+    result_handler=None,
+    metrics=None
+):
     if args.stdin:
         logging.info("reading measurements from stdin")
         looper = StreamLooper(
@@ -195,7 +229,8 @@ def get_msm_looper(args, config, msm_handler, result_handler=None):
         looper = KafkaLooper(
             config,
             msm_handler,
-            result_handler=result_handler
+            result_handler=result_handler,
+            metrics=metrics
         )
     else:
         error("no measurement source specified")
@@ -203,6 +238,157 @@ def get_msm_looper(args, config, msm_handler, result_handler=None):
     return looper
 
 
+def setup_profiling(config, looper):
+    """
+    Sets up on-demand profiling of the looper as configured in the profiling
+    section of the config file.
+    """
+    messages = config.getint("profiling", "messages", fallback=1000)
+    seconds = config.getfloat("profiling", "seconds", fallback=0)
+    try:
+        controller = ProfilingController(
+            config.get(
+                "profiling",
+                "output_dir",
+                fallback=tempfile.gettempdir()
+            ),
+            mode=config.get("profiling", "mode", fallback="cprofile"),
+            messages=messages if messages > 0 else None,
+            seconds=seconds if seconds > 0 else None,
+            sample_interval=config.getfloat(
+                "profiling",
+                "sample_interval",
+                fallback=0.005
+            ),
+            tracemalloc_frames=config.getint(
+                "profiling",
+                "tracemalloc_frames",
+                fallback=10
+            ),
+            logger=logging.getLogger()
+        )
+    except ValueError as e:
+        error("invalid profiling configuration - %s" % str(e))
+    controller.attach(looper)
+
+    if config.getboolean("profiling", "signals", fallback=True):
+        controller.install_signal_handlers()
+    if config.has_option("profiling", "control_port"):
+        try:
+            controller.start_control_server(
+                config.getint("profiling", "control_port"),
+                addr=config.get(
+                    "profiling",
+                    "control_addr",
+                    fallback="127.0.0.1"
+                )
+            )
+        except OSError as e:
+            error("could not start profiling control endpoint - %s" % str(e))
+    return controller
+
+
+def setup_change_feed(config, db_adapter):
+    """
+    Creates the publisher of the tag changes as configured in the
+    change_feed section of the config file. The events are published from
+    the change_outbox table of db_adapter.
+    """
+    sink_type = config.get("change_feed", "sink", fallback="file").lower()
+    if sink_type == "file":
+        if not config.has_option("change_feed", "path"):
+            error("could not find required option change_feed.path "
+                  "in config file")
+        path = config.get("change_feed", "path")
+        logging.info("publishing tag changes to file %s" % path)
+        try:
+            sink = FileChangeSink(
+                path,
+                fsync=config.getboolean("change_feed", "fsync", fallback=False)
+            )
+        except IOError as e:
+            error("could not open change feed file %s - %s" % (path, str(e)))
+    elif sink_type == "kafka":
+        for _option in ["topic_name", "bootstrap_servers"]:
+            if not config.has_option("change_feed", _option):
+                error("could not find required option change_feed.%s "
+                      "in config file" % _option)
+        logging.info(
+            "publishing tag changes to kafka topic %s" % (
+                config.get("change_feed", "topic_name")
+            )
+        )
+        try:
+            sink = KafkaChangeSink(
+                config.get("change_feed", "topic_name"),
+                config.get("change_feed", "bootstrap_servers"),
+                client_id=config.get(
+                    "change_feed",
+                    "client_id",
+                    fallback=None
+                )
+            )
+        except Exception as e:
+            error("could not connect to kafka for the change feed "
+                  "(%s) - %s" % (type(e), str(e)))
+    else:
+        error("unknown change feed sink '%s' configured" % sink_type)
+
+    change_types = DEFAULT_CHANGE_TYPES
+    if config.getboolean("change_feed", "publish_prolong", fallback=False):
+        change_types = change_types + ("prolong", )
+    return ChangeFeedPublisher(
+        sink,
+        db_adapter,
+        change_types=change_types,
+        retry_interval=config.getfloat(
+            "change_feed",
+            "retry_interval",
+            fallback=10.0
+        ),
+        logger=logging.getLogger()
+    )
+
+
+def setup_logging(config):
+    """
+    Configures the handlers of the root logger as set in the logging section
+    of the config file.
+    """
+    loglevel_str = config.get("logging", "level", fallback="info").lower()
+    try:
+        loglevel = LOG_LEVELS[loglevel_str]
+    except KeyError:
+        error("unknown logging level '%s' configured" % loglevel_str)
+    root_logger = logging.getLogger()
+    root_logger.setLevel(loglevel)
+
+    log_format = config.get("logging", "format", fallback="text").lower()
+    if log_format not in ("text", "json"):
+        error("unknown logging format '%s' configured" % log_format)
+    try:
+        sample_rate = config.getfloat(
+            "logging",
+            "sample_rate",
+            fallback=1.0
+        )
+        sampling_filter = SamplingFilter(sample_rate) \
+            if sample_rate < 1.0 else None
+    except ValueError as e:
+        error("invalid logging sample_rate - %s" % str(e))
+
+    for _handler in root_logger.handlers:
+        if log_format == "json":
+            _handler.setFormatter(JsonFormatter())
+        if sampling_filter is not None:
+            _handler.addFilter(sampling_filter)
+
+    if sampling_filter is not None:
+        logging.info(
+            "logging %.1f%% of the DEBUG and INFO lines", 100 * sample_rate
+        )
+
+
 def run(args, config):
     # set up database connection
     db_logger = logging.getLogger()
@@ -215,15 +401,41 @@ def run(args, config):
     if intxn_table_mappings is None:
         error("table mappings are not defined")
 
+    prepare_statements = config.getboolean(
+        "tag2domain",
+        "prepare_statements",
+        fallback=False
+    )
+    if prepare_statements:
+        logging.info("using prepared statements for the intersection tables")
+    pipeline_writes = config.getboolean(
+        "tag2domain",
+        "pipeline_writes",
+        fallback=False
+    )
+    if pipeline_writes:
+        logging.info("sending the writes of a measurement in one message")
     try:
         db_adapter = Psycopg2Adapter(
             db_pars,
             intxn_table_mappings,
-            logger=db_logger
+            logger=db_logger,
+            prepare_statements=prepare_statements,
+            pipeline_writes=pipeline_writes
         )
     except py_tag2domain.exceptions.AdapterConnectionException as e:
         error("could not connect to database - %s" % str(e))
 
+    if args.rebuild_open_tag_counts:
+        logging.info("rebuilding open tag counts")
+        try:
+            db_adapter.rebuild_open_tag_counts()
+            db_adapter.commit()
+        except py_tag2domain.exceptions.AdapterDBError as e:
+            error("could not rebuild open tag counts - %s" % str(e))
+        logging.info("finished rebuilding open tag counts")
+        return
+
     # create MeasruementToTags object
     msm2tags_logger = logging.getLogger()
     max_measurement_age_int = config.getint(
@@ -246,10 +458,54 @@ def run(args, config):
                 max_measurement_age_int
             )
         )
+    update_change_watermark = config.getboolean(
+        "tag2domain",
+        "update_change_watermark",
+        fallback=False
+    )
+    if update_change_watermark:
+        logging.info("updating change watermark on tag changes")
+    maintain_open_tag_counts = config.getboolean(
+        "tag2domain",
+        "maintain_open_tag_counts",
+        fallback=False
+    )
+    if maintain_open_tag_counts:
+        logging.info("maintaining open tag counts")
+    summarize_logging = config.getboolean(
+        "logging",
+        "summarize",
+        fallback=False
+    )
+
+    # metrics are served over HTTP if the metrics section is present
+    metrics = None
+    if config.has_section("metrics"):
+        metrics = IngestMetrics()
+        try:
+            metrics.start_http_server(
+                config.getint("metrics", "port", fallback=9100),
+                addr=config.get("metrics", "addr", fallback="0.0.0.0")
+            )
+        except OSError as e:
+            error("could not start metrics server - %s" % str(e))
+
+    # tag changes are only published if the change_feed section is present
+    change_feed = None
+    if config.has_section("change_feed"):
+        change_feed = setup_change_feed(config, db_adapter)
+        # events left in the outbox by a previous run
+        change_feed.publish()
+
     msm2tags = MeasurementToTags(
         db_adapter,
         logger=msm2tags_logger,
-        max_measurement_age=max_measurement_age
+        max_measurement_age=max_measurement_age,
+        update_change_watermark=update_change_watermark,
+        maintain_open_tag_counts=maintain_open_tag_counts,
+        metrics=metrics,
+        summarize_logging=summarize_logging,
+        change_feed=change_feed
     )
 
     def msm_handler(msm):
@@ -267,9 +523,27 @@ def run(args, config):
 
         return True, result
 
-    msm_looper = get_msm_looper(args, config, msm_handler)
+    msm_looper = get_msm_looper(
+        args,
+        config,
+        msm_handler,
+        result_handler=(
+            change_feed.handle_result if change_feed is not None else None
+        ),
+        metrics=metrics
+    )
 
-    msm_looper.loop()
+    # profiling is only set up if the profiling section is present, without
+    # a running session the message handler is not wrapped
+    if config.has_section("profiling"):
+        setup_profiling(config, msm_looper)
+
+    try:
+        msm_looper.loop()
+    finally:
+        if change_feed is not None:
+            change_feed.publish()
+            change_feed.close()
 
     logging.info("all measurements consumed - exiting")
 
@@ -307,6 +581,13 @@ if __name__ == '__main__':
         action="store_true"
     )
 
+    input_group.add_argument(
+        "--rebuild-open-tag-counts",
+        action="store_true",
+        help="recalculate the open_tag_counts table from the intersection "
+             "tables and exit"
+    )
+
     logging.basicConfig(level=logging.INFO)
 
     args = parser.parse_args()
@@ -321,11 +602,6 @@ if __name__ == '__main__':
     except Exception as e:
         error("could not read config file - %s" % (str(e)))
 
-    loglevel_str = config.get("logging", "level", fallback="info").lower()
-    try:
-        loglevel = LOG_LEVELS[loglevel_str]
-    except KeyError:
-        error("unknown logging level '%s' configured" % loglevel_str)
-    logging.getLogger().setLevel(loglevel)
+    setup_logging(config)
 
     run(args, config)
@@ -0,0 +1,311 @@
+from __future__ import print_function
+import os
+import json
+import time
+import logging
+
+import kafka
+
+# changes of MeasurementToTags.handle_measurement that are published
+CHANGE_TYPES = ("insert", "prolong", "end")
+DEFAULT_CHANGE_TYPES = ("insert", "end")
+
+
+class FileChangeSink(object):
+    """
+    Appends the change events to a local file, one JSON object per line.
+    Meant for testing and for consumers on the same host, e.g.
+
+        tail -F changes.jsonl | ...
+    """
+    def __init__(self, path, fsync=False):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        path - str
+            file the events are appended to. It is created if it does not
+            exist.
+        fsync - bool
+            if set, every batch is synced to disk before write returns
+        """
+        self.path = path
+        self.fsync = fsync
+        self.f = open(path, "a", encoding="utf-8")
+
+    def write(self, events):
+        self.f.write("".join(
+            json.dumps(_event, sort_keys=True) + "\n" for _event in events
+        ))
+        self.f.flush()
+        if self.fsync:
+            os.fsync(self.f.fileno())
+
+    def close(self):
+        self.f.close()
+
+
+class KafkaChangeSink(object):
+    """
+    Sends the change events to a Kafka topic as JSON encoded messages. The
+    messages are keyed by tag type and tagged ID, so that the events of an
+    entity end up in the same partition and stay in order.
+    """
+    def __init__(self, topic, bootstrap_servers, client_id=None, timeout=30):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        topic - str
+            topic the events are sent to
+        bootstrap_servers - str or list of str
+            Kafka servers to connect to
+        client_id - str or None
+            client ID of the producer
+        timeout - float
+            seconds to wait for the acknowledgement of a batch
+
+        Raises
+        ------
+        kafka.errors.KafkaError
+            if the producer could not be created
+        """
+        self.topic = topic
+        self.timeout = timeout
+        kwargs = dict(
+            bootstrap_servers=bootstrap_servers,
+            acks="all",
+            key_serializer=lambda x: x.encode("utf-8"),
+            value_serializer=lambda x: json.dumps(
+                x, sort_keys=True
+            ).encode("utf-8")
+        )
+        if client_id is not None:
+            kwargs["client_id"] = client_id
+        self.producer = kafka.KafkaProducer(**kwargs)
+
+    def write(self, events):
+        futures = [
+            self.producer.send(
+                self.topic,
+                key="%s:%i" % (_event["tag_type"], _event["tagged_id"]),
+                value=_event
+            )
+            for _event in events
+        ]
+        self.producer.flush(timeout=self.timeout)
+        # raises the error of the first message that could not be sent
+        for _future in futures:
+            _future.get(timeout=self.timeout)
+
+    def close(self):
+        self.producer.close(timeout=self.timeout)
+
+
+class ChangeFeedPublisher(object):
+    """
+    Publishes the intersection changes applied by
+    MeasurementToTags.handle_measurement, so that downstream systems do not
+    have to poll the API for changes.
+
+    Delivery is at least once: MeasurementToTags writes the events of a
+    measurement to the change_outbox table in the same transaction as its
+    tag changes (see MeasurementToTags.change_feed). publish_pending sends
+    the events to the sink in the order they were written and only deletes
+    them after the sink accepted them. Events that could not be published
+    stay in the outbox and are sent again later, so consumers have to
+    expect duplicates and can detect them by event_id. By default only
+    opened (insert) and ended (end) tags are published, prolongs only update
+    measured_at.
+
+    An event looks like this:
+    {
+        "event_id": int,  # ID in the change_outbox table, unique per event
+        "change": str,  # 'insert', 'prolong' or 'end'
+        "tag_type": str,  # 'delegation' or 'domain'
+        "tagged_id": int,  # ID in domain or delegation table
+        "taxonomy_id": int,  # taxonomy ID
+        "tag_id": int,  # tag ID
+        "value_id": int or None,  # value ID
+        "measured_at": str,  # timestamp of the measurement (ISO 8601), this
+                             # is the start or end time of the tag
+        "producer": str,  # producer of the measurement
+        "measurement_id": str or None  # ID of the measurement
+    }
+    """
+    def __init__(
+        self,
+        sink,
+        db_adapter,
+        change_types=DEFAULT_CHANGE_TYPES,
+        batch_size=1000,
+        retry_interval=10.0,
+        logger=logging.getLogger()
+    ):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        sink - FileChangeSink, KafkaChangeSink
+            object with a write(events) method that raises if the events
+            could not be written
+        db_adapter - Psycopg2Adapter, InMemoryAdapter
+            adapter whose change outbox is published. It is committed by
+            publish_pending.
+        change_types - iterable of str
+            changes that are published, a subset of CHANGE_TYPES
+        batch_size - int
+            maximum number of events written to the sink at once
+        retry_interval - float
+            minimum time in seconds between two attempts to publish events
+            that are left in the outbox by a failed publish
+        logger - logging.Logger
+            Logger used for logging
+        """
+        change_types = tuple(change_types)
+        for _change_type in change_types:
+            if _change_type not in CHANGE_TYPES:
+                raise ValueError("unknown change type '%s'" % _change_type)
+        if batch_size < 1:
+            raise ValueError("batch_size must be positive")
+        self.sink = sink
+        self.db_adapter = db_adapter
+        self.change_types = change_types
+        self.batch_size = batch_size
+        self.retry_interval = retry_interval
+        self.logger = logger
+        # set if events were left in the outbox by a failed publish
+        self._retry_pending = False
+        self._last_attempt = None
+
+    def events(self, msm, result):
+        """
+        Returns the events for the result of handle_measurement of the
+        measurement msm. The event_id is assigned by the change outbox.
+        """
+        events = []
+        for _change_type in self.change_types:
+            for _tag_state in result["tag_changes"][_change_type]:
+                events.append({
+                    "change": _change_type,
+                    "tag_type": result["tag_type"],
+                    "tagged_id": result["tagged_id"],
+                    "taxonomy_id": result["taxonomy_id"],
+                    "tag_id": _tag_state.tag_id,
+                    "value_id": _tag_state.value_id,
+                    "measured_at": result["measured_at"].isoformat(),
+                    "producer": msm.get("producer"),
+                    "measurement_id": msm.get("measurement_id")
+                })
+        return events
+
+    def publish_pending(self):
+        """
+        Writes the events of the change outbox to the sink, batch_size events
+        at a time. Each batch is deleted from the outbox after the sink
+        accepted it.
+
+        Raises
+        ------
+        AdapterDBError
+            if the outbox could not be read or updated
+        Exception
+            any error of the sink. The events of the failed batch stay in
+            the outbox.
+
+        Return
+        ------
+        int - number of published events
+        """
+        n_events = 0
+        while True:
+            try:
+                rows = self.db_adapter.fetch_change_events(self.batch_size)
+                if len(rows) == 0:
+                    self.db_adapter.commit()
+                    break
+                self.sink.write([
+                    dict(_event, event_id=_event_id)
+                    for _event_id, _event in rows
+                ])
+                self.db_adapter.delete_change_events(
+                    [_event_id for _event_id, _ in rows]
+                )
+                self.db_adapter.commit()
+            except Exception:
+                self.db_adapter.rollback()
+                raise
+            n_events += len(rows)
+        if n_events > 0:
+            self.logger.debug("published %i tag changes", n_events)
+        return n_events
+
+    def publish(self):
+        """
+        Like publish_pending but logs errors instead of raising them. The
+        events that could not be published are sent with the next call.
+
+        Return
+        ------
+        int - number of published events
+        """
+        self._last_attempt = time.time()
+        try:
+            n_events = self.publish_pending()
+        except Exception as e:
+            self.logger.warning(
+                "could not publish tag changes, retrying in %s s - %s",
+                self.retry_interval,
+                str(e)
+            )
+            self._retry_pending = True
+            return 0
+        self._retry_pending = False
+        return n_events
+
+    def handle_result(self, success, msm, result):
+        """
+        Publishes the pending changes after a measurement was handled. Can
+        be used as result_handler of the loopers of msm2tag2domain.
+
+        The outbox is only read if the measurement wrote events to it, or if
+        events were left there by a failed publish and the last attempt is
+        at least retry_interval seconds ago. Measurements that only prolong
+        tags (unless prolongs are published) or are skipped do not cost a
+        round trip to the DB.
+
+        Parameters
+        ----------
+        success - bool
+            whether the measurement was handled successfully
+        msm - dict
+            the measurement
+        result - dict or None
+            return value of MeasurementToTags.handle_measurement, None if the
+            measurement was skipped
+
+        Return
+        ------
+        int - number of published events
+        """
+        wrote_events = (
+            success
+            and result is not None
+            and any(
+                len(result["tag_changes"][_change_type]) > 0
+                for _change_type in self.change_types
+            )
+        )
+        retry_due = self._retry_pending and (
+            self._last_attempt is None
+            or time.time() - self._last_attempt >= self.retry_interval
+        )
+        if not wrote_events and not retry_due:
+            return 0
+        return self.publish()
+
+    def close(self):
+        self.sink.close()
@@ -5,6 +5,9 @@ import psycopg2
 import psycopg2.extras
 import json
 import copy
+import re
+import hashlib
+import weakref
 
 from .exceptions import (
     AdapterConnectionException,
@@ -13,6 +16,24 @@ from .exceptions import (
 )
 
 from .db_statements import db_statements as db_stmts
+from .logging_util import lazy_join
+
+# compiled statements that are prepared on the server if prepare_statements
+# is set. These are executed for every measurement.
+PREPARED_STATEMENTS = (
+    "get_open_tags",
+    "get_all_tags",
+    "insert_intersections",
+    "prolong_intersections_no_value",
+    "prolong_intersections_w_value",
+    "end_intersection_no_value",
+    "end_intersection_w_value"
+)
+
+# connection -> (backend PID, names of the statements prepared on it).
+# Prepared statements belong to the server session, so this is shared by all
+# adapters that use the same connection.
+_prepared_statements = weakref.WeakKeyDictionary()
 
 
 class Psycopg2Adapter(object):
@@ -40,6 +61,39 @@ class Psycopg2Adapter(object):
             compiled[type] = _stmts
         return compiled
 
+    @classmethod
+    def to_prepared(cls, stmt):
+        """
+        Converts a compiled statement with psycopg2 placeholders into a
+        PREPARE statement and the EXECUTE statement that runs it with the
+        same parameters.
+
+        The name of the prepared statement is derived from the SQL, so
+        adapters with different table mappings can share a connection.
+
+        Return
+        ------
+        (str, str, str) - name, PREPARE statement, EXECUTE statement
+        """
+        n_params = [0]
+
+        def _to_positional(match):
+            if match.group(1) == "%":
+                return "%"
+            n_params[0] += 1
+            return "$%i" % n_params[0]
+
+        sql = re.sub(r"%(%|s)", _to_positional, stmt)
+        name = "tag2domain_%s" % hashlib.md5(sql.encode()).hexdigest()[:16]
+        prepare_stmt = "PREPARE %s AS %s" % (name, sql)
+        if n_params[0] == 0:
+            execute_stmt = "EXECUTE %s" % name
+        else:
+            execute_stmt = "EXECUTE %s (%s)" % (
+                name, ", ".join(["%s"] * n_params[0])
+            )
+        return name, prepare_stmt, execute_stmt
+
     @classmethod
     def to_psycopg_args(cls, config):
         if config is None:
@@ -66,7 +120,9 @@ class Psycopg2Adapter(object):
         self,
         connect_params,
         tag_type_intxn_table_mappings,
-        logger=logging.getLogger()
+        logger=logging.getLogger(),
+        prepare_statements=False,
+        pipeline_writes=False
     ):
         """
         Constructor
@@ -77,6 +133,19 @@ class Psycopg2Adapter(object):
             database connection string, dict of parameters or connection object
         logger - logging.Logger
             Logger used for logging
+        prepare_statements - bool
+            if set, the statements in PREPARED_STATEMENTS are prepared on the
+            server the first time they are used on a connection and are
+            executed as prepared statements afterwards. This saves parsing
+            and planning but does not work with connection poolers that
+            reset the server session between transactions.
+        pipeline_writes - bool
+            if set, the statements that write intersections, open tag counts
+            and the change watermark are not sent right away but together
+            before the next statement or on commit. A measurement then sends
+            all its writes in a single message. Errors in these statements
+            are only raised by the next call that talks to the database, as
+            an AdapterDBError that names the failed statement.
 
         Raises
         ------
@@ -88,6 +157,16 @@ class Psycopg2Adapter(object):
             self.tag_type_intxn_table_mappings
         )
         self.tag_types = list(self.tag_type_intxn_table_mappings.keys())
+        self.prepare_statements = prepare_statements
+        self.prepared_db_statements = {
+            _type: {
+                _name: self.__class__.to_prepared(_stmts[_name])
+                for _name in PREPARED_STATEMENTS
+            }
+            for _type, _stmts in self.compiled_db_statements.items()
+        } if prepare_statements else None
+        self.pipeline_writes = pipeline_writes
+        self._pending_writes = []
 
         self.connect_params = connect_params
         self.logger = logger
@@ -114,6 +193,85 @@ class Psycopg2Adapter(object):
 
         self.db_cursor = self.db_connection.cursor()
 
+    def _execute(self, query, vars=None):
+        """
+        Executes query on the cursor of the adapter. Pending writes (see
+        pipeline_writes) are sent ahead of query, so that errors in them are
+        not reported against query.
+
+        Raises
+        ------
+        AdapterDBError
+            if one of the pending writes failed
+        """
+        self._flush_writes()
+        self.db_cursor.execute(query, vars)
+
+    def _execute_batch(self, query, vars_list, name):
+        """
+        Executes query once for every entry of vars_list, or defers the
+        statements until the next statement or commit if pipeline_writes is
+        set. name identifies the statement in errors.
+        """
+        if self.pipeline_writes:
+            self._pending_writes.extend(
+                (name, self.db_cursor.mogrify(query, _vars))
+                for _vars in vars_list
+            )
+        else:
+            psycopg2.extras.execute_batch(self.db_cursor, query, vars_list)
+
+    def _flush_writes(self):
+        """
+        Sends the pending writes to the server in a single message.
+
+        Raises
+        ------
+        AdapterDBError
+            if one of the writes failed. The transaction has to be rolled
+            back afterwards.
+        """
+        if len(self._pending_writes) == 0:
+            return
+        writes = self._pending_writes
+        self._pending_writes = []
+        try:
+            self.db_cursor.execute(b";".join(
+                [b"SAVEPOINT tag2domain_pipeline"]
+                + [_stmt for (_, _stmt) in writes]
+                + [b"RELEASE SAVEPOINT tag2domain_pipeline"]
+            ))
+        except psycopg2.Error as e:
+            raise AdapterDBError(self._describe_failed_write(writes, e))
+
+    def _describe_failed_write(self, writes, error):
+        """
+        Finds the pending write that caused error by repeating the writes
+        one by one after rolling back to the savepoint set by _flush_writes.
+        The server only reports the error, not which statement of the
+        message failed.
+        """
+        try:
+            self.db_cursor.execute(
+                "ROLLBACK TO SAVEPOINT tag2domain_pipeline"
+            )
+            for name, stmt in writes:
+                try:
+                    self.db_cursor.execute(stmt)
+                except psycopg2.Error as e:
+                    return "pipelined %s statement failed - %s" % (
+                        name, str(e).strip()
+                    )
+            self.db_cursor.execute(
+                "ROLLBACK TO SAVEPOINT tag2domain_pipeline"
+            )
+        except psycopg2.Error as e:
+            self.logger.debug("could not repeat pipelined writes - %s", e)
+        return "pipelined writes (%s) failed - %s" % (
+            ", ".join(sorted(set(_name for (_name, _) in writes))),
+            str(error).strip()
+        )
+
     def is_valid_tag_type(self, tag_type):
         return tag_type in self.tag_types
 
@@ -126,8 +284,45 @@ class Psycopg2Adapter(object):
                 "invalid db statement name - Bad Programmer Error"
             )
 
+        if self.prepare_statements and stmt_name in PREPARED_STATEMENTS:
+            return self._get_prepared_stmt(stmt_name, type)
+
         return self.compiled_db_statements[type][stmt_name]
 
+    def _get_prepared_stmt(self, stmt_name, type):
+        """
+        Prepares the statement on the current connection if necessary and
+        returns the EXECUTE statement.
+        """
+        name, prepare_stmt, execute_stmt = \
+            self.prepared_db_statements[type][stmt_name]
+        try:
+            backend_pid = self.db_connection.get_backend_pid()
+            state = _prepared_statements.get(self.db_connection)
+            if state is None or state[0] != backend_pid:
+                # new connection or new server session - statements prepared
+                # in an earlier session are gone
+                self.db_cursor.execute(
+                    "SELECT name FROM pg_prepared_statements"
+                )
+                state = (
+                    backend_pid,
+                    set(_name for (_name, ) in self.db_cursor.fetchall())
+                )
+                _prepared_statements[self.db_connection] = state
+
+            if name not in state[1]:
+                self.logger.debug(
+                    "preparing %s statement %s as %s", type, stmt_name, name
+                )
+                # prepared statements are not affected by a rollback
+                self.db_cursor.execute(prepare_stmt)
+                state[1].add(name)
+        except psycopg2.Error as e:
+            raise AdapterDBError(str(e))
+
+        return execute_stmt
+
     def fetch_tag_ids(self, taxonomy_id):
         """
         Fetch the available tags under taxonomy with id taxonomy_id
@@ -137,7 +332,7 @@ class Psycopg2Adapter(object):
         dict: tag_name -> tag_id
         """
 
-        self.db_cursor.execute(
+        self._execute(
             "SELECT tag_name,tag_id FROM tags WHERE taxonomy_id = %s",
             [taxonomy_id, ]
         )
@@ -154,6 +349,7 @@ class Psycopg2Adapter(object):
         ------
         List[Dict] - list of taxonomies with DB columns as key
         """
+        self._flush_writes()
         dict_cursor = self.db_connection.cursor(
             cursor_factory=psycopg2.extras.RealDictCursor
         )
@@ -168,6 +364,7 @@ class Psycopg2Adapter(object):
         ------
         List[Dict] - list of tags with DB columns as keys
         """
+        self._flush_writes()
         dict_cursor = self.db_connection.cursor(
             cursor_factory=psycopg2.extras.RealDictCursor
         )
@@ -193,6 +390,7 @@ class Psycopg2Adapter(object):
         if not isinstance(tag_id, int):
             raise ValueError("tag_id must be int")
 
+        self._flush_writes()
         dict_cursor = self.db_connection.cursor(
             cursor_factory=psycopg2.extras.RealDictCursor
         )
@@ -221,6 +419,7 @@ class Psycopg2Adapter(object):
         ------
         List[Dict] - list of tags with DB columns as keys
         """
+        self._flush_writes()
         dict_cursor = self.db_connection.cursor(
             cursor_factory=psycopg2.extras.RealDictCursor
         )
@@ -241,7 +440,7 @@ class Psycopg2Adapter(object):
         list : int
             List of tag IDs that are open
         """
-        self.db_cursor.execute(
+        self._execute(
             self.get_compiled_stmt("get_open_tags", type),
             [id_, taxonomy_id]
         )
@@ -267,7 +466,7 @@ class Psycopg2Adapter(object):
         list : int
             List of tag IDs that are open
         """
-        self.db_cursor.execute(
+        self._execute(
             self.get_compiled_stmt("get_all_tags", type),
             [id_, taxonomy_id]
         )
@@ -320,9 +519,7 @@ class Psycopg2Adapter(object):
             stmt = self.get_compiled_stmt("insert_intersections", type)
             params = []
             for _tag in tag_list:
-                self.logger.debug("Inserting %s intersection %s" % (
-                    type, str(_tag)
-                ))
+                self.logger.debug("Inserting %s intersection %s", type, _tag)
                 params.append((
                     id_,
                     _tag["tag_id"],
@@ -336,11 +533,7 @@ class Psycopg2Adapter(object):
                     producer
                 ))
 
-            psycopg2.extras.execute_batch(
-                self.db_cursor,
-                stmt,
-                params
-            )
+            self._execute_batch(stmt, params, "%s insert_intersections" % type)
 
         except psycopg2.Error as e:
             raise AdapterDBError(str(e))
@@ -372,9 +565,9 @@ class Psycopg2Adapter(object):
         for _tag in tag_list:
             if _tag["value_id"] is None:
                 self.logger.debug(
-                    "prolonging %s intersection %s with value_id null" % (
-                        type, str(_tag)
-                    )
+                    "prolonging %s intersection %s with value_id null",
+                    type,
+                    _tag
                 )
                 params_no_value.append(
                     (
@@ -386,9 +579,7 @@ class Psycopg2Adapter(object):
                     )
                 )
             else:
-                self.logger.debug("prolonging %s intersection %s" % (
-                    type, str(_tag)
-                ))
+                self.logger.debug("prolonging %s intersection %s", type, _tag)
                 params_w_value.append(
                     (
                         timestamp,  # measured_at
@@ -400,16 +591,16 @@ class Psycopg2Adapter(object):
                     )
                 )
         try:
-            psycopg2.extras.execute_batch(
-                self.db_cursor,
+            self._execute_batch(
                 stmt_no_value,
-                params_no_value
+                params_no_value,
+                "%s prolong_intersections_no_value" % type
             )
 
-            psycopg2.extras.execute_batch(
-                self.db_cursor,
+            self._execute_batch(
                 stmt_w_value,
-                params_w_value
+                params_w_value,
+                "%s prolong_intersections_w_value" % type
             )
         except psycopg2.Error as e:
             raise AdapterDBError(str(e))
@@ -441,9 +632,9 @@ class Psycopg2Adapter(object):
         for _tag in tag_list:
             if _tag["value_id"] is None:
                 self.logger.debug(
-                    "ending %s intersection %s with value_id null" % (
-                        type, str(_tag)
-                    )
+                    "ending %s intersection %s with value_id null",
+                    type,
+                    _tag
                 )
                 params_no_value.append(
                     (
@@ -457,9 +648,7 @@ class Psycopg2Adapter(object):
                     )
                 )
             else:
-                self.logger.debug("ending %s intersection %s" % (
-                    type, str(_tag)
-                ))
+                self.logger.debug("ending %s intersection %s", type, _tag)
                 params_w_value.append(
                     (
                         timestamp,  # measured_at
@@ -474,16 +663,16 @@ class Psycopg2Adapter(object):
                 )
 
         try:
-            psycopg2.extras.execute_batch(
-                self.db_cursor,
+            self._execute_batch(
                 stmt_no_value,
-                params_no_value
+                params_no_value,
+                "%s end_intersection_no_value" % type
             )
 
-            psycopg2.extras.execute_batch(
-                self.db_cursor,
+            self._execute_batch(
                 stmt_w_value,
-                params_w_value
+                params_w_value,
+                "%s end_intersection_w_value" % type
             )
         except psycopg2.Error as e:
             raise AdapterDBError(str(e))
@@ -504,8 +693,8 @@ class Psycopg2Adapter(object):
         InconsistentTaxonomyException
             found multiple taxonomies with the same name
         """
-        self.logger.debug("fetching taxonomy by ID %i" % taxonomy_id)
-        self.db_cursor.execute(
+        self.logger.debug("fetching taxonomy by ID %i", taxonomy_id)
+        self._execute(
             """
                 SELECT
                     id,
@@ -527,7 +716,7 @@ class Psycopg2Adapter(object):
             )
 
         (id, allows_auto_tags, allows_auto_values) = rows[0]
-        self.logger.debug("found taxonomy with id %i" % taxonomy_id)
+        self.logger.debug("found taxonomy with id %i", taxonomy_id)
         return {
             "id": id,
             "allows_auto_tags": allows_auto_tags,
@@ -550,8 +739,8 @@ class Psycopg2Adapter(object):
         InconsistentTaxonomyException
             found multiple taxonomies with the same name
         """
-        self.logger.debug("fetching taxonomy by name %s" % taxonomy_name)
-        self.db_cursor.execute(
+        self.logger.debug("fetching taxonomy by name %s", taxonomy_name)
+        self._execute(
             """
                 SELECT
                     id,
@@ -573,7 +762,7 @@ class Psycopg2Adapter(object):
             )
 
         (id, allows_auto_tags, allows_auto_values) = rows[0]
-        self.logger.debug("found taxonomy with id %i" % id)
+        self.logger.debug("found taxonomy with id %i", id)
         return {
             "id": id,
             "allows_auto_tags": allows_auto_tags,
@@ -599,18 +788,21 @@ class Psycopg2Adapter(object):
 
         if len(tag_id_list) == 0:
             self.logger.debug(
-                "checking empty tag_id_list exist on taxonomy %i" % taxonomy_id
+                "checking empty tag_id_list exist on taxonomy %i",
+                taxonomy_id
             )
             return
         else:
-            self.logger.debug("checking tag_ids %s exist in taxonomy %i" % (
-                ', '.join(list(map(str, tag_id_list))), taxonomy_id
-            ))
+            self.logger.debug(
+                "checking tag_ids %s exist in taxonomy %i",
+                lazy_join(tag_id_list),
+                taxonomy_id
+            )
 
         not_found_ids = []
 
         for _id in tag_id_list:
-            self.db_cursor.execute(
+            self._execute(
                 """
                 SELECT
                     tag_id
@@ -624,10 +816,10 @@ class Psycopg2Adapter(object):
             )
             _found_ids = self.db_cursor.fetchall()
             if len(_found_ids) == 0:
-                self.logger.debug("could not find tag ID %i" % _id)
+                self.logger.debug("could not find tag ID %i", _id)
                 not_found_ids.append(_id)
             elif len(_found_ids) == 1:
-                self.logger.debug("found tag ID %i" % _id)
+                self.logger.debug("found tag ID %i", _id)
             elif len(_found_ids) > 1:
                 raise InconsistentTaxonomyException(
                     "multiple tags with the same ID in the same taxonomy found"
@@ -659,14 +851,16 @@ class Psycopg2Adapter(object):
         """
         if len(tag_name_list) == 0:
             self.logger.debug(
-                "checking empty tag_name_list exist "
-                "on taxonomy %i" % taxonomy_id
+                "checking empty tag_name_list exist on taxonomy %i",
+                taxonomy_id
             )
             return {}
         else:
-            self.logger.debug("looking for tags %s in taxonomy %i" % (
-                ', '.join(map(str, tag_name_list)), taxonomy_id
-            ))
+            self.logger.debug(
+                "looking for tags %s in taxonomy %i",
+                lazy_join(tag_name_list),
+                taxonomy_id
+            )
 
         sql = (
             """
@@ -678,7 +872,7 @@ class Psycopg2Adapter(object):
             """ % ','.join(["%s"] * len(tag_name_list))
         )
 
-        self.db_cursor.execute(sql, [taxonomy_id, ] + tag_name_list)
+        self._execute(sql, [taxonomy_id, ] + tag_name_list)
 
         tag_ids_db = defaultdict(list)
         for _tag_name, _tag_id in self.db_cursor.fetchall():
@@ -688,14 +882,14 @@ class Psycopg2Adapter(object):
         for _tag_name in tag_name_list:
             _found_ids = tag_ids_db[_tag_name]
             if len(_found_ids) == 0:
-                self.logger.debug(
-                    "could not find tag with name %s" % _tag_name
-                )
+                self.logger.debug("could not find tag with name %s", _tag_name)
                 tag_ids[_tag_name] = None
             elif len(_found_ids) == 1:
                 _tag_id = _found_ids[0]
                 self.logger.debug(
-                    "found tag with name %s under ID %i" % (_tag_name, _tag_id)
+                    "found tag with name %s under ID %i",
+                    _tag_name,
+                    _tag_id
                 )
                 tag_ids[_tag_name] = _tag_id
             elif len(_found_ids) > 1:
@@ -725,14 +919,15 @@ class Psycopg2Adapter(object):
             )
             return
         else:
-            self.logger.debug("checking value_ids %s exist" % (
-                ', '.join(map(str, value_id_list))
-            ))
+            self.logger.debug(
+                "checking value_ids %s exist",
+                lazy_join(value_id_list)
+            )
 
         not_found_ids = []
 
         for _tag_id, _value_id in value_id_list:
-            self.db_cursor.execute(
+            self._execute(
                 """
                 SELECT
                     id
@@ -747,14 +942,16 @@ class Psycopg2Adapter(object):
             _found_ids = self.db_cursor.fetchall()
             if len(_found_ids) == 0:
                 self.logger.debug(
-                    "could not find value ID %i for "
-                    "tag ID %i" % (_value_id, _tag_id)
+                    "could not find value ID %i for tag ID %i",
+                    _value_id,
+                    _tag_id
                 )
                 not_found_ids.append((_tag_id, _value_id))
             elif len(_found_ids) == 1:
                 self.logger.debug(
-                    "found value ID %i for "
-                    "tag ID %i" % (_value_id, _tag_id)
+                    "found value ID %i for tag ID %i",
+                    _value_id,
+                    _tag_id
                 )
             elif len(_found_ids) > 1:
                 raise InconsistentTaxonomyException(
@@ -790,9 +987,7 @@ class Psycopg2Adapter(object):
             )
             return {}
         else:
-            self.logger.debug("looking for values %s" % (
-                ', ' % list(map(str, value_list))
-            ))
+            self.logger.debug("looking for values %s", lazy_join(value_list))
 
         sql = (
             """
@@ -811,7 +1006,7 @@ class Psycopg2Adapter(object):
             for value in _tuples
         ]
 
-        self.db_cursor.execute(sql, params)
+        self._execute(sql, params)
 
         db_value_ids = defaultdict(list)
         for _tag_id, _value, _id in self.db_cursor.fetchall():
@@ -822,16 +1017,15 @@ class Psycopg2Adapter(object):
         for _tag_id, _value in value_list:
             _found_ids = db_value_ids[(_tag_id, _value)]
             if len(_found_ids) == 0:
-                self.logger.debug("could not find value %s" % _value)
+                self.logger.debug("could not find value %s", _value)
                 value_ids[(_tag_id, _value)] = None
             elif len(_found_ids) == 1:
                 _value_id = _found_ids[0]
                 self.logger.debug(
-                    "found value %s for tag ID %i under value ID %i" % (
-                        _value,
-                        _tag_id,
-                        _value_id
-                    )
+                    "found value %s for tag ID %i under value ID %i",
+                    _value,
+                    _tag_id,
+                    _value_id
                 )
                 value_ids[(_tag_id, _value)] = _value_id
             elif len(_found_ids) > 1:
@@ -883,7 +1077,7 @@ class Psycopg2Adapter(object):
                                      "tag definition" % str(e))
         try:
             for _tag in tag_list_of_lists:
-                self.db_cursor.execute(
+                self._execute(
                     """
                     INSERT INTO tags
                         (tag_name, tag_description, taxonomy_id, extras)
@@ -939,11 +1133,12 @@ class Psycopg2Adapter(object):
                 )
         try:
             for _value in value_list_of_lists:
-                self.logger.debug("inserting value '%s' for tag %i" % (
+                self.logger.debug(
+                    "inserting value '%s' for tag %i",
                     _value[0],
                     _value[1]
-                ))
-                self.db_cursor.execute(
+                )
+                self._execute(
                     """
                     INSERT INTO taxonomy_tag_val
                         (value, tag_id) VALUES (%s, %s)
@@ -961,10 +1156,173 @@ class Psycopg2Adapter(object):
 
         return value_ids
 
+    def update_change_watermark(self):
+        """
+        Increase the counter in the change_watermark table.
+
+        Readers that cache query results (e.g. tag2domain-api) compare the
+        counter against the one seen when the result was cached to decide
+        whether the result is still valid. The update becomes visible on
+        commit.
+        """
+        self.logger.debug("updating change watermark")
+        try:
+            self._execute_batch(
+                """
+                UPDATE change_watermark
+                SET
+                    counter = counter + 1,
+                    changed_at = now()
+                """,
+                [None],
+                "update_change_watermark"
+            )
+        except psycopg2.Error as e:
+            raise AdapterDBError(str(e))
+
+    def update_open_tag_counts(self, taxonomy_id, type, deltas):
+        """
+        Adds deltas to the counters in the open_tag_counts table.
+
+        Parameters
+        ----------
+        taxonomy_id - int
+            taxonomy the counters belong to
+        type - str
+            tag type the counters belong to
+        deltas - dict
+            (tag_id, value_id) -> int as returned by
+            py_tag2domain.util.calc_open_tag_count_deltas
+        """
+        if not self.is_valid_tag_type(type):
+            raise ValueError("unknown tag type '%s' encountered" % type)
+
+        if len(deltas) == 0:
+            return
+
+        try:
+            self._execute_batch(
+                """
+                INSERT INTO open_tag_counts
+                    (tag_type, taxonomy_id, tag_id, value_id, entity_count)
+                VALUES (%s, %s, %s, %s, %s)
+                ON CONFLICT
+                    (tag_type, taxonomy_id, COALESCE(tag_id, -1),
+                     COALESCE(value_id, -1))
+                DO UPDATE SET
+                    entity_count =
+                        open_tag_counts.entity_count + EXCLUDED.entity_count
+                """,
+                # rows are updated in a fixed order to avoid deadlocks
+                # between concurrent writers
+                [
+                    (type, taxonomy_id, tag_id, value_id, delta)
+                    for (tag_id, value_id), delta in sorted(
+                        deltas.items(),
+                        key=lambda x: (x[0][0] or -1, x[0][1] or -1)
+                    )
+                ],
+                "%s update_open_tag_counts" % type
+            )
+        except psycopg2.Error as e:
+            raise AdapterDBError(str(e))
+
+    def insert_change_events(self, events):
+        """
+        Writes change events to the change_outbox table, see
+        py_tag2domain.change_feed. The events become visible on commit.
+
+        Parameters
+        ----------
+        events - list of dict
+            JSON serializable events
+        """
+        if len(events) == 0:
+            return
+
+        try:
+            self._execute_batch(
+                "INSERT INTO change_outbox (event) VALUES (%s)",
+                [(psycopg2.extras.Json(_event), ) for _event in events],
+                "insert_change_events"
+            )
+        except psycopg2.Error as e:
+            raise AdapterDBError(str(e))
+
+    def fetch_change_events(self, limit):
+        """
+        Returns the oldest events of the change_outbox table. The rows are
+        locked until the end of the transaction, rows locked by another
+        transaction are skipped.
+
+        Parameters
+        ----------
+        limit - int
+            maximum number of events returned
+
+        Return
+        ------
+        List[Tuple[int, dict]] - (event ID, event) in the order the events
+            were written
+        """
+        try:
+            self._execute(
+                """
+                SELECT id, event
+                FROM change_outbox
+                ORDER BY id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+                """,
+                (limit, )
+            )
+            return [(_row[0], _row[1]) for _row in self.db_cursor.fetchall()]
+        except psycopg2.Error as e:
+            raise AdapterDBError(str(e))
+
+    def delete_change_events(self, event_ids):
+        """
+        Deletes published events from the change_outbox table.
+
+        Parameters
+        ----------
+        event_ids - list of int
+            IDs as returned by fetch_change_events
+        """
+        if len(event_ids) == 0:
+            return
+
+        try:
+            self._execute_batch(
+                "DELETE FROM change_outbox WHERE id = ANY(%s)",
+                [(list(event_ids), )],
+                "delete_change_events"
+            )
+        except psycopg2.Error as e:
+            raise AdapterDBError(str(e))
+
+    def rebuild_open_tag_counts(self):
+        """
+        Recalculates the open_tag_counts table from the intersection tables.
+        The changes become visible on commit.
+        """
+        try:
+            self._execute("DELETE FROM open_tag_counts")
+            for type in self.tag_types:
+                self.logger.info("counting open tags of type '%s'", type)
+                self._execute(
+                    self.get_compiled_stmt("rebuild_open_tag_counts", type),
+                    {"tag_type": type}
+                )
+        except psycopg2.Error as e:
+            raise AdapterDBError(str(e))
+
     def commit(self):
+        self._flush_writes()
         self.db_connection.commit()
 
     def rollback(self):
+        self._pending_writes = []
         self.db_connection.rollback()
 
     def close_connection(self):
@@ -113,3 +113,42 @@ _d["end_intersection_w_value"] = (
         AND (%(end_ts)s IS NULL)
     """
 )
+
+_d["rebuild_open_tag_counts"] = (
+    """
+    INSERT INTO open_tag_counts
+        (tag_type, taxonomy_id, tag_id, value_id, entity_count)
+    SELECT %%(tag_type)s, taxonomy_id, tag_id, value_id, entity_count
+    FROM (
+        SELECT
+            %(taxonomy_id)s AS taxonomy_id,
+            NULL::integer AS tag_id,
+            NULL::integer AS value_id,
+            COUNT(DISTINCT %(id)s) AS entity_count
+        FROM %(table_name)s
+        WHERE (%(end_date)s IS NULL) AND (%(end_ts)s IS NULL)
+        GROUP BY %(taxonomy_id)s
+        UNION ALL
+        SELECT
+            %(taxonomy_id)s,
+            %(tag_id)s,
+            NULL::integer,
+            COUNT(DISTINCT %(id)s)
+        FROM %(table_name)s
+        WHERE (%(end_date)s IS NULL) AND (%(end_ts)s IS NULL)
+        GROUP BY %(taxonomy_id)s, %(tag_id)s
+        UNION ALL
+        SELECT
+            %(taxonomy_id)s,
+            %(tag_id)s,
+            %(value_id)s,
+            COUNT(DISTINCT %(id)s)
+        FROM %(table_name)s
+        WHERE
+            (%(end_date)s IS NULL)
+            AND (%(end_ts)s IS NULL)
+            AND (%(value_id)s IS NOT NULL)
+        GROUP BY %(taxonomy_id)s, %(tag_id)s, %(value_id)s
+    ) AS counts
+    """
+)
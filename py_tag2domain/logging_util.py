@@ -0,0 +1,104 @@
+from __future__ import print_function
+import json
+import random
+import logging
+import datetime
+
+# attributes every LogRecord has, everything else was passed with extra=...
+_RECORD_ATTRIBUTES = frozenset(
+    logging.LogRecord(None, None, "", 0, "", (), None).__dict__.keys()
+) | frozenset(["message", "asctime"])
+
+
+def is_enabled_for(logger, level):
+    """
+    Returns whether logger would emit a record with the given level. logger
+    can also be the logging module, which logs to the root logger.
+    """
+    if logger is logging:
+        logger = logging.getLogger()
+    return logger.isEnabledFor(level)
+
+
+class LazyFormat(object):
+    """
+    Defers an expensive conversion of a log argument until the record is
+    formatted, e.g.
+
+        logger.debug("looking for tags %s", LazyFormat(", ".join, names))
+
+    If the level is disabled, the arguments are never formatted.
+    """
+    __slots__ = ("func", "args", "kwargs")
+
+    def __init__(self, func, *args, **kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+
+    def __str__(self):
+        return str(self.func(*self.args, **self.kwargs))
+
+
+def lazy_join(items, separator=", "):
+    return LazyFormat(lambda: separator.join(map(str, items)))
+
+
+def lazy_json(obj, **kwargs):
+    return LazyFormat(json.dumps, obj, default=str, **kwargs)
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats log records as one JSON object per line. Fields passed with
+    extra=... (e.g. the measurement summary of MeasurementToTags) are added
+    as top level keys.
+    """
+    def format(self, record):
+        entry = {
+            "ts": datetime.datetime.utcfromtimestamp(
+                record.created
+            ).isoformat() + "Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        for _key, _value in record.__dict__.items():
+            if _key not in _RECORD_ATTRIBUTES and not _key.startswith("_"):
+                entry[_key] = _value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Lets through a fraction sample_rate of the records below min_level.
+    Records at or above min_level (by default warnings and errors) are never
+    dropped.
+    """
+    def __init__(self, sample_rate, min_level=logging.WARNING, seed=None):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        sample_rate - float
+            fraction of the records below min_level that are kept, between 0
+            and 1
+        min_level - int
+            records with this level or above are always kept
+        seed - int or None
+            seed of the random generator
+        """
+        super(SamplingFilter, self).__init__()
+        if not 0.0 <= sample_rate <= 1.0:
+            raise ValueError("sample_rate must be between 0 and 1")
+        self.sample_rate = sample_rate
+        self.min_level = min_level
+        self.random = random.Random(seed)
+
+    def filter(self, record):
+        if record.levelno >= self.min_level:
+            return True
+        return self.random.random() < self.sample_rate
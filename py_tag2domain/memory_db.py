@@ -0,0 +1,953 @@
+from __future__ import print_function
+import json
+import logging
+import copy
+from collections import OrderedDict, defaultdict
+
+from .exceptions import (
+    AdapterDBError,
+    InconsistentTaxonomyException
+)
+
+# columns of the intersection rows, named like the keys of the intersection
+# table mappings
+INTXN_FIELDS = (
+    "id",
+    "taxonomy_id",
+    "tag_id",
+    "value_id",
+    "measured_at",
+    "producer",
+    "start_date",
+    "end_date",
+    "start_ts",
+    "end_ts"
+)
+
+TAXONOMY_DEFAULTS = OrderedDict([
+    ("description", None),
+    ("is_actionable", None),
+    ("is_automatically_classifiable", None),
+    ("is_stable", None),
+    ("for_numbers", None),
+    ("for_domains", None),
+    ("url", None)
+])
+
+
+class InMemoryAdapter(object):
+    """
+    Adapter that keeps taxonomies, tags, values and intersections in memory.
+
+    Implements the interface of Psycopg2Adapter that is used by
+    MeasurementToTags with the same return values and errors, so that
+    measurements can be handled without a database, e.g. in tests and to
+    profile MeasurementToTags.
+
+    Changes are recorded in an undo log and are discarded by rollback. Like
+    in PostgreSQL, a failed write (AdapterDBError) aborts the transaction:
+    all following calls raise AdapterDBError until rollback is called, and
+    commit rolls the transaction back. IDs are never reused, even if the
+    transaction that allocated them was rolled back.
+
+    The initial data is added with add_taxonomy, add_tag, add_value and
+    add_intersection, which bypass the transaction and are committed
+    immediately.
+    """
+    def __init__(self, tag_types, logger=logging.getLogger()):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        tag_types - iterable of str
+            valid tag types. A dict of intersection table mappings as passed
+            to Psycopg2Adapter can be given as well, only its keys are used.
+        logger - logging.Logger
+            Logger used for logging
+        """
+        self.tag_types = list(tag_types)
+        self.logger = logger
+
+        self.taxonomies = OrderedDict()
+        self.tags = OrderedDict()
+        self.values = OrderedDict()
+        self.intersections = {_type: [] for _type in self.tag_types}
+        self.change_watermark = 0
+        # (tag_type, taxonomy_id, tag_id, value_id) -> entity_count
+        self.open_tag_counts = defaultdict(int)
+        # event ID -> change event, see py_tag2domain.change_feed
+        self.change_outbox = OrderedDict()
+
+        # indexes
+        self._taxonomy_ids_by_name = {}
+        # (taxonomy_id, tag_name) -> tag_id
+        self._tag_ids_by_name = {}
+        # (tag_id, value) -> list of value IDs, values are not unique
+        self._value_ids_by_value = defaultdict(list)
+        # tag_type -> (id, taxonomy_id) -> list of intersection rows
+        self._intersections_by_id = {
+            _type: defaultdict(list) for _type in self.tag_types
+        }
+
+        self._next_ids = {
+            "taxonomy": 1,
+            "tags": 1,
+            "values": 1,
+            "change_outbox": 1
+        }
+        self._undo_log = []
+        self._aborted = False
+        self._closed = False
+
+    # ------------------------------------------------------------------------
+    # transaction handling
+
+    def _check_transaction(self):
+        if self._closed:
+            raise AdapterDBError("connection already closed")
+        if self._aborted:
+            raise AdapterDBError(
+                "current transaction is aborted, commands ignored until end "
+                "of transaction block"
+            )
+
+    def _fail(self, message):
+        self._aborted = True
+        return AdapterDBError(message)
+
+    def _next_id(self, sequence):
+        _id = self._next_ids[sequence]
+        self._next_ids[sequence] += 1
+        return _id
+
+    def _set_fields(self, row, **fields):
+        old = {_key: row[_key] for _key in fields}
+        row.update(fields)
+        self._undo_log.append(lambda: row.update(old))
+
+    def commit(self):
+        if self._aborted:
+            self.logger.debug("commit of aborted transaction - rolling back")
+            self.rollback()
+            return
+        self._undo_log = []
+
+    def rollback(self):
+        while len(self._undo_log) > 0:
+            self._undo_log.pop()()
+        self._aborted = False
+
+    def close_connection(self):
+        self.rollback()
+        self._closed = True
+
+    # ------------------------------------------------------------------------
+    # initial data
+
+    def add_taxonomy(
+        self,
+        name,
+        allows_auto_tags=False,
+        allows_auto_values=False,
+        taxonomy_id=None,
+        **columns
+    ):
+        """
+        Adds a taxonomy. Further columns of the taxonomy table (e.g.
+        description) can be given as keyword arguments.
+
+        Return
+        ------
+        int - ID of the taxonomy
+        """
+        if name in self._taxonomy_ids_by_name:
+            raise AdapterDBError("taxonomy '%s' already exists" % name)
+        if taxonomy_id is None:
+            taxonomy_id = self._next_id("taxonomy")
+        elif taxonomy_id in self.taxonomies:
+            raise AdapterDBError("taxonomy %i already exists" % taxonomy_id)
+        else:
+            self._next_ids["taxonomy"] = max(
+                self._next_ids["taxonomy"], taxonomy_id + 1
+            )
+
+        row = OrderedDict([("id", taxonomy_id), ("name", name)])
+        row.update(TAXONOMY_DEFAULTS)
+        row.update(columns)
+        row["allows_auto_tags"] = allows_auto_tags
+        row["allows_auto_values"] = allows_auto_values
+        self.taxonomies[taxonomy_id] = row
+        self._taxonomy_ids_by_name[name] = taxonomy_id
+        return taxonomy_id
+
+    def add_tag(self, taxonomy_id, tag_name, tag_description="", extras=None):
+        """
+        Adds a tag to the taxonomy with ID taxonomy_id.
+
+        Return
+        ------
+        int - ID of the tag
+        """
+        return self._insert_tag(
+            tag_name, tag_description, taxonomy_id, extras, undo=False
+        )
+
+    def add_value(self, tag_id, value):
+        """
+        Adds a value to the tag with ID tag_id.
+
+        Return
+        ------
+        int - ID of the value
+        """
+        return self._insert_value(value, tag_id, undo=False)
+
+    def add_intersection(
+        self,
+        type,
+        id_,
+        taxonomy_id,
+        tag_id,
+        start_ts,
+        value_id=None,
+        measured_at=None,
+        end_ts=None,
+        producer=None
+    ):
+        """
+        Adds an intersection. measured_at defaults to start_ts, the dates are
+        derived from start_ts and end_ts.
+        """
+        if not self.is_valid_tag_type(type):
+            raise ValueError("unknown tag type '%s' encountered" % type)
+        self._insert_intersection(
+            type,
+            id_,
+            taxonomy_id,
+            tag_id,
+            value_id,
+            start_ts if measured_at is None else measured_at,
+            start_ts,
+            end_ts,
+            producer,
+            undo=False
+        )
+
+    # ------------------------------------------------------------------------
+    # low level writes
+
+    def _insert_tag(self, tag_name, tag_description, taxonomy_id, extras,
+                    undo=True):
+        if taxonomy_id not in self.taxonomies:
+            raise AdapterDBError(
+                "taxonomy with id '%s' does not exist" % taxonomy_id
+            )
+        if tag_description is None:
+            raise AdapterDBError("tag_description must not be null")
+        key = (taxonomy_id, tag_name)
+        if key in self._tag_ids_by_name:
+            raise AdapterDBError(
+                "tag '%s' already exists in taxonomy %i" % (
+                    tag_name, taxonomy_id
+                )
+            )
+
+        tag_id = self._next_id("tags")
+        self.tags[tag_id] = OrderedDict([
+            ("tag_id", tag_id),
+            ("tag_name", tag_name),
+            ("tag_description", tag_description),
+            ("taxonomy_id", taxonomy_id),
+            # stored as JSON in the DB
+            ("extras", json.loads(json.dumps(extras))
+                if extras is not None else {}),
+            # set by a trigger in the DB
+            ("category", tag_name.rsplit("::", 1)[0] if "::" in tag_name
+                else "")
+        ])
+        self._tag_ids_by_name[key] = tag_id
+
+        if undo:
+            def _undo():
+                del self.tags[tag_id]
+                del self._tag_ids_by_name[key]
+            self._undo_log.append(_undo)
+        return tag_id
+
+    def _insert_value(self, value, tag_id, undo=True):
+        if tag_id not in self.tags:
+            raise AdapterDBError("tag with id '%s' does not exist" % tag_id)
+
+        value_id = self._next_id("values")
+        self.values[value_id] = OrderedDict([
+            ("id", value_id),
+            ("value", value),
+            ("tag_id", tag_id)
+        ])
+        self._value_ids_by_value[(tag_id, value)].append(value_id)
+
+        if undo:
+            def _undo():
+                del self.values[value_id]
+                self._value_ids_by_value[(tag_id, value)].remove(value_id)
+            self._undo_log.append(_undo)
+        return value_id
+
+    def _insert_intersection(
+        self,
+        type,
+        id_,
+        taxonomy_id,
+        tag_id,
+        value_id,
+        measured_at,
+        start_ts,
+        end_ts,
+        producer,
+        undo=True
+    ):
+        if taxonomy_id not in self.taxonomies:
+            raise AdapterDBError(
+                "taxonomy with id '%s' does not exist" % taxonomy_id
+            )
+        if tag_id not in self.tags:
+            raise AdapterDBError("tag with id '%s' does not exist" % tag_id)
+        if value_id is not None and value_id not in self.values:
+            raise AdapterDBError(
+                "value with id '%s' does not exist" % value_id
+            )
+
+        row = {
+            "id": id_,
+            "taxonomy_id": taxonomy_id,
+            "tag_id": tag_id,
+            "value_id": value_id,
+            "measured_at": measured_at,
+            "producer": producer,
+            "start_date": InMemoryAdapter._format_as_date(start_ts),
+            "end_date":
+                InMemoryAdapter._format_as_date(end_ts)
+                if end_ts is not None else None,
+            "start_ts": start_ts,
+            "end_ts": end_ts
+        }
+        rows = self.intersections[type]
+        rows_by_id = self._intersections_by_id[type][(id_, taxonomy_id)]
+        rows.append(row)
+        rows_by_id.append(row)
+
+        if undo:
+            def _undo():
+                rows.remove(row)
+                rows_by_id.remove(row)
+            self._undo_log.append(_undo)
+
+    def _format_as_date(ts):
+        # start_date and end_date are integer columns
+        return int(ts.strftime("%Y%m%d"))
+
+    def _open_intersections(self, type, id_, taxonomy_id):
+        return [
+            _row
+            for _row in self._intersections_by_id[type].get(
+                (id_, taxonomy_id), ()
+            )
+            if _row["end_date"] is None and _row["end_ts"] is None
+        ]
+
+    # ------------------------------------------------------------------------
+    # Psycopg2Adapter interface
+
+    def is_valid_tag_type(self, tag_type):
+        return tag_type in self.tag_types
+
+    def _check_tag_type(self, type):
+        if type not in self.intersections:
+            raise AdapterDBError("unknown intersection type '%s'" % type)
+
+    def fetch_tag_ids(self, taxonomy_id):
+        """
+        Fetch the available tags under taxonomy with id taxonomy_id
+
+        Return
+        -------
+        dict: tag_name -> tag_id
+        """
+        self._check_transaction()
+        return OrderedDict(
+            (_tag["tag_name"], _tag["tag_id"])
+            for _tag in self.tags.values()
+            if _tag["taxonomy_id"] == taxonomy_id
+        )
+
+    def get_taxonomies(self):
+        """
+        Return all taxonomies
+
+        Return
+        ------
+        List[Dict] - list of taxonomies with DB columns as key
+        """
+        self._check_transaction()
+        return [dict(_row) for _row in self.taxonomies.values()]
+
+    def get_taxonomy_tags(self, taxonomy_id):
+        """
+        Return all tags that are found in the given taxonomy.
+
+        Return
+        ------
+        List[Dict] - list of tags with DB columns as keys
+        """
+        self._check_transaction()
+        return [
+            copy.deepcopy(dict(_tag))
+            for _tag in self.tags.values()
+            if _tag["taxonomy_id"] == taxonomy_id
+        ]
+
+    def get_tag_values(self, tag_id):
+        """
+        Return all values associated with the given tag_id.
+
+        Return
+        ------
+        List[Dict] - list of tags with DB columns as keys
+        """
+        if not isinstance(tag_id, int):
+            raise ValueError("tag_id must be int")
+        self._check_transaction()
+        return [
+            dict(_value)
+            for _value in self.values.values()
+            if _value["tag_id"] == tag_id
+        ]
+
+    def get_taxonomy_intersections(self, taxonomy_id, type):
+        """
+        Return all intersections found in taxonomy with ID taxonomy_id that
+        are of type.
+
+        Return
+        ------
+        List[Dict] - list of tags with the keys of the intersection table
+            mappings as keys
+        """
+        self._check_tag_type(type)
+        self._check_transaction()
+        return [
+            dict(_row)
+            for _row in self.intersections[type]
+            if _row["taxonomy_id"] == taxonomy_id
+        ]
+
+    def get_open_tags(self, taxonomy_id, type, id_):
+        """
+        Get open tags (end_date and end_ts NULL) that belong to the taxonomy
+        with ID taxonomy_id from the intersections of tag_type type and that
+        are linked to id id_.
+
+        Return
+        -------
+        list : dict
+            tag_id, value_id, measured_at and producer of the open tags
+        """
+        self._check_tag_type(type)
+        self._check_transaction()
+        return [
+            {
+                "tag_id": _row["tag_id"],
+                "value_id": _row["value_id"],
+                "measured_at": _row["measured_at"],
+                "producer": _row["producer"]
+            }
+            for _row in self._open_intersections(type, id_, taxonomy_id)
+        ]
+
+    def get_all_tags(self, taxonomy_id, type, id_):
+        """
+        Get all tags that belong to the taxonomy with ID taxonomy_id from the
+        intersections of tag_type type and that are linked to id id_.
+
+        Return
+        -------
+        list : dict
+            tag_id, value_id, start_ts, measured_at, end_ts and producer of
+            the tags
+        """
+        self._check_tag_type(type)
+        self._check_transaction()
+        return [
+            {
+                "tag_id": _row["tag_id"],
+                "value_id": _row["value_id"],
+                "start_ts": _row["start_ts"],
+                "measured_at": _row["measured_at"],
+                "end_ts": _row["end_ts"],
+                "producer": _row["producer"]
+            }
+            for _row in self._intersections_by_id[type].get(
+                (id_, taxonomy_id), ()
+            )
+        ]
+
+    def insert_intersections(
+        self,
+        taxonomy_id,
+        timestamp,
+        tag_list,
+        type,
+        id_,
+        producer=None
+    ):
+        """
+        Inserts intersections between entities with id id_ and the tags in
+        tag_list in a given taxonomy.
+        """
+        if producer is not None and not isinstance(producer, str):
+            raise ValueError("expected producer to be a string, got %s" % (
+                str(type(producer))
+            ))
+
+        if not self.is_valid_tag_type(type):
+            raise ValueError("unknown tag type '%s' encountered" % type)
+
+        self._check_transaction()
+        for _tag in tag_list:
+            self.logger.debug("Inserting %s intersection %s", type, _tag)
+            try:
+                self._insert_intersection(
+                    type,
+                    id_,
+                    taxonomy_id,
+                    _tag["tag_id"],
+                    _tag["value_id"],
+                    timestamp,
+                    timestamp,
+                    None,
+                    producer
+                )
+            except AdapterDBError as e:
+                raise self._fail(str(e))
+
+    def _matching_open_intersections(self, taxonomy_id, type, id_, tag):
+        return [
+            _row
+            for _row in self._open_intersections(type, id_, taxonomy_id)
+            if _row["tag_id"] == tag["tag_id"]
+            and _row["value_id"] == tag["value_id"]
+        ]
+
+    def prolong_intersections(
+        self,
+        taxonomy_id,
+        timestamp,
+        tag_list,
+        type,
+        id_,
+        producer=None
+    ):
+        """
+        Prolongs intersections between entities with id id_ and the tags in
+        tag_list in a given taxonomy.
+        """
+        if not self.is_valid_tag_type(type):
+            raise ValueError("unknown tag type '%s' encountered" % type)
+
+        self._check_transaction()
+        for _tag in tag_list:
+            self.logger.debug("prolonging %s intersection %s", type, _tag)
+            for _row in self._matching_open_intersections(
+                taxonomy_id, type, id_, _tag
+            ):
+                self._set_fields(
+                    _row,
+                    measured_at=timestamp,
+                    producer=producer
+                )
+
+    def end_intersections(
+        self,
+        taxonomy_id,
+        timestamp,
+        tag_list,
+        type,
+        id_,
+        producer=None
+    ):
+        """
+        Ends intersections between entities with id id_ and the tags in
+        tag_list in a given taxonomy.
+        """
+        if not self.is_valid_tag_type(type):
+            raise ValueError("unknown tag type '%s' encountered" % type)
+
+        self._check_transaction()
+        for _tag in tag_list:
+            self.logger.debug("ending %s intersection %s", type, _tag)
+            for _row in self._matching_open_intersections(
+                taxonomy_id, type, id_, _tag
+            ):
+                self._set_fields(
+                    _row,
+                    measured_at=timestamp,
+                    end_date=InMemoryAdapter._format_as_date(timestamp),
+                    end_ts=timestamp,
+                    producer=producer
+                )
+
+    def _taxonomy_info(self, row):
+        return {
+            "id": row["id"],
+            "allows_auto_tags": row["allows_auto_tags"],
+            "allows_auto_values": row["allows_auto_values"]
+        }
+
+    def fetch_taxonomy_by_id(self, taxonomy_id):
+        """
+        Return information about the taxonomy with ID taxonomy_id
+
+        Return
+        -------
+        dict - taxonomy information. Has keys 'id', 'is_allows_autotags', and
+                'is_allows_autovalues'
+
+        Raise
+        -----
+        AdapterDBError
+            indicates that taxonomy with that name does not exist
+        """
+        self.logger.debug("fetching taxonomy by ID %i", taxonomy_id)
+        self._check_transaction()
+        if taxonomy_id not in self.taxonomies:
+            raise AdapterDBError(
+                "taxonomy with id '%s' does not exist" % taxonomy_id
+            )
+        return self._taxonomy_info(self.taxonomies[taxonomy_id])
+
+    def fetch_taxonomy_by_name(self, taxonomy_name):
+        """
+        Return information about the taxonomy with name taxonomy_name
+
+        Return
+        -------
+        dict - taxonomy information. Has keys 'id', 'is_allows_autotags', and
+                'is_allows_autovalues'
+
+        Raise
+        -----
+        AdapterDBError
+            indicates that taxonomy with that name does not exist
+        """
+        self.logger.debug("fetching taxonomy by name %s", taxonomy_name)
+        self._check_transaction()
+        if taxonomy_name not in self._taxonomy_ids_by_name:
+            raise AdapterDBError(
+                "taxonomy with name '%s' does not exist" % taxonomy_name
+            )
+        return self._taxonomy_info(
+            self.taxonomies[self._taxonomy_ids_by_name[taxonomy_name]]
+        )
+
+    def check_tag_ids_exist(self, taxonomy_id, tag_id_list):
+        """
+        Check that the given tag_ids exist and are associated with taxonomy_id.
+
+        Raises
+        ------
+        AdapterDBError - indicates that some of the IDs do not exist. The
+                         .missing_ids attribute contains the missing IDs.
+        """
+        self._check_transaction()
+        not_found_ids = [
+            _id
+            for _id in tag_id_list
+            if _id not in self.tags
+            or self.tags[_id]["taxonomy_id"] != taxonomy_id
+        ]
+        if len(not_found_ids) > 0:
+            e = AdapterDBError(
+                "IDs %s not found" % ', '.join(map(str, not_found_ids))
+            )
+            e.missing_ids = not_found_ids
+            raise e
+
+    def fetch_tag_ids_by_name(self, taxonomy_id, tag_name_list):
+        """
+        Return the IDs of the tags in tag_name_list that belong to the
+        taxonomy with ID taxonomy_id.
+
+        If no tag could be found for a given name, the ID returned is None.
+
+        Return
+        -------
+        dict[str->int or None] - dict that maps names to tag IDs
+        """
+        self._check_transaction()
+        return {
+            _tag_name: self._tag_ids_by_name.get((taxonomy_id, _tag_name))
+            for _tag_name in tag_name_list
+        }
+
+    def check_value_ids_exist(self, value_id_list):
+        """
+        Check that the given value IDs exist and are associated with the given
+        tag IDs.
+
+        Parameters
+        ----------
+        value_id_list - List[Tuple[int, int]]
+            list of tag_id, value_id pairs
+
+        Raises
+        ------
+        AdapterDBError - indicates that some of the IDs do not exist. The
+                         .missing_ids attribute contains the missing IDs.
+        """
+        self._check_transaction()
+        not_found_ids = [
+            (_tag_id, _value_id)
+            for _tag_id, _value_id in value_id_list
+            if _value_id not in self.values
+            or self.values[_value_id]["tag_id"] != _tag_id
+        ]
+        if len(not_found_ids) > 0:
+            e = AdapterDBError(
+                "IDs %s not found" % ', '.join(map(str, not_found_ids))
+            )
+            e.missing_ids = not_found_ids
+            raise e
+
+    def fetch_value_ids_by_value(self, value_list):
+        """
+        Return the IDs of the values given in value_list.
+
+        If a value could not be found, None is returned.
+
+        Parameters
+        ----------
+        value_list - List[Tuple[int, str]]
+            list of tag_id, value pairs
+
+        Return
+        -------
+        dict[Tuple[tag_id, value]->int or None] - dict that maps values
+                                                  to value IDs
+        """
+        self._check_transaction()
+        value_ids = {}
+        for _key in value_list:
+            _found_ids = self._value_ids_by_value.get(tuple(_key), [])
+            if len(_found_ids) == 0:
+                value_ids[tuple(_key)] = None
+            elif len(_found_ids) == 1:
+                value_ids[tuple(_key)] = _found_ids[0]
+            else:
+                raise InconsistentTaxonomyException(
+                    "multiple values entries with the same entry and the same "
+                    "tag ID found"
+                )
+        return value_ids
+
+    def insert_tags(self, tag_list):
+        """
+        Insert the tags in tag_list.
+
+        Each tag is given as a dictionary with the structure
+            {
+                "tag_name": <new tag name>,
+                "tag_description": <new tag description>,
+                "taxonomy_id": <ID of the taxonomy the tag belongs to>,
+                "extras": <additional information, optional>
+            }
+
+        Return
+        ------
+        dict[str->int] - maps tag_name to new tag_id
+        """
+        for _tag in tag_list:
+            for _key in ["tag_name", "tag_description", "taxonomy_id"]:
+                if _key not in _tag:
+                    raise AdapterDBError(
+                        "missing field '%s' in tag definition" % repr(_key)
+                    )
+
+        self._check_transaction()
+        tag_ids = {}
+        for _tag in tag_list:
+            try:
+                tag_ids[_tag["tag_name"]] = self._insert_tag(
+                    _tag["tag_name"],
+                    _tag["tag_description"],
+                    _tag["taxonomy_id"],
+                    _tag.get("extras")
+                )
+            except AdapterDBError as e:
+                raise self._fail(str(e))
+        return tag_ids
+
+    def insert_values(self, value_list):
+        """
+        Insert the values in value_list.
+
+        Each tag is given as a dictionary with the structure
+            {
+                "value": <value to insert>,
+                "tag_id": <ID of the tag the value is associated with>
+            }
+
+        Return
+        ------
+        dict[Tuple[str,int]->int] - maps value/tag_id pairs to new value ID
+        """
+        for _value in value_list:
+            for _key in ["value", "tag_id"]:
+                if _key not in _value:
+                    raise AdapterDBError(
+                        "missing field '%s' in value definition" % repr(_key)
+                    )
+
+        self._check_transaction()
+        value_ids = {}
+        for _value in value_list:
+            self.logger.debug(
+                "inserting value '%s' for tag %i",
+                _value["value"],
+                _value["tag_id"]
+            )
+            try:
+                value_ids[(_value["value"], _value["tag_id"])] = \
+                    self._insert_value(_value["value"], _value["tag_id"])
+            except AdapterDBError as e:
+                raise self._fail(str(e))
+        return value_ids
+
+    def update_change_watermark(self):
+        """
+        Increase the change watermark counter.
+        """
+        self.logger.debug("updating change watermark")
+        self._check_transaction()
+        old = self.change_watermark
+
+        def _undo():
+            self.change_watermark = old
+        self.change_watermark += 1
+        self._undo_log.append(_undo)
+
+    def update_open_tag_counts(self, taxonomy_id, type, deltas):
+        """
+        Adds deltas to the open tag counters.
+
+        Parameters
+        ----------
+        taxonomy_id - int
+            taxonomy the counters belong to
+        type - str
+            tag type the counters belong to
+        deltas - dict
+            (tag_id, value_id) -> int as returned by
+            py_tag2domain.util.calc_open_tag_count_deltas
+        """
+        if not self.is_valid_tag_type(type):
+            raise ValueError("unknown tag type '%s' encountered" % type)
+
+        self._check_transaction()
+        for (tag_id, value_id), delta in deltas.items():
+            key = (type, taxonomy_id, tag_id, value_id)
+            self.open_tag_counts[key] += delta
+
+            def _undo(key=key, delta=delta):
+                self.open_tag_counts[key] -= delta
+            self._undo_log.append(_undo)
+
+    def insert_change_events(self, events):
+        """
+        Writes change events to the change outbox.
+
+        Parameters
+        ----------
+        events - list of dict
+            JSON serializable events
+        """
+        self._check_transaction()
+        for _event in events:
+            # events are stored as JSON like in the change_outbox table
+            event_id = self._next_id("change_outbox")
+            self.change_outbox[event_id] = json.loads(json.dumps(_event))
+
+            def _undo(event_id=event_id):
+                del self.change_outbox[event_id]
+            self._undo_log.append(_undo)
+
+    def fetch_change_events(self, limit):
+        """
+        Returns the oldest events of the change outbox.
+
+        Parameters
+        ----------
+        limit - int
+            maximum number of events returned
+
+        Return
+        ------
+        List[Tuple[int, dict]] - (event ID, event) in the order the events
+            were written
+        """
+        self._check_transaction()
+        return [
+            (_event_id, copy.deepcopy(_event))
+            for _event_id, _event in list(self.change_outbox.items())[:limit]
+        ]
+
+    def delete_change_events(self, event_ids):
+        """
+        Deletes published events from the change outbox.
+
+        Parameters
+        ----------
+        event_ids - list of int
+            IDs as returned by fetch_change_events
+        """
+        self._check_transaction()
+        for _event_id in event_ids:
+            event = self.change_outbox.pop(_event_id, None)
+            if event is None:
+                continue
+
+            def _undo(event_id=_event_id, event=event):
+                self.change_outbox[event_id] = event
+                # keep the outbox ordered by event ID
+                for _event_id in sorted(self.change_outbox):
+                    self.change_outbox.move_to_end(_event_id)
+            self._undo_log.append(_undo)
+
+    def rebuild_open_tag_counts(self):
+        """
+        Recalculates the open tag counters from the intersections.
+        """
+        self._check_transaction()
+        old = self.open_tag_counts
+        counts = defaultdict(set)
+        for type, rows in self.intersections.items():
+            for _row in rows:
+                if _row["end_date"] is not None or _row["end_ts"] is not None:
+                    continue
+                taxonomy_id = _row["taxonomy_id"]
+                counts[(type, taxonomy_id, None, None)].add(_row["id"])
+                counts[(type, taxonomy_id, _row["tag_id"], None)].add(
+                    _row["id"]
+                )
+                if _row["value_id"] is not None:
+                    counts[(
+                        type, taxonomy_id, _row["tag_id"], _row["value_id"]
+                    )].add(_row["id"])
+
+        self.open_tag_counts = defaultdict(int, {
+            _key: len(_ids) for _key, _ids in counts.items()
+        })
+
+        def _undo():
+            self.open_tag_counts = old
+        self._undo_log.append(_undo)
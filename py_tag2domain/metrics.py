@@ -0,0 +1,151 @@
+from __future__ import print_function
+import logging
+
+import prometheus_client
+
+# stages of MeasurementToTags.handle_measurement that are timed
+STAGES = (
+    "validate",
+    "prepare_taxonomy",
+    "calculate_changes",
+    "write_changes",
+    "commit"
+)
+
+# outcomes of handling a measurement
+RESULTS = ("ok", "stale", "invalid", "failed")
+
+# buckets in seconds, handling a measurement usually takes a few milliseconds
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+    2.5, 5.0, 10.0
+)
+
+
+class IngestMetrics(object):
+    """
+    Prometheus metrics of the ingest path.
+
+    MeasurementToTags records the duration of each processing stage, the
+    outcome of every measurement and the number of inserted, prolonged and
+    ended intersections. The message rate is the rate of
+    tag2domain_measurements_total. The consumer of a message queue can
+    additionally report its lag.
+    """
+    def __init__(
+        self,
+        registry=prometheus_client.REGISTRY,
+        namespace="tag2domain",
+        logger=logging.getLogger()
+    ):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        registry - prometheus_client.CollectorRegistry
+            registry the metrics are registered with. Metric names must be
+            unique within a registry, so only one IngestMetrics object can be
+            created per registry and namespace.
+        namespace - str
+            prefix of the metric names
+        logger - logging.Logger
+            Logger used for logging
+        """
+        self.registry = registry
+        self.logger = logger
+
+        self.stage_seconds = prometheus_client.Histogram(
+            "ingest_stage_seconds",
+            "Time spent in each stage of handling a measurement",
+            ["stage"],
+            namespace=namespace,
+            buckets=LATENCY_BUCKETS,
+            registry=registry
+        )
+        self.measurement_seconds = prometheus_client.Histogram(
+            "ingest_measurement_seconds",
+            "Time spent handling a measurement",
+            namespace=namespace,
+            buckets=LATENCY_BUCKETS,
+            registry=registry
+        )
+        self.measurements = prometheus_client.Counter(
+            "measurements",
+            "Number of handled measurements by result",
+            ["result"],
+            namespace=namespace,
+            registry=registry
+        )
+        self.tag_changes = prometheus_client.Counter(
+            "intersection_changes",
+            "Number of inserted, prolonged and ended intersections",
+            ["change"],
+            namespace=namespace,
+            registry=registry
+        )
+        self.consumer_lag = prometheus_client.Gauge(
+            "consumer_lag_messages",
+            "Number of messages in the queue that have not been consumed yet",
+            ["topic", "partition"],
+            namespace=namespace,
+            registry=registry
+        )
+
+        # initialize the labelled series so that they are exported from
+        # the start
+        for _stage in STAGES:
+            self.stage_seconds.labels(stage=_stage)
+        for _result in RESULTS:
+            self.measurements.labels(result=_result)
+        for _change in ("insert", "prolong", "end"):
+            self.tag_changes.labels(change=_change)
+
+    def observe_stage(self, stage, seconds):
+        self.stage_seconds.labels(stage=stage).observe(seconds)
+
+    def observe_measurement(self, result, seconds=None):
+        """
+        Counts a handled measurement.
+
+        Parameters
+        ----------
+        result - str
+            one of RESULTS
+        seconds - float or None
+            time it took to handle the measurement. Only recorded for
+            successfully handled measurements.
+        """
+        self.measurements.labels(result=result).inc()
+        if seconds is not None:
+            self.measurement_seconds.observe(seconds)
+
+    def observe_changes(self, changes):
+        """
+        Counts the intersection changes calculated for a measurement.
+
+        Parameters
+        ----------
+        changes - dict
+            keys 'insert', 'prolong', 'end' -> list of tags
+        """
+        for _change, _tags in changes.items():
+            if len(_tags) > 0:
+                self.tag_changes.labels(change=_change).inc(len(_tags))
+
+    def set_consumer_lag(self, topic, partition, lag):
+        self.consumer_lag.labels(topic=topic, partition=str(partition)).set(
+            lag
+        )
+
+    def start_http_server(self, port, addr="0.0.0.0"):
+        """
+        Serves the metrics of the registry on http://<addr>:<port>/ in a
+        background thread.
+        """
+        self.logger.info("serving metrics on %s:%i" % (addr, port))
+        prometheus_client.start_http_server(
+            port,
+            addr=addr,
+            registry=self.registry
+        )
@@ -15,7 +15,12 @@ from py_tag2domain.exceptions import (
     StaleMeasurementException,
     AdapterDBError
 )
-from py_tag2domain.util import parse_timestamp, calc_changes
+from py_tag2domain.util import (
+    parse_timestamp,
+    calc_changes,
+    calc_open_tag_count_deltas
+)
+from py_tag2domain.logging_util import is_enabled_for, lazy_json
 
 DEFAULT_MAX_MEASUREMENT_AGE = None
 
@@ -37,12 +42,34 @@ class MeasurementToTags(object):
         self,
         db_adapter,
         logger=logging,
-        max_measurement_age=DEFAULT_MAX_MEASUREMENT_AGE
+        max_measurement_age=DEFAULT_MAX_MEASUREMENT_AGE,
+        update_change_watermark=False,
+        maintain_open_tag_counts=False,
+        metrics=None,
+        summarize_logging=False,
+        change_feed=None
     ):
         self.db_adapter = db_adapter
         self.logger = logger
         self.msm_schema = MeasurementToTags.load_msm_schema(self.logger)
         self.max_measurement_age = max_measurement_age
+        # if set, the change watermark is increased whenever a measurement
+        # opens or ends a tag or adds tags or values to a taxonomy. This
+        # requires the change_watermark table.
+        self.update_change_watermark = update_change_watermark
+        # if set, the counters in the open_tag_counts table are updated in
+        # the same transaction as the intersections.
+        self.maintain_open_tag_counts = maintain_open_tag_counts
+        # py_tag2domain.metrics.IngestMetrics that records stage durations,
+        # results and intersection changes, or None
+        self.metrics = metrics
+        # if set, a single INFO line summarizes each measurement and the
+        # per tag lines are logged at DEBUG level
+        self.summarize_logging = summarize_logging
+        # py_tag2domain.change_feed.ChangeFeedPublisher whose events are
+        # written to the change_outbox table in the same transaction as the
+        # intersections, or None
+        self.change_feed = change_feed
 
     def handle_measurement(self, msm, skip_validation=False):
         """
@@ -87,30 +114,67 @@ class MeasurementToTags(object):
         dict - contains information about the tag changes triggered by the
             measurement
         """
+        if self.metrics is None:
+            return self._handle_measurement(msm, skip_validation)
+
+        t_start = time.time()
+        try:
+            result = self._handle_measurement(msm, skip_validation)
+        except StaleMeasurementException:
+            self.metrics.observe_measurement("stale")
+            raise
+        except (
+            InvalidMeasurementException,
+            DisallowedTaxonomyModificationException
+        ):
+            self.metrics.observe_measurement("invalid")
+            raise
+        except Exception:
+            self.metrics.observe_measurement("failed")
+            raise
+
+        self.metrics.observe_measurement("ok", time.time() - t_start)
+        self.metrics.observe_changes(result["tag_changes"])
+        return result
+
+    def _finish_stage(self, stage, description, t_start):
+        duration = time.time() - t_start
+        self.logger.debug(
+            "finished %s in %5.3f ms", description, 1000 * duration
+        )
+        if self.metrics is not None:
+            self.metrics.observe_stage(stage, duration)
+
+    def _handle_measurement(self, msm, skip_validation):
         t_start_total = time.time()
 
         self.logger.debug("received measurement")
         if not skip_validation:
             # throws InvalidMeasurementException if msm is invalid
+            _t_start = time.time()
             self.validate_measurement(msm)
+            self._finish_stage("validate", "validating measurement", _t_start)
 
-        self.logger.debug(json.dumps(msm, indent=4))
+        self.logger.debug("%s", lazy_json(msm, indent=4))
 
         msm_timestamp = parse_timestamp(msm["measured_at"])
 
+        received_level = logging.DEBUG if self.summarize_logging \
+            else logging.INFO
         if "measurement_id" in msm:
-            self.logger.info(
-                "received measurement %s:%s measured at %s" % (
-                    msm["producer"],
-                    msm["measurement_id"],
-                    msm["measured_at"]
-                )
+            self.logger.log(
+                received_level,
+                "received measurement %s:%s measured at %s",
+                msm["producer"],
+                msm["measurement_id"],
+                msm["measured_at"]
             )
         else:
-            self.logger.info(
-                "received measurement from producer %s measured at %s" % (
-                    msm["producer"], msm["measured_at"]
-                )
+            self.logger.log(
+                received_level,
+                "received measurement from producer %s measured at %s",
+                msm["producer"],
+                msm["measured_at"]
             )
 
         # throw an InvalidMeasurmentException if the tag type is not known
@@ -126,10 +190,7 @@ class MeasurementToTags(object):
         # tag2domain tables
         _t_start = time.time()
         taxonomy_db_info = self.prepare_tag2domain_taxonomy(msm)
-        self.logger.debug(
-            "finished preparing taxonomy in %5.3f ms",
-            1000 * (time.time() - _t_start)
-        )
+        self._finish_stage("prepare_taxonomy", "preparing taxonomy", _t_start)
 
         _t_start = time.time()
         required_intersection_changes = self.calculate_changes(
@@ -139,9 +200,10 @@ class MeasurementToTags(object):
             msm["producer"],
             taxonomy_db_info
         )
-        self.logger.debug(
-            "finished calculating intersection changes in %5.3f ms",
-            1000 * (time.time() - _t_start)
+        self._finish_stage(
+            "calculate_changes",
+            "calculating intersection changes",
+            _t_start
         )
 
         _t_start = time.time()
@@ -153,25 +215,28 @@ class MeasurementToTags(object):
             msm["tagged_id"],
             msm["producer"]
         )
-        self.logger.debug(
-            "finished writing intersection changes in %5.3f ms",
-            1000 * (time.time() - _t_start)
+        self._finish_stage(
+            "write_changes",
+            "writing intersection changes",
+            _t_start
         )
 
-        self.logger.debug("committing to DB")
-        _t_start = time.time()
-        self.db_adapter.commit()
-        self.logger.debug(
-            "finished committing DB changes in %5.3f ms",
-            1000 * (time.time() - _t_start)
-        )
+        if self.maintain_open_tag_counts:
+            self.db_adapter.update_open_tag_counts(
+                taxonomy_db_info["taxonomy"]["id"],
+                msm["tag_type"],
+                calc_open_tag_count_deltas(required_intersection_changes)
+            )
 
-        self.logger.info(
-            "finished handling measurement in %5.3f ms",
-            1000 * (time.time() - t_start_total)
-        )
+        # new tags and values always come with an insert, so inserts and ends
+        # cover all changes to the open tags and the taxonomies
+        if self.update_change_watermark and (
+            len(required_intersection_changes["insert"]) > 0
+            or len(required_intersection_changes["end"]) > 0
+        ):
+            self.db_adapter.update_change_watermark()
 
-        return {
+        result = {
             "tag_type": msm["tag_type"],
             "tagged_id": msm["tagged_id"],
             "taxonomy_id": taxonomy_db_info["taxonomy"]["id"],
@@ -179,6 +244,67 @@ class MeasurementToTags(object):
             "tag_changes": required_intersection_changes
         }
 
+        if self.change_feed is not None:
+            self.db_adapter.insert_change_events(
+                self.change_feed.events(msm, result)
+            )
+
+        self.logger.debug("committing to DB")
+        _t_start = time.time()
+        self.db_adapter.commit()
+        self._finish_stage("commit", "committing DB changes", _t_start)
+
+        if self.summarize_logging:
+            self.log_summary(
+                msm,
+                taxonomy_db_info["taxonomy"]["id"],
+                required_intersection_changes,
+                time.time() - t_start_total
+            )
+        else:
+            self.logger.info(
+                "finished handling measurement in %5.3f ms",
+                1000 * (time.time() - t_start_total)
+            )
+
+        return result
+
+    def log_summary(self, msm, taxonomy_id, changes, duration):
+        """
+        Logs one INFO line that summarizes the handling of msm. The fields of
+        the line are also attached to the log record, so that they show up as
+        separate keys in structured logs (see logging_util.JsonFormatter).
+        """
+        if not is_enabled_for(self.logger, logging.INFO):
+            return
+        summary = {
+            "producer": msm["producer"],
+            "measurement_id": msm.get("measurement_id"),
+            "tag_type": msm["tag_type"],
+            "tagged_id": msm["tagged_id"],
+            "taxonomy_id": taxonomy_id,
+            "measured_at": msm["measured_at"],
+            "inserted": len(changes["insert"]),
+            "prolonged": len(changes["prolong"]),
+            "ended": len(changes["end"]),
+            "duration_ms": round(1000 * duration, 3)
+        }
+        self.logger.info(
+            "handled measurement %s:%s for %s ID %i taxonomy ID %i measured "
+            "at %s - %i opened, %i prolonged, %i ended in %5.3f ms",
+            summary["producer"],
+            summary["measurement_id"],
+            summary["tag_type"],
+            summary["tagged_id"],
+            summary["taxonomy_id"],
+            summary["measured_at"],
+            summary["inserted"],
+            summary["prolonged"],
+            summary["ended"],
+            summary["duration_ms"],
+            extra=summary
+        )
+
     def calculate_changes(
         self,
         tagged_id,
@@ -613,9 +739,11 @@ class MeasurementToTags(object):
                 tags_to_add.append(_copy)
 
         for _tag in tags_to_add:
-            self.logger.info("adding new tag '%s' to taxonomy ID %i" % (
-                _tag["tag_name"], _tag["taxonomy_id"]
-            ))
+            self.logger.info(
+                "adding new tag '%s' to taxonomy ID %i",
+                _tag["tag_name"],
+                _tag["taxonomy_id"]
+            )
 
         if len(tags_to_add) > 0:
             assert db_info["taxonomy"]["allows_auto_tags"]
@@ -638,10 +766,11 @@ class MeasurementToTags(object):
         ]
 
         for _value in values_to_add:
-            self.logger.info("adding new value '%s' to tag ID %i" % (
+            self.logger.info(
+                "adding new value '%s' to tag ID %i",
                 _value["value"],
                 _value["tag_id"]
-            ))
+            )
 
         if len(values_to_add) > 0:
             assert db_info["taxonomy"]["allows_auto_values"]
@@ -702,16 +831,9 @@ class MeasurementToTags(object):
         if not isinstance(tagged_id, int):
             raise ValueError("tagged_id must be int")
 
-        for _intxn in changes["insert"]:
-            self.logger.info(
-                "%s ID % 8i taxonomy ID % 3i: opening tag-value-pair %s-%s" % (
-                    intxn_type,
-                    tagged_id,
-                    taxonomy_id,
-                    str(_intxn.tag_id),
-                    str(_intxn.value_id)
-                )
-            )
+        self._log_intersection_changes(
+            "opening", changes["insert"], intxn_type, tagged_id, taxonomy_id
+        )
         self.db_adapter.insert_intersections(
             taxonomy_id,
             timestamp,
@@ -721,17 +843,13 @@ class MeasurementToTags(object):
             producer
         )
 
-        for _intxn in changes["prolong"]:
-            self.logger.info(
-                "%s ID % 8i taxonomy ID % 3i: prolonging "
-                "tag-value-pair %s-%s" % (
-                    intxn_type,
-                    tagged_id,
-                    taxonomy_id,
-                    str(_intxn.tag_id),
-                    str(_intxn.value_id)
-                )
-            )
+        self._log_intersection_changes(
+            "prolonging",
+            changes["prolong"],
+            intxn_type,
+            tagged_id,
+            taxonomy_id
+        )
         self.db_adapter.prolong_intersections(
             taxonomy_id,
             timestamp,
@@ -741,17 +859,9 @@ class MeasurementToTags(object):
             producer
         )
 
-        for _intxn in changes["end"]:
-            self.logger.info(
-                "%s ID % 8i taxonomy ID % 3i: ending "
-                "tag-value-pair %s-%s" % (
-                    intxn_type,
-                    tagged_id,
-                    taxonomy_id,
-                    str(_intxn.tag_id),
-                    str(_intxn.value_id)
-                )
-            )
+        self._log_intersection_changes(
+            "ending", changes["end"], intxn_type, tagged_id, taxonomy_id
+        )
         self.db_adapter.end_intersections(
             taxonomy_id,
             timestamp,
@@ -761,6 +871,30 @@ class MeasurementToTags(object):
             producer
         )
 
+    def _log_intersection_changes(
+        self,
+        verb,
+        intxns,
+        intxn_type,
+        tagged_id,
+        taxonomy_id
+    ):
+        # one line per tag, demoted to DEBUG if the measurement is summarized
+        level = logging.DEBUG if self.summarize_logging else logging.INFO
+        if len(intxns) == 0 or not is_enabled_for(self.logger, level):
+            return
+        for _intxn in intxns:
+            self.logger.log(
+                level,
+                "%s ID % 8i taxonomy ID % 3i: %s tag-value-pair %s-%s",
+                intxn_type,
+                tagged_id,
+                taxonomy_id,
+                verb,
+                _intxn.tag_id,
+                _intxn.value_id
+            )
+
     @staticmethod
     def load_msm_schema(logger=logging):
         """
@@ -771,7 +905,5 @@ class MeasurementToTags(object):
             "schema",
             "measurement.json"
         )
-        logger.debug(
-            "Loading measurement schema from %s" % msm_schema_path
-        )
+        logger.debug("Loading measurement schema from %s", msm_schema_path)
         return json.loads(open(msm_schema_path).read())
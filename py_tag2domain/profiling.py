@@ -0,0 +1,471 @@
+from __future__ import print_function
+import os
+import sys
+import json
+import time
+import signal
+import logging
+import cProfile
+import threading
+import tracemalloc
+import http.server
+from urllib.parse import urlparse, parse_qs
+from collections import Counter
+
+PROFILING_MODES = ("cprofile", "sampling")
+
+
+class CProfileSession(object):
+    """
+    Deterministic profile of the message handler using cProfile. The
+    profiler is only enabled while a message is handled.
+    """
+    suffix = ".prof"
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self, controller):
+        pass
+
+    def enter(self):
+        self.profile.enable()
+
+    def exit(self):
+        self.profile.disable()
+
+    def stop(self):
+        pass
+
+    def dump(self, path):
+        # readable with pstats or snakeviz
+        self.profile.dump_stats(path)
+
+
+class SamplingSession(object):
+    """
+    Sampling profile of the main thread. A background thread records the
+    stack of the main thread every interval seconds, including the time spent
+    waiting for messages. The stacks are written in the collapsed format
+    used by flamegraph.pl and speedscope.
+    """
+    suffix = ".folded"
+
+    def __init__(self, interval=0.005, thread_id=None):
+        self.interval = interval
+        self.thread_id = (
+            thread_id if thread_id is not None else threading.main_thread().ident
+        )
+        self.stacks = Counter()
+        self.n_samples = 0
+        self._stopped = threading.Event()
+        self._thread = None
+        self.deadline = None
+
+    def start(self, controller):
+        def _run():
+            while not self._stopped.wait(self.interval):
+                self.sample()
+                if self.deadline is not None and time.time() > self.deadline:
+                    # nothing to do in the main thread, so the session can be
+                    # finished here even if no further messages arrive
+                    controller.finish(reason="time limit reached")
+                    return
+
+        self._thread = threading.Thread(
+            target=_run,
+            name="msm2tag2domain-sampler",
+            daemon=True
+        )
+        self._thread.start()
+
+    def sample(self):
+        frame = sys._current_frames().get(self.thread_id)
+        if frame is None:
+            return
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append("%s (%s:%i)" % (
+                code.co_name,
+                os.path.basename(code.co_filename),
+                code.co_firstlineno
+            ))
+            frame = frame.f_back
+        self.stacks[";".join(reversed(stack))] += 1
+        self.n_samples += 1
+
+    def enter(self):
+        pass
+
+    def exit(self):
+        pass
+
+    def stop(self):
+        self._stopped.set()
+        if (
+            self._thread is not None
+            and self._thread is not threading.current_thread()
+        ):
+            self._thread.join()
+
+    def dump(self, path):
+        with open(path, "w") as f:
+            for _stack, _count in self.stacks.most_common():
+                f.write("%s %i\n" % (_stack, _count))
+
+
+class ProfilingController(object):
+    """
+    Profiles the message handler of a looper (see msm2tag2domain.py) on
+    demand.
+
+    A profiling session is started with start() (e.g. from a signal handler
+    or the control endpoint) and ends after a number of messages or seconds.
+    While a session is active the msm_handler of the looper is replaced by a
+    profiled handler. The original handler is restored when the session ends,
+    so there is no overhead when no session is active. The aggregated stats
+    are written to a file in output_dir.
+
+    memory_snapshot() starts tracemalloc on the first call and writes the
+    difference to the previous snapshot on every further call.
+    """
+    def __init__(
+        self,
+        output_dir,
+        mode="cprofile",
+        messages=1000,
+        seconds=None,
+        sample_interval=0.005,
+        tracemalloc_frames=10,
+        logger=logging.getLogger()
+    ):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        output_dir - str
+            directory the profiles and memory diffs are written to
+        mode - str
+            default profiling mode, one of PROFILING_MODES
+        messages - int or None
+            default number of messages to profile
+        seconds - float or None
+            default duration of a profiling session
+        sample_interval - float
+            time between two samples in sampling mode
+        tracemalloc_frames - int
+            number of frames tracemalloc stores per allocation
+        logger - logging.Logger
+            Logger used for logging
+        """
+        if mode not in PROFILING_MODES:
+            raise ValueError("unknown profiling mode '%s'" % mode)
+        self.output_dir = output_dir
+        self.mode = mode
+        self.messages = messages
+        self.seconds = seconds
+        self.sample_interval = sample_interval
+        self.tracemalloc_frames = tracemalloc_frames
+        self.logger = logger
+
+        self.looper = None
+        self.msm_handler = None
+        self.session = None
+        self._session_info = None
+        self._lock = threading.RLock()
+        self._last_snapshot = None
+
+    def attach(self, looper):
+        """
+        Sets the looper whose msm_handler is profiled.
+        """
+        self.looper = looper
+        self.msm_handler = looper.msm_handler
+
+    @property
+    def active(self):
+        return self.session is not None
+
+    def _output_path(self, kind, suffix):
+        return os.path.join(
+            self.output_dir,
+            "msm2tag2domain-%i-%s-%s%s" % (
+                os.getpid(),
+                kind,
+                time.strftime("%Y%m%dT%H%M%S"),
+                suffix
+            )
+        )
+
+    def start(self, mode=None, messages=None, seconds=None):
+        """
+        Starts a profiling session that ends after the given number of
+        messages or seconds, whichever comes first. Defaults are taken from
+        the constructor arguments.
+
+        Return
+        ------
+        bool - False if a session is already running
+        """
+        mode = self.mode if mode is None else mode
+        messages = self.messages if messages is None else messages
+        seconds = self.seconds if seconds is None else seconds
+        if mode not in PROFILING_MODES:
+            raise ValueError("unknown profiling mode '%s'" % mode)
+        if self.looper is None:
+            raise RuntimeError("no looper attached")
+        if not messages and not seconds:
+            raise ValueError("either messages or seconds must be set")
+
+        with self._lock:
+            if self.active:
+                self.logger.warning("profiling session already running")
+                return False
+
+            if mode == "cprofile":
+                session = CProfileSession()
+            else:
+                session = SamplingSession(self.sample_interval)
+                if seconds:
+                    session.deadline = time.time() + seconds
+            self._session_info = {
+                "mode": mode,
+                "messages": messages or None,
+                "seconds": seconds or None,
+                "started_at": time.time(),
+                "handled": 0
+            }
+            self.session = session
+            session.start(self)
+            self.looper.msm_handler = self._profiled_handler
+
+        self.logger.info(
+            "started %s profiling for %s messages / %s seconds" % (
+                mode, messages or "unlimited", seconds or "unlimited"
+            )
+        )
+        return True
+
+    def _profiled_handler(self, msm):
+        session = self.session
+        if session is None:
+            return self.msm_handler(msm)
+
+        session.enter()
+        try:
+            return self.msm_handler(msm)
+        finally:
+            session.exit()
+            info = self._session_info
+            info["handled"] += 1
+            if info["messages"] is not None and \
+                    info["handled"] >= info["messages"]:
+                self.finish(reason="message limit reached")
+            elif info["seconds"] is not None and \
+                    time.time() - info["started_at"] >= info["seconds"]:
+                self.finish(reason="time limit reached")
+
+    def finish(self, reason="stopped"):
+        """
+        Ends the running session and writes the profile.
+
+        Return
+        ------
+        str or None - path of the written profile, None if no session was
+            running
+        """
+        with self._lock:
+            session = self.session
+            if session is None:
+                return None
+            self.looper.msm_handler = self.msm_handler
+            self.session = None
+            session.stop()
+
+            path = self._output_path("profile", session.suffix)
+            session.dump(path)
+
+        self.logger.info(
+            "finished %s profiling after %i messages (%s) - written to %s" % (
+                self._session_info["mode"],
+                self._session_info["handled"],
+                reason,
+                path
+            )
+        )
+        return path
+
+    def status(self):
+        with self._lock:
+            if self.session is None:
+                return {"active": False}
+            return dict(self._session_info, active=True)
+
+    def memory_snapshot(self, limit=50):
+        """
+        Starts tracemalloc and takes a first snapshot, or writes the
+        allocations that grew the most since the previous snapshot.
+
+        Return
+        ------
+        str or None - path of the written diff, None if tracemalloc was
+            started by this call
+        """
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(self.tracemalloc_frames)
+                self._last_snapshot = None
+
+            snapshot = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__)
+            ])
+            previous = self._last_snapshot
+            self._last_snapshot = snapshot
+            if previous is None:
+                self.logger.info(
+                    "tracemalloc started - trigger again to write the diff"
+                )
+                return None
+
+            path = self._output_path("memory", ".txt")
+            diffs = snapshot.compare_to(previous, "traceback")
+            with open(path, "w") as f:
+                current, peak = tracemalloc.get_traced_memory()
+                f.write("traced memory: current %i B, peak %i B\n\n" % (
+                    current, peak
+                ))
+                for _diff in diffs[:limit]:
+                    f.write("%s\n" % str(_diff))
+                    for _line in _diff.traceback.format():
+                        f.write("    %s\n" % _line)
+                    f.write("\n")
+
+        self.logger.info("tracemalloc diff written to %s" % path)
+        return path
+
+    def stop_memory_tracing(self):
+        with self._lock:
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+                self.logger.info("tracemalloc stopped")
+            self._last_snapshot = None
+
+    def install_signal_handlers(
+        self,
+        profile_signal=signal.SIGUSR1,
+        memory_signal=signal.SIGUSR2
+    ):
+        """
+        Starts a profiling session with the default settings on
+        profile_signal (or finishes the running one) and calls
+        memory_snapshot on memory_signal.
+        """
+        def _on_profile_signal(signum, frame):
+            if self.active:
+                self.finish(reason="signal received")
+            else:
+                self.start()
+
+        def _on_memory_signal(signum, frame):
+            self.memory_snapshot()
+
+        signal.signal(profile_signal, _on_profile_signal)
+        signal.signal(memory_signal, _on_memory_signal)
+        self.logger.info(
+            "send %s to start or stop profiling and %s for tracemalloc "
+            "snapshots" % (
+                signal.Signals(profile_signal).name,
+                signal.Signals(memory_signal).name
+            )
+        )
+
+    def start_control_server(self, port, addr="127.0.0.1"):
+        """
+        Serves the control endpoint in a background thread:
+            GET  /status                 - state of the profiling session
+            POST /profile?mode=&messages=&seconds=
+                                         - start a profiling session
+            POST /profile/stop           - finish the running session
+            POST /tracemalloc            - take a snapshot / write a diff
+            POST /tracemalloc/stop       - stop tracemalloc
+
+        Return
+        ------
+        http.server.ThreadingHTTPServer
+        """
+        controller = self
+
+        class ControlHandler(http.server.BaseHTTPRequestHandler):
+            def _reply(self, status, body):
+                content = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def do_GET(self):
+                if urlparse(self.path).path == "/status":
+                    self._reply(200, controller.status())
+                else:
+                    self._reply(404, {"detail": "not found"})
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                query = {
+                    _key: _values[-1]
+                    for _key, _values in parse_qs(url.query).items()
+                }
+                try:
+                    if url.path == "/profile":
+                        started = controller.start(
+                            mode=query.get("mode"),
+                            messages=(
+                                int(query["messages"])
+                                if "messages" in query else None
+                            ),
+                            seconds=(
+                                float(query["seconds"])
+                                if "seconds" in query else None
+                            )
+                        )
+                        if started:
+                            self._reply(202, controller.status())
+                        else:
+                            self._reply(409, {
+                                "detail": "profiling session already running"
+                            })
+                    elif url.path == "/profile/stop":
+                        path = controller.finish(reason="stop requested")
+                        self._reply(200, {"path": path})
+                    elif url.path == "/tracemalloc":
+                        path = controller.memory_snapshot()
+                        self._reply(200, {"path": path})
+                    elif url.path == "/tracemalloc/stop":
+                        controller.stop_memory_tracing()
+                        self._reply(200, {"path": None})
+                    else:
+                        self._reply(404, {"detail": "not found"})
+                except ValueError as e:
+                    self._reply(400, {"detail": str(e)})
+
+            def log_message(self, format, *args):
+                controller.logger.debug(
+                    "control endpoint: " + format % args
+                )
+
+        server = http.server.ThreadingHTTPServer((addr, port), ControlHandler)
+        thread = threading.Thread(
+            target=server.serve_forever,
+            name="msm2tag2domain-profiling-control",
+            daemon=True
+        )
+        thread.start()
+        self.logger.info(
+            "serving profiling control endpoint on %s:%i" % (
+                addr, server.server_address[1]
+            )
+        )
+        return server
@@ -114,6 +114,47 @@ def calc_changes(from_, to):
     return changes
 
 
+def calc_open_tag_count_deltas(changes):
+    """
+    Calculate how the open tag counters of a taxonomy change for a single
+    entity when the changes calculated by :func:`calc_changes` are applied.
+
+    Parameters
+    ----------
+    changes - dict
+        keys 'insert', 'prolong', 'end' -> list of tags with the attributes
+        tag_id and value_id
+
+    Returns
+    -------
+    dict : (tag_id, value_id) -> int
+        change of the counters, only non-zero changes are returned. The key
+        (None, None) refers to the count over the whole taxonomy, (tag_id,
+        None) to the count over all values of a tag.
+    """
+    before = frozenset(changes["prolong"]) | frozenset(changes["end"])
+    after = frozenset(changes["prolong"]) | frozenset(changes["insert"])
+
+    deltas = {}
+    deltas[(None, None)] = int(len(after) > 0) - int(len(before) > 0)
+
+    tags_before = frozenset(_tag.tag_id for _tag in before)
+    tags_after = frozenset(_tag.tag_id for _tag in after)
+    for tag_id in tags_after - tags_before:
+        deltas[(tag_id, None)] = 1
+    for tag_id in tags_before - tags_after:
+        deltas[(tag_id, None)] = -1
+
+    for _tag in after - before:
+        if _tag.value_id is not None:
+            deltas[(_tag.tag_id, _tag.value_id)] = 1
+    for _tag in before - after:
+        if _tag.value_id is not None:
+            deltas[(_tag.tag_id, _tag.value_id)] = -1
+
+    return {key: delta for key, delta in deltas.items() if delta != 0}
+
+
 def parse_timestamp(ts):
     """
     Takes a timestamp in format "%Y-%m-%dT%H:%M:%S(.$d)" with or
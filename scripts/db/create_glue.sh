@@ -51,6 +51,7 @@ function run_psql_script {
     -v ON_ERROR_STOP=1 \
     -v t2d_schema="$TAG2DOMAIN_SCHEMA" \
     -v t2d_intxn_table_name="$TAG2DOMAIN_INTXN_TABLE_NAME" \
+    -v t2d_validity_range="${TAG2DOMAIN_VALIDITY_RANGE:-false}" \
     -v t2d_entity_table="$TAG2DOMAIN_ENTITY_TABLE" \
     -v t2d_entity_id_column="$TAG2DOMAIN_ENTITY_ID_COLUMN" \
     -v t2d_entity_name_column="$TAG2DOMAIN_ENTITY_NAME_COLUMN" \
@@ -1,7 +1,24 @@
 CREATE SCHEMA IF NOT EXISTS :t2d_schema;
 SET search_path TO :t2d_schema;
 
--- creates the view that is used to retrieve tags
+-- creates the view that is used to retrieve tags. If the intersection table
+-- has a validity range (TAG2DOMAIN_VALIDITY_RANGE) it is exposed as well, so
+-- that the at_time functions can use its GiST index.
+\if :t2d_validity_range
+CREATE OR REPLACE VIEW v_unified_tags
+AS SELECT
+  :t2d_entity_table.:t2d_entity_id_column AS domain_id,
+  :t2d_entity_table.:t2d_entity_name_column AS domain_name,
+  ':t2d_tag_type' AS tag_type,
+  :t2d_intxn_table_name.tag_id,
+  :t2d_intxn_table_name.value_id,
+  :t2d_intxn_table_name.start_ts,
+  :t2d_intxn_table_name.measured_at,
+  :t2d_intxn_table_name.end_ts,
+  :t2d_intxn_table_name.validity
+FROM :t2d_entity_table
+JOIN :t2d_intxn_table_name ON (:t2d_entity_table.:t2d_entity_id_column = :t2d_intxn_table_name.entity_id);
+\else
 CREATE OR REPLACE VIEW v_unified_tags
 AS SELECT
   :t2d_entity_table.:t2d_entity_id_column AS domain_id,
@@ -14,9 +31,10 @@ AS SELECT
   :t2d_intxn_table_name.end_ts
 FROM :t2d_entity_table
 JOIN :t2d_intxn_table_name ON (:t2d_entity_table.:t2d_entity_id_column = :t2d_intxn_table_name.entity_id);
+\endif
 
 -- creates a filter table (this is an empty place holder only)
-CREATE TABLE v_tag2domain_domain_filter (
+CREATE TABLE IF NOT EXISTS v_tag2domain_domain_filter (
     domain_id bigint NOT NULL,
     tag_name character varying(200) NOT NULL,
     start_ts timestamp with time zone NOT NULL,
@@ -27,6 +45,12 @@ CREATE TABLE v_tag2domain_domain_filter (
 -- ----------------------------------------------------------------------------
 -- SQL functions used to access the intersection tables
 -- ----------------------------------------------------------------------------
+--
+-- The at_time functions repeat their condition on end_ts in the form
+--   (end_ts > at_time) OR (end_ts IS NULL)
+-- which lets PostgreSQL skip the history partitions of a partitioned
+-- intersection table (TAG2DOMAIN_PARTITIONED) that ended before at_time. The
+-- open functions only touch the open partition through (end_ts IS NULL).
 
 DROP FUNCTION IF EXISTS tag2domain_get_open_tags;
 -- function tag2domain_get_open_tags()
@@ -42,7 +66,16 @@ CREATE FUNCTION tag2domain_get_open_tags()
     measured_at timestamp with time zone,
     end_time timestamp with time zone
   ) AS $$
- SELECT * FROM v_unified_tags
+ SELECT
+    v_unified_tags.domain_id,
+    v_unified_tags.domain_name,
+    v_unified_tags.tag_type,
+    v_unified_tags.tag_id,
+    v_unified_tags.value_id,
+    v_unified_tags.start_ts,
+    v_unified_tags.measured_at,
+    v_unified_tags.end_ts
+ FROM v_unified_tags
  WHERE (v_unified_tags.end_ts IS NULL)
 $$ LANGUAGE SQL STABLE
     SET search_path TO :t2d_schema
@@ -69,7 +102,16 @@ CREATE FUNCTION tag2domain_get_open_tags_filtered(filter_type text, filter_value
     measured_at timestamp with time zone,
     end_time timestamp with time zone
   ) AS $$
- SELECT v_unified_tags.* FROM v_unified_tags
+ SELECT
+    v_unified_tags.domain_id,
+    v_unified_tags.domain_name,
+    v_unified_tags.tag_type,
+    v_unified_tags.tag_id,
+    v_unified_tags.value_id,
+    v_unified_tags.start_ts,
+    v_unified_tags.measured_at,
+    v_unified_tags.end_ts
+ FROM v_unified_tags
  JOIN v_tag2domain_domain_filter USING (domain_id)
  WHERE (
     (v_unified_tags.end_ts IS NULL)
@@ -84,6 +126,7 @@ $$ LANGUAGE SQL STABLE
 DROP FUNCTION IF EXISTS tag2domain_get_tags_at_time;
 -- function tag2domain_get_tags_at_time(at_time)
 -- Returns all tags that were open at time at_time.
+\if :t2d_validity_range
 CREATE FUNCTION tag2domain_get_tags_at_time(at_time timestamp)
   RETURNS TABLE(
     domain_id bigint,
@@ -95,14 +138,54 @@ CREATE FUNCTION tag2domain_get_tags_at_time(at_time timestamp)
     measured_at timestamp with time zone,
     end_time timestamp with time zone
   ) AS $$
- SELECT v_unified_tags.* FROM v_unified_tags
+ SELECT
+    v_unified_tags.domain_id,
+    v_unified_tags.domain_name,
+    v_unified_tags.tag_type,
+    v_unified_tags.tag_id,
+    v_unified_tags.value_id,
+    v_unified_tags.start_ts,
+    v_unified_tags.measured_at,
+    v_unified_tags.end_ts
+ FROM v_unified_tags
+ WHERE (
+    (v_unified_tags.validity @> $1::timestamp with time zone)
+    AND ((v_unified_tags.end_ts > $1) OR (v_unified_tags.end_ts IS NULL))
+  )
+$$ LANGUAGE SQL STABLE
+    SET search_path TO :t2d_schema
+;
+\else
+CREATE FUNCTION tag2domain_get_tags_at_time(at_time timestamp)
+  RETURNS TABLE(
+    domain_id bigint,
+    domain_name character varying(100),
+    tag_type text,
+    tag_id int,
+    value_id int,
+    start_time timestamp with time zone,
+    measured_at timestamp with time zone,
+    end_time timestamp with time zone
+  ) AS $$
+ SELECT
+    v_unified_tags.domain_id,
+    v_unified_tags.domain_name,
+    v_unified_tags.tag_type,
+    v_unified_tags.tag_id,
+    v_unified_tags.value_id,
+    v_unified_tags.start_ts,
+    v_unified_tags.measured_at,
+    v_unified_tags.end_ts
+ FROM v_unified_tags
  WHERE (
     (v_unified_tags.start_ts <= $1)
+    AND (COALESCE(v_unified_tags.end_ts, 'infinity') > $1)
     AND ((v_unified_tags.end_ts > $1) OR (v_unified_tags.end_ts IS NULL))
   )
 $$ LANGUAGE SQL STABLE
     SET search_path TO :t2d_schema
 ;
+\endif
 
 DROP FUNCTION IF EXISTS tag2domain_get_tags_at_time_filtered;
 -- function tag2domain_get_tags_at_time_filtered(at_time, filter_type, filter_value)
@@ -114,6 +197,41 @@ DROP FUNCTION IF EXISTS tag2domain_get_tags_at_time_filtered;
 -- v_tag2domain_domain_filter table. A domain passes if a row with
 --   tag_name=filter_type AND value=filter_value
 -- exists.
+\if :t2d_validity_range
+CREATE FUNCTION tag2domain_get_tags_at_time_filtered(at_time timestamp, filter_type text, filter_value text)
+  RETURNS TABLE(
+    domain_id bigint,
+    domain_name character varying(100),
+    tag_type text,
+    tag_id int,
+    value_id int,
+    start_time timestamp with time zone,
+    measured_at timestamp with time zone,
+    end_time timestamp with time zone
+  ) AS $$
+ SELECT
+    v_unified_tags.domain_id,
+    v_unified_tags.domain_name,
+    v_unified_tags.tag_type,
+    v_unified_tags.tag_id,
+    v_unified_tags.value_id,
+    v_unified_tags.start_ts,
+    v_unified_tags.measured_at,
+    v_unified_tags.end_ts
+ FROM v_unified_tags
+ JOIN v_tag2domain_domain_filter USING (domain_id)
+ WHERE (
+    (v_unified_tags.validity @> $1::timestamp with time zone)
+    AND ((v_unified_tags.end_ts > $1) OR (v_unified_tags.end_ts IS NULL))
+    AND (v_tag2domain_domain_filter.start_ts AT TIME ZONE 'UTC' <= $1)
+    AND ((v_tag2domain_domain_filter.end_ts AT TIME ZONE 'UTC' > $1) OR (v_tag2domain_domain_filter.end_ts IS NULL))
+    AND (v_tag2domain_domain_filter.tag_name = $2)
+    AND (v_tag2domain_domain_filter.value = $3)
+  )
+$$ LANGUAGE SQL STABLE
+    SET search_path TO :t2d_schema
+;
+\else
 CREATE FUNCTION tag2domain_get_tags_at_time_filtered(at_time timestamp, filter_type text, filter_value text)
   RETURNS TABLE(
     domain_id bigint,
@@ -125,10 +243,20 @@ CREATE FUNCTION tag2domain_get_tags_at_time_filtered(at_time timestamp, filter_t
     measured_at timestamp with time zone,
     end_time timestamp with time zone
   ) AS $$
- SELECT v_unified_tags.* FROM v_unified_tags
+ SELECT
+    v_unified_tags.domain_id,
+    v_unified_tags.domain_name,
+    v_unified_tags.tag_type,
+    v_unified_tags.tag_id,
+    v_unified_tags.value_id,
+    v_unified_tags.start_ts,
+    v_unified_tags.measured_at,
+    v_unified_tags.end_ts
+ FROM v_unified_tags
  JOIN v_tag2domain_domain_filter USING (domain_id)
  WHERE (
     (v_unified_tags.start_ts <= $1)
+    AND (COALESCE(v_unified_tags.end_ts, 'infinity') > $1)
     AND ((v_unified_tags.end_ts > $1) OR (v_unified_tags.end_ts IS NULL))
     AND (v_tag2domain_domain_filter.start_ts AT TIME ZONE 'UTC' <= $1)
     AND ((v_tag2domain_domain_filter.end_ts AT TIME ZONE 'UTC' > $1) OR (v_tag2domain_domain_filter.end_ts IS NULL))
@@ -138,12 +266,13 @@ CREATE FUNCTION tag2domain_get_tags_at_time_filtered(at_time timestamp, filter_t
 $$ LANGUAGE SQL STABLE
     SET search_path TO :t2d_schema
 ;
+\endif
 
 DROP FUNCTION IF EXISTS tag2domain_get_open_tags_domain;
 -- function tag2domain_get_open_tags_domain(domain_name)
 --
 -- returns a table with the open tags for a single domain with name domain_name
-CREATE FUNCTION (domain_name character varying (100))
+CREATE FUNCTION tag2domain_get_open_tags_domain(domain_name character varying (100))
   RETURNS TABLE(
     domain_id bigint,
     domain_name character varying(100),
@@ -154,7 +283,16 @@ CREATE FUNCTION (domain_name character varying (100))
     measured_at timestamp with time zone,
     end_time timestamp with time zone
   ) AS $$
- SELECT v_unified_tags.* FROM v_unified_tags
+ SELECT
+    v_unified_tags.domain_id,
+    v_unified_tags.domain_name,
+    v_unified_tags.tag_type,
+    v_unified_tags.tag_id,
+    v_unified_tags.value_id,
+    v_unified_tags.start_ts,
+    v_unified_tags.measured_at,
+    v_unified_tags.end_ts
+ FROM v_unified_tags
  WHERE
     (v_unified_tags.end_ts IS NULL)
     AND (v_unified_tags.domain_name = $1)
@@ -166,6 +304,7 @@ DROP FUNCTION IF EXISTS tag2domain_get_tags_at_time_domain;
 -- function tag2domain_get_open_tags_domain(at_time, domain_name)
 --
 -- returns a table with the tags set at time at_time for a single domain with name domain_name
+\if :t2d_validity_range
 CREATE FUNCTION tag2domain_get_tags_at_time_domain(at_time timestamp, domain_name character varying (100))
   RETURNS TABLE(
     domain_id bigint,
@@ -177,15 +316,157 @@ CREATE FUNCTION tag2domain_get_tags_at_time_domain(at_time timestamp, domain_nam
     measured_at timestamp with time zone,
     end_time timestamp with time zone
   ) AS $$
- SELECT * FROM v_unified_tags
+ SELECT
+    v_unified_tags.domain_id,
+    v_unified_tags.domain_name,
+    v_unified_tags.tag_type,
+    v_unified_tags.tag_id,
+    v_unified_tags.value_id,
+    v_unified_tags.start_ts,
+    v_unified_tags.measured_at,
+    v_unified_tags.end_ts
+ FROM v_unified_tags
+ WHERE (
+    (v_unified_tags.validity @> $1::timestamp with time zone)
+    AND ((v_unified_tags.end_ts > $1) OR (v_unified_tags.end_ts IS NULL))
+    AND (v_unified_tags.domain_name = $2)
+  )
+$$ LANGUAGE SQL STABLE
+    SET search_path TO :t2d_schema
+;
+\else
+CREATE FUNCTION tag2domain_get_tags_at_time_domain(at_time timestamp, domain_name character varying (100))
+  RETURNS TABLE(
+    domain_id bigint,
+    domain_name character varying(100),
+    tag_type text,
+    tag_id int,
+    value_id int,
+    start_time timestamp with time zone,
+    measured_at timestamp with time zone,
+    end_time timestamp with time zone
+  ) AS $$
+ SELECT
+    v_unified_tags.domain_id,
+    v_unified_tags.domain_name,
+    v_unified_tags.tag_type,
+    v_unified_tags.tag_id,
+    v_unified_tags.value_id,
+    v_unified_tags.start_ts,
+    v_unified_tags.measured_at,
+    v_unified_tags.end_ts
+ FROM v_unified_tags
  WHERE (
     (v_unified_tags.start_ts <= $1)
+    AND (COALESCE(v_unified_tags.end_ts, 'infinity') > $1)
     AND ((v_unified_tags.end_ts > $1) OR (v_unified_tags.end_ts IS NULL))
     AND (v_unified_tags.domain_name = $2)
   )
 $$ LANGUAGE SQL STABLE
     SET search_path TO :t2d_schema
 ;
+\endif
+
+DROP FUNCTION IF EXISTS tag2domain_get_open_tags_domains;
+-- function tag2domain_get_open_tags_domains(domain_names)
+--
+-- returns a table with the open tags for all domains whose name is in the
+-- array domain_names
+CREATE FUNCTION tag2domain_get_open_tags_domains(domain_names character varying[])
+  RETURNS TABLE(
+    domain_id bigint,
+    domain_name character varying(100),
+    tag_type text,
+    tag_id int,
+    value_id int,
+    start_time timestamp with time zone,
+    measured_at timestamp with time zone,
+    end_time timestamp with time zone
+  ) AS $$
+ SELECT
+    v_unified_tags.domain_id,
+    v_unified_tags.domain_name,
+    v_unified_tags.tag_type,
+    v_unified_tags.tag_id,
+    v_unified_tags.value_id,
+    v_unified_tags.start_ts,
+    v_unified_tags.measured_at,
+    v_unified_tags.end_ts
+ FROM unnest($1) AS requested(domain_name)
+ JOIN v_unified_tags ON (v_unified_tags.domain_name = requested.domain_name)
+ WHERE
+    (v_unified_tags.end_ts IS NULL)
+$$ LANGUAGE SQL STABLE
+    SET search_path TO :t2d_schema
+;
+
+DROP FUNCTION IF EXISTS tag2domain_get_tags_at_time_domains;
+-- function tag2domain_get_tags_at_time_domains(at_time, domain_names)
+--
+-- returns a table with the tags set at time at_time for all domains whose name
+-- is in the array domain_names
+\if :t2d_validity_range
+CREATE FUNCTION tag2domain_get_tags_at_time_domains(at_time timestamp, domain_names character varying[])
+  RETURNS TABLE(
+    domain_id bigint,
+    domain_name character varying(100),
+    tag_type text,
+    tag_id int,
+    value_id int,
+    start_time timestamp with time zone,
+    measured_at timestamp with time zone,
+    end_time timestamp with time zone
+  ) AS $$
+ SELECT
+    v_unified_tags.domain_id,
+    v_unified_tags.domain_name,
+    v_unified_tags.tag_type,
+    v_unified_tags.tag_id,
+    v_unified_tags.value_id,
+    v_unified_tags.start_ts,
+    v_unified_tags.measured_at,
+    v_unified_tags.end_ts
+ FROM unnest($2) AS requested(domain_name)
+ JOIN v_unified_tags ON (v_unified_tags.domain_name = requested.domain_name)
+ WHERE (
+    (v_unified_tags.validity @> $1::timestamp with time zone)
+    AND ((v_unified_tags.end_ts > $1) OR (v_unified_tags.end_ts IS NULL))
+  )
+$$ LANGUAGE SQL STABLE
+    SET search_path TO :t2d_schema
+;
+\else
+CREATE FUNCTION tag2domain_get_tags_at_time_domains(at_time timestamp, domain_names character varying[])
+  RETURNS TABLE(
+    domain_id bigint,
+    domain_name character varying(100),
+    tag_type text,
+    tag_id int,
+    value_id int,
+    start_time timestamp with time zone,
+    measured_at timestamp with time zone,
+    end_time timestamp with time zone
+  ) AS $$
+ SELECT
+    v_unified_tags.domain_id,
+    v_unified_tags.domain_name,
+    v_unified_tags.tag_type,
+    v_unified_tags.tag_id,
+    v_unified_tags.value_id,
+    v_unified_tags.start_ts,
+    v_unified_tags.measured_at,
+    v_unified_tags.end_ts
+ FROM unnest($2) AS requested(domain_name)
+ JOIN v_unified_tags ON (v_unified_tags.domain_name = requested.domain_name)
+ WHERE (
+    (v_unified_tags.start_ts <= $1)
+    AND (COALESCE(v_unified_tags.end_ts, 'infinity') > $1)
+    AND ((v_unified_tags.end_ts > $1) OR (v_unified_tags.end_ts IS NULL))
+  )
+$$ LANGUAGE SQL STABLE
+    SET search_path TO :t2d_schema
+;
+\endif
 
 DROP FUNCTION IF EXISTS tag2domain_get_all_tags_domain;
 -- function tag2domain_get_all_tags_domain(domain_name)
@@ -202,10 +483,73 @@ CREATE FUNCTION tag2domain_get_all_tags_domain(domain_name character varying (10
     measured_at timestamp with time zone,
     end_time timestamp with time zone
   ) AS $$
- SELECT v_unified_tags.* FROM v_unified_tags
+ SELECT
+    v_unified_tags.domain_id,
+    v_unified_tags.domain_name,
+    v_unified_tags.tag_type,
+    v_unified_tags.tag_id,
+    v_unified_tags.value_id,
+    v_unified_tags.start_ts,
+    v_unified_tags.measured_at,
+    v_unified_tags.end_ts
+ FROM v_unified_tags
  WHERE (
     (v_unified_tags.domain_name = $1)
   )
 $$ LANGUAGE SQL
     SET search_path TO :t2d_schema
+;
+
+DROP FUNCTION IF EXISTS tag2domain_get_tags_changed;
+-- function tag2domain_get_tags_changed(since, until)
+--
+-- returns a table with all tags that were opened or closed in the time range
+-- (since, until], i.e. whose start_ts or end_ts is in the range. A tag that
+-- was opened and closed in the range is returned once. The two branches of
+-- the UNION ALL are answered by the indexes on start_ts and end_ts, so the
+-- cost depends on the number of changes in the range and not on the total
+-- number of tags.
+CREATE FUNCTION tag2domain_get_tags_changed(since timestamp, until timestamp)
+  RETURNS TABLE(
+    domain_id bigint,
+    domain_name character varying(100),
+    tag_type text,
+    tag_id int,
+    value_id int,
+    start_time timestamp with time zone,
+    measured_at timestamp with time zone,
+    end_time timestamp with time zone
+  ) AS $$
+ SELECT
+    v_unified_tags.domain_id,
+    v_unified_tags.domain_name,
+    v_unified_tags.tag_type,
+    v_unified_tags.tag_id,
+    v_unified_tags.value_id,
+    v_unified_tags.start_ts,
+    v_unified_tags.measured_at,
+    v_unified_tags.end_ts
+ FROM v_unified_tags
+ WHERE (
+    (v_unified_tags.start_ts > $1)
+    AND (v_unified_tags.start_ts <= $2)
+  )
+ UNION ALL
+ SELECT
+    v_unified_tags.domain_id,
+    v_unified_tags.domain_name,
+    v_unified_tags.tag_type,
+    v_unified_tags.tag_id,
+    v_unified_tags.value_id,
+    v_unified_tags.start_ts,
+    v_unified_tags.measured_at,
+    v_unified_tags.end_ts
+ FROM v_unified_tags
+ WHERE (
+    (v_unified_tags.end_ts > $1)
+    AND (v_unified_tags.end_ts <= $2)
+    AND (v_unified_tags.start_ts <= $1)
+  )
+$$ LANGUAGE SQL STABLE
+    SET search_path TO :t2d_schema
 ;
\ No newline at end of file
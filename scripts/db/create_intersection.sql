@@ -14,6 +14,15 @@ SET default_with_oids = false;
 CREATE SCHEMA IF NOT EXISTS :t2d_schema;
 SET search_path TO :t2d_schema;
 
+-- the optional partitioned layout keeps open rows (end_ts IS NULL) in a small
+-- default partition and moves rows into monthly history partitions once
+-- end_ts is set.
+\if :t2d_partitioned
+\set t2d_intxn_partition_clause 'PARTITION BY RANGE (end_ts)'
+\else
+\set t2d_intxn_partition_clause ''
+\endif
+
 CREATE TABLE :t2d_intxn_table_name (
     entity_id bigint,
     tag_id integer,
@@ -29,7 +38,7 @@ CREATE TABLE :t2d_intxn_table_name (
     FOREIGN KEY (taxonomy_id) REFERENCES taxonomy(id),
     FOREIGN KEY (tag_id) REFERENCES tags(tag_id),
     FOREIGN KEY (entity_id) REFERENCES :t2d_entity_table(:t2d_entity_id_column)
-);
+) :t2d_intxn_partition_clause;
 
 COMMENT ON TABLE :t2d_intxn_table_name IS 'Intersection table that marks which tags and values where set on an entity in a given timespan';
 COMMENT ON COLUMN :t2d_intxn_table_name.entity_id IS 'Foreign key in the table of entities';
@@ -46,4 +55,226 @@ COMMENT ON COLUMN :t2d_intxn_table_name.producer IS 'Name of producer that measu
 CREATE INDEX ON :t2d_intxn_table_name USING btree (entity_id);
 CREATE INDEX ON :t2d_intxn_table_name USING btree (end_ts DESC);
 CREATE INDEX ON :t2d_intxn_table_name USING btree (start_ts DESC);
-CREATE INDEX ON :t2d_intxn_table_name USING btree (tag_id);
\ No newline at end of file
+CREATE INDEX ON :t2d_intxn_table_name USING btree (tag_id);
+
+-- open intervals are looked up by get_open_tags and updated by the prolong and
+-- end statements of msm2tag2domain.
+\set t2d_intxn_open_idx :t2d_intxn_table_name '_open_idx'
+CREATE INDEX :t2d_intxn_open_idx ON :t2d_intxn_table_name USING btree
+    (entity_id, taxonomy_id, tag_id, value_id)
+    WHERE (end_ts IS NULL);
+
+-- covers the at_time lookups of the glue functions, which compare against
+-- COALESCE(end_ts, 'infinity') so that a single range scan suffices.
+\set t2d_intxn_at_time_idx :t2d_intxn_table_name '_at_time_idx'
+CREATE INDEX :t2d_intxn_at_time_idx ON :t2d_intxn_table_name USING btree
+    ((COALESCE(end_ts, 'infinity'::timestamp with time zone)), start_ts)
+    INCLUDE (entity_id, taxonomy_id, tag_id, value_id, measured_at, end_ts);
+
+-- optional validity range used by the at_time lookups of the glue functions.
+-- The column is kept in sync with start_ts and end_ts by a trigger, so that a
+-- single GiST index answers point-in-time queries regardless of how much
+-- history has accumulated.
+\if :t2d_validity_range
+ALTER TABLE :t2d_intxn_table_name ADD COLUMN validity tstzrange;
+COMMENT ON COLUMN :t2d_intxn_table_name.validity IS 'Range [start_ts, end_ts) in which the tag was set, maintained by a trigger';
+
+CREATE OR REPLACE FUNCTION tag2domain_set_validity()
+  RETURNS trigger AS $$
+BEGIN
+  IF NEW.end_ts < NEW.start_ts THEN
+    NEW.validity := 'empty'::tstzrange;
+  ELSE
+    NEW.validity := tstzrange(NEW.start_ts, NEW.end_ts, '[)');
+  END IF;
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- function tag2domain_create_validity_trigger(intxn_table)
+--
+-- creates the trigger that maintains the validity column on an intersection
+-- table. On a partitioned table the trigger is created on every partition
+-- instead, as PostgreSQL before 13 does not support BEFORE ROW triggers on
+-- partitioned tables. Tables that already have the trigger are skipped.
+-- Returns the number of triggers created.
+CREATE OR REPLACE FUNCTION tag2domain_create_validity_trigger(intxn_table regclass)
+  RETURNS integer AS $$
+DECLARE
+  table_schema name;
+  trigger_name name;
+  intxn_partition regclass;
+  n_created integer := 0;
+BEGIN
+  SELECT pg_namespace.nspname, pg_class.relname || '_set_validity'
+  INTO table_schema, trigger_name
+  FROM pg_class
+  JOIN pg_namespace ON (pg_namespace.oid = pg_class.relnamespace)
+  WHERE pg_class.oid = intxn_table;
+
+  FOR intxn_partition IN
+    WITH RECURSIVE partitions(relid) AS (
+      SELECT intxn_table::oid
+      UNION ALL
+      SELECT pg_inherits.inhrelid
+      FROM pg_inherits
+      JOIN partitions ON (pg_inherits.inhparent = partitions.relid)
+    )
+    SELECT partitions.relid::regclass
+    FROM partitions
+    JOIN pg_class ON (pg_class.oid = partitions.relid)
+    WHERE pg_class.relkind = 'r'
+  LOOP
+    CONTINUE WHEN EXISTS (
+      SELECT 1 FROM pg_trigger
+      WHERE tgrelid = intxn_partition AND tgname = trigger_name
+    );
+    EXECUTE format(
+      'CREATE TRIGGER %I BEFORE INSERT OR UPDATE OF start_ts, end_ts ON %s '
+      'FOR EACH ROW EXECUTE PROCEDURE %I.tag2domain_set_validity()',
+      trigger_name,
+      intxn_partition,
+      table_schema
+    );
+    n_created := n_created + 1;
+  END LOOP;
+
+  RETURN n_created;
+END;
+$$ LANGUAGE plpgsql;
+
+\set t2d_intxn_validity_idx :t2d_intxn_table_name '_validity_idx'
+CREATE INDEX :t2d_intxn_validity_idx ON :t2d_intxn_table_name USING gist
+    (validity);
+\endif
+
+\if :t2d_partitioned
+-- the default partition holds the open rows and, as a catch-all, the ended
+-- rows that no history partition covers, so that ending a tag never fails
+\set t2d_intxn_open_partition :t2d_intxn_table_name '_open'
+CREATE TABLE :t2d_intxn_open_partition PARTITION OF :t2d_intxn_table_name
+    DEFAULT;
+COMMENT ON TABLE :t2d_intxn_open_partition IS 'Open tags of the intersection table and closed tags that are not covered by a history partition yet';
+
+-- holds everything that ended before the current month
+SELECT date_trunc('month', now() AT TIME ZONE 'UTC') AT TIME ZONE 'UTC' AS t2d_history_end \gset
+\set t2d_intxn_history_partition :t2d_intxn_table_name '_history'
+CREATE TABLE :t2d_intxn_history_partition PARTITION OF :t2d_intxn_table_name
+    FOR VALUES FROM (MINVALUE) TO (:'t2d_history_end');
+
+-- function tag2domain_create_history_partitions(intxn_table, months_ahead)
+--
+-- creates the monthly history partitions of a partitioned intersection table
+-- from the current month up to months_ahead months in the future. Months
+-- that were missed because the function did not run, i.e. the months between
+-- the newest history partition and the current month, are created as well.
+-- Existing partitions are skipped. Rows that ended in a month without a
+-- history partition are kept in the default partition and are moved into the
+-- new partition of their month. This should be run regularly (e.g. from
+-- cron) to keep the default partition small. Returns the number of
+-- partitions created.
+CREATE OR REPLACE FUNCTION tag2domain_create_history_partitions(intxn_table regclass, months_ahead integer)
+  RETURNS integer AS $$
+DECLARE
+  table_schema name;
+  table_name name;
+  default_partition regclass;
+  partition_name text;
+  month_start timestamp with time zone;
+  month_end timestamp with time zone;
+  current_month timestamp;
+  first_month timestamp;
+  n_created integer := 0;
+BEGIN
+  SELECT pg_namespace.nspname, pg_class.relname
+  INTO table_schema, table_name
+  FROM pg_class
+  JOIN pg_namespace ON (pg_namespace.oid = pg_class.relnamespace)
+  WHERE pg_class.oid = intxn_table;
+
+  SELECT NULLIF(partdefid, 0)::regclass
+  INTO default_partition
+  FROM pg_partitioned_table
+  WHERE partrelid = intxn_table;
+
+  -- start after the newest monthly history partition before the current
+  -- month. The partitions of missed months are empty unless rows ended
+  -- there, which are then moved out of the default partition.
+  current_month := date_trunc('month', now() AT TIME ZONE 'UTC');
+  SELECT max(to_date(right(pg_class.relname, 6), 'YYYYMM'))::timestamp + interval '1 month'
+  INTO first_month
+  FROM pg_inherits
+  JOIN pg_class ON (pg_class.oid = pg_inherits.inhrelid)
+  WHERE
+    pg_inherits.inhparent = intxn_table
+    AND left(pg_class.relname, -7) = table_name || '_history'
+    AND right(pg_class.relname, 7) ~ '^_[0-9]{6}$'
+    AND to_date(right(pg_class.relname, 6), 'YYYYMM') < current_month;
+  first_month := LEAST(COALESCE(first_month, current_month), current_month);
+
+  FOR i IN
+    (
+      (extract(year FROM first_month) - extract(year FROM current_month)) * 12
+      + extract(month FROM first_month) - extract(month FROM current_month)
+    )::integer..months_ahead
+  LOOP
+    month_start := (current_month + make_interval(months => i)) AT TIME ZONE 'UTC';
+    month_end := ((month_start AT TIME ZONE 'UTC') + interval '1 month') AT TIME ZONE 'UTC';
+    partition_name := table_name || '_history_' || to_char(month_start AT TIME ZONE 'UTC', 'YYYYMM');
+    CONTINUE WHEN to_regclass(format('%I.%I', table_schema, partition_name)) IS NOT NULL;
+
+    -- the partition is filled with the rows of its month from the default
+    -- partition before it is attached, as attaching fails if the default
+    -- partition still holds such rows
+    EXECUTE format(
+      'CREATE TABLE %I.%I (LIKE %s INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+      table_schema,
+      partition_name,
+      intxn_table
+    );
+    IF default_partition IS NOT NULL THEN
+      EXECUTE format(
+        'WITH moved AS ('
+        '  DELETE FROM %s WHERE end_ts >= %L AND end_ts < %L RETURNING *'
+        ') INSERT INTO %I.%I SELECT * FROM moved',
+        default_partition,
+        month_start,
+        month_end,
+        table_schema,
+        partition_name
+      );
+    END IF;
+    EXECUTE format(
+      'ALTER TABLE %s ATTACH PARTITION %I.%I FOR VALUES FROM (%L) TO (%L)',
+      intxn_table,
+      table_schema,
+      partition_name,
+      month_start,
+      month_end
+    );
+    n_created := n_created + 1;
+  END LOOP;
+
+  -- the new partitions need the trigger of the validity column as well
+  IF EXISTS (
+    SELECT 1 FROM pg_attribute
+    WHERE attrelid = intxn_table AND attname = 'validity' AND NOT attisdropped
+  ) THEN
+    EXECUTE format(
+      'SELECT %I.tag2domain_create_validity_trigger(%L::regclass)',
+      table_schema,
+      intxn_table
+    );
+  END IF;
+
+  RETURN n_created;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT tag2domain_create_history_partitions(:'t2d_intxn_table_name', :t2d_history_months);
+\endif
+
+-- the trigger of the validity column is created once all partitions exist
+\if :t2d_validity_range
+SELECT tag2domain_create_validity_trigger(:'t2d_intxn_table_name');
+\endif
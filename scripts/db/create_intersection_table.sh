@@ -47,6 +47,9 @@ function run_psql_script {
     -v ON_ERROR_STOP=1 \
     -v t2d_schema="$TAG2DOMAIN_SCHEMA" \
     -v t2d_intxn_table_name="$TAG2DOMAIN_INTXN_TABLE_NAME" \
+    -v t2d_validity_range="${TAG2DOMAIN_VALIDITY_RANGE:-false}" \
+    -v t2d_partitioned="${TAG2DOMAIN_PARTITIONED:-false}" \
+    -v t2d_history_months="${TAG2DOMAIN_HISTORY_PARTITION_MONTHS:-12}" \
     -v t2d_entity_table="$TAG2DOMAIN_ENTITY_TABLE" \
     -v t2d_entity_id_column="$TAG2DOMAIN_ENTITY_ID_COLUMN" \
     -v t2d_tag_type="$TAG2DOMAIN_TAG_TYPE" \
@@ -0,0 +1,56 @@
+#!/bin/bash
+set -e
+
+
+SCRIPT_DIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" >/dev/null 2>&1 && pwd )"
+cd "$SCRIPT_DIR"
+
+function error_exit {
+    >&2 echo "ERROR: $1"
+    exit 1
+}
+
+if [ -z "$POSTGRES_USER" ]; then
+    error_exit "POSTGRES_USER is not set"
+fi
+
+if [ -z "$POSTGRES_DB" ]; then
+    error_exit "POSTGRES_DB is not set"
+fi
+
+if [ -z "$TAG2DOMAIN_SCHEMA" ]; then
+    error_exit "TAG2DOMAIN_SCHEMA is not set"
+fi
+
+if [ -z "$TAG2DOMAIN_INTXN_TABLE_NAME" ]; then
+    error_exit "TAG2DOMAIN_INTXN_TABLE_NAME is not set"
+fi
+
+function run_psql_script {
+  psql \
+    -v ON_ERROR_STOP=1 \
+    -v t2d_schema="$TAG2DOMAIN_SCHEMA" \
+    -v t2d_intxn_table_name="$TAG2DOMAIN_INTXN_TABLE_NAME" \
+    -v t2d_validity_range="${TAG2DOMAIN_VALIDITY_RANGE:-false}" \
+    --username "$POSTGRES_USER" \
+    --dbname "$POSTGRES_DB" \
+    -f "$1"
+}
+
+if [ -n "$POSTGRES_HOST" ]; then
+  export PGHOST="$POSTGRES_HOST"
+fi
+
+if [ -n "$POSTGRES_PORT" ]; then
+  export PGPORT="$POSTGRES_PORT"
+fi
+
+if [ -n "$POSTGRES_PASSWORD_FILE" ]; then
+  export PGPASSFILE="$POSTGRES_PASSWORD_FILE"
+fi
+
+# all migrations are idempotent and are applied in order
+for file in $(find migrations -mindepth 1 -maxdepth 1 -name "*.sql" | sort); do
+  echo "applying $file"
+  run_psql_script "$file"
+done
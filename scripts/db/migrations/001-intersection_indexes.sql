@@ -0,0 +1,36 @@
+-- Adds the indexes for open intervals and at_time lookups to an intersection
+-- table created by an earlier version of create_intersection.sql.
+--
+-- The indexes are built concurrently so that msm2tag2domain can keep writing
+-- to the table. If a build fails, drop the invalid index and rerun. Indexes on
+-- partitioned tables (TAG2DOMAIN_PARTITIONED) can not be built concurrently;
+-- there the build blocks writes to the partitions until it is done.
+SET search_path TO :t2d_schema;
+
+\set t2d_intxn_open_idx :t2d_intxn_table_name '_open_idx'
+\set t2d_intxn_at_time_idx :t2d_intxn_table_name '_at_time_idx'
+SELECT (relkind = 'p') AS t2d_intxn_is_partitioned
+FROM pg_class WHERE oid = :'t2d_intxn_table_name'::regclass \gset
+\if :t2d_intxn_is_partitioned
+CREATE INDEX IF NOT EXISTS :t2d_intxn_open_idx
+    ON :t2d_intxn_table_name USING btree
+    (entity_id, taxonomy_id, tag_id, value_id)
+    WHERE (end_ts IS NULL);
+
+CREATE INDEX IF NOT EXISTS :t2d_intxn_at_time_idx
+    ON :t2d_intxn_table_name USING btree
+    ((COALESCE(end_ts, 'infinity'::timestamp with time zone)), start_ts)
+    INCLUDE (entity_id, taxonomy_id, tag_id, value_id, measured_at, end_ts);
+\else
+CREATE INDEX CONCURRENTLY IF NOT EXISTS :t2d_intxn_open_idx
+    ON :t2d_intxn_table_name USING btree
+    (entity_id, taxonomy_id, tag_id, value_id)
+    WHERE (end_ts IS NULL);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS :t2d_intxn_at_time_idx
+    ON :t2d_intxn_table_name USING btree
+    ((COALESCE(end_ts, 'infinity'::timestamp with time zone)), start_ts)
+    INCLUDE (entity_id, taxonomy_id, tag_id, value_id, measured_at, end_ts);
+\endif
+
+ANALYZE :t2d_intxn_table_name;
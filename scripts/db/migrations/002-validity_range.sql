@@ -0,0 +1,100 @@
+-- Adds the validity range column, its trigger and its GiST index to an
+-- intersection table if TAG2DOMAIN_VALIDITY_RANGE is set to true. Otherwise
+-- this migration does nothing.
+--
+-- Existing rows are backfilled in a single UPDATE, which rewrites every row of
+-- the table. On large tables run this during a maintenance window.
+SET search_path TO :t2d_schema;
+
+\if :t2d_validity_range
+ALTER TABLE :t2d_intxn_table_name ADD COLUMN IF NOT EXISTS validity tstzrange;
+COMMENT ON COLUMN :t2d_intxn_table_name.validity IS 'Range [start_ts, end_ts) in which the tag was set, maintained by a trigger';
+
+CREATE OR REPLACE FUNCTION tag2domain_set_validity()
+  RETURNS trigger AS $$
+BEGIN
+  IF NEW.end_ts < NEW.start_ts THEN
+    NEW.validity := 'empty'::tstzrange;
+  ELSE
+    NEW.validity := tstzrange(NEW.start_ts, NEW.end_ts, '[)');
+  END IF;
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- function tag2domain_create_validity_trigger(intxn_table)
+--
+-- creates the trigger that maintains the validity column on an intersection
+-- table. On a partitioned table the trigger is created on every partition
+-- instead, as PostgreSQL before 13 does not support BEFORE ROW triggers on
+-- partitioned tables. Tables that already have the trigger are skipped.
+-- Returns the number of triggers created.
+CREATE OR REPLACE FUNCTION tag2domain_create_validity_trigger(intxn_table regclass)
+  RETURNS integer AS $$
+DECLARE
+  table_schema name;
+  trigger_name name;
+  intxn_partition regclass;
+  n_created integer := 0;
+BEGIN
+  SELECT pg_namespace.nspname, pg_class.relname || '_set_validity'
+  INTO table_schema, trigger_name
+  FROM pg_class
+  JOIN pg_namespace ON (pg_namespace.oid = pg_class.relnamespace)
+  WHERE pg_class.oid = intxn_table;
+
+  FOR intxn_partition IN
+    WITH RECURSIVE partitions(relid) AS (
+      SELECT intxn_table::oid
+      UNION ALL
+      SELECT pg_inherits.inhrelid
+      FROM pg_inherits
+      JOIN partitions ON (pg_inherits.inhparent = partitions.relid)
+    )
+    SELECT partitions.relid::regclass
+    FROM partitions
+    JOIN pg_class ON (pg_class.oid = partitions.relid)
+    WHERE pg_class.relkind = 'r'
+  LOOP
+    CONTINUE WHEN EXISTS (
+      SELECT 1 FROM pg_trigger
+      WHERE tgrelid = intxn_partition AND tgname = trigger_name
+    );
+    EXECUTE format(
+      'CREATE TRIGGER %I BEFORE INSERT OR UPDATE OF start_ts, end_ts ON %s '
+      'FOR EACH ROW EXECUTE PROCEDURE %I.tag2domain_set_validity()',
+      trigger_name,
+      intxn_partition,
+      table_schema
+    );
+    n_created := n_created + 1;
+  END LOOP;
+
+  RETURN n_created;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT tag2domain_create_validity_trigger(:'t2d_intxn_table_name');
+
+UPDATE :t2d_intxn_table_name
+SET validity = CASE
+    WHEN end_ts < start_ts THEN 'empty'::tstzrange
+    ELSE tstzrange(start_ts, end_ts, '[)')
+  END
+WHERE validity IS NULL;
+
+\set t2d_intxn_validity_idx :t2d_intxn_table_name '_validity_idx'
+-- indexes on partitioned tables (TAG2DOMAIN_PARTITIONED) can not be built
+-- concurrently
+SELECT (relkind = 'p') AS t2d_intxn_is_partitioned
+FROM pg_class WHERE oid = :'t2d_intxn_table_name'::regclass \gset
+\if :t2d_intxn_is_partitioned
+CREATE INDEX IF NOT EXISTS :t2d_intxn_validity_idx
+    ON :t2d_intxn_table_name USING gist (validity);
+\else
+CREATE INDEX CONCURRENTLY IF NOT EXISTS :t2d_intxn_validity_idx
+    ON :t2d_intxn_table_name USING gist (validity);
+\endif
+
+ANALYZE :t2d_intxn_table_name;
+\endif
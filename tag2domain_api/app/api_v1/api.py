@@ -7,7 +7,8 @@ from tag2domain_api.app.api_v1.endpoints import (
     meta,
     bydomain,
     filters,
-    msm2tag
+    msm2tag,
+    export
 )
 
 router = APIRouter()
@@ -45,3 +46,8 @@ router.include_router(
     prefix="/stats",
     tags=["Statistics"]
 )
+router.include_router(
+    export.router,
+    prefix="/export",
+    tags=["Export"]
+)
@@ -1,17 +1,150 @@
 import datetime
 import logging
+from collections import OrderedDict
 
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
 from typing import List
 
-from tag2domain_api.app.util.models import TagsOfDomainsResponse
+from tag2domain_api.app.util.models import (
+    TagsOfDomainsResponse,
+    DomainsLookupRequest,
+    DomainsLookupResponse,
+    ErrorMessage
+)
 from tag2domain_api.app.util.config import config
 from tag2domain_api.app.util.db import execute_db, get_sql_base_table
+from tag2domain_api.app.util.responses import fast_response
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+TAG_COLUMNS = [
+    "taxonomy_id",
+    "taxonomy_name",
+    "tag_id",
+    "tag_name",
+    "value_id",
+    "value",
+    "start_time",
+    "measured_at",
+    "end_time"
+]
+
+
+@router.post(
+    "/",
+    response_model=DomainsLookupResponse,
+    name="taxonomies_by_domains",
+    summary="Show the tags of many domains at a single point in time",
+    responses={
+        400: {
+            "model": ErrorMessage,
+            "description": "Too many domains in the request"
+        }
+    }
+)
+def get_tags_by_domains(lookup: DomainsLookupRequest):
+    """ Returns the tags of up to BYDOMAIN_MAX_DOMAINS domains with a
+    single query.
+
+    **POST Body (JSON):**
+      * domains ... list of domain names to query (required)
+      * at_time .. reference time to look at. If empty, open tags are returned.
+            (YYYY-MM-DDTHH:mm:ss)
+      * taxonomy ... only return tags of this taxonomy
+
+    **Output (JSON):**
+      * domains ... list of the domains that have tags, in the order of the
+            request. A name that belongs to several domains is returned once
+            per domain_id.
+        * domain_id ... ID of the domain
+        * domain_name ... name of the domain
+        * tags ... list of tags in the format of /api/v1/bydomain/{domain}
+      * unknown_domains ... requested domain names without tags (at at_time
+            and in taxonomy, if given)
+    """
+    # remove duplicates but keep the order of the request
+    domain_names = list(OrderedDict.fromkeys(lookup.domains))
+    if len(domain_names) > config['BYDOMAIN_MAX_DOMAINS']:
+        raise HTTPException(
+            status_code=400,
+            detail="at most %i domains can be looked up at once" % (
+                config['BYDOMAIN_MAX_DOMAINS']
+            )
+        )
+    if len(domain_names) == 0:
+        return fast_response(
+            {"domains": [], "unknown_domains": []},
+            DomainsLookupResponse
+        )
+
+    parameters = {"taxonomy_name": lookup.taxonomy}
+    base_table, base_table_params = get_sql_base_table(
+        lookup.at_time,
+        domains=domain_names
+    )
+    parameters.update(base_table_params)
+
+    whereclause = "TRUE"
+    if lookup.taxonomy is not None:
+        whereclause = "(taxonomy.name = %(taxonomy_name)s)"
+
+    SQL = """
+            SELECT
+              domain_id,
+              domain_name,
+              taxonomy_id,
+              taxonomy.name AS taxonomy_name,
+              tag_table.tag_id,
+              tag_name,
+              value_id,
+              value,
+              start_time,
+              measured_at,
+              end_time
+            FROM %s AS tag_table -- base_table
+            JOIN tags USING (tag_id)
+            JOIN taxonomy ON (tags.taxonomy_id = taxonomy.id)
+            LEFT JOIN taxonomy_tag_val ON (tag_table.value_id = taxonomy_tag_val.id)
+            WHERE %s -- whereclause
+            ORDER BY domain_id, tag_table.tag_id asc""" % (
+        base_table,
+        whereclause
+    )
+    rows = execute_db(SQL, parameters, dict_=True)
+
+    # the rows are ordered by domain_id, so the domains of a name are as well
+    domains = OrderedDict()
+    for row in rows:
+        key = (row["domain_id"], row["domain_name"])
+        domain = domains.get(key)
+        if domain is None:
+            domain = domains[key] = {
+                "domain_id": row["domain_id"],
+                "domain_name": row["domain_name"],
+                "tags": []
+            }
+        domain["tags"].append({_key: row[_key] for _key in TAG_COLUMNS})
+
+    domains_by_name = {}
+    for domain in domains.values():
+        domains_by_name.setdefault(domain["domain_name"], []).append(domain)
+
+    return fast_response(
+        {
+            "domains": [
+                _domain
+                for _name in domain_names
+                for _domain in domains_by_name.get(_name, [])
+            ],
+            "unknown_domains": [
+                _name for _name in domain_names if _name not in domains_by_name
+            ]
+        },
+        DomainsLookupResponse
+    )
+
 
 @router.get(
     "/{domain}",
@@ -69,7 +202,7 @@ def get_tags_by_domain(
             ORDER BY domain_id, tag_table.tag_id asc
             LIMIT %%(limit)s OFFSET %%(offset)s""" % (base_table)
     rows = execute_db(SQL, parameters, dict_=True)
-    return rows
+    return fast_response(rows, List[TagsOfDomainsResponse])
 
 
 @router.get(
@@ -125,4 +258,4 @@ def get_tag_history_by_domain(
       LIMIT %(limit)s OFFSET %(offset)s
     """
     rows = execute_db(SQL, parameters, dict_=True)
-    return rows
+    return fast_response(rows, List[TagsOfDomainsResponse])
@@ -2,16 +2,20 @@ import time
 import datetime
 import logging
 
+import orjson
 from fastapi import APIRouter, HTTPException, Query
 from typing import List, Optional
 
-from fastapi.responses import ORJSONResponse
+from fastapi.responses import Response
+from pydantic import parse_obj_as
+from pydantic.datetime_parse import parse_datetime
 
 from tag2domain_api.app.util.models import (
     DomainsResponse,
     DomainsWithTagsResponse,
     VersionComparisonOperatorParameter,
-    DomainsResponseWithVersion
+    DomainsResponseWithVersion,
+    TagChangesResponse
 )
 from tag2domain_api.app.util.config import config
 from tag2domain_api.app.util.db import (
@@ -19,11 +23,86 @@ from tag2domain_api.app.util.db import (
     get_sql_base_table,
     RE_FILTER
 )
+from tag2domain_api.app.util.responses import (
+    fast_response,
+    get_response_media_type,
+    JSON_MEDIA_TYPE
+)
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+SQL_DOMAINS_WITH_TAGS_JSON = """
+    SELECT COALESCE(json_agg(domains ORDER BY domains.domain_id), '[]')::text
+    FROM (
+        SELECT
+            domain_id,
+            domain_name,
+            json_agg(
+                json_build_object(
+                    'tag_id', tag_id,
+                    'tag_name', tag_name,
+                    'start_time', start_time,
+                    'measured_at', measured_at,
+                    'end_time', end_time
+                )
+                ORDER BY tag_id, tag_type
+            ) AS tags
+        FROM %s -- from clause
+        GROUP BY domain_id, domain_name
+        ORDER BY domain_id
+        LIMIT %%(limit)s OFFSET %%(offset)s
+    ) AS domains"""
+
+
+def _parse_tag_times(domains):
+    for _domain in domains:
+        for _tag in _domain["tags"]:
+            for _key in ("start_time", "measured_at", "end_time"):
+                if _tag[_key] is not None:
+                    _tag[_key] = parse_datetime(_tag[_key])
+    return domains
+
+
+def domains_with_tags_json_response(from_clause, parameters, response_model):
+    """
+    Groups the tags per domain in the DB and returns the JSON document built
+    by the DB without decoding it. limit and offset apply to domains, so the
+    tags of a domain are never split across pages.
+
+    If the client prefers MessagePack, the document is decoded and returned
+    like the results grouped in python (see fast_response).
+
+    Parameters
+    ----------
+    from_clause - str
+        FROM and WHERE clause of the query. Must provide the columns
+        domain_id, domain_name, tag_id, tag_name, tag_type, start_time,
+        measured_at and end_time.
+    parameters - dict
+        parameters of the query including limit and offset
+    response_model - pydantic model or typing type
+        response_model of the route
+
+    Return
+    ------
+    fastapi.responses.Response
+    """
+    rows = execute_db(
+        SQL_DOMAINS_WITH_TAGS_JSON % from_clause,
+        parameters
+    )
+    document = rows[0][0]
+    if get_response_media_type() != JSON_MEDIA_TYPE:
+        return fast_response(
+            _parse_tag_times(orjson.loads(document)),
+            response_model
+        )
+    if config['VALIDATE_RESPONSES']:
+        parse_obj_as(response_model, orjson.loads(document))
+    return Response(content=document, media_type=JSON_MEDIA_TYPE)
+
 
 @router.get(
     "/bytag",
@@ -104,7 +183,7 @@ def get_domains_by_tag(
         )
     )
     rows = execute_db(SQL, parameters, dict_=True)
-    return rows
+    return fast_response(rows, List[DomainsResponse])
 
 
 @router.get(
@@ -150,6 +229,16 @@ def get_domains_by_taxonomy(
     parameters.update(base_table_params)
 
     whereclause = "(taxonomy.name = %(taxonomy_name)s)"
+    if config['DOMAINS_GROUP_IN_DB']:
+        return domains_with_tags_json_response(
+            """%s AS tag_table -- base_table
+            JOIN tags USING(tag_id)
+            JOIN taxonomy ON (tags.taxonomy_id = taxonomy.id)
+            WHERE (%s) -- whereclause""" % (base_table, whereclause),
+            parameters,
+            List[DomainsWithTagsResponse]
+        )
+
     SQL = (
         """
         SELECT
@@ -198,7 +287,7 @@ def get_domains_by_taxonomy(
 
     logger.debug("preparing response...")
     start = time.time()
-    response = ORJSONResponse(content=ret)
+    response = fast_response(ret, List[DomainsWithTagsResponse])
     logger.debug("response prepared in %f s", time.time() - start)
     return response
 
@@ -247,6 +336,18 @@ def get_domains_by_category(
     base_table, base_table_params = get_sql_base_table(at_time, filter)
     parameters.update(base_table_params)
 
+    if config['DOMAINS_GROUP_IN_DB']:
+        return domains_with_tags_json_response(
+            """%s AS tag_table -- base_table
+            JOIN tags USING (tag_id)
+            JOIN taxonomy ON (tags.taxonomy_id = taxonomy.id)
+            WHERE
+              (taxonomy.name = %%(taxonomy_name)s)
+              AND (tags.category = %%(category)s)""" % base_table,
+            parameters,
+            List[DomainsWithTagsResponse]
+        )
+
     SQL = """SELECT
                 domain_id,
                 domain_name,
@@ -260,19 +361,7 @@ def get_domains_by_category(
              JOIN taxonomy ON (tags.taxonomy_id = taxonomy.id)
              WHERE
               (taxonomy.name = %%(taxonomy_name)s)
-              AND
-              (
-                ( -- tags with a category
-                  (STRPOS(tag_name, '::') != 0)
-                  AND (
-                  (REGEXP_REPLACE(tag_name, '^(.+)::.+$', '\\1')) = %%(category)s)
-                )
-                OR
-                ( -- tags without a category
-                  (STRPOS(tag_name, '::') = 0)
-                  AND (%%(category)s = '')
-                )
-              )
+              AND (tags.category = %%(category)s)
              ORDER BY domain_id, tag_id asc
              LIMIT %%(limit)s OFFSET %%(offset)s""" % base_table
 
@@ -303,7 +392,7 @@ def get_domains_by_category(
 
     logger.debug("preparing response...")
     start = time.time()
-    response = ORJSONResponse(content=ret)
+    response = fast_response(ret, List[DomainsWithTagsResponse])
     logger.debug("response prepared in %f s", time.time() - start)
 
     return response
@@ -424,4 +513,91 @@ def get_domains_by_version(
       OFFSET %%(offset)s
     """ % (base_table, value_clause)
     rows = execute_db(SQL, parameters, dict_=True)
-    return rows
+    return fast_response(rows, List[DomainsResponseWithVersion])
+
+
+@router.get(
+    "/changes",
+    response_model=List[TagChangesResponse],
+    name="tag_changes",
+    summary="Show all tags that were opened or closed between {since} and "
+            "{until}"
+)
+def get_tag_changes(
+    since: datetime.datetime,
+    until: datetime.datetime,
+    taxonomy: Optional[str] = None,
+    tag: Optional[str] = None,
+    limit: int = config['default_limit'],
+    offset: int = config['default_offset']
+):
+    """ Returns all tags whose start_time or end_time is in the time range
+    ({since}, {until}].
+
+    Instead of fetching the tags at two points in time and comparing them, a
+    client that synchronizes the tags periodically can fetch the changes since
+    its last sync. Tags with an end_time in the range were closed, tags with a
+    start_time in the range were opened. A tag that was opened and closed in
+    the range is returned once.
+
+    **GET Parameters:**
+      * since ... start of the time range (exclusive, required)
+            (YYYY-MM-DDTHH:mm:ss)
+      * until ... end of the time range (inclusive, required)
+            (YYYY-MM-DDTHH:mm:ss)
+      * taxonomy ... only return tags of this taxonomy
+      * tag ... only return tags with this name
+      * limit .... how many entries should we return?
+      * offset.... starting at {offset}
+
+    **Output (JSON):**
+      * domain_id, domain_name, tag_type, tag_id, tag_name, value_id, value,
+        taxonomy_id, taxonomy_name, start_time, measured_at, end_time
+    """
+    if until < since:
+        raise HTTPException(
+            status_code=400,
+            detail="until must not be before since"
+        )
+
+    parameters = {
+        "since": since,
+        "until": until,
+        "taxonomy_name": taxonomy,
+        "tag_name": tag,
+        "limit": limit,
+        "offset": offset
+    }
+
+    whereclause_list = ["TRUE", ]
+    if taxonomy is not None:
+        whereclause_list.append("(taxonomy.name = %(taxonomy_name)s)")
+    if tag is not None:
+        whereclause_list.append("(tags.tag_name = %(tag_name)s)")
+    whereclause = ' AND '.join(whereclause_list)
+
+    SQL = """
+      SELECT
+          domain_id,
+          domain_name,
+          tag_type,
+          tag_table.tag_id,
+          tags.tag_name,
+          tag_table.value_id,
+          taxonomy_tag_val.value,
+          taxonomy.id AS taxonomy_id,
+          taxonomy.name AS taxonomy_name,
+          start_time,
+          measured_at,
+          end_time
+      FROM tag2domain_get_tags_changed(%%(since)s, %%(until)s) AS tag_table
+      JOIN tags USING (tag_id)
+      JOIN taxonomy ON (tags.taxonomy_id = taxonomy.id)
+      LEFT JOIN taxonomy_tag_val ON (tag_table.value_id = taxonomy_tag_val.id)
+      WHERE %s -- whereclause
+      ORDER BY domain_id, tag_table.tag_id, start_time, tag_type
+      LIMIT %%(limit)s
+      OFFSET %%(offset)s
+    """ % whereclause
+    rows = execute_db(SQL, parameters, dict_=True)
+    return fast_response(rows, List[TagChangesResponse])
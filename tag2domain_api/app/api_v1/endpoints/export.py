@@ -0,0 +1,184 @@
+import datetime
+import logging
+
+import anyio
+from fastapi import APIRouter, Query
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import iterate_in_threadpool
+
+from tag2domain_api.app.util.config import config
+from tag2domain_api.app.util.db import RE_FILTER
+from tag2domain_api.app.util.export import (
+    EXPORT_FORMATS,
+    EXPORT_FILE_SUFFIXES,
+    SNAPSHOT_FORMATS,
+    SNAPSHOT_FILE_SUFFIXES,
+    GZIP_MEDIA_TYPE,
+    DOMAINS_BY_TAXONOMY_SCHEMA,
+    TAG_HISTORY_SCHEMA,
+    sql_domains_by_taxonomy,
+    sql_tag_history_by_domain,
+    export_query,
+    iter_snapshot
+)
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+RE_EXPORT_FORMAT = "^(%s)$" % "|".join(sorted(EXPORT_FORMATS.keys()))
+RE_SNAPSHOT_FORMAT = "^(%s)$" % "|".join(sorted(SNAPSHOT_FORMATS.keys()))
+
+
+async def closing_stream(iterator):
+    """
+    Iterates over a generator in the threadpool like StreamingResponse but
+    closes it when the response ends, also if the client disconnected.
+    Otherwise the generator, and with it the DB connection of the export,
+    is only closed when it is garbage collected.
+    """
+    try:
+        async for chunk in iterate_in_threadpool(iterator):
+            yield chunk
+    finally:
+        with anyio.CancelScope(shield=True):
+            await anyio.to_thread.run_sync(iterator.close)
+
+
+def export_response(query, params, schema, format, filename, chunk_size):
+    return StreamingResponse(
+        closing_stream(
+            export_query(query, params, schema, format, chunk_size=chunk_size)
+        ),
+        media_type=EXPORT_FORMATS[format],
+        headers={
+            "Content-Disposition": 'attachment; filename="%s.%s"' % (
+                filename, EXPORT_FILE_SUFFIXES[format]
+            )
+        }
+    )
+
+
+@router.get(
+    "/bytaxonomy",
+    name="export_domains_by_taxonomy",
+    summary="Export all domains which are classified by {taxonomy} and their "
+            "tags",
+    response_class=StreamingResponse
+)
+def export_domains_by_taxonomy(
+    taxonomy: str,
+    format: str = Query("arrow", regex=RE_EXPORT_FORMAT),
+    at_time: datetime.datetime = None,
+    filter: str = Query(None, regex=RE_FILTER),
+    chunk_size: int = Query(config['EXPORT_CHUNK_SIZE'], ge=1)
+):
+    """ Exports the tags of all domains of a given {taxonomy} as Apache Arrow
+    IPC stream or Parquet file. The rows are the same as the ones of
+    /api/v1/domains/bytaxonomy but without grouping and paging.
+
+    **GET Parameters:**
+      * taxonomy ... the taxonomy name to query (required)
+      * format .... arrow (Arrow IPC stream, default) or parquet
+      * at_time .. reference time to look at. If empty, open tags are returned.
+            (YYYY-MM-DDTHH:mm:ss)
+      * filter ... filter of the form Tag=Value
+      * chunk_size ... number of rows per record batch / row group
+
+    **Output columns:**
+      * domain_id, domain_name, tag_id, tag_name, start_time, measured_at,
+        end_time
+    """
+    query, params = sql_domains_by_taxonomy(taxonomy, at_time, filter)
+    return export_response(
+        query,
+        params,
+        DOMAINS_BY_TAXONOMY_SCHEMA,
+        format,
+        taxonomy,
+        chunk_size
+    )
+
+
+@router.get(
+    "/bydomain/{domain}/history",
+    name="export_tag_history_by_domain",
+    summary="Export the tag history of a domain",
+    response_class=StreamingResponse
+)
+def export_tag_history_by_domain(
+    domain: str,
+    format: str = Query("arrow", regex=RE_EXPORT_FORMAT),
+    chunk_size: int = Query(config['EXPORT_CHUNK_SIZE'], ge=1)
+):
+    """ Exports the tag history of a single domain as Apache Arrow IPC stream
+    or Parquet file. The rows are the same as the ones of
+    /api/v1/bydomain/{domain}/history but without paging.
+
+    **GET Parameters:**
+      * domain ... the domain name to query (required)
+      * format .... arrow (Arrow IPC stream, default) or parquet
+      * chunk_size ... number of rows per record batch / row group
+
+    **Output columns:**
+      * taxonomy_id, taxonomy_name, tag_id, tag_name, value_id, value,
+        start_time, measured_at, end_time
+    """
+    query, params = sql_tag_history_by_domain(domain)
+    return export_response(
+        query,
+        params,
+        TAG_HISTORY_SCHEMA,
+        format,
+        domain,
+        chunk_size
+    )
+
+
+@router.get(
+    "/snapshot",
+    name="export_snapshot",
+    summary="Export all open tags or all tags at a point in time",
+    response_class=StreamingResponse
+)
+def export_snapshot(
+    format: str = Query("csv", regex=RE_SNAPSHOT_FORMAT),
+    compress: bool = False,
+    at_time: datetime.datetime = None,
+    taxonomy: str = None,
+    filter: str = Query(None, regex=RE_FILTER)
+):
+    """ Exports a snapshot of all open tags (or of all tags at {at_time})
+    using COPY ... TO STDOUT. The rows are not ordered.
+
+    **GET Parameters:**
+      * format .... csv (with header, default) or binary (binary COPY format
+            of PostgreSQL)
+      * compress ... gzip compress the snapshot
+      * at_time .. reference time to look at. If empty, open tags are returned.
+            (YYYY-MM-DDTHH:mm:ss)
+      * taxonomy ... only export the tags of this taxonomy
+      * filter ... filter of the form Tag=Value
+
+    **Output columns:**
+      * domain_id, domain_name, tag_type, taxonomy_name, category, tag_id,
+        tag_name, value_id, value, start_time, measured_at, end_time
+    """
+    filename = "snapshot.%s" % SNAPSHOT_FILE_SUFFIXES[format]
+    media_type = SNAPSHOT_FORMATS[format]
+    if compress:
+        filename += ".gz"
+        media_type = GZIP_MEDIA_TYPE
+    return StreamingResponse(
+        closing_stream(iter_snapshot(
+            at_time=at_time,
+            taxonomy=taxonomy,
+            filter=filter,
+            format_=format,
+            compress=compress
+        )),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": 'attachment; filename="%s"' % filename
+        }
+    )
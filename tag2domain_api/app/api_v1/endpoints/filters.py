@@ -4,6 +4,7 @@ from fastapi import APIRouter
 from typing import List
 
 from tag2domain_api.app.util.db import execute_db
+from tag2domain_api.app.util.responses import fast_response
 
 logger = logging.getLogger(__name__)
 
@@ -28,7 +29,7 @@ def get_types():
         FROM v_tag2domain_domain_filter
         ORDER BY tag_name
     """, ())
-    return [name for name, in rows]
+    return fast_response([name for name, in rows], List[str])
 
 
 @router.get(
@@ -54,4 +55,4 @@ def get_values(filter: str):
         (filter, )
     )
 
-    return [name for name, in rows]
+    return fast_response([name for name, in rows], List[str])
@@ -11,7 +11,8 @@ from tag2domain_api.app.util.models import (
     ErrorMessage
 )
 from tag2domain_api.app.util.config import config
-from tag2domain_api.app.util.db import execute_db
+from tag2domain_api.app.util.responses import fast_response
+from tag2domain_api.app.util.db import execute_db_cached
 
 logger = logging.getLogger(__name__)
 
@@ -56,14 +57,15 @@ def get_taxonomies(
                 name,
                 description,
                 is_actionable,
-                is_automatically_classifiable,
-                is_stable,allows_auto_tags,
+                is_automatically_classifiable::int::float8
+                  AS is_automatically_classifiable,
+                is_stable::int::float8 AS is_stable,
                 for_numbers,
                 for_domains,
                 url
              FROM taxonomy ORDER BY id asc LIMIT %s OFFSET %s"""
-    rows = execute_db(SQL, (limit, offset), dict_=True)
-    return rows
+    rows = execute_db_cached(SQL, (limit, offset), dict_=True)
+    return fast_response(rows, List[TaxonomiesResponse])
 
 
 @router.get(
@@ -109,15 +111,7 @@ def get_tags(
                 detail="querying category tags requires taxonomy to be set"
             )
 
-        if category == "":
-            category_where_clause = "(STRPOS(tag_name, '::') = 0)"
-        else:
-            category_where_clause = (
-                "(STRPOS(tag_name, '::') != 0) "
-                "AND ("
-                "(REGEXP_REPLACE(tag_name,'^(.+)::.+$', '\\1')) = %(category)s"
-                ")"
-            )
+        category_where_clause = "(tags.category = %(category)s)"
     else:
         category_where_clause = "True"
 
@@ -130,8 +124,8 @@ def get_tags(
       LIMIT %%(limit)s
       OFFSET %%(offset)s
     """ % (taxonomy_where_clause, category_where_clause)
-    rows = execute_db(SQL, params, dict_=True)
-    return rows
+    rows = execute_db_cached(SQL, params, dict_=True)
+    return fast_response(rows, List[TagsResponse])
 
 
 @router.get(
@@ -165,28 +159,18 @@ def get_categories(
         taxonomy_clause = "(taxonomy.name = %(taxonomy)s)"
 
     SQL = """
-      SELECT DISTINCT ON (category)
-        (REGEXP_REPLACE(tag_name, '^(.+)::.+$', '\\1')) AS category
+      SELECT DISTINCT
+        category,
+        (category = '') AS is_root
       FROM tags
       JOIN taxonomy ON (tags.taxonomy_id = taxonomy.id)
-      WHERE STRPOS(tag_name, '::') != 0 AND {0}
-      UNION ALL
-      SELECT
-        category
-      FROM (
-        SELECT
-          '' AS category
-          FROM tags
-          JOIN taxonomy ON (tags.taxonomy_id = taxonomy.id)
-          WHERE
-            STRPOS(tag_name, '::') = 0 AND {0}
-          LIMIT 1
-      ) AS t
+      WHERE {0}
+      ORDER BY is_root, category
       LIMIT %(limit)s
       OFFSET %(offset)s
     """.format(taxonomy_clause)
-    rows = execute_db(SQL, params, dict_=False)
-    return [_elem[0] for _elem in rows]
+    rows = execute_db_cached(SQL, params, dict_=False)
+    return fast_response([_elem[0] for _elem in rows], List[str])
 
 
 @router.get(
@@ -227,8 +211,8 @@ def get_values(
       LIMIT %(limit)s
       OFFSET %(offset)s
     """
-    rows = execute_db(SQL, params, dict_=True)
-    return rows
+    rows = execute_db_cached(SQL, params, dict_=True)
+    return fast_response(rows, List[ValuesResponse])
 
 
 @router.get(
@@ -286,37 +270,7 @@ def get_tag_info(
       SELECT
         tags.tag_name AS tag_name,
         tags.tag_description AS tag_description,
-        REGEXP_REPLACE(tags.tag_name, '^(.+)::.+$', '\\1') AS tag_category,
-        tags.extras AS tag_extras,
-        taxonomy.name AS taxonomy_name,
-        taxonomy.description AS taxonomy_description,
-        taxonomy.url AS taxonomy_url,
-        taxonomy.is_actionable AS taxonomy_flags_is_actionable,
-        taxonomy.is_automatically_classifiable AS taxonomy_flags_is_automatically_classifiable,
-        taxonomy.is_stable AS taxonomy_flags_is_stable,
-        taxonomy.for_numbers AS taxonomy_flags_for_numbers,
-        taxonomy.for_domains AS taxonomy_flags_for_domains,
-        taxonomy.allows_auto_tags AS taxonomy_flags_allows_auto_tags,
-        taxonomy.allows_auto_values AS taxonomy_flags_allows_auto_values,
-        COUNT(DISTINCT taxonomy_tag_val.id) AS values_count
-      FROM tags
-      JOIN taxonomy ON (taxonomy.id = tags.taxonomy_id)
-      LEFT JOIN taxonomy_tag_val ON (taxonomy_tag_val.tag_id = tags.tag_id)
-      WHERE
-        tags.tag_name = %(tag)s
-        AND taxonomy.name = %(taxonomy)s
-        AND (STRPOS(tag_name, '::') != 0)
-      GROUP BY
-      tags.tag_name, tags.tag_description, tags.extras,
-      taxonomy.name, taxonomy.description, taxonomy.description,
-      taxonomy.url, taxonomy.is_actionable, taxonomy.is_automatically_classifiable,
-      taxonomy.is_stable, taxonomy.for_numbers, taxonomy.for_domains,
-      taxonomy.allows_auto_tags, taxonomy.allows_auto_values
-      UNION ALL
-      SELECT
-        tags.tag_name AS tag_name,
-        tags.tag_description AS tag_description,
-        NULL AS tag_category,
+        NULLIF(tags.category, '') AS tag_category,
         tags.extras AS tag_extras,
         taxonomy.name AS taxonomy_name,
         taxonomy.description AS taxonomy_description,
@@ -335,16 +289,15 @@ def get_tag_info(
       WHERE
         tags.tag_name = %(tag)s
         AND taxonomy.name = %(taxonomy)s
-        AND (STRPOS(tag_name, '::') = 0)
       GROUP BY
-      tags.tag_name, tags.tag_description, tags.extras,
+      tags.tag_name, tags.tag_description, tags.category, tags.extras,
       taxonomy.name, taxonomy.description, taxonomy.description,
       taxonomy.url, taxonomy.is_actionable, taxonomy.is_automatically_classifiable,
       taxonomy.is_stable, taxonomy.for_numbers, taxonomy.for_domains,
       taxonomy.allows_auto_tags, taxonomy.allows_auto_values
     ;
     """
-    rows = execute_db(SQL, params, dict_=True)
+    rows = execute_db_cached(SQL, params, dict_=True)
 
     if len(rows) == 0:
         raise HTTPException(
@@ -370,7 +323,7 @@ def get_tag_info(
             'flags': {
                 'is_actionable': row['taxonomy_flags_is_actionable'],
                 'is_automatically_classifiable': row['taxonomy_flags_is_automatically_classifiable'],
-                'is_stable': row['taxonomy_flags_is_actionable'],
+                'is_stable': row['taxonomy_flags_is_stable'],
                 'for_numbers': row['taxonomy_flags_for_numbers'],
                 'for_domains': row['taxonomy_flags_for_domains'],
                 'allows_auto_tags': row['taxonomy_flags_allows_auto_tags'],
@@ -382,4 +335,4 @@ def get_tag_info(
         }
     }
 
-    return ret
+    return fast_response(ret, TagInfoResponse)
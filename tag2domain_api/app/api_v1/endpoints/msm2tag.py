@@ -4,7 +4,8 @@ import traceback
 from fastapi import APIRouter, HTTPException, Body
 
 from tag2domain_api.app.util.config import config
-from tag2domain_api.app.util.db import get_db
+from tag2domain_api.app.util.db import get_db, invalidate_result_cache
+from tag2domain_api.app.util.metrics import get_ingest_metrics
 
 logger = logging.getLogger(__name__)
 
@@ -28,6 +29,11 @@ if "ENABLE_MSM2TAG" in config and config["ENABLE_MSM2TAG"] is True:
     else:
         _, intxn_table_mappings = parse_config(config["MSM2TAG_DB_CONFIG"])
     max_measurement_age = config["MSM2TAG_MAX_MEASUREMENT_AGE"]
+    update_change_watermark = config["MSM2TAG_UPDATE_CHANGE_WATERMARK"]
+    maintain_open_tag_counts = config["MSM2TAG_MAINTAIN_OPEN_TAG_COUNTS"]
+    summarize_logging = config["MSM2TAG_SUMMARIZE_LOGGING"]
+    prepare_statements = config["MSM2TAG_PREPARE_STATEMENTS"]
+    pipeline_writes = config["MSM2TAG_PIPELINE_WRITES"]
 
     @router.post("/")
     async def msm2tag(
@@ -55,23 +61,29 @@ if "ENABLE_MSM2TAG" in config and config["ENABLE_MSM2TAG"] is True:
         _db_adapter = Psycopg2Adapter(
             get_db(),
             intxn_table_mappings,
-            logger=logger
+            logger=logger,
+            prepare_statements=prepare_statements,
+            pipeline_writes=pipeline_writes
         )
 
         _msm2tags = MeasurementToTags(
             _db_adapter,
             logger=logger,
-            max_measurement_age=max_measurement_age
+            max_measurement_age=max_measurement_age,
+            update_change_watermark=update_change_watermark,
+            maintain_open_tag_counts=maintain_open_tag_counts,
+            metrics=get_ingest_metrics(),
+            summarize_logging=summarize_logging
         )
         try:
-            logger.debug(msm.dict(exclude_unset=True))
-            _msm2tags.handle_measurement(
-                msm.dict(exclude_unset=True),
-                skip_validation=True
-            )
+            msm_dict = msm.dict(exclude_unset=True)
+            logger.debug("%s", msm_dict)
+            _msm2tags.handle_measurement(msm_dict, skip_validation=True)
         except (InvalidMeasurementException, StaleMeasurementException) as e:
             logger.info("error 400: " + str(e))
             logger.debug(traceback.format_exc())
             raise HTTPException(status_code=400, detail=str(e))
 
+        invalidate_result_cache()
+
         return {"message": "OK"}
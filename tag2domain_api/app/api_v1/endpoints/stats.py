@@ -11,8 +11,9 @@ from tag2domain_api.app.util.models import (
     StatsValuesResponse
 )
 from tag2domain_api.app.util.config import config
+from tag2domain_api.app.util.responses import fast_response
 from tag2domain_api.app.util.db import (
-    execute_db,
+    execute_db_cached,
     get_sql_base_table,
     RE_FILTER
 )
@@ -22,6 +23,22 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
+def use_open_tag_counts(at_time, filter):
+    """
+    Returns True if stats can be read from the open_tag_counts table
+    instead of being counted on the base table.
+
+    The counters count the entities per tag type, so they are only used for
+    a single tag type. Summing them over several tag types would count a
+    domain that is tagged through more than one of them several times.
+    """
+    return (
+        bool(config['STATS_OPEN_TAG_COUNTS_TAG_TYPE'])
+        and at_time is None
+        and filter is None
+    )
+
+
 @router.get(
     "/taxonomies",
     response_model=List[StatsTaxonomiesResponse],
@@ -56,6 +73,29 @@ def get_stats_taxonomies(
       | taxonomy_name               | name of the taxonomy                                                            |
       | count                       | number of domains labeled by at least one tag from this taxonomy                |
     """
+    if use_open_tag_counts(at_time, filter):
+        SQL = """
+          SELECT
+            entity_count AS count,
+            taxonomy.name AS taxonomy_name
+            FROM open_tag_counts
+            JOIN taxonomy ON (open_tag_counts.taxonomy_id = taxonomy.id)
+            WHERE
+              (open_tag_counts.tag_type = %(tag_type)s)
+              AND (open_tag_counts.tag_id IS NULL)
+              AND (entity_count > 0)
+            ORDER BY count DESC LIMIT %(limit)s OFFSET %(offset)s
+          """
+        params = {
+            'tag_type': config['STATS_OPEN_TAG_COUNTS_TAG_TYPE'],
+            'limit': limit,
+            'offset': offset
+        }
+        return fast_response(
+            execute_db_cached(SQL, params, dict_=True),
+            List[StatsTaxonomiesResponse]
+        )
+
     base_table, base_table_params = get_sql_base_table(at_time, filter)
 
     # Build the SQL statement
@@ -75,8 +115,8 @@ def get_stats_taxonomies(
         'offset': offset
     }
     params.update(base_table_params)
-    rows = execute_db(SQL, params, dict_=True)
-    return rows
+    rows = execute_db_cached(SQL, params, dict_=True, at_time=at_time)
+    return fast_response(rows, List[StatsTaxonomiesResponse])
 
 
 @router.get(
@@ -118,37 +158,17 @@ def get_stats_categories(
     base_table, base_table_params = get_sql_base_table(at_time, filter)
 
     SQL = """
-      WITH t AS (
-        SELECT
-          domain_id,
-          REGEXP_REPLACE(tag_name, '^(.+)::.+$', '\\1') AS category
-        FROM %s AS tag_table -- base_table
-        JOIN tags USING (tag_id)
-        JOIN taxonomy ON (tags.taxonomy_id = taxonomy.id)
-        WHERE
-          (taxonomy.name = %%(taxonomy)s)
-          AND (STRPOS(tag_name, '::') != 0)
-        UNION ALL
-        SELECT
-          domain_id,
-          '' AS category
-        FROM %s AS tag_table -- base_table
-        JOIN tags USING (tag_id)
-        JOIN taxonomy ON (tags.taxonomy_id = taxonomy.id)
-        WHERE
-          (taxonomy.name = %%(taxonomy)s)
-          AND (STRPOS(tag_name, '::') = 0)
-      )
       SELECT
         category,
-        COUNT(*) AS count
-      FROM (
-        SELECT DISTINCT ON (domain_id, category) category FROM t
-      ) AS subquery
+        COUNT(DISTINCT domain_id) AS count
+      FROM %s AS tag_table -- base_table
+      JOIN tags USING (tag_id)
+      JOIN taxonomy ON (tags.taxonomy_id = taxonomy.id)
+      WHERE (taxonomy.name = %%(taxonomy)s)
       GROUP BY category
-      ORDER BY count DESC
+      ORDER BY count DESC, category
       LIMIT %%(limit)s
-        OFFSET %%(offset)s""" % (base_table, base_table)
+        OFFSET %%(offset)s""" % base_table
     params = {
         'taxonomy': taxonomy,
         'at_time': at_time,
@@ -156,8 +176,8 @@ def get_stats_categories(
         'offset': offset
     }
     params.update(base_table_params)
-    rows = execute_db(SQL, params, dict_=True)
-    return rows
+    rows = execute_db_cached(SQL, params, dict_=True, at_time=at_time)
+    return fast_response(rows, List[StatsCategoriesResponse])
 
 
 @router.get(
@@ -201,24 +221,36 @@ def get_stats_bycategory(
     base_table, base_table_params = get_sql_base_table(at_time, filter)
 
     if category is not None:
-        category_clause = """
-          (
-            ( -- tags with a category
-              (STRPOS(tag_name, '::') != 0)
-              AND (
-                (REGEXP_REPLACE(tag_name, '^(.+)::.+$', '\\1')) = %(category)s
-              )
-            )
-            OR
-            ( -- tags without a category
-              (STRPOS(tag_name, '::') = 0)
-              AND (%(category)s = '')
-            )
-          )
-        """
+        category_clause = "(tags.category = %(category)s)"
     else:
         category_clause = "TRUE"
 
+    if use_open_tag_counts(at_time, filter):
+        SQL = """
+          SELECT
+            tag_name,
+            entity_count AS count
+          FROM open_tag_counts
+          JOIN tags USING (tag_id)
+          JOIN taxonomy ON (tags.taxonomy_id = taxonomy.id)
+          WHERE
+            (open_tag_counts.tag_type = %%(tag_type)s)
+            AND (taxonomy.name = %%(taxonomy)s)
+            AND (open_tag_counts.value_id IS NULL)
+            AND (entity_count > 0)
+            AND (%s) -- category clause
+          ORDER BY count DESC
+          """ % category_clause
+        params = {
+            'tag_type': config['STATS_OPEN_TAG_COUNTS_TAG_TYPE'],
+            'taxonomy': taxonomy,
+            'category': category
+        }
+        return fast_response(
+            execute_db_cached(SQL, params, dict_=True),
+            List[StatsTagsResponse]
+        )
+
     SQL = """
       SELECT
         tag_name,
@@ -240,8 +272,8 @@ def get_stats_bycategory(
         'offset': offset
     }
     params.update(base_table_params)
-    rows = execute_db(SQL, params, dict_=True)
-    return rows
+    rows = execute_db_cached(SQL, params, dict_=True, at_time=at_time)
+    return fast_response(rows, List[StatsTagsResponse])
 
 
 @router.get(
@@ -281,6 +313,34 @@ def get_stats_values(
       | value                       | value                                                                           |
       | count                       | number of domains labeled by value and tag {tag}                                |
     """
+    if use_open_tag_counts(at_time, filter):
+        SQL = """
+          SELECT
+            value,
+            entity_count AS count
+          FROM open_tag_counts
+          JOIN tags USING (tag_id)
+          JOIN taxonomy ON (tags.taxonomy_id = taxonomy.id)
+          JOIN taxonomy_tag_val ON (
+            open_tag_counts.value_id = taxonomy_tag_val.id
+          )
+          WHERE
+            (open_tag_counts.tag_type = %(tag_type)s)
+            AND (taxonomy.name = %(taxonomy)s)
+            AND (tag_name = %(tag)s)
+            AND (entity_count > 0)
+          ORDER BY count DESC
+        """
+        params = {
+            'tag_type': config['STATS_OPEN_TAG_COUNTS_TAG_TYPE'],
+            'taxonomy': taxonomy,
+            'tag': tag
+        }
+        return fast_response(
+            execute_db_cached(SQL, params, dict_=True),
+            List[StatsValuesResponse]
+        )
+
     base_table, base_table_params = get_sql_base_table(at_time, filter)
 
     SQL = """
@@ -309,5 +369,5 @@ def get_stats_values(
         'offset': offset
     }
     params.update(base_table_params)
-    rows = execute_db(SQL, params, dict_=True)
-    return rows
+    rows = execute_db_cached(SQL, params, dict_=True, at_time=at_time)
+    return fast_response(rows, List[StatsValuesResponse])
@@ -2,6 +2,10 @@ from fastapi import APIRouter
 import logging
 
 from tag2domain_api.app.util.config import config
+from tag2domain_api.app.util.db import (
+    get_result_cache,
+    get_slow_query_log
+)
 
 logger = logging.getLogger(__name__)
 
@@ -24,3 +28,21 @@ async def get_version():
 )
 async def get_api_versions():
     return [{"version": "v1"}, ]
+
+
+@router.get(
+    "/cache",
+    name="Result cache statistics",
+    summary="Return the size and hit ratio of the result cache"
+)
+async def get_cache_stats():
+    return get_result_cache().stats()
+
+
+@router.get(
+    "/slow-queries",
+    name="Slow query log",
+    summary="Return the latest statements that exceeded the threshold"
+)
+async def get_slow_queries():
+    return get_slow_query_log().entries()
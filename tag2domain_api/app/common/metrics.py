@@ -0,0 +1,24 @@
+from fastapi import APIRouter, Response
+import logging
+
+import prometheus_client
+
+from tag2domain_api.app.util.metrics import generate_metrics
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+@router.get(
+    "/metrics",
+    name="Prometheus metrics",
+    summary="Return the ingest and result cache metrics in the Prometheus "
+            "text format",
+    response_class=Response
+)
+async def get_metrics():
+    return Response(
+        content=generate_metrics(),
+        media_type=prometheus_client.CONTENT_TYPE_LATEST
+    )
@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 import logging
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse
 
 import tag2domain_api.app.util.logging
 from tag2domain_api.app.util.config import config, description
@@ -10,6 +11,19 @@ from tag2domain_api.app.util.db import connect_db, disconnect_db
 from tag2domain_api.app.api_v1.api import router as router_api_v1
 from tag2domain_api.app.common.test import router as router_test
 from tag2domain_api.app.common.meta import router as router_meta
+from tag2domain_api.app.common.metrics import router as router_metrics
+from tag2domain_api.app.util.metrics import metrics_enabled
+from tag2domain_api.app.util.responses import (
+    negotiate_media_type,
+    set_response_media_type,
+    reset_response_media_type
+)
+from tag2domain_api.app.util.statements import (
+    StatementContextMiddleware,
+    StatementTimeoutError,
+    QueryCancelledError
+)
+from tag2domain_api.app.util.timing import ServerTimingMiddleware
 
 tag2domain_api.app.util.logging.setup()
 logger = logging.getLogger(__name__)
@@ -25,6 +39,43 @@ app = FastAPI(
 app.include_router(router_test, prefix="/test", tags=["Test"])
 app.include_router(router_meta, prefix="/meta", tags=["Meta"])
 app.include_router(router_api_v1, prefix="/api/v1")
+if metrics_enabled():
+    app.include_router(router_metrics, tags=["Metrics"])
+
+
+@app.middleware("http")
+async def negotiate_response_format(request: Request, call_next):
+    """Makes the Accept header available to the endpoints that return
+    their results with fast_response."""
+    token = set_response_media_type(
+        negotiate_media_type(request.headers.get("accept"))
+    )
+    try:
+        return await call_next(request)
+    finally:
+        reset_response_media_type(token)
+
+
+app.add_middleware(StatementContextMiddleware, config=config)
+app.add_middleware(ServerTimingMiddleware, config=config)
+
+
+@app.exception_handler(StatementTimeoutError)
+def statement_timeout(request: Request, exc: StatementTimeoutError):
+    logger.warning("statement timeout on %s - %s", request.url.path, exc)
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "the query exceeded the statement timeout"}
+    )
+
+
+@app.exception_handler(QueryCancelledError)
+def query_cancelled(request: Request, exc: QueryCancelledError):
+    # the client has already gone away, nobody reads this response
+    return JSONResponse(
+        status_code=408,
+        content={"detail": "the query was cancelled"}
+    )
 
 
 @app.on_event('startup')
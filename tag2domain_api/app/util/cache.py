@@ -0,0 +1,106 @@
+import datetime
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResultCache(object):
+    """
+    Bounded LRU cache for query results.
+
+    Every entry is bound to a change watermark and is only returned if the
+    current watermark equals the one recorded when the entry was stored.
+    Entries that expire (results for the open tags or for recent points in
+    time) are in addition only returned if, with a non-zero ttl, they are
+    younger than ttl seconds.
+
+    A max_entries of 0 disables the cache.
+    """
+
+    def __init__(self, max_entries=0, ttl=0, history_min_age=86400):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.history_min_age = history_min_age
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def is_historic(self, at_time):
+        """
+        Returns True if at_time is older than history_min_age seconds.
+
+        Results for such points in time only change if a backdated
+        measurement is ingested, which moves the change watermark, so they
+        are not subject to the ttl.
+        """
+        if at_time is None:
+            return False
+        if at_time.tzinfo is None:
+            now = datetime.datetime.utcnow()
+        else:
+            now = datetime.datetime.now(datetime.timezone.utc)
+        return (now - at_time).total_seconds() > self.history_min_age
+
+    def get(self, key, watermark=None):
+        """
+        Returns a tuple (found, value). found is False if there is no valid
+        entry for key.
+        """
+        if not self.enabled:
+            return False, None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, entry_watermark, stored_at, expires = entry
+                if entry_watermark != watermark or (
+                    expires
+                    and self.ttl > 0
+                    and time.time() - stored_at > self.ttl
+                ):
+                    del self._entries[key]
+                    self.invalidations += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value, watermark=None, expires=True):
+        """
+        Stores value under key bound to watermark. If expires is False the
+        entry is not subject to the ttl.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = (value, watermark, time.time(), expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "max_entries": self.max_entries,
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / requests) if requests > 0 else None,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations
+            }
@@ -1,6 +1,8 @@
 import os
 from dotenv import load_dotenv, find_dotenv
 
+from tag2domain_api.app.util.statements import parse_statement_timeouts
+
 
 """
 Config file
@@ -41,9 +43,100 @@ config.update(dict(
     DBPASSWORD=os.getenv('DBPASSWORD'),
     DBSSLMODE=os.getenv('DBSSLMODE', 'require'),
     DBTAG2DOMAIN_SCHEMA=os.getenv('DBTAG2DOMAIN_SCHEMA', 'tag2domain'),
+    # comma separated list of read replicas (host[:port]) that use the
+    # database and credentials above. The read-only endpoints use the
+    # replicas, only msm2tag writes to the primary (DBHOST).
+    DBREPLICA_HOSTS=os.getenv('DBREPLICA_HOSTS', ''),
+    # round_robin or least_connections
+    DBREPLICA_SELECTION=os.getenv('DBREPLICA_SELECTION', 'round_robin'),
+    # replicas that lag behind the primary by more than this many seconds
+    # are not used (0 means no limit)
+    DBREPLICA_MAX_LAG=float(os.getenv('DBREPLICA_MAX_LAG', '0')),
+    # minimum time in seconds between two health checks of a replica
+    DBREPLICA_CHECK_INTERVAL=float(
+        os.getenv('DBREPLICA_CHECK_INTERVAL', '5')
+    ),
     ENABLE_MSM2TAG=(os.getenv('ENABLE_MSM2TAG', False) == 'True'),
     MSM2TAG_MAX_MEASUREMENT_AGE=os.getenv('MSM2TAG_MAX_MEASUREMENT_AGE', None),
-    MSM2TAG_DB_CONFIG=os.getenv('MSM2TAG_DB_CONFIG', None)
+    MSM2TAG_DB_CONFIG=os.getenv('MSM2TAG_DB_CONFIG', None),
+    MSM2TAG_UPDATE_CHANGE_WATERMARK=(
+        os.getenv('MSM2TAG_UPDATE_CHANGE_WATERMARK', False) == 'True'
+    ),
+    MSM2TAG_MAINTAIN_OPEN_TAG_COUNTS=(
+        os.getenv('MSM2TAG_MAINTAIN_OPEN_TAG_COUNTS', False) == 'True'
+    ),
+    # prepare the statements on the intersection tables on the server
+    MSM2TAG_PREPARE_STATEMENTS=(
+        os.getenv('MSM2TAG_PREPARE_STATEMENTS', False) == 'True'
+    ),
+    # send the writes of a measurement in a single message
+    MSM2TAG_PIPELINE_WRITES=(
+        os.getenv('MSM2TAG_PIPELINE_WRITES', False) == 'True'
+    ),
+    # log a single summary line per measurement instead of one line per tag
+    MSM2TAG_SUMMARIZE_LOGGING=(
+        os.getenv('MSM2TAG_SUMMARIZE_LOGGING', False) == 'True'
+    ),
+    # validate the results of the endpoints against their response_model.
+    # Results are otherwise serialized without validation, see
+    # util/responses.py.
+    VALIDATE_RESPONSES=(os.getenv('VALIDATE_RESPONSES', False) == 'True'),
+    # statement timeout in milliseconds of the queries of an endpoint (0
+    # means no limit). STATEMENT_TIMEOUTS overrides it by path prefix, e.g.
+    # /api/v1/stats/values=5000,/api/v1/domains=30000
+    STATEMENT_TIMEOUT=int(os.getenv('STATEMENT_TIMEOUT', '0')),
+    STATEMENT_TIMEOUTS=parse_statement_timeouts(
+        os.getenv('STATEMENT_TIMEOUTS', '')
+    ),
+    # cancel the queries of a request when the client disconnects
+    CANCEL_ON_DISCONNECT=(
+        os.getenv('CANCEL_ON_DISCONNECT', 'True') == 'True'
+    ),
+    # return the time spent in the DB and in serializing the result in the
+    # Server-Timing header of the responses
+    SERVER_TIMING=(os.getenv('SERVER_TIMING', False) == 'True'),
+    # number of statements kept in the slow query log shown on
+    # /meta/slow-queries (0 disables the log) and the minimum duration in
+    # milliseconds of the statements that are logged
+    SLOW_QUERY_LOG_SIZE=int(os.getenv('SLOW_QUERY_LOG_SIZE', '0')),
+    SLOW_QUERY_THRESHOLD=float(os.getenv('SLOW_QUERY_THRESHOLD', '1000')),
+    # maximum number of domains in a single POST /bydomain/ request
+    BYDOMAIN_MAX_DOMAINS=int(os.getenv('BYDOMAIN_MAX_DOMAINS', '1000')),
+    # number of rows fetched from the DB and written per record batch / row
+    # group by the /export endpoints
+    EXPORT_CHUNK_SIZE=int(os.getenv('EXPORT_CHUNK_SIZE', '10000')),
+    # group the tags per domain in the DB for /domains/bytaxonomy and
+    # /domains/bycategory. limit and offset then count domains instead of
+    # tags.
+    DOMAINS_GROUP_IN_DB=(os.getenv('DOMAINS_GROUP_IN_DB', False) == 'True'),
+    # serve Prometheus metrics of the msm2tag endpoint and the result cache
+    # on /metrics
+    ENABLE_METRICS=(os.getenv('ENABLE_METRICS', False) == 'True'),
+    # tag type whose counters in the open_tag_counts table are used for
+    # unfiltered stats on the open tags. The counters are not used if it is
+    # empty.
+    STATS_OPEN_TAG_COUNTS_TAG_TYPE=os.getenv(
+        'STATS_OPEN_TAG_COUNTS_TAG_TYPE', ''
+    ).strip(),
+    # result cache for the stats and meta endpoints. Caching is disabled if
+    # the number of entries is 0. Cached results are invalidated by the change
+    # watermark, so all writers must update it (update_change_watermark=true
+    # for msm2tag2domain, MSM2TAG_UPDATE_CHANGE_WATERMARK=True for the msm2tag
+    # endpoint). A warning is logged on startup if it has never advanced.
+    RESULT_CACHE_MAX_ENTRIES=int(os.getenv('RESULT_CACHE_MAX_ENTRIES', '0')),
+    # maximum age in seconds of cached results that depend on the open tags
+    # (0 means no limit, results are kept until the change watermark moves)
+    RESULT_CACHE_TTL=float(os.getenv('RESULT_CACHE_TTL', '300')),
+    # results for at_time queries that are older than this many seconds are
+    # not subject to RESULT_CACHE_TTL, they are only invalidated when the
+    # change watermark moves
+    RESULT_CACHE_HISTORY_MIN_AGE=float(
+        os.getenv('RESULT_CACHE_HISTORY_MIN_AGE', '86400')
+    ),
+    # minimum time in seconds between two reads of the change watermark
+    RESULT_CACHE_WATERMARK_INTERVAL=float(
+        os.getenv('RESULT_CACHE_WATERMARK_INTERVAL', '1')
+    )
 ))
 
 if __name__ == "__main__":
@@ -3,14 +3,41 @@ import time
 import re
 import copy
 import random
+import contextlib
+
+import threading
 
 import psycopg2
+import psycopg2.errors
 import psycopg2.extras
 
+from tag2domain_api.app.util.cache import ResultCache
+from tag2domain_api.app.util.statements import (
+    StatementTimeoutError,
+    QueryCancelledError,
+    exclusive_statement,
+    running_statement,
+    cancelled_error
+)
+from tag2domain_api.app.util.timing import SlowQueryLog, get_request_timing
+from tag2domain_api.app.util.replicas import (
+    ReplicaPool,
+    parse_replica_hosts,
+    replica_db_configs
+)
+
 _db_conn = None
 _db_config = None
 _config = None
 
+_result_cache = ResultCache()
+_replica_pool = ReplicaPool()
+_slow_query_log = SlowQueryLog()
+_watermark_interval = 1.0
+_watermark_lock = threading.Lock()
+_watermark = None
+_watermark_read_at = None
+
 logger = logging.getLogger(__name__)
 
 RE_FILTER = (
@@ -44,35 +71,97 @@ def get_db_dict_cursor():
     return _db_conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
 
 
+def _fetch_all(conn, query, params, dict_, log_id):
+    if dict_:
+        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    else:
+        cursor = conn.cursor()
+
+    if params is None:
+        logger.debug(query)
+    else:
+        if isinstance(params, dict):
+            logger.debug(query, params)
+        else:
+            logger.debug(query, *params)
+
+    rows = None
+    statement_start = time.time()
+    with running_statement(conn) as context:
+        try:
+            logger.debug(str(log_id) + " - executing query...")
+            start = time.time()
+            if context is not None and context.statement_timeout > 0:
+                # only applies to the transaction of this statement. It is
+                # sent with the statement to save a round trip.
+                cursor.execute(
+                    cursor.mogrify(
+                        "SET LOCAL statement_timeout = %s;\n",
+                        (int(context.statement_timeout), )
+                    )
+                    + cursor.mogrify(query, params)
+                )
+            else:
+                cursor.execute(query, params)
+            logger.debug(str(log_id) + " - done - %f s", time.time() - start)
+            logger.debug(str(log_id) + " - fetching result...")
+            start = time.time()
+            rows = cursor.fetchall()
+            conn.commit()  # immediately end transaction
+            logger.debug(str(log_id) + " - done - %f s", time.time() - start)
+        except psycopg2.errors.QueryCanceled as e:
+            conn.rollback()
+            raise cancelled_error(e)
+        finally:
+            # failed statements are logged as well, e.g. those that timed
+            # out are the slowest ones
+            _record_statement(
+                query,
+                params,
+                time.time() - statement_start,
+                len(rows) if rows is not None else None
+            )
+    return rows
+
+
+def _record_statement(query, params, duration, rows):
+    timing = get_request_timing()
+    if timing is not None:
+        timing.add_statement(duration, rows)
+    _slow_query_log.record(query, params, duration, rows, timing=timing)
+
+
 def execute_db(query, params=None, dict_=False, handle_failure=True):
     """
     Executes a DB statement and returns the results
+
+    The statement is executed on a read replica if one is configured and
+    healthy and on the primary otherwise. Statements that fail on a replica
+    are repeated on the primary.
+
+    Statements that exceed the statement timeout of the request or that are
+    cancelled because the client disconnected raise StatementTimeoutError
+    and QueryCancelledError, respectively. They are not repeated.
     """
 
     _log_id = random.randint(0, 32768)
-    try:
-        if dict_:
-            cursor = get_db_dict_cursor()
-        else:
-            cursor = get_db_cursor()
+    if _replica_pool.enabled:
+        try:
+            with replica_db_connection() as conn:
+                if conn is not None:
+                    return _fetch_all(conn, query, params, dict_, _log_id)
+        except psycopg2.Error as e:
+            logger.warning(
+                "failed DB stmt on replica (%s) - using the primary", str(e)
+            )
 
-        if params is None:
-            logger.debug(query)
-        else:
-            if isinstance(params, dict):
-                logger.debug(query, params)
-            else:
-                logger.debug(query, *params)
-
-        logger.debug(str(_log_id) + " - executing query...")
-        start = time.time()
-        cursor.execute(query, params)
-        logger.debug(str(_log_id) + " - done - %f s", time.time() - start)
-        logger.debug(str(_log_id) + " - fetching result...")
-        start = time.time()
-        rows = cursor.fetchall()
-        get_db().commit()  # immediately end transaction
-        logger.debug(str(_log_id) + " - done - %f s", time.time() - start)
+    try:
+        conn = get_db()
+        if conn is None:
+            raise RuntimeError("no DB connected")
+        rows = _fetch_all(conn, query, params, dict_, _log_id)
+    except (StatementTimeoutError, QueryCancelledError):
+        raise
     except (psycopg2.Error, RuntimeError) as e:
         if handle_failure:
             logger.debug("failed DB stmt (%s) - reconnecting", str(e))
@@ -84,6 +173,369 @@ def execute_db(query, params=None, dict_=False, handle_failure=True):
     return rows
 
 
+def configure_replicas(
+    db_configs=(),
+    selection="round_robin",
+    max_lag=0,
+    check_interval=5.0
+):
+    """
+    Replaces the pool of read replicas used for the read-only statements.
+    An empty list of db_configs routes all statements to the primary.
+    """
+    global _replica_pool
+    _replica_pool.close()
+    _replica_pool = ReplicaPool(
+        db_configs=db_configs,
+        selection=selection,
+        max_lag=max_lag,
+        check_interval=check_interval
+    )
+
+
+def get_replica_pool():
+    return _replica_pool
+
+
+@contextlib.contextmanager
+def replica_db_connection():
+    """
+    Selects a healthy read replica for read-only statements. If the
+    statements fail because of the connection, the replica is not used until
+    its next successful health check.
+
+    Return
+    ------
+    context manager yielding a psycopg2 connection or None if no replica is
+    healthy
+    """
+    replica = _replica_pool.acquire()
+    if replica is None:
+        yield None
+        return
+
+    failed = False
+    try:
+        yield replica.conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        failed = True
+        raise
+    except psycopg2.Error:
+        try:
+            with exclusive_statement(replica.conn):
+                replica.conn.rollback()
+        except psycopg2.Error:
+            failed = True
+        raise
+    finally:
+        _replica_pool.release(replica, failed=failed)
+
+
+@contextlib.contextmanager
+def read_db_connection():
+    """
+    Like replica_db_connection but falls back to the shared primary
+    connection if no replica is healthy.
+
+    Return
+    ------
+    context manager yielding a psycopg2 connection
+    """
+    with replica_db_connection() as conn:
+        if conn is None:
+            conn = get_db()
+            if conn is None:
+                raise RuntimeError("no DB connected")
+        yield conn
+
+
+def configure_result_cache(
+    max_entries=0,
+    ttl=0,
+    history_min_age=86400,
+    watermark_interval=1.0
+):
+    """
+    Replaces the result cache used by execute_db_cached. A max_entries of 0
+    disables caching.
+    """
+    global _result_cache
+    global _watermark_interval
+    _result_cache = ResultCache(
+        max_entries=max_entries,
+        ttl=ttl,
+        history_min_age=history_min_age
+    )
+    _watermark_interval = watermark_interval
+    _reset_change_watermark()
+
+
+def get_result_cache():
+    return _result_cache
+
+
+def configure_slow_query_log(max_entries=0, threshold=1000):
+    """
+    Replaces the slow query log. A max_entries of 0 disables the log.
+    """
+    global _slow_query_log
+    _slow_query_log = SlowQueryLog(
+        max_entries=max_entries,
+        threshold=threshold
+    )
+
+
+def get_slow_query_log():
+    return _slow_query_log
+
+
+def invalidate_result_cache():
+    """
+    Drops all cached results, e.g. after this process modified the tags.
+    """
+    _result_cache.clear()
+    _reset_change_watermark()
+
+
+def _reset_change_watermark():
+    global _watermark
+    global _watermark_read_at
+    with _watermark_lock:
+        _watermark = None
+        _watermark_read_at = None
+
+
+def get_change_watermark():
+    """
+    Returns the counter of the change_watermark table or None if it is not
+    available. The value is read from the DB at most once per watermark
+    interval.
+    """
+    global _watermark
+    global _watermark_read_at
+    with _watermark_lock:
+        if (
+            _watermark_read_at is not None
+            and time.time() - _watermark_read_at < _watermark_interval
+        ):
+            return _watermark
+
+        # the watermark is read from the same servers as the results, so
+        # that results of a lagging replica are not cached with a newer
+        # watermark
+        try:
+            with read_db_connection() as conn, exclusive_statement(conn):
+                try:
+                    cursor = conn.cursor()
+                    cursor.execute("SELECT counter FROM change_watermark")
+                    row = cursor.fetchone()
+                    conn.commit()
+                except psycopg2.Error:
+                    # the connection is shared, it is rolled back before
+                    # the statements of other requests can run on it
+                    try:
+                        conn.rollback()
+                    except psycopg2.Error:
+                        pass
+                    raise
+            _watermark = row[0] if row is not None else None
+        except (psycopg2.Error, RuntimeError) as e:
+            logger.debug("could not read change watermark - %s", str(e))
+            _watermark = None
+        _watermark_read_at = time.time()
+        return _watermark
+
+
+def check_result_cache():
+    """
+    Warns if the result cache is enabled but its results are not
+    invalidated by the change watermark, either because the change_watermark
+    table is not available or because its counter has never advanced. The
+    latter is the case if the writers do not update the watermark
+    (update_change_watermark of msm2tag2domain,
+    MSM2TAG_UPDATE_CHANGE_WATERMARK of the msm2tag endpoint).
+
+    Return
+    ------
+    int or None - the change watermark
+    """
+    if not _result_cache.enabled:
+        return None
+    watermark = get_change_watermark()
+    if watermark is None:
+        logger.warning(
+            "result cache is enabled but the change_watermark table is not "
+            "available - no results are cached"
+        )
+    elif watermark == 0:
+        logger.warning(
+            "result cache is enabled but the change watermark has never "
+            "advanced - make sure that all writers update it "
+            "(update_change_watermark=true for msm2tag2domain, "
+            "MSM2TAG_UPDATE_CHANGE_WATERMARK=True for the msm2tag endpoint). "
+            "Until it advances, all cached results expire after "
+            "RESULT_CACHE_TTL"
+        )
+    return watermark
+
+
+def _cache_key(query, params, dict_):
+    if isinstance(params, dict):
+        params = tuple(sorted(params.items()))
+    elif params is not None:
+        params = tuple(params)
+    return (query, params, dict_)
+
+
+def execute_db_cached(query, params=None, dict_=False, at_time=None):
+    """
+    Like execute_db but serves results from the result cache if possible.
+
+    at_time is the point in time the query refers to (None for the open
+    tags). Results are only cached if the change watermark is available and
+    are invalidated when it changes, as even results for points in time far
+    in the past change if a backdated measurement is ingested. Results for
+    points in time older than the cache's history_min_age do not expire
+    otherwise, unless the watermark has never advanced (see
+    check_result_cache).
+    """
+    cache = _result_cache
+    if not cache.enabled:
+        return execute_db(query, params, dict_=dict_)
+
+    watermark = get_change_watermark()
+    if watermark is None:
+        return execute_db(query, params, dict_=dict_)
+
+    key = _cache_key(query, params, dict_)
+    found, rows = cache.get(key, watermark)
+    if found:
+        return rows
+
+    rows = execute_db(query, params, dict_=dict_)
+    # a watermark that has never advanced is most likely not updated by the
+    # writers, so historic results must not be kept forever
+    cache.put(
+        key,
+        rows,
+        watermark,
+        expires=(watermark == 0 or not cache.is_historic(at_time))
+    )
+    return rows
+
+
+def iter_db_chunks(query, params=None, chunk_size=10000):
+    """
+    Executes a DB statement with a server-side cursor and yields the results
+    in lists of at most chunk_size rows, so results that do not fit into
+    memory can be streamed.
+
+    The cursor runs in a single transaction on a dedicated connection (see
+    dedicated_db_connection), so the commits of other requests do not end
+    it and the rows are not materialized. The connection is closed when the
+    generator is exhausted or closed, e.g. because the client disconnected.
+
+    Parameters
+    ----------
+    query - str
+        SQL statement
+    params - dict, tuple or None
+        parameters of the statement
+    chunk_size - int
+        number of rows fetched from the DB at once
+
+    Return
+    ------
+    generator of lists of tuples
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be positive")
+
+    with dedicated_db_connection() as conn:
+        name = "tag2domain_export_%i" % random.randint(0, 2**31)
+        cursor = conn.cursor(name)
+        cursor.itersize = chunk_size
+        try:
+            start = time.time()
+            cursor.execute(query, params)
+            logger.debug(
+                "declared cursor %s in %f s", name, time.time() - start
+            )
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if len(rows) == 0:
+                    break
+                yield rows
+        finally:
+            try:
+                cursor.close()
+            except psycopg2.Error as e:
+                logger.debug("could not close cursor %s - %s", name, str(e))
+
+
+@contextlib.contextmanager
+def dedicated_db_connection():
+    """
+    Opens a new connection with the settings of a healthy read replica or of
+    the shared connection for long running statements that would otherwise
+    block all other requests. If the shared connection was set with set_db
+    and no replica is configured, it is used instead and the statements of
+    other requests wait until the block has ended.
+
+    Return
+    ------
+    context manager yielding a psycopg2 connection
+    """
+    replica = _replica_pool.acquire()
+    if replica is not None:
+        conn = None
+        try:
+            try:
+                conn = psycopg2.connect(**replica.db_config)
+            except psycopg2.Error as e:
+                logger.warning(
+                    "could not connect to replica %s (%s) - using the "
+                    "primary", replica.name, str(e)
+                )
+                conn = None
+            if conn is not None:
+                try:
+                    conn.set_session(readonly=True)
+                    yield conn
+                finally:
+                    conn.close()
+                return
+        finally:
+            _replica_pool.release(replica, failed=conn is None)
+
+    if _db_config is None:
+        conn = get_db()
+        if conn is None:
+            raise RuntimeError("no DB connected")
+        # the other requests wait until the shared connection is returned
+        with exclusive_statement(conn):
+            try:
+                yield conn
+            finally:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    pass
+        return
+
+    try:
+        conn = psycopg2.connect(**_db_config)
+    except Exception as ex:
+        raise RuntimeError(
+            "could not connect to the DB. Reason: %s" % (str(ex))
+        )
+    try:
+        conn.set_session(readonly=True)
+        yield conn
+    finally:
+        conn.close()
+
+
 def connect_db(config=None):
     """Connects to the specific database.
     :rtype: psycopg2 connection"""
@@ -118,6 +570,30 @@ def connect_db(config=None):
             options='-c search_path=%s' % config['DBTAG2DOMAIN_SCHEMA']
         )
         _config = copy.deepcopy(config)
+        configure_replicas(
+            db_configs=replica_db_configs(
+                db_config,
+                parse_replica_hosts(
+                    config.get('DBREPLICA_HOSTS'),
+                    config['DBPORT']
+                )
+            ),
+            selection=config.get('DBREPLICA_SELECTION', 'round_robin'),
+            max_lag=config.get('DBREPLICA_MAX_LAG', 0),
+            check_interval=config.get('DBREPLICA_CHECK_INTERVAL', 5.0)
+        )
+        configure_result_cache(
+            max_entries=config.get('RESULT_CACHE_MAX_ENTRIES', 0),
+            ttl=config.get('RESULT_CACHE_TTL', 0),
+            history_min_age=config.get('RESULT_CACHE_HISTORY_MIN_AGE', 86400),
+            watermark_interval=config.get(
+                'RESULT_CACHE_WATERMARK_INTERVAL', 1.0
+            )
+        )
+        configure_slow_query_log(
+            max_entries=config.get('SLOW_QUERY_LOG_SIZE', 0),
+            threshold=config.get('SLOW_QUERY_THRESHOLD', 1000)
+        )
 
     def filter(key, value):
         if key in ["password", ]:
@@ -157,6 +633,8 @@ def connect_db(config=None):
     _db_conn = conn
     _db_config = db_config
 
+    check_result_cache()
+
     return _db_conn
 
 
@@ -167,19 +645,24 @@ def set_db(db_conn):
     _db_conn = db_conn
     _db_config = None
     _config = None
+    configure_replicas()
+    invalidate_result_cache()
 
 
 def disconnect_db():
     global _db_conn
     _db_conn.close()
     _db_conn = None
+    _replica_pool.close()
 
 
-def get_sql_base_table(at_time, filter=None, domain=None):
-    if filter is not None and domain is not None:
+def get_sql_base_table(at_time, filter=None, domain=None, domains=None):
+    if filter is not None and (domain is not None or domains is not None):
         raise ValueError(
             "filtering by domain and by filter is not implemented"
         )
+    if domain is not None and domains is not None:
+        raise ValueError("domain and domains are mutually exclusive")
     if filter is not None:
         m = COMPILED_RE_FILTER.match(filter)
         if not m:
@@ -219,6 +702,20 @@ def get_sql_base_table(at_time, filter=None, domain=None):
         else:
             s = 'tag2domain_get_open_tags_domain(%(__domain)s)'
         return s, params
+    elif domains is not None:
+        params = {'__domains': list(domains)}
+        if at_time is not None:
+            params['__at_time'] = at_time
+            s = (
+                'tag2domain_get_tags_at_time_domains'
+                '(%(__at_time)s, %(__domains)s::character varying[])'
+            )
+        else:
+            s = (
+                'tag2domain_get_open_tags_domains'
+                '(%(__domains)s::character varying[])'
+            )
+        return s, params
     else:
         if at_time is not None:
             params = {'__at_time': at_time}
@@ -0,0 +1,581 @@
+"""
+Bulk export of query results.
+
+The results of the bulk queries are fetched with a server-side cursor in
+chunks and written as Apache Arrow IPC stream or Parquet. Every chunk becomes
+one record batch (Arrow) or row group (Parquet) and is sent to the client
+before the next chunk is fetched.
+
+Snapshots of all open tags (or all tags at a point in time) are streamed
+with COPY ... TO STDOUT as CSV or in the binary COPY format of PostgreSQL,
+optionally gzip compressed.
+
+Usage:
+    python -m tag2domain_api.app.util.export bytaxonomy <taxonomy> \\
+        --format parquet --output tax.parquet
+    python -m tag2domain_api.app.util.export history <domain> \\
+        --format arrow --output - > history.arrow
+    python -m tag2domain_api.app.util.export snapshot \\
+        --format csv --gzip --output snapshot.csv.gz
+
+The DB connection is configured with the same environment variables as
+tag2domain-api.
+"""
+from __future__ import print_function
+import sys
+import zlib
+import queue
+import logging
+import argparse
+import datetime
+import threading
+import time
+
+import pyarrow as pa
+import pyarrow.ipc
+import pyarrow.parquet
+
+from tag2domain_api.app.util.db import (
+    get_sql_base_table,
+    iter_db_chunks,
+    dedicated_db_connection
+)
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = {
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet"
+}
+
+EXPORT_FILE_SUFFIXES = {
+    "arrow": "arrows",
+    "parquet": "parquet"
+}
+
+SNAPSHOT_FORMATS = {
+    "csv": "text/csv",
+    "binary": "application/octet-stream"
+}
+
+SNAPSHOT_FILE_SUFFIXES = {
+    "csv": "csv",
+    "binary": "pgcopy"
+}
+
+GZIP_MEDIA_TYPE = "application/gzip"
+
+TIMESTAMP = pa.timestamp("us", tz="UTC")
+
+DOMAINS_BY_TAXONOMY_SCHEMA = pa.schema([
+    ("domain_id", pa.int64()),
+    ("domain_name", pa.string()),
+    ("tag_id", pa.int64()),
+    ("tag_name", pa.string()),
+    ("start_time", TIMESTAMP),
+    ("measured_at", TIMESTAMP),
+    ("end_time", TIMESTAMP)
+])
+
+TAG_HISTORY_SCHEMA = pa.schema([
+    ("taxonomy_id", pa.int64()),
+    ("taxonomy_name", pa.string()),
+    ("tag_id", pa.int64()),
+    ("tag_name", pa.string()),
+    ("value_id", pa.int64()),
+    ("value", pa.string()),
+    ("start_time", TIMESTAMP),
+    ("measured_at", TIMESTAMP),
+    ("end_time", TIMESTAMP)
+])
+
+
+def sql_domains_by_taxonomy(taxonomy, at_time=None, filter=None):
+    """
+    Returns the statement and parameters that select the tags of all
+    domains in a taxonomy. The columns match DOMAINS_BY_TAXONOMY_SCHEMA.
+    """
+    base_table, params = get_sql_base_table(at_time, filter)
+    params["taxonomy_name"] = taxonomy
+    SQL = """
+        SELECT
+            domain_id,
+            domain_name,
+            tag_id,
+            tag_name,
+            start_time,
+            measured_at,
+            end_time
+        FROM %s AS tag_table -- base_table
+        JOIN tags USING(tag_id)
+        JOIN taxonomy ON (tags.taxonomy_id = taxonomy.id)
+        WHERE (taxonomy.name = %%(taxonomy_name)s)
+        ORDER BY domain_id, tag_id asc, tag_type""" % base_table
+    return SQL, params
+
+
+def sql_tag_history_by_domain(domain):
+    """
+    Returns the statement and parameters that select the tag history of a
+    domain. The columns match TAG_HISTORY_SCHEMA.
+    """
+    SQL = """
+        SELECT
+            taxonomy_id,
+            taxonomy.name AS taxonomy_name,
+            tag_table.tag_id,
+            tag_name,
+            value_id,
+            value,
+            start_time,
+            measured_at,
+            end_time
+        FROM tag2domain_get_all_tags_domain(%(domain)s) AS tag_table
+        JOIN tags USING (tag_id)
+        JOIN taxonomy ON (tags.taxonomy_id = taxonomy.id)
+        LEFT JOIN taxonomy_tag_val ON (tag_table.value_id = taxonomy_tag_val.id)
+        ORDER BY domain_id, tag_id ASC"""
+    return SQL, {"domain": domain}
+
+
+def sql_snapshot(at_time=None, taxonomy=None, filter=None):
+    """
+    Returns the statement and parameters that select all open tags (or all
+    tags at at_time) with the names of their taxonomies, tags and values.
+    The rows are not ordered, so the DB can scan the tables sequentially.
+
+    Parameters
+    ----------
+    at_time - datetime.datetime or None
+        point in time of the snapshot, None for the open tags
+    taxonomy - str or None
+        only export tags of this taxonomy
+    filter - str or None
+        filter clause of the form Tag=Value
+    """
+    base_table, params = get_sql_base_table(at_time, filter)
+    whereclause = "TRUE"
+    if taxonomy is not None:
+        params["taxonomy_name"] = taxonomy
+        whereclause = "(taxonomy.name = %(taxonomy_name)s)"
+    SQL = """
+        SELECT
+            domain_id,
+            domain_name,
+            tag_type,
+            taxonomy.name AS taxonomy_name,
+            tags.category,
+            tag_table.tag_id,
+            tag_name,
+            value_id,
+            value,
+            start_time,
+            measured_at,
+            end_time
+        FROM %s AS tag_table -- base_table
+        JOIN tags USING (tag_id)
+        JOIN taxonomy ON (tags.taxonomy_id = taxonomy.id)
+        LEFT JOIN taxonomy_tag_val ON (tag_table.value_id = taxonomy_tag_val.id)
+        WHERE %s -- whereclause""" % (base_table, whereclause)
+    return SQL, params
+
+
+def copy_statement(cursor, query, params, format_):
+    """
+    Returns a COPY ... TO STDOUT statement for query. COPY does not support
+    parameters, so they are bound on the client with mogrify.
+    """
+    if format_ not in SNAPSHOT_FORMATS:
+        raise ValueError("unknown snapshot format '%s'" % format_)
+    options = "FORMAT csv, HEADER" if format_ == "csv" else "FORMAT binary"
+    # the query may end with a comment
+    return "COPY (%s\n) TO STDOUT WITH (%s)" % (
+        cursor.mogrify(query, params).decode(),
+        options
+    )
+
+
+class GzipWriter(object):
+    """
+    Write-only file object that gzip compresses everything written to it
+    into another file object.
+    """
+    def __init__(self, f, level=6):
+        self.f = f
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def write(self, data):
+        compressed = self.compressor.compress(data)
+        if len(compressed) > 0:
+            self.f.write(compressed)
+        return len(data)
+
+    def close(self):
+        self.f.write(self.compressor.flush())
+
+
+def copy_snapshot(f, at_time=None, taxonomy=None, filter=None,
+                  format_="csv", compress=False):
+    """
+    Writes a snapshot of the tags (see sql_snapshot) to the file object f
+    using COPY ... TO STDOUT on a dedicated DB connection.
+    """
+    query, params = sql_snapshot(at_time, taxonomy, filter)
+    with dedicated_db_connection() as conn:
+        cursor = conn.cursor()
+        stmt = copy_statement(cursor, query, params, format_)
+        writer = GzipWriter(f) if compress else f
+        start = time.time()
+        cursor.copy_expert(stmt, writer)
+        if compress:
+            writer.close()
+        logger.debug(
+            "copied %i snapshot rows in %f s",
+            cursor.rowcount,
+            time.time() - start
+        )
+
+
+class _QueueWriter(object):
+    """
+    Write-only file object that puts the written data into a queue. Used to
+    turn copy_expert, which pushes its output into a file object, into a
+    generator.
+    """
+    def __init__(self, chunks, stopped, chunk_size=65536):
+        self.chunks = chunks
+        self.stopped = stopped
+        self.chunk_size = chunk_size
+        self.buffer = []
+        self.buffered = 0
+
+    def write(self, data):
+        self.buffer.append(bytes(data))
+        self.buffered += len(data)
+        if self.buffered >= self.chunk_size:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        if self.buffered == 0:
+            return
+        data = b"".join(self.buffer)
+        self.buffer = []
+        self.buffered = 0
+        while True:
+            if self.stopped.is_set():
+                raise _SnapshotAborted()
+            try:
+                self.chunks.put(data, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+
+class _SnapshotAborted(Exception):
+    pass
+
+
+_END_OF_SNAPSHOT = object()
+
+
+def iter_snapshot(at_time=None, taxonomy=None, filter=None, format_="csv",
+                  compress=False, max_queued_chunks=16):
+    """
+    Like copy_snapshot but returns a generator of bytes. The COPY runs in a
+    background thread that is cancelled if the generator is closed early,
+    e.g. because the client disconnected.
+
+    Return
+    ------
+    generator of bytes
+    """
+    query, params = sql_snapshot(at_time, taxonomy, filter)
+    if format_ not in SNAPSHOT_FORMATS:
+        raise ValueError("unknown snapshot format '%s'" % format_)
+
+    chunks = queue.Queue(maxsize=max_queued_chunks)
+    stopped = threading.Event()
+    state = {"conn": None, "error": None}
+
+    def _copy():
+        writer = _QueueWriter(chunks, stopped)
+        try:
+            with dedicated_db_connection() as conn:
+                state["conn"] = conn
+                cursor = conn.cursor()
+                stmt = copy_statement(cursor, query, params, format_)
+                if compress:
+                    gzip_writer = GzipWriter(writer)
+                    cursor.copy_expert(stmt, gzip_writer)
+                    gzip_writer.close()
+                else:
+                    cursor.copy_expert(stmt, writer)
+                writer.flush()
+        except _SnapshotAborted:
+            pass
+        except Exception as e:
+            if not stopped.is_set():
+                state["error"] = e
+        finally:
+            state["conn"] = None
+            while not stopped.is_set():
+                try:
+                    chunks.put(_END_OF_SNAPSHOT, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+
+    def _generate():
+        thread = threading.Thread(
+            target=_copy,
+            name="tag2domain-snapshot",
+            daemon=True
+        )
+        thread.start()
+        try:
+            while True:
+                data = chunks.get()
+                if data is _END_OF_SNAPSHOT:
+                    break
+                yield data
+            if state["error"] is not None:
+                raise state["error"]
+        finally:
+            if thread.is_alive():
+                stopped.set()
+                conn = state["conn"]
+                if conn is not None:
+                    # stops the COPY on the server
+                    conn.cancel()
+                thread.join()
+
+    return _generate()
+
+
+class _ChunkSink(object):
+    """
+    Write-only file object that collects the bytes written by pyarrow until
+    they are taken with pop().
+    """
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def pop(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def rows_to_batch(rows, schema):
+    """
+    Converts a list of row tuples in the column order of schema into a
+    pyarrow.RecordBatch.
+    """
+    columns = list(zip(*rows)) if len(rows) > 0 else [()] * len(schema)
+    return pa.RecordBatch.from_arrays(
+        [
+            pa.array(_column, type=_field.type)
+            for _column, _field in zip(columns, schema)
+        ],
+        schema=schema
+    )
+
+
+def iter_export(chunks, schema, format_):
+    """
+    Encodes chunks of rows in an export format.
+
+    Parameters
+    ----------
+    chunks - iterable of lists of tuples
+        rows in the column order of schema, e.g. from iter_db_chunks
+    schema - pyarrow.Schema
+        schema of the rows
+    format_ - str
+        one of EXPORT_FORMATS
+
+    Return
+    ------
+    generator of bytes
+    """
+    if format_ not in EXPORT_FORMATS:
+        raise ValueError("unknown export format '%s'" % format_)
+
+    sink = _ChunkSink()
+    if format_ == "arrow":
+        writer = pa.ipc.new_stream(sink, schema)
+    else:
+        writer = pa.parquet.ParquetWriter(
+            pa.PythonFile(sink, mode="w"),
+            schema
+        )
+
+    n_rows = 0
+    for _rows in chunks:
+        batch = rows_to_batch(_rows, schema)
+        if format_ == "arrow":
+            writer.write_batch(batch)
+        else:
+            writer.write_table(pa.Table.from_batches([batch]))
+        n_rows += len(_rows)
+        data = sink.pop()
+        if len(data) > 0:
+            yield data
+    writer.close()
+    yield sink.pop()
+    logger.debug("exported %i rows as %s", n_rows, format_)
+
+
+def export_query(query, params, schema, format_, chunk_size=10000):
+    """
+    Executes query with a server-side cursor and encodes the results in an
+    export format, see iter_export. Closing the returned generator closes
+    the cursor and its DB connection.
+    """
+    chunks = iter_db_chunks(query, params, chunk_size=chunk_size)
+    try:
+        yield from iter_export(chunks, schema, format_)
+    finally:
+        chunks.close()
+
+
+def main(argv=None):
+    from tag2domain_api.app.util.config import config
+    from tag2domain_api.app.util.db import connect_db, disconnect_db
+
+    parser = argparse.ArgumentParser(
+        description="export tag2domain query results as Arrow or Parquet or "
+                    "snapshots of the tags as CSV or binary COPY data"
+    )
+    parser.add_argument(
+        "query",
+        choices=["bytaxonomy", "history", "snapshot"],
+        help="bytaxonomy: tags of all domains in a taxonomy, history: tag "
+             "history of a domain, snapshot: all open tags or all tags at "
+             "--at-time"
+    )
+    parser.add_argument(
+        "name",
+        nargs="?",
+        help="name of the taxonomy (bytaxonomy) or domain (history)"
+    )
+    parser.add_argument(
+        "--format",
+        choices=sorted(
+            list(EXPORT_FORMATS.keys()) + list(SNAPSHOT_FORMATS.keys())
+        ),
+        help="parquet or arrow (default: parquet) for bytaxonomy and "
+             "history, csv or binary (default: csv) for snapshot"
+    )
+    parser.add_argument(
+        "--output",
+        help="output file, - for stdout. Defaults to <name>.<format suffix>"
+    )
+    parser.add_argument(
+        "--at-time",
+        type=datetime.datetime.fromisoformat,
+        help="reference time (bytaxonomy and snapshot), open tags if not "
+             "given"
+    )
+    parser.add_argument(
+        "--filter",
+        help="filter clause (bytaxonomy and snapshot)"
+    )
+    parser.add_argument(
+        "--taxonomy",
+        help="only export tags of this taxonomy (snapshot only)"
+    )
+    parser.add_argument(
+        "--gzip",
+        action="store_true",
+        help="gzip compress the output (snapshot only)"
+    )
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    args = parser.parse_args(argv)
+
+    if args.query == "snapshot":
+        format_ = args.format or "csv"
+        if format_ not in SNAPSHOT_FORMATS:
+            parser.error("invalid snapshot format '%s'" % format_)
+        name = "snapshot"
+        suffix = SNAPSHOT_FILE_SUFFIXES[format_]
+        if args.gzip:
+            suffix += ".gz"
+    else:
+        format_ = args.format or "parquet"
+        if format_ not in EXPORT_FORMATS:
+            parser.error("invalid export format '%s'" % format_)
+        if args.name is None:
+            parser.error("%s requires a name" % args.query)
+        name = args.name
+        suffix = EXPORT_FILE_SUFFIXES[format_]
+        if args.query == "bytaxonomy":
+            query, params = sql_domains_by_taxonomy(
+                args.name,
+                at_time=args.at_time,
+                filter=args.filter
+            )
+            schema = DOMAINS_BY_TAXONOMY_SCHEMA
+        else:
+            query, params = sql_tag_history_by_domain(args.name)
+            schema = TAG_HISTORY_SCHEMA
+
+    output = args.output
+    if output is None:
+        output = "%s.%s" % (name, suffix)
+
+    connect_db(config)
+    try:
+        f = sys.stdout.buffer if output == "-" else open(output, "wb")
+        try:
+            if args.query == "snapshot":
+                copy_snapshot(
+                    f,
+                    at_time=args.at_time,
+                    taxonomy=args.taxonomy,
+                    filter=args.filter,
+                    format_=format_,
+                    compress=args.gzip
+                )
+            else:
+                for _data in export_query(
+                    query,
+                    params,
+                    schema,
+                    format_,
+                    chunk_size=args.chunk_size
+                ):
+                    f.write(_data)
+        finally:
+            if f is not sys.stdout.buffer:
+                f.close()
+    finally:
+        disconnect_db()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import logging
+
+import prometheus_client
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from tag2domain_api.app.util.config import config
+from tag2domain_api.app.util.db import get_result_cache, get_replica_pool
+
+logger = logging.getLogger(__name__)
+
+_ingest_metrics = None
+
+
+class ResultCacheCollector(object):
+    """
+    Exports the statistics of the result cache. The cache is looked up on
+    every scrape as it is replaced when the DB connection is set up.
+    """
+    def collect(self):
+        stats = get_result_cache().stats()
+        entries = GaugeMetricFamily(
+            "tag2domain_result_cache_entries",
+            "Number of entries in the result cache"
+        )
+        entries.add_metric([], stats["entries"])
+        yield entries
+
+        for _name, _description in [
+            ("hits", "Number of result cache hits"),
+            ("misses", "Number of result cache misses"),
+            ("evictions", "Number of entries evicted from the result cache"),
+            ("invalidations", "Number of invalidated result cache entries")
+        ]:
+            counter = CounterMetricFamily(
+                "tag2domain_result_cache_%s" % _name,
+                _description
+            )
+            counter.add_metric([], stats[_name])
+            yield counter
+
+
+class ReplicaCollector(object):
+    """
+    Exports the health, replication lag and number of statements in flight
+    of the read replicas.
+    """
+    def collect(self):
+        healthy = GaugeMetricFamily(
+            "tag2domain_replica_healthy",
+            "Whether a read replica is used (1) or not (0)",
+            labels=["replica"]
+        )
+        lag = GaugeMetricFamily(
+            "tag2domain_replica_lag_seconds",
+            "Replication lag of a read replica at its last health check",
+            labels=["replica"]
+        )
+        in_use = GaugeMetricFamily(
+            "tag2domain_replica_statements_in_flight",
+            "Number of statements in flight on a read replica",
+            labels=["replica"]
+        )
+        for _replica in get_replica_pool().status():
+            healthy.add_metric([_replica["name"]], int(_replica["healthy"]))
+            if _replica["lag"] is not None:
+                lag.add_metric([_replica["name"]], _replica["lag"])
+            in_use.add_metric([_replica["name"]], _replica["in_use"])
+        yield healthy
+        yield lag
+        yield in_use
+
+
+def metrics_enabled():
+    return config["ENABLE_METRICS"] is True
+
+
+def get_ingest_metrics():
+    """
+    Returns the IngestMetrics used by the msm2tag endpoint, or None if
+    metrics or the msm2tag endpoint are disabled.
+    """
+    global _ingest_metrics
+    if not metrics_enabled() or config["ENABLE_MSM2TAG"] is not True:
+        return None
+    if _ingest_metrics is None:
+        # py_tag2domain is only available if msm2tag is enabled
+        from py_tag2domain.metrics import IngestMetrics
+        logger.info("setting up ingest metrics")
+        _ingest_metrics = IngestMetrics(logger=logger)
+    return _ingest_metrics
+
+
+def generate_metrics():
+    """
+    Returns the metrics in the Prometheus text format.
+    """
+    # make sure the ingest metrics are exported before the first measurement
+    get_ingest_metrics()
+    return prometheus_client.generate_latest(prometheus_client.REGISTRY)
+
+
+if metrics_enabled():
+    prometheus_client.REGISTRY.register(ResultCacheCollector())
+    prometheus_client.REGISTRY.register(ReplicaCollector())
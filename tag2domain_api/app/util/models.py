@@ -86,6 +86,38 @@ class TagsOfDomainsResponse(BaseModel):
     end_time: datetime = None
 
 
+class TagChangesResponse(BaseModel):
+    domain_id: int
+    domain_name: str
+    tag_type: str
+    tag_id: int
+    tag_name: str
+    value_id: Union[int, None]
+    value: Union[str, None]
+    taxonomy_id: int
+    taxonomy_name: str
+    start_time: datetime
+    measured_at: Union[datetime, None]
+    end_time: datetime = None
+
+
+class DomainsLookupRequest(BaseModel):
+    domains: List[str]
+    at_time: datetime = None
+    taxonomy: str = None
+
+
+class DomainWithTagsOfDomainResponse(BaseModel):
+    domain_id: int
+    domain_name: str
+    tags: List[TagsOfDomainsResponse]
+
+
+class DomainsLookupResponse(BaseModel):
+    domains: List[DomainWithTagsOfDomainResponse]
+    unknown_domains: List[str]
+
+
 class StatsTaxonomiesResponse(BaseModel):
     taxonomy_name: str
     count: int
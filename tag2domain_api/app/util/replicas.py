@@ -0,0 +1,314 @@
+import copy
+import logging
+import threading
+import time
+
+import psycopg2
+
+logger = logging.getLogger(__name__)
+
+SELECTION_POLICIES = ("round_robin", "least_connections")
+
+# replication lag of a standby in seconds. The lag is 0 if the standby has
+# replayed everything it received, so an idle primary does not make its
+# standbys look stale. The lag of a server that is not in recovery is 0.
+SQL_REPLICATION_LAG = """
+    SELECT
+        CASE
+            WHEN NOT pg_is_in_recovery() THEN 0
+            WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+        END::float8"""
+
+
+def parse_replica_hosts(hosts, default_port):
+    """
+    Parses a comma separated list of host[:port] entries.
+
+    Parameters
+    ----------
+    hosts - str or None
+        list of replicas, e.g. "replica1:5432,replica2"
+    default_port - str or int
+        port of the entries without a port
+
+    Return
+    ------
+    list of (host, port) tuples
+    """
+    replicas = []
+    for _entry in (hosts or "").split(","):
+        _entry = _entry.strip()
+        if _entry == "":
+            continue
+        host, _, port = _entry.rpartition(":")
+        if host == "" or not port.isdigit():
+            host, port = _entry, default_port
+        replicas.append((host, str(port)))
+    return replicas
+
+
+class Replica(object):
+    """
+    State of a single read replica. The connection for the statements is
+    opened on the first successful health check and shared by all requests
+    routed to the replica. The health checks use a connection of their own,
+    so they do not interfere with the statements in flight.
+    """
+    def __init__(self, db_config):
+        self.db_config = db_config
+        self.name = "%s:%s" % (db_config["host"], db_config["port"])
+        self.conn = None
+        self.check_conn = None
+        self.healthy = False
+        self.lag = None
+        self.checked_at = None
+        self.in_use = 0
+        # the connection is closed when the last statement in flight ends
+        self.close_pending = False
+
+    def connect(self):
+        conn = psycopg2.connect(**self.db_config)
+        conn.set_session(readonly=True)
+        return conn
+
+    def close_conn(self):
+        if self.conn is not None:
+            try:
+                self.conn.close()
+            except psycopg2.Error:
+                pass
+            self.conn = None
+        self.close_pending = False
+
+    def close_check_conn(self):
+        if self.check_conn is not None:
+            try:
+                self.check_conn.close()
+            except psycopg2.Error:
+                pass
+            self.check_conn = None
+
+    def close(self):
+        self.close_conn()
+        self.close_check_conn()
+
+
+class ReplicaPool(object):
+    """
+    Routes read-only statements to a set of read replicas.
+
+    The replicas are health checked at most once per check_interval seconds
+    when a connection is acquired. A replica is healthy if it can be
+    connected to and, if max_lag is non-zero, its replication lag is at most
+    max_lag seconds. acquire returns None if no replica is configured or
+    healthy, the caller then uses the primary.
+
+    The connection of a replica that failed is not handed out anymore and is
+    closed once the statements in flight on it have ended.
+
+    An empty pool is disabled.
+    """
+    lag_query = SQL_REPLICATION_LAG
+
+    def __init__(
+        self,
+        db_configs=(),
+        selection="round_robin",
+        max_lag=0,
+        check_interval=5.0
+    ):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        db_configs - list of dict
+            psycopg2.connect arguments of the replicas
+        selection - str
+            round_robin or least_connections (the replica with the fewest
+            statements in flight)
+        max_lag - float
+            maximum replication lag in seconds, 0 means no limit
+        check_interval - float
+            minimum time in seconds between two health checks of a replica
+
+        Raises
+        ------
+        ValueError
+            if selection is unknown
+        """
+        if selection not in SELECTION_POLICIES:
+            raise ValueError("unknown replica selection '%s'" % selection)
+        self.replicas = [Replica(_db_config) for _db_config in db_configs]
+        self.selection = selection
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._next = 0
+
+    @property
+    def enabled(self):
+        return len(self.replicas) > 0
+
+    def _fail(self, replica):
+        # must be called with the lock held
+        replica.healthy = False
+        if replica.conn is None:
+            return
+        if replica.in_use == 0:
+            replica.close_conn()
+        else:
+            replica.close_pending = True
+
+    def check(self, replica):
+        """
+        Updates the health and replication lag of replica using its check
+        connection and opens the connection for the statements if necessary.
+        """
+        try:
+            if replica.check_conn is None or replica.check_conn.closed:
+                replica.check_conn = replica.connect()
+            cursor = replica.check_conn.cursor()
+            cursor.execute(self.lag_query)
+            lag = cursor.fetchone()[0]
+            replica.check_conn.commit()
+
+            # no statement can be in flight without a connection, so the
+            # new connection does not replace one that is in use
+            with self._lock:
+                needs_conn = replica.conn is None
+            if needs_conn:
+                conn = replica.connect()
+                with self._lock:
+                    replica.conn = conn
+        except psycopg2.Error as e:
+            logger.warning("replica %s is unavailable - %s", replica.name, e)
+            replica.close_check_conn()
+            with self._lock:
+                replica.lag = None
+                self._fail(replica)
+            return
+
+        replica.lag = lag
+        if self.max_lag > 0 and (lag is None or lag > self.max_lag):
+            if replica.healthy:
+                logger.warning(
+                    "replica %s lags behind by %s s - not using it",
+                    replica.name,
+                    lag
+                )
+            replica.healthy = False
+        else:
+            if not replica.healthy:
+                logger.info("using replica %s", replica.name)
+            replica.healthy = True
+
+    def _due_replicas(self, now):
+        # claims the replicas that are due for a health check, the checks
+        # are run outside of the lock
+        due = []
+        with self._lock:
+            for _replica in self.replicas:
+                if (
+                    _replica.checked_at is None
+                    or now - _replica.checked_at >= self.check_interval
+                ):
+                    _replica.checked_at = now
+                    due.append(_replica)
+        return due
+
+    def acquire(self):
+        """
+        Selects a healthy replica and marks a statement as in flight on it.
+        Every replica returned must be passed to release.
+
+        Return
+        ------
+        Replica or None if no replica is healthy
+        """
+        if not self.enabled:
+            return None
+        for _replica in self._due_replicas(time.time()):
+            self.check(_replica)
+
+        with self._lock:
+            healthy = [
+                _replica for _replica in self.replicas
+                if (
+                    _replica.healthy
+                    and _replica.conn is not None
+                    and not _replica.close_pending
+                )
+            ]
+            if len(healthy) == 0:
+                return None
+            if self.selection == "least_connections":
+                replica = min(healthy, key=lambda x: x.in_use)
+            else:
+                replica = healthy[self._next % len(healthy)]
+                self._next += 1
+            replica.in_use += 1
+            return replica
+
+    def release(self, replica, failed=False):
+        """
+        Ends a statement on replica. A failed replica is not used until its
+        next successful health check. Its connection is closed once no
+        statement is in flight on it anymore.
+        """
+        with self._lock:
+            replica.in_use -= 1
+            if failed:
+                replica.checked_at = time.time()
+                self._fail(replica)
+            elif replica.close_pending and replica.in_use == 0:
+                replica.close_conn()
+
+    def status(self):
+        """
+        Returns the name, health, replication lag and the number of
+        statements in flight of every replica.
+        """
+        with self._lock:
+            return [
+                {
+                    "name": _replica.name,
+                    "healthy": _replica.healthy,
+                    "lag": _replica.lag,
+                    "in_use": _replica.in_use
+                }
+                for _replica in self.replicas
+            ]
+
+    def close(self):
+        for _replica in self.replicas:
+            _replica.close()
+            _replica.healthy = False
+
+
+def replica_db_configs(db_config, replicas):
+    """
+    Returns the connection arguments of the replicas. They use the database,
+    credentials and options of the primary.
+
+    Parameters
+    ----------
+    db_config - dict
+        psycopg2.connect arguments of the primary
+    replicas - list of (host, port) tuples
+
+    Return
+    ------
+    list of dict
+    """
+    db_configs = []
+    for host, port in replicas:
+        _db_config = copy.deepcopy(db_config)
+        _db_config["host"] = host
+        _db_config["port"] = port
+        _db_config["application_name"] = "tag2domain_api_replica"
+        # the health checks run while handling requests
+        _db_config.setdefault("connect_timeout", 5)
+        db_configs.append(_db_config)
+    return db_configs
@@ -0,0 +1,183 @@
+import decimal
+import datetime
+import contextvars
+
+import orjson
+import msgpack
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+from pydantic import parse_obj_as
+
+from tag2domain_api.app.util.config import config
+from tag2domain_api.app.util.timing import timed_serialization
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+
+# media type of the response negotiated for the current request, set by the
+# middleware in main.py
+_response_media_type = contextvars.ContextVar(
+    "response_media_type",
+    default=JSON_MEDIA_TYPE
+)
+
+
+class ResponseContractError(ValueError):
+    pass
+
+
+def negotiate_media_type(accept):
+    """
+    Returns the media type of the response for the Accept header of a
+    request, either JSON_MEDIA_TYPE or one of MSGPACK_MEDIA_TYPES. JSON is
+    returned unless MessagePack is preferred.
+    """
+    if not accept:
+        return JSON_MEDIA_TYPE
+    qualities = {}
+    for _position, _range in enumerate(accept.split(",")):
+        media_type, *media_params = _range.split(";")
+        media_type = media_type.strip().lower()
+        q = 1.0
+        for _param in media_params:
+            key, _, value = _param.partition("=")
+            if key.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qualities.setdefault(media_type, (q, -_position))
+
+    best_type = JSON_MEDIA_TYPE
+    best = max(
+        qualities.get(JSON_MEDIA_TYPE, (0.0, 0)),
+        qualities.get("application/*", (0.0, 0)),
+        qualities.get("*/*", (0.0, 0))
+    )
+    for _media_type in MSGPACK_MEDIA_TYPES:
+        quality = qualities.get(_media_type)
+        if quality is not None and quality[0] > 0 and quality > best:
+            best_type, best = _media_type, quality
+    return best_type
+
+
+def set_response_media_type(media_type):
+    return _response_media_type.set(media_type)
+
+
+def reset_response_media_type(token):
+    _response_media_type.reset(token)
+
+
+def get_response_media_type():
+    """
+    Returns the media type negotiated for the current request.
+    """
+    return _response_media_type.get()
+
+
+def _orjson_default(obj):
+    # numeric columns (e.g. the averages in the stats) are returned as
+    # Decimal by psycopg2, pydantic encodes them as numbers as well
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    raise TypeError("type %s is not JSON serializable" % type(obj).__name__)
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response that serializes the DB rows with orjson. Unlike
+    fastapi.responses.ORJSONResponse it supports Decimal values.
+    """
+    def render(self, content):
+        with timed_serialization():
+            return orjson.dumps(
+                content,
+                default=_orjson_default,
+                option=orjson.OPT_NON_STR_KEYS
+            )
+
+
+def _msgpack_default(obj):
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    elif isinstance(obj, (datetime.datetime, datetime.date)):
+        # timezone aware datetimes are packed as timestamps, everything else
+        # is sent as in the JSON responses
+        return obj.isoformat()
+    raise TypeError("type %s is not serializable" % type(obj).__name__)
+
+
+class MsgpackResponse(Response):
+    """
+    MessagePack response. Datetimes with timezone are encoded with the
+    timestamp extension type.
+    """
+    media_type = MSGPACK_MEDIA_TYPES[0]
+
+    def render(self, content):
+        with timed_serialization():
+            return msgpack.packb(
+                content,
+                default=_msgpack_default,
+                datetime=True,
+                use_bin_type=True
+            )
+
+
+def _check_contract(content, response_model):
+    expected = jsonable_encoder(parse_obj_as(response_model, content))
+    actual = orjson.loads(FastJSONResponse(content=content).body)
+    # compare the serialized documents as e.g. True == 1.0 in python
+    if (
+        orjson.dumps(actual, option=orjson.OPT_SORT_KEYS)
+        != orjson.dumps(expected, option=orjson.OPT_SORT_KEYS)
+    ):
+        raise ResponseContractError(
+            "fast path result differs from response_model %s - "
+            "expected %s, got %s" % (response_model, expected, actual)
+        )
+
+
+def fast_response(content, response_model):
+    """
+    Returns the result of an endpoint without passing it through pydantic.
+
+    Returning a Response from an endpoint makes FastAPI skip the validation
+    and conversion of the result against the response_model of the route,
+    which is the most expensive part of requests that return many rows. The
+    response_model is still used for the OpenAPI schema, so content must
+    already match it.
+
+    The result is encoded with MessagePack instead of JSON if the client
+    prefers it (see negotiate_media_type).
+
+    If config['VALIDATE_RESPONSES'] is set (e.g. in the tests), content is
+    validated against response_model and the JSON document produced by the
+    fast path is compared to the one FastAPI would have returned.
+
+    Parameters
+    ----------
+    content - list, dict
+        result of the endpoint, usually the rows returned by execute_db
+    response_model - pydantic model or typing type
+        response_model of the route
+
+    Return
+    ------
+    FastJSONResponse or MsgpackResponse
+
+    Raises
+    ------
+    pydantic.ValidationError - if validation is enabled and content does not
+        match response_model
+    ResponseContractError - if validation is enabled and the fast path
+        serializes content differently than FastAPI
+    """
+    if config['VALIDATE_RESPONSES']:
+        _check_contract(content, response_model)
+
+    media_type = get_response_media_type()
+    if media_type != JSON_MEDIA_TYPE:
+        return MsgpackResponse(content=content, media_type=media_type)
+    return FastJSONResponse(content=content)
@@ -0,0 +1,262 @@
+import asyncio
+import contextlib
+import contextvars
+import logging
+import threading
+import weakref
+
+import anyio
+import psycopg2
+
+logger = logging.getLogger(__name__)
+
+# context of the request that is currently handled, see StatementContext
+_statement_context = contextvars.ContextVar(
+    "statement_context",
+    default=None
+)
+
+# statements on a shared connection are run one after the other, so that a
+# cancelled request only ever cancels its own statement
+_connection_locks = weakref.WeakKeyDictionary()
+_connection_locks_lock = threading.Lock()
+
+
+class StatementTimeoutError(RuntimeError):
+    """
+    Raised if a statement was cancelled because it exceeded the statement
+    timeout of the endpoint.
+    """
+    pass
+
+
+class QueryCancelledError(RuntimeError):
+    """
+    Raised if a statement was cancelled because the client disconnected.
+    """
+    pass
+
+
+def parse_statement_timeouts(timeouts):
+    """
+    Parses a comma separated list of path=milliseconds entries.
+
+    Parameters
+    ----------
+    timeouts - str or None
+        statement timeouts by path prefix, e.g.
+        "/api/v1/stats/values=5000,/api/v1/domains=30000"
+
+    Raises
+    ------
+    ValueError
+        if an entry is not of the form path=milliseconds
+
+    Return
+    ------
+    tuple of (path prefix, milliseconds) tuples, longest prefix first
+    """
+    parsed = []
+    for _entry in (timeouts or "").split(","):
+        _entry = _entry.strip()
+        if _entry == "":
+            continue
+        path, sep, milliseconds = _entry.rpartition("=")
+        if sep == "" or not path.startswith("/"):
+            raise ValueError("invalid statement timeout '%s'" % _entry)
+        parsed.append((path.strip(), int(milliseconds)))
+    return tuple(sorted(parsed, key=lambda x: len(x[0]), reverse=True))
+
+
+def statement_timeout_for_path(path, timeouts, default=0):
+    """
+    Returns the statement timeout in milliseconds of the longest path prefix
+    in timeouts that matches path, or default.
+    """
+    for _prefix, _milliseconds in timeouts:
+        if path == _prefix or path.startswith(_prefix.rstrip("/") + "/"):
+            return _milliseconds
+    return default
+
+
+class StatementContext(object):
+    """
+    Statement timeout and cancellation state of a request. The statements of
+    the request are run with the statement timeout (in milliseconds, 0 means
+    no limit) and are cancelled by cancel, e.g. when the client disconnects.
+    """
+    def __init__(self, statement_timeout=0):
+        self.statement_timeout = statement_timeout
+        self.cancelled = False
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def start(self, conn):
+        with self._lock:
+            if self.cancelled:
+                raise QueryCancelledError("request was cancelled")
+            self._conn = conn
+
+    def finish(self):
+        with self._lock:
+            self._conn = None
+
+    def cancel(self):
+        """
+        Cancels the running statement of the request and all statements it
+        would run afterwards. A statement that is about to be sent when
+        cancel is called runs to completion, the next one is not started.
+        """
+        with self._lock:
+            self.cancelled = True
+            if self._conn is not None:
+                try:
+                    self._conn.cancel()
+                except psycopg2.Error as e:
+                    logger.debug("could not cancel statement - %s", str(e))
+
+
+def get_statement_context():
+    return _statement_context.get()
+
+
+def set_statement_context(context):
+    return _statement_context.set(context)
+
+
+def reset_statement_context(token):
+    _statement_context.reset(token)
+
+
+def _connection_lock(conn):
+    with _connection_locks_lock:
+        lock = _connection_locks.get(conn)
+        if lock is None:
+            lock = threading.Lock()
+            _connection_locks[conn] = lock
+        return lock
+
+
+@contextlib.contextmanager
+def exclusive_statement(conn):
+    """
+    Runs the statements of the block exclusively on conn without registering
+    them with the statement context of the current request. Used for
+    statements that are not run on behalf of a single request, e.g. reading
+    the change watermark.
+
+    Return
+    ------
+    context manager
+    """
+    with _connection_lock(conn):
+        yield
+
+
+@contextlib.contextmanager
+def running_statement(conn):
+    """
+    Runs the statements of the block exclusively on conn and registers them
+    with the statement context of the current request, so they can be
+    cancelled.
+
+    Raises
+    ------
+    QueryCancelledError
+        if the request has already been cancelled
+
+    Return
+    ------
+    context manager yielding the StatementContext or None
+    """
+    context = _statement_context.get()
+    with _connection_lock(conn):
+        if context is None:
+            yield None
+            return
+        context.start(conn)
+        try:
+            yield context
+        finally:
+            context.finish()
+
+
+def cancelled_error(e):
+    """
+    Turns the psycopg2.errors.QueryCanceled e into a StatementTimeoutError or,
+    if the request was cancelled, a QueryCancelledError.
+    """
+    context = _statement_context.get()
+    if context is not None and context.cancelled:
+        return QueryCancelledError("statement was cancelled - %s" % str(e))
+    return StatementTimeoutError("statement timed out - %s" % str(e))
+
+
+class StatementContextMiddleware(object):
+    """
+    ASGI middleware that sets up the StatementContext of each HTTP request.
+
+    The statement timeout is looked up by the path of the request in the
+    STATEMENT_TIMEOUTS of config. If cancel_on_disconnect is set, the
+    messages of the client are read in the background and the statements of
+    the request are cancelled as soon as the client disconnects before the
+    response is complete. The messages are passed on to the application
+    unchanged.
+    """
+    def __init__(self, app, config):
+        self.app = app
+        self.config = config
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        context = StatementContext(statement_timeout_for_path(
+            scope["path"],
+            self.config["STATEMENT_TIMEOUTS"],
+            default=self.config["STATEMENT_TIMEOUT"]
+        ))
+        token = set_statement_context(context)
+        try:
+            if self.config["CANCEL_ON_DISCONNECT"]:
+                await self._call_watched(context, scope, receive, send)
+            else:
+                await self.app(scope, receive, send)
+        finally:
+            reset_statement_context(token)
+
+    async def _call_watched(self, context, scope, receive, send):
+        messages = asyncio.Queue()
+        state = {"response_complete": False}
+
+        async def watch_client():
+            while True:
+                message = await receive()
+                await messages.put(message)
+                if message["type"] == "http.disconnect":
+                    if not state["response_complete"]:
+                        logger.info(
+                            "client disconnected - cancelling statements"
+                        )
+                        # cancel blocks until the DB has received it
+                        await anyio.to_thread.run_sync(context.cancel)
+                    return
+
+        async def receive_from_client():
+            return await messages.get()
+
+        async def send_to_client(message):
+            if (
+                message["type"] == "http.response.body"
+                and not message.get("more_body", False)
+            ):
+                state["response_complete"] = True
+            await send(message)
+
+        async with anyio.create_task_group() as task_group:
+            task_group.start_soon(watch_client)
+            try:
+                await self.app(scope, receive_from_client, send_to_client)
+            finally:
+                task_group.cancel_scope.cancel()
@@ -0,0 +1,217 @@
+import collections
+import contextlib
+import contextvars
+import datetime
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# timing of the request that is currently handled, see RequestTiming
+_request_timing = contextvars.ContextVar(
+    "request_timing",
+    default=None
+)
+
+
+class RequestTiming(object):
+    """
+    Time spent by a request in the DB and in serializing its result. The
+    statements of a request are run in the threadpool, they add to the
+    RequestTiming of the request that was set up by the ServerTimingMiddleware.
+    """
+    def __init__(self, path=None, query_string=None):
+        self.path = path
+        self.query_string = query_string
+        self.start = time.time()
+        self.db_time = 0.0
+        self.statements = 0
+        self.rows = 0
+        self.serialization_time = 0.0
+        self._lock = threading.Lock()
+
+    def add_statement(self, duration, rows):
+        with self._lock:
+            self.db_time += duration
+            self.statements += 1
+            if rows is not None:
+                self.rows += rows
+
+    def add_serialization(self, duration):
+        with self._lock:
+            self.serialization_time += duration
+
+    def server_timing(self):
+        """
+        Returns the value of the Server-Timing header. The durations are in
+        milliseconds.
+        """
+        with self._lock:
+            return (
+                'db;dur=%.3f;desc="%i statements, %i rows", '
+                'serialize;dur=%.3f, '
+                'total;dur=%.3f' % (
+                    1000 * self.db_time,
+                    self.statements,
+                    self.rows,
+                    1000 * self.serialization_time,
+                    1000 * (time.time() - self.start)
+                )
+            )
+
+
+def get_request_timing():
+    return _request_timing.get()
+
+
+def set_request_timing(timing):
+    return _request_timing.set(timing)
+
+
+def reset_request_timing(token):
+    _request_timing.reset(token)
+
+
+@contextlib.contextmanager
+def timed_serialization():
+    """
+    Adds the time spent in the block to the serialization time of the
+    current request.
+    """
+    start = time.time()
+    try:
+        yield
+    finally:
+        timing = _request_timing.get()
+        if timing is not None:
+            timing.add_serialization(time.time() - start)
+
+
+def _loggable(value):
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    elif isinstance(value, (list, tuple)):
+        return [_loggable(_value) for _value in value]
+    elif isinstance(value, dict):
+        return {
+            str(_key): _loggable(_value)
+            for _key, _value in value.items()
+        }
+    elif isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return str(value)
+
+
+class SlowQueryLog(object):
+    """
+    Rolling log of the statements that took at least threshold milliseconds.
+    Only the latest max_entries statements are kept.
+
+    A max_entries of 0 disables the log.
+    """
+
+    def __init__(self, max_entries=0, threshold=1000):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self._entries = collections.deque(maxlen=max(max_entries, 1))
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def record(self, query, params, duration, rows, timing=None):
+        """
+        Logs a statement if it took at least threshold milliseconds.
+
+        Parameters
+        ----------
+        query - str
+            SQL template of the statement
+        params - dict, tuple or None
+            parameters of the statement
+        duration - float
+            execution and fetch time in seconds
+        rows - int or None
+            number of rows returned, None if the statement failed
+        timing - RequestTiming or None
+            timing of the request that ran the statement
+
+        Return
+        ------
+        True if the statement was logged
+        """
+        if not self.enabled or 1000 * duration < self.threshold:
+            return False
+        entry = {
+            "logged_at": datetime.datetime.utcnow().isoformat(),
+            "path": timing.path if timing is not None else None,
+            "query_string": (
+                timing.query_string if timing is not None else None
+            ),
+            "duration_ms": round(1000 * duration, 3),
+            "rows": rows,
+            "query": query,
+            "params": _loggable(params)
+        }
+        logger.info(
+            "slow statement on %s - %.3f ms, %s rows",
+            entry["path"],
+            entry["duration_ms"],
+            rows
+        )
+        with self._lock:
+            self._entries.append(entry)
+        return True
+
+    def entries(self):
+        """
+        Returns the logged statements, latest first.
+        """
+        with self._lock:
+            return list(reversed(self._entries))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class ServerTimingMiddleware(object):
+    """
+    ASGI middleware that sets up the RequestTiming of each HTTP request.
+
+    If server_timing is set in config (SERVER_TIMING), the timing is
+    returned to the client in the Server-Timing header of the response. The
+    header is sent before the body, so the statements of streamed responses
+    (e.g. the /export endpoints) are not included.
+    """
+    def __init__(self, app, config):
+        self.app = app
+        self.config = config
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timing = RequestTiming(
+            path=scope["path"],
+            query_string=scope.get("query_string", b"").decode("latin-1")
+        )
+        send_timing = self.config["SERVER_TIMING"]
+
+        async def send_with_timing(message):
+            if send_timing and message["type"] == "http.response.start":
+                message = dict(message)
+                message["headers"] = list(message.get("headers", [])) + [(
+                    b"server-timing",
+                    timing.server_timing().encode("latin-1")
+                )]
+            await send(message)
+
+        token = set_request_timing(timing)
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            reset_request_timing(token)
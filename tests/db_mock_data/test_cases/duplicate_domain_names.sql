@@ -0,0 +1,8 @@
+-- entity tables of other deployments may contain a name several times, e.g.
+-- for re-registered domains
+ALTER TABLE public.domains DROP CONSTRAINT idx_domains_domain_name;
+
+INSERT INTO public.domains (domain_id, domain_name) VALUES (1001, 'test1.at');
+
+INSERT INTO domain_tags (domain_id, tag_id, start_date, end_date, taxonomy_id, value_id, measured_at, start_ts, end_ts, producer)
+                 VALUES (1001, 1, '20200317', null, 1, null, to_timestamp('2020-03-17 12:53:21', 'YYYY-MM-DD HH24:MI:SS'), to_timestamp('2020-03-17 12:53:21', 'YYYY-MM-DD HH24:MI:SS'), null, 'test_producer1');
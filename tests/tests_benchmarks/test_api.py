@@ -0,0 +1,149 @@
+import os
+import shutil
+import random
+import logging
+import binascii
+import tempfile
+import importlib.util
+from unittest import TestCase
+
+from benchmarks.datagen import (
+    TaxonomyShape,
+    create_benchmark_db,
+    create_benchmark_glue,
+    seed_domain_filter,
+    drop_benchmark_db
+)
+from benchmarks.api import (
+    DEFAULT_MIX,
+    ApiServer,
+    LoadLevel,
+    RequestFactory,
+    compare_to_baseline,
+    parse_mix,
+    write_msm2tag_config
+)
+
+from tests.util import config
+
+LOGGER = logging.getLogger("tests.benchmarks")
+LOGGER.setLevel(logging.WARNING)
+
+SHAPE = TaxonomyShape(
+    n_taxonomies=2,
+    n_tags=10,
+    n_values=3,
+    n_categories=2,
+    tags_per_domain=2
+)
+
+
+def level_result(concurrency, p95, throughput, error_rate):
+    return {
+        "concurrency": concurrency,
+        "endpoints": {
+            "bydomain": {
+                "latency_ms": {"p95": p95},
+                "throughput_rps": throughput,
+                "error_rate": error_rate
+            }
+        }
+    }
+
+
+class LoadTestTest(TestCase):
+    def test_parse_mix(self):
+        self.assertDictEqual(parse_mix(""), DEFAULT_MIX)
+        mix = parse_mix("bydomain=1,msm2tag=0")
+        self.assertEqual(mix["bydomain"], 1)
+        self.assertEqual(mix["msm2tag"], 0)
+        self.assertEqual(mix["stats_tags"], DEFAULT_MIX["stats_tags"])
+        self.assertListEqual(list(mix.keys()), list(DEFAULT_MIX.keys()))
+
+        for _mix in ["nonexisting=1", "bydomain", "bydomain=-1"]:
+            with self.assertRaises(ValueError):
+                parse_mix(_mix)
+        with self.assertRaises(ValueError):
+            parse_mix(",".join("%s=0" % _name for _name in DEFAULT_MIX))
+
+    def test_requests(self):
+        factory = RequestFactory(100, 50, SHAPE, page_size=10)
+        rng = random.Random(0)
+        for _endpoint in DEFAULT_MIX:
+            method, path, body = factory.make_request(_endpoint, rng)
+            self.assertTrue(path.startswith("/api/v1/"))
+            if _endpoint == "msm2tag":
+                self.assertEqual(method, "POST")
+                self.assertIsNotNone(body)
+            else:
+                self.assertEqual(method, "GET")
+                self.assertIsNone(body)
+
+        with self.assertRaises(ValueError):
+            factory.make_request("nonexisting", rng)
+
+    def test_compare_to_baseline(self):
+        baseline = [level_result(1, 10.0, 100.0, 0.0)]
+        self.assertListEqual(compare_to_baseline(
+            [level_result(1, 12.0, 90.0, 0.0)], baseline, 1.5
+        ), [])
+        # levels that are not in the baseline are not compared
+        self.assertListEqual(compare_to_baseline(
+            [level_result(4, 100.0, 1.0, 1.0)], baseline, 1.5
+        ), [])
+
+        regressions = compare_to_baseline(
+            [level_result(1, 20.0, 50.0, 0.1)], baseline, 1.5
+        )
+        self.assertEqual(len(regressions), 3)
+        for _regression in regressions:
+            self.assertEqual(_regression["concurrency"], 1)
+            self.assertEqual(_regression["endpoint"], "bydomain")
+
+
+class LoadTestDBTest(TestCase):
+    def setUp(self):
+        if config is None:
+            self.skipTest("no db connection specified - skipping DB tests")
+        if shutil.which("psql") is None:
+            self.skipTest("psql not found - skipping benchmark DB tests")
+        if importlib.util.find_spec("uvicorn") is None:
+            self.skipTest("uvicorn not found - skipping API load tests")
+        self.db_name = "tag2domain_benchmark_test_%s" % (
+            binascii.b2a_hex(os.urandom(6)).decode()
+        )
+        self.bench_config = create_benchmark_db(
+            config, self.db_name, 200, shape=SHAPE, seeded_fraction=0.5
+        )
+        create_benchmark_glue(config, self.db_name)
+        seed_domain_filter(self.bench_config, 2)
+
+        fd, self.msm2tag_config_path = tempfile.mkstemp(suffix=".cfg")
+        os.close(fd)
+        write_msm2tag_config(self.msm2tag_config_path, self.bench_config)
+        self.server = ApiServer(
+            self.bench_config, self.msm2tag_config_path, logger=LOGGER
+        )
+        self.server.start()
+
+    def tearDown(self):
+        self.server.stop()
+        os.unlink(self.msm2tag_config_path)
+        drop_benchmark_db(config, self.db_name)
+
+    def test_level(self):
+        factory = RequestFactory(200, 100, SHAPE, page_size=10)
+        result = LoadLevel(
+            self.server.host, self.server.port, factory, DEFAULT_MIX,
+            concurrency=2, duration=2
+        ).run()
+
+        self.assertEqual(result["concurrency"], 2)
+        self.assertGreater(result["requests"], 0)
+        self.assertEqual(result["errors"], 0, result["endpoints"])
+        self.assertEqual(
+            sum(_e["requests"] for _e in result["endpoints"].values()),
+            result["requests"]
+        )
+        for _endpoint in result["endpoints"].values():
+            self.assertIn("p95", _endpoint["latency_ms"])
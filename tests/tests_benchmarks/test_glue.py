@@ -0,0 +1,172 @@
+import os
+import shutil
+import binascii
+import datetime
+from unittest import TestCase
+
+from benchmarks.datagen import (
+    TaxonomyShape,
+    create_benchmark_db,
+    create_benchmark_glue,
+    seed_domain_filter,
+    drop_benchmark_db
+)
+from benchmarks.glue import (
+    GlueCase,
+    GlueBenchmark,
+    glue_cases,
+    summarize_plan,
+    check_plan,
+    compare_to_baseline
+)
+
+from tests.util import config
+
+SHAPE = TaxonomyShape(
+    n_taxonomies=2,
+    n_tags=10,
+    n_values=3,
+    n_categories=2,
+    tags_per_domain=2
+)
+
+CASE = GlueCase(
+    "open_tags",
+    "tag2domain_get_open_tags",
+    (),
+    ("domain_tags",)
+)
+
+
+def explain_result(intxn_scan):
+    return [{
+        "Plan": {
+            "Node Type": "Hash Join",
+            "Actual Rows": 10,
+            "Shared Hit Blocks": 20,
+            "Shared Read Blocks": 5,
+            "Plans": [
+                intxn_scan,
+                {
+                    "Node Type": "Hash",
+                    "Plans": [{
+                        "Node Type": "Seq Scan",
+                        "Relation Name": "domains"
+                    }]
+                }
+            ]
+        },
+        "Execution Time": 1.5
+    }]
+
+
+INDEX_SCAN = {
+    "Node Type": "Index Scan",
+    "Index Name": "domain_tags_open_idx",
+    "Relation Name": "domain_tags"
+}
+SEQ_SCAN = {
+    "Node Type": "Seq Scan",
+    "Relation Name": "domain_tags_history"
+}
+
+
+class GluePlanTest(TestCase):
+    def test_summarize_plan(self):
+        summary = summarize_plan(explain_result(INDEX_SCAN))
+        self.assertDictEqual(summary, {
+            "execution_time_ms": 1.5,
+            "rows": 10,
+            "shared_buffers": 25,
+            "scans": [
+                "Index Scan using domain_tags_open_idx on domain_tags",
+                "Seq Scan on domains"
+            ],
+            "node_types": ["Hash", "Hash Join", "Index Scan", "Seq Scan"]
+        })
+
+    def test_check_plan(self):
+        raw_plan = explain_result(INDEX_SCAN)
+        self.assertListEqual(
+            check_plan(CASE, summarize_plan(raw_plan), raw_plan), []
+        )
+
+        # partitions count as the intersection table
+        raw_plan = explain_result(SEQ_SCAN)
+        flags = check_plan(CASE, summarize_plan(raw_plan), raw_plan)
+        self.assertEqual(len(flags), 1)
+        self.assertEqual(flags[0]["flag"], "seq_scan")
+        self.assertEqual(flags[0]["relation"], "domain_tags_history")
+
+    def test_compare_to_baseline(self):
+        baseline = {
+            "timing_ms": {"median": 10.0},
+            "plan": summarize_plan(explain_result(INDEX_SCAN))
+        }
+        self.assertListEqual(
+            compare_to_baseline(baseline, baseline, 1.5), []
+        )
+
+        result = {
+            "timing_ms": {"median": 20.0},
+            "plan": summarize_plan(explain_result(SEQ_SCAN))
+        }
+        result["plan"]["shared_buffers"] = 100
+        self.assertListEqual(
+            [_flag["flag"] for _flag in compare_to_baseline(
+                result, baseline, 1.5
+            )],
+            ["plan_changed", "slower", "more_buffers"]
+        )
+
+
+class GlueBenchmarkDBTest(TestCase):
+    def setUp(self):
+        if config is None:
+            self.skipTest("no db connection specified - skipping DB tests")
+        if shutil.which("psql") is None:
+            self.skipTest("psql not found - skipping benchmark DB tests")
+        self.db_name = "tag2domain_benchmark_test_%s" % (
+            binascii.b2a_hex(os.urandom(6)).decode()
+        )
+        self.bench_config = create_benchmark_db(
+            config, self.db_name, 200, shape=SHAPE, seeded_fraction=0.5,
+            intervals_per_tag=4
+        )
+        create_benchmark_glue(config, self.db_name)
+        seed_domain_filter(self.bench_config, 2)
+
+    def tearDown(self):
+        drop_benchmark_db(config, self.db_name)
+
+    def test_cases(self):
+        benchmark = GlueBenchmark(self.bench_config, repeat=2)
+        try:
+            self.assertEqual(benchmark.count_intervals(), 100 * 2 * 2 * 4)
+            results = {
+                _case.name: benchmark.run_case(_case)
+                for _case in glue_cases(
+                    100, 4, datetime.timedelta(days=30)
+                )
+            }
+        finally:
+            benchmark.close()
+
+        # every seeded domain has one open and one closed interval per tag
+        # slot at any time since the oldest interval
+        for _name in [
+            "open_tags",
+            "tags_at_time[recent]",
+            "tags_at_time[middle]",
+            "tags_at_time[oldest]"
+        ]:
+            self.assertEqual(results[_name]["rows"], 100 * 2 * 2)
+            self.assertEqual(results[_name]["plan"]["rows"], 100 * 2 * 2)
+        self.assertEqual(results["open_tags_domain"]["rows"], 2 * 2)
+        self.assertEqual(results["all_tags_domain"]["rows"], 4 * 2 * 2)
+        self.assertGreater(results["open_tags_filtered"]["rows"], 0)
+        self.assertGreater(results["tags_at_time_filtered"]["rows"], 0)
+
+        for _result in results.values():
+            self.assertEqual(_result["timing_ms"]["runs"], 2)
+            self.assertGreater(len(_result["plan"]["scans"]), 0)
@@ -0,0 +1,122 @@
+import os
+import logging
+import shutil
+import binascii
+from unittest import TestCase
+
+import jsonschema
+
+from py_tag2domain.msm2tags import MeasurementToTags
+
+from benchmarks.datagen import (
+    TaxonomyShape,
+    MeasurementGenerator,
+    base_tags,
+    create_benchmark_db,
+    drop_benchmark_db
+)
+from benchmarks.ingest import IngestRun, percentiles
+
+from tests.util import config
+
+LOGGER = logging.getLogger("tests.benchmarks")
+LOGGER.setLevel(logging.WARNING)
+
+SHAPE = TaxonomyShape(
+    n_taxonomies=2,
+    n_tags=10,
+    n_values=3,
+    n_categories=2,
+    tags_per_domain=2
+)
+
+
+class BenchmarkArgs(object):
+    update_change_watermark = False
+    maintain_open_tag_counts = False
+    prepare_statements = False
+    pipeline_writes = False
+
+
+class MeasurementGeneratorTest(TestCase):
+    def test_reproducible(self):
+        msms_a = MeasurementGenerator(100, SHAPE, seed=3).generate(50)
+        msms_b = MeasurementGenerator(100, SHAPE, seed=3).generate(50)
+        self.assertListEqual(msms_a, msms_b)
+
+    def test_prolong_repeats_current_tags(self):
+        generator = MeasurementGenerator(
+            100, SHAPE, churn_rate=0.0, auto_tag_rate=0.0
+        )
+        for kind, msm in generator.generate(20):
+            self.assertEqual(kind, "prolong")
+            self.assertListEqual(
+                msm["tags"],
+                base_tags(SHAPE, msm["tagged_id"], int(msm["taxonomy"][-1]))
+            )
+
+    def test_measurements_are_valid(self):
+        schema = MeasurementToTags.load_msm_schema()
+        generator = MeasurementGenerator(
+            10, SHAPE, churn_rate=0.3, auto_tag_rate=0.3
+        )
+        kinds = set()
+        last_measured_at = None
+        for kind, msm in generator.generate(100):
+            kinds.add(kind)
+            jsonschema.validate(instance=msm, schema=schema)
+            if msm.get("autogenerate_tags"):
+                for _tag in msm["tags"]:
+                    self.assertIn("description", _tag)
+            if last_measured_at is not None:
+                self.assertGreater(msm["measured_at"], last_measured_at)
+            last_measured_at = msm["measured_at"]
+        self.assertSetEqual(kinds, set(["prolong", "churn", "auto_tag"]))
+
+    def test_percentiles(self):
+        summary = percentiles([0.001 * i for i in range(1, 101)])
+        self.assertEqual(summary["count"], 100)
+        self.assertAlmostEqual(summary["p50"], 50)
+        self.assertAlmostEqual(summary["p99"], 99)
+        self.assertAlmostEqual(summary["max"], 100)
+        self.assertDictEqual(percentiles([]), {"count": 0})
+
+
+class IngestBenchmarkDBTest(TestCase):
+    def setUp(self):
+        if config is None:
+            self.skipTest("no db connection specified - skipping DB tests")
+        if shutil.which("psql") is None:
+            self.skipTest("psql not found - skipping benchmark DB tests")
+        self.db_name = "tag2domain_benchmark_test_%s" % (
+            binascii.b2a_hex(os.urandom(6)).decode()
+        )
+        self.bench_config = create_benchmark_db(
+            config, self.db_name, 200, shape=SHAPE, seeded_fraction=0.5
+        )
+
+    def tearDown(self):
+        drop_benchmark_db(config, self.db_name)
+
+    def test_drivers(self):
+        generator = MeasurementGenerator(
+            200, SHAPE, churn_rate=0.1, auto_tag_rate=0.05
+        )
+        for driver in ["handle_measurement", "stream_looper"]:
+            ingest_run = IngestRun(
+                driver, self.bench_config, BenchmarkArgs(), logger=LOGGER
+            )
+            try:
+                msms = [_msm for _, _msm in generator.generate(100)]
+                result = ingest_run.result(ingest_run.replay(msms))
+            finally:
+                ingest_run.close()
+
+            self.assertEqual(result["messages"], 100)
+            self.assertEqual(result["failed"], 0)
+            self.assertEqual(result["stale"], 0)
+            self.assertEqual(result["commits_per_msg"], 1.0)
+            self.assertGreater(result["statements_per_msg"], 0)
+            self.assertGreater(result["changes"]["prolong"], 0)
+            self.assertGreater(result["changes"]["insert"], 0)
+            self.assertEqual(result["latency_ms"]["commit"]["count"], 100)
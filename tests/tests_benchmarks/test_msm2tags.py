@@ -0,0 +1,75 @@
+import logging
+from unittest import TestCase
+
+from benchmarks.datagen import (
+    TaxonomyShape,
+    MeasurementGenerator,
+    base_tags,
+    create_memory_adapter
+)
+from benchmarks.msm2tags import MemoryRun
+
+LOGGER = logging.getLogger("tests.benchmarks")
+LOGGER.setLevel(logging.WARNING)
+
+SHAPE = TaxonomyShape(
+    n_taxonomies=2,
+    n_tags=10,
+    n_values=3,
+    n_categories=2,
+    tags_per_domain=2
+)
+
+
+class BenchmarkArgs(object):
+    update_change_watermark = True
+    maintain_open_tag_counts = True
+    summarize_logging = False
+
+
+class MemoryRunTest(TestCase):
+    def test_memory_adapter_is_seeded(self):
+        adapter = create_memory_adapter(10, SHAPE, seeded_fraction=0.5)
+        taxonomy_id = adapter.fetch_taxonomy_by_name("benchmark_1")["id"]
+        open_tags = adapter.get_open_tags(taxonomy_id, "domain", 3)
+        tag_names = {
+            _id: _name
+            for _name, _id in adapter.fetch_tag_ids(taxonomy_id).items()
+        }
+        self.assertSetEqual(
+            set(tag_names[_tag["tag_id"]] for _tag in open_tags),
+            set(_tag["tag"] for _tag in base_tags(SHAPE, 3, 1))
+        )
+        self.assertListEqual(
+            adapter.get_open_tags(taxonomy_id, "domain", 6), []
+        )
+
+    def test_replay(self):
+        adapter = create_memory_adapter(20, SHAPE, logger=LOGGER)
+        adapter.rebuild_open_tag_counts()
+        adapter.commit()
+        memory_run = MemoryRun(adapter, BenchmarkArgs(), LOGGER)
+        msms = MeasurementGenerator(
+            20, SHAPE, churn_rate=0.3, auto_tag_rate=0.0
+        ).generate(100)
+        duration = memory_run.replay([_msm for _, _msm in msms])
+        result = memory_run.result(duration)
+
+        self.assertEqual(result["messages"], 100)
+        self.assertEqual(result["failed"], 0)
+        self.assertEqual(result["stale"], 0)
+        self.assertEqual(
+            result["changes"]["prolong"] + result["changes"]["insert"],
+            sum(len(_msm["tags"]) for _, _msm in msms)
+        )
+        self.assertGreater(adapter.change_watermark, 0)
+
+        # the maintained counters agree with recounting the intersections
+        maintained_counts = {
+            _key: _count
+            for _key, _count in adapter.open_tag_counts.items()
+            if _count != 0
+        }
+        adapter.rebuild_open_tag_counts()
+        self.assertDictEqual(maintained_counts, dict(adapter.open_tag_counts))
+        self.assertNotIn("commit", result["latency_ms"])
@@ -1,6 +1,11 @@
 from __future__ import print_function
+import datetime
+from unittest import TestCase
+
+import psycopg2.tz
 
 from py_tag2domain.db import Psycopg2Adapter
+from py_tag2domain.memory_db import InMemoryAdapter
 from tests.util import PostgresReadOnlyDBTest, PostgresAutoDBTest
 
 
@@ -41,3 +46,94 @@ class PostgresPsycopgAdapterAutoDBTest(PostgresAutoDBTest):
     def tearDown(self):
         print("tearing down instance of PostgresPsycopgAdapterAutoDBTest")
         super(PostgresPsycopgAdapterAutoDBTest, self).tearDown()
+
+
+def _ts(*args):
+    return datetime.datetime(
+        *args,
+        tzinfo=psycopg2.tz.FixedOffsetTimezone(offset=0, name=None)
+    )
+
+
+def create_memory_test_adapter():
+    """
+    Create an InMemoryAdapter that holds the same taxonomies, tags, values
+    and intersections as tests/db_mock_data/basic/tag2domain_db_test_data.sql.
+    """
+    adapter = InMemoryAdapter(["delegation", "domain", "intersection"])
+    for i, (allows_auto_tags, allows_auto_values, is_actionable) in enumerate(
+        [(False, False, 1), (True, False, 1), (False, True, 0.5),
+         (True, True, None)],
+        start=1
+    ):
+        adapter.add_taxonomy(
+            "tax_test%i" % i,
+            allows_auto_tags=allows_auto_tags,
+            allows_auto_values=allows_auto_values,
+            description="test taxonomie %i" % i,
+            is_actionable=is_actionable,
+            is_automatically_classifiable=True,
+            is_stable=False,
+            for_numbers=True,
+            for_domains=True,
+            url="test.at/test_taxonomie_%i" % i
+        )
+
+    for tag_number, taxonomy_id in [(1, 1), (2, 1), (3, 1), (1, 3)]:
+        adapter.add_tag(
+            taxonomy_id,
+            "test_tag_%i_tax_%i" % (tag_number, taxonomy_id),
+            "test tag %i for tax %i" % (tag_number, taxonomy_id)
+        )
+
+    adapter.add_value(1, "value_1_tag_1")
+    adapter.add_value(1, "value_2_tag_1")
+    adapter.add_value(4, "value_1_tag_4")
+
+    for _type in ["delegation", "domain", "intersection"]:
+        adapter.add_intersection(
+            _type, 1, 1, 1, _ts(2020, 3, 17, 12, 53, 21),
+            producer="test_producer1"
+        )
+        adapter.add_intersection(
+            _type, 2, 1, 1, _ts(2020, 3, 17, 12, 53, 21), value_id=1
+        )
+        adapter.add_intersection(
+            _type, 1, 1, 2, _ts(2020, 4, 25, 18, 21),
+            measured_at=_ts(2020, 6, 30, 20, 51, 36),
+            producer="test_producer1"
+        )
+        adapter.add_intersection(
+            _type, 1, 1, 3, _ts(2020, 4, 25, 18, 21),
+            measured_at=_ts(2020, 7, 10, 14, 20),
+            end_ts=_ts(2020, 7, 10, 14, 20),
+            producer="test_producer3"
+        )
+        adapter.add_intersection(
+            _type, 1, 3, 4, _ts(2020, 4, 25, 18, 21),
+            measured_at=_ts(2020, 6, 30, 20, 51, 36),
+            producer="test_producer3"
+        )
+    return adapter
+
+
+class InMemoryAdapterTest(TestCase):
+    """
+    Runs the tests of a Postgres test class against an InMemoryAdapter. Must
+    be listed before the Postgres test class in the bases.
+    """
+    @classmethod
+    def setUpClass(cls):
+        print("setting up class InMemoryAdapterTest")
+
+    @classmethod
+    def tearDownClass(cls):
+        print("tearing down class InMemoryAdapterTest")
+
+    def setUp(self):
+        print("setting up instance of InMemoryAdapterTest")
+        self.adapter = create_memory_test_adapter()
+
+    def tearDown(self):
+        print("tearing down instance of InMemoryAdapterTest")
+        self.adapter.close_connection()
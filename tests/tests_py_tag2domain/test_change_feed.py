@@ -0,0 +1,256 @@
+import os
+import json
+import shutil
+import tempfile
+from unittest import TestCase
+
+from py_tag2domain.msm2tags import MeasurementToTags
+from py_tag2domain.util import parse_timestamp
+from py_tag2domain.change_feed import (
+    ChangeFeedPublisher,
+    FileChangeSink,
+    CHANGE_TYPES
+)
+from .db_test_classes import create_memory_test_adapter
+
+
+def measurement(measured_at, tags):
+    return {
+        "version": "1",
+        "tag_type": "domain",
+        "tagged_id": 1,
+        "taxonomy": "tax_test1",
+        "producer": "test_producer1",
+        "measurement_id": "test:1",
+        "measured_at": measured_at,
+        "tags": tags
+    }
+
+
+class FailingSink(object):
+    def __init__(self, fail_after=0):
+        self.fail_after = fail_after
+        self.events = []
+
+    def write(self, events):
+        if self.fail_after <= 0:
+            raise IOError("sink is down")
+        self.fail_after -= 1
+        self.events.extend(events)
+
+
+class ChangeFeedTest(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, "changes.jsonl")
+        self.adapter = create_memory_test_adapter()
+        self.msm_to_tags = MeasurementToTags(
+            self.adapter,
+            max_measurement_age=None
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def publisher(self, sink, **kwargs):
+        return ChangeFeedPublisher(sink, self.adapter, **kwargs)
+
+    def handle(self, publisher, msm):
+        self.msm_to_tags.change_feed = publisher
+        result = self.msm_to_tags.handle_measurement(msm)
+        return publisher.handle_result(True, msm, result)
+
+    def outbox_changes(self):
+        return [
+            (_event["change"], _event["tag_id"])
+            for _, _event in self.adapter.fetch_change_events(100)
+        ]
+
+    def read_events(self):
+        with open(self.path, encoding="utf-8") as f:
+            return [json.loads(_line) for _line in f]
+
+    def read_changes(self):
+        return [
+            (_event["change"], _event["tag_id"])
+            for _event in self.read_events()
+        ]
+
+    def test_insert_and_end(self):
+        publisher = self.publisher(FileChangeSink(self.path))
+        # ends tag 1 and prolongs tag 2
+        n_events = self.handle(publisher, measurement(
+            "2020-10-01T09:00:00",
+            [{"tag": "test_tag_2_tax_1"}, {"tag": "test_tag_3_tax_1"}]
+        ))
+        publisher.close()
+
+        self.assertEqual(n_events, 2)
+        self.assertListEqual(self.read_changes(), [("insert", 3), ("end", 1)])
+        self.assertListEqual(
+            [_event["event_id"] for _event in self.read_events()],
+            [1, 2]
+        )
+        self.assertListEqual(self.outbox_changes(), [])
+        for _event in self.read_events():
+            self.assertEqual(_event["tag_type"], "domain")
+            self.assertEqual(_event["tagged_id"], 1)
+            self.assertEqual(_event["taxonomy_id"], 1)
+            self.assertIsNone(_event["value_id"])
+            self.assertEqual(_event["producer"], "test_producer1")
+            self.assertEqual(_event["measurement_id"], "test:1")
+            self.assertTrue(
+                _event["measured_at"].startswith("2020-10-01T09:00:00")
+            )
+
+    def test_prolong(self):
+        publisher = self.publisher(
+            FileChangeSink(self.path),
+            change_types=CHANGE_TYPES
+        )
+        self.handle(publisher, measurement(
+            "2020-10-01T09:00:00",
+            [{"tag": "test_tag_2_tax_1"}, {"tag": "test_tag_3_tax_1"}]
+        ))
+        publisher.close()
+        self.assertListEqual(
+            self.read_changes(),
+            [("insert", 3), ("prolong", 2), ("end", 1)]
+        )
+
+    def test_appends_batches(self):
+        publisher = self.publisher(FileChangeSink(self.path))
+        self.handle(publisher, measurement(
+            "2020-10-01T09:00:00",
+            [{"tag": "test_tag_2_tax_1"}, {"tag": "test_tag_3_tax_1"}]
+        ))
+        # only prolongs, nothing is published
+        self.assertEqual(self.handle(publisher, measurement(
+            "2020-10-01T10:00:00",
+            [{"tag": "test_tag_2_tax_1"}, {"tag": "test_tag_3_tax_1"}]
+        )), 0)
+        publisher.close()
+
+        publisher = self.publisher(FileChangeSink(self.path))
+        self.handle(publisher, measurement("2020-10-01T11:00:00", []))
+        publisher.close()
+        self.assertListEqual(
+            self.read_changes(),
+            [("insert", 3), ("end", 1), ("end", 2), ("end", 3)]
+        )
+
+    def test_skipped_measurements(self):
+        # nothing is pending, so the sink is not called
+        publisher = self.publisher(FailingSink())
+        self.assertEqual(publisher.handle_result(True, {}, None), 0)
+        self.assertEqual(publisher.handle_result(False, {}, None), 0)
+
+    def count_outbox_reads(self):
+        reads = []
+        fetch_change_events = self.adapter.fetch_change_events
+
+        def _fetch_change_events(limit):
+            reads.append(limit)
+            return fetch_change_events(limit)
+        self.adapter.fetch_change_events = _fetch_change_events
+        return reads
+
+    def test_prolong_only_does_not_read_outbox(self):
+        reads = self.count_outbox_reads()
+        publisher = self.publisher(FileChangeSink(self.path))
+        self.handle(publisher, measurement(
+            "2020-10-01T09:00:00",
+            [{"tag": "test_tag_2_tax_1"}, {"tag": "test_tag_3_tax_1"}]
+        ))
+        self.assertEqual(len(reads), 2)
+
+        self.assertEqual(self.handle(publisher, measurement(
+            "2020-10-01T10:00:00",
+            [{"tag": "test_tag_2_tax_1"}, {"tag": "test_tag_3_tax_1"}]
+        )), 0)
+        self.assertEqual(publisher.handle_result(True, {}, None), 0)
+        self.assertEqual(len(reads), 2)
+        publisher.close()
+
+    def test_publish_failure(self):
+        # the tag changes are committed, the events stay in the outbox
+        publisher = self.publisher(FailingSink(), retry_interval=3600)
+        self.assertEqual(self.handle(publisher, measurement(
+            "2020-10-01T09:00:00",
+            [{"tag": "test_tag_2_tax_1"}, {"tag": "test_tag_3_tax_1"}]
+        )), 0)
+        self.assertListEqual(
+            self.outbox_changes(),
+            [("insert", 3), ("end", 1)]
+        )
+        self.assertRaises(IOError, publisher.publish_pending)
+
+        # the retry is not due yet
+        reads = self.count_outbox_reads()
+        publisher.sink = FileChangeSink(self.path)
+        self.assertEqual(self.handle(publisher, measurement(
+            "2020-10-01T10:00:00",
+            [{"tag": "test_tag_2_tax_1"}, {"tag": "test_tag_3_tax_1"}]
+        )), 0)
+        self.assertListEqual(reads, [])
+
+        # the pending events are published by the next measurement once the
+        # retry interval has passed, even if it only prolongs
+        publisher.retry_interval = 0
+        self.assertEqual(self.handle(publisher, measurement(
+            "2020-10-01T11:00:00",
+            [{"tag": "test_tag_2_tax_1"}, {"tag": "test_tag_3_tax_1"}]
+        )), 2)
+        publisher.close()
+        self.assertListEqual(self.read_changes(), [("insert", 3), ("end", 1)])
+        self.assertListEqual(self.outbox_changes(), [])
+
+        # nothing is pending anymore
+        n_reads = len(reads)
+        self.assertEqual(self.handle(publisher, measurement(
+            "2020-10-01T12:00:00",
+            [{"tag": "test_tag_2_tax_1"}, {"tag": "test_tag_3_tax_1"}]
+        )), 0)
+        self.assertEqual(len(reads), n_reads)
+
+    def test_only_accepted_batches_are_deleted(self):
+        sink = FailingSink(fail_after=1)
+        publisher = self.publisher(sink, batch_size=1)
+        self.handle(publisher, measurement(
+            "2020-10-01T09:00:00",
+            [{"tag": "test_tag_2_tax_1"}, {"tag": "test_tag_3_tax_1"}]
+        ))
+        self.assertListEqual(
+            [(_event["change"], _event["tag_id"]) for _event in sink.events],
+            [("insert", 3)]
+        )
+        self.assertListEqual(self.outbox_changes(), [("end", 1)])
+
+    def test_rolled_back_events(self):
+        publisher = self.publisher(FailingSink())
+        self.adapter.insert_change_events(publisher.events(
+            measurement("2020-10-01T09:00:00", []),
+            {
+                "tag_type": "domain",
+                "tagged_id": 1,
+                "taxonomy_id": 1,
+                "measured_at": parse_timestamp("2020-10-01T09:00:00"),
+                "tag_changes": {
+                    "insert": [MeasurementToTags.TagStateTuple(3, None)],
+                    "prolong": [],
+                    "end": []
+                }
+            }
+        ))
+        self.assertListEqual(self.outbox_changes(), [("insert", 3)])
+        self.adapter.rollback()
+        self.assertListEqual(self.outbox_changes(), [])
+
+    def test_unknown_change_type(self):
+        self.assertRaises(
+            ValueError,
+            ChangeFeedPublisher,
+            FailingSink(),
+            self.adapter,
+            change_types=("insert", "delete")
+        )
@@ -12,8 +12,8 @@ from .db_test_classes import (
 )
 from py_tag2domain.exceptions import AdapterDBError
 from py_tag2domain.util import parse_timestamp
-from py_tag2domain.db import Psycopg2Adapter
-from tests.util import parse_test_db_config
+from py_tag2domain.db import Psycopg2Adapter, PREPARED_STATEMENTS
+from tests.util import parse_test_db_config, DB_CONNECTION
 
 TAXONOMY_IDS = [
     (1, False, False),
@@ -210,6 +210,45 @@ class Psycopg2AdapterStaticTest(TestCase):
             "some unknown type"
         )
 
+    def test_to_prepared(self):
+        name, prepare_stmt, execute_stmt = Psycopg2Adapter.to_prepared(
+            "SELECT * FROM t WHERE (a = %s) AND (b LIKE 'x%%') AND (c = %s)"
+        )
+        self.assertEqual(
+            prepare_stmt,
+            "PREPARE %s AS SELECT * FROM t WHERE (a = $1) AND (b LIKE 'x%%') "
+            "AND (c = $2)" % name
+        )
+        self.assertEqual(execute_stmt, "EXECUTE %s (%%s, %%s)" % name)
+
+        name, _, execute_stmt = Psycopg2Adapter.to_prepared("SELECT 1")
+        self.assertEqual(execute_stmt, "EXECUTE %s" % name)
+        # the name only depends on the statement
+        self.assertEqual(Psycopg2Adapter.to_prepared("SELECT 1")[0], name)
+
+    def test_prepared_statements_after_reconnect(self):
+        config, intxn_table_map = parse_test_db_config()
+        connection_args = Psycopg2Adapter.to_psycopg_args(config)
+
+        def prepared_names(adapter):
+            cursor = adapter.db_connection.cursor()
+            cursor.execute("SELECT name FROM pg_prepared_statements")
+            return set(_name for (_name, ) in cursor.fetchall())
+
+        for _ in range(2):
+            conn = psycopg2.connect(**connection_args)
+            # a second adapter on the same connection reuses the statements
+            for _ in range(2):
+                adapter = Psycopg2Adapter(
+                    conn, intxn_table_map, prepare_statements=True
+                )
+                adapter.get_open_tags(1, "domain", 1)
+                adapter.rollback()
+            self.assertSetEqual(prepared_names(adapter), set([
+                adapter.prepared_db_statements["domain"]["get_open_tags"][0]
+            ]))
+            conn.close()
+
     def test_get_stmt_unknown_stmt_fail(self):
         config, intxn_table_map = parse_test_db_config()
         connection_args = Psycopg2Adapter.to_psycopg_args(config)
@@ -392,6 +431,25 @@ class Psycopg2AdapterWriteTest(PostgresPsycopgAdapterAutoDBTest):
             else:
                 self.assertEqual(_row["extras"], {})
 
+    @parameterized.expand([
+        ("new_tag", ""),
+        ("cat_1::new_tag", "cat_1"),
+        ("cat_1::cat_2::new_tag", "cat_1::cat_2"),
+    ])
+    def test_insert_tags_sets_category(self, tag_name, category):
+        tag_ids = self.adapter.insert_tags([{
+            "tag_name": tag_name,
+            "tag_description": "new tag",
+            "taxonomy_id": 1
+        }])
+        self.adapter.commit()
+        cursor = self.adapter.db_connection.cursor()
+        cursor.execute(
+            "SELECT category FROM tags WHERE tag_id = %s",
+            (tag_ids[tag_name],)
+        )
+        self.assertEqual(cursor.fetchone()[0], category)
+
     @parameterized.expand(TEST_INSERT_TAGS_INVALID)
     def test_insert_tags_invalid(self, tag_list):
         self.assertRaises(
@@ -1091,3 +1149,155 @@ class Psycopg2AdapterWriteTest(PostgresPsycopgAdapterAutoDBTest):
         self.assertEqual(_row["end_date"], int(timestamp.strftime("%Y%m%d")))
         self.assertEqual(_row["measured_at"], timestamp)
         self.assertIsNone(_row["producer"])
+
+    def test_change_outbox(self):
+        self.adapter.insert_change_events([
+            {"change": "insert", "tag_id": 1},
+            {"change": "end", "tag_id": 2}
+        ])
+        self.adapter.commit()
+
+        events = self.adapter.fetch_change_events(10)
+        self.assertListEqual(
+            [_event for _, _event in events],
+            [{"change": "insert", "tag_id": 1}, {"change": "end", "tag_id": 2}]
+        )
+        event_ids = [_event_id for _event_id, _ in events]
+        self.assertListEqual(event_ids, sorted(event_ids))
+
+        # locked rows are skipped by other publishers
+        other = psycopg2.connect(**dict(DB_CONNECTION, dbname=self.db_name))
+        try:
+            other_cursor = other.cursor()
+            other_cursor.execute(
+                "SELECT id FROM change_outbox FOR UPDATE SKIP LOCKED"
+            )
+            self.assertListEqual(other_cursor.fetchall(), [])
+        finally:
+            other.close()
+
+        self.adapter.delete_change_events(event_ids[:1])
+        self.adapter.rollback()
+        self.assertEqual(len(self.adapter.fetch_change_events(10)), 2)
+
+        self.adapter.delete_change_events(event_ids[:1])
+        self.adapter.commit()
+        self.assertListEqual(
+            self.adapter.fetch_change_events(10),
+            [(event_ids[1], {"change": "end", "tag_id": 2})]
+        )
+        self.adapter.rollback()
+
+
+class Psycopg2AdapterPreparedWriteTest(Psycopg2AdapterWriteTest):
+    """
+    Runs the write tests with prepared statements.
+    """
+    def setUp(self):
+        super(Psycopg2AdapterPreparedWriteTest, self).setUp()
+        self.adapter = Psycopg2Adapter(
+            self.db_connection,
+            self.__class__.intxn_table_mappings,
+            prepare_statements=True
+        )
+
+    def test_statements_are_prepared(self):
+        self.adapter.get_open_tags(1, "domain", 1)
+        self.adapter.prolong_intersections(
+            1,
+            parse_timestamp("2020-09-30T12:34:21"),
+            [{"tag_id": 1, "value_id": None}],
+            "domain",
+            1
+        )
+        self.adapter.commit()
+
+        cursor = self.db_connection.cursor()
+        cursor.execute("SELECT name FROM pg_prepared_statements")
+        self.assertSetEqual(
+            set(_name for (_name, ) in cursor.fetchall()),
+            set(
+                self.adapter.prepared_db_statements["domain"][_stmt][0]
+                for _stmt in PREPARED_STATEMENTS
+                if _stmt.startswith("get_open_tags")
+                or _stmt.startswith("prolong_intersections")
+            )
+        )
+
+
+class Psycopg2AdapterPipelinedWriteTest(PostgresPsycopgAdapterAutoDBTest):
+    def setUp(self):
+        super(Psycopg2AdapterPipelinedWriteTest, self).setUp()
+        self.adapter = Psycopg2Adapter(
+            self.db_connection,
+            self.__class__.intxn_table_mappings,
+            pipeline_writes=True
+        )
+
+    def test_writes_are_visible_to_reads(self):
+        timestamp = parse_timestamp("2020-09-30T12:34:21")
+        self.adapter.end_intersections(
+            1, timestamp, [{"tag_id": 1, "value_id": None}], "domain", 1
+        )
+        self.adapter.insert_intersections(
+            1, timestamp, [{"tag_id": 3, "value_id": None}], "domain", 1
+        )
+        self.assertSetEqual(
+            set(_tag["tag_id"] for _tag in self.adapter.get_open_tags(
+                1, "domain", 1
+            )),
+            set([2, 3])
+        )
+        self.adapter.commit()
+
+    def test_write_errors_are_raised_on_commit(self):
+        self.adapter.insert_intersections(
+            1,
+            parse_timestamp("2020-09-30T12:34:21"),
+            [{"tag_id": 1, "value_id": None}],
+            "domain",
+            4352
+        )
+        self.assertRaises(AdapterDBError, self.adapter.commit)
+        self.adapter.rollback()
+        self.assertListEqual(self.adapter.get_all_tags(1, "domain", 4352), [])
+
+    def test_write_errors_are_raised_by_next_read(self):
+        timestamp = parse_timestamp("2020-09-30T12:34:21")
+        self.adapter.prolong_intersections(
+            1, timestamp, [{"tag_id": 2, "value_id": None}], "domain", 1
+        )
+        self.adapter.insert_intersections(
+            1, timestamp, [{"tag_id": 1, "value_id": None}], "domain", 4352
+        )
+        self.adapter.update_change_watermark()
+        with self.assertRaises(AdapterDBError) as cm:
+            self.adapter.get_open_tags(1, "domain", 1)
+        self.assertIn("domain insert_intersections", str(cm.exception))
+        self.assertIn("4352", str(cm.exception))
+        self.adapter.rollback()
+        self.assertListEqual(self.adapter.get_all_tags(1, "domain", 4352), [])
+
+    def test_writes_are_sent_on_commit(self):
+        timestamp = parse_timestamp("2020-09-30T12:34:21")
+        self.adapter.prolong_intersections(
+            1, timestamp, [{"tag_id": 2, "value_id": None}], "domain", 1
+        )
+        self.adapter.update_change_watermark()
+
+        # the writes are not sent yet
+        cursor = self.db_connection.cursor()
+        cursor.execute("SELECT counter FROM change_watermark")
+        self.assertEqual(cursor.fetchone()[0], 0)
+
+        self.adapter.commit()
+        cursor.execute("SELECT counter FROM change_watermark")
+        self.assertEqual(cursor.fetchone()[0], 1)
+        self.assertEqual(
+            [
+                _tag["measured_at"]
+                for _tag in self.adapter.get_all_tags(1, "domain", 1)
+                if _tag["tag_id"] == 2
+            ],
+            [timestamp]
+        )
@@ -0,0 +1,149 @@
+import json
+import logging
+from unittest import TestCase
+
+from py_tag2domain.msm2tags import MeasurementToTags
+from py_tag2domain.logging_util import (
+    is_enabled_for,
+    LazyFormat,
+    lazy_join,
+    JsonFormatter,
+    SamplingFilter
+)
+from .db_test_classes import create_memory_test_adapter
+
+LOGGER_NAME = "tests.logging_util"
+
+
+def make_record(level, msg="message", args=(), extra=None):
+    record = logging.LogRecord(
+        LOGGER_NAME, level, __file__, 1, msg, args, None
+    )
+    for _key, _value in (extra or {}).items():
+        setattr(record, _key, _value)
+    return record
+
+
+class LazyFormatTest(TestCase):
+    def setUp(self):
+        self.logger = logging.getLogger(LOGGER_NAME)
+        self.calls = []
+
+    def expensive(self, value):
+        self.calls.append(value)
+        return value
+
+    def test_not_formatted_if_level_disabled(self):
+        with self.assertLogs(self.logger, logging.INFO):
+            self.logger.debug("%s", LazyFormat(self.expensive, "debug"))
+            self.logger.info("%s", LazyFormat(self.expensive, "info"))
+        self.assertListEqual(self.calls, ["info"])
+
+    def test_lazy_join(self):
+        with self.assertLogs(self.logger, logging.DEBUG) as cm:
+            self.logger.debug("ids %s", lazy_join([1, (2, 3)]))
+        self.assertEqual(cm.records[0].getMessage(), "ids 1, (2, 3)")
+
+    def test_is_enabled_for_logging_module(self):
+        self.assertEqual(
+            is_enabled_for(logging, logging.DEBUG),
+            logging.getLogger().isEnabledFor(logging.DEBUG)
+        )
+
+
+class JsonFormatterTest(TestCase):
+    def test_format(self):
+        entry = json.loads(JsonFormatter().format(make_record(
+            logging.INFO,
+            "handled %s",
+            ("msm",),
+            extra={"tagged_id": 3, "producer": "p"}
+        )))
+        self.assertEqual(entry["message"], "handled msm")
+        self.assertEqual(entry["level"], "INFO")
+        self.assertEqual(entry["logger"], LOGGER_NAME)
+        self.assertEqual(entry["tagged_id"], 3)
+        self.assertEqual(entry["producer"], "p")
+        self.assertNotIn("args", entry)
+
+
+class SamplingFilterTest(TestCase):
+    def test_warnings_are_never_dropped(self):
+        sampling_filter = SamplingFilter(0.0)
+        self.assertFalse(sampling_filter.filter(make_record(logging.INFO)))
+        self.assertTrue(sampling_filter.filter(make_record(logging.WARNING)))
+        self.assertTrue(sampling_filter.filter(make_record(logging.ERROR)))
+
+    def test_sample_rate(self):
+        sampling_filter = SamplingFilter(0.25, seed=1)
+        kept = sum(
+            sampling_filter.filter(make_record(logging.DEBUG))
+            for _ in range(4000)
+        )
+        self.assertAlmostEqual(kept / 4000, 0.25, delta=0.03)
+
+    def test_invalid_sample_rate(self):
+        self.assertRaises(ValueError, SamplingFilter, 1.5)
+
+
+class SummarizedLoggingTest(TestCase):
+    MSM = {
+        "version": "1",
+        "tag_type": "domain",
+        "tagged_id": 1,
+        "taxonomy": "tax_test1",
+        "producer": "test_producer1",
+        "measured_at": "2020-10-01T09:00:00",
+        "measurement_id": "test/1",
+        "tags": [{"tag": "test_tag_2_tax_1"}, {"tag": "test_tag_3_tax_1"}]
+    }
+
+    def setUp(self):
+        self.logger = logging.getLogger(LOGGER_NAME)
+
+    def handle(self, summarize_logging, level):
+        msm_to_tags = MeasurementToTags(
+            create_memory_test_adapter(),
+            logger=self.logger,
+            summarize_logging=summarize_logging
+        )
+        with self.assertLogs(self.logger, level) as cm:
+            result = msm_to_tags.handle_measurement(dict(self.MSM))
+        return result, cm.records
+
+    def test_one_info_line_per_measurement(self):
+        result, records = self.handle(True, logging.INFO)
+        self.assertEqual(len(records), 1)
+        summary = records[0]
+        self.assertEqual(summary.tagged_id, 1)
+        self.assertEqual(summary.measurement_id, "test/1")
+        for _key, _name in [
+            ("insert", "inserted"),
+            ("prolong", "prolonged"),
+            ("end", "ended")
+        ]:
+            self.assertEqual(
+                getattr(summary, _name), len(result["tag_changes"][_key])
+            )
+
+    def test_tag_lines_at_debug_level(self):
+        result, records = self.handle(True, logging.DEBUG)
+        tag_lines = [
+            _record
+            for _record in records
+            if "tag-value-pair" in _record.getMessage()
+        ]
+        self.assertEqual(
+            len(tag_lines),
+            sum(map(len, result["tag_changes"].values()))
+        )
+        self.assertTrue(all(
+            _record.levelno == logging.DEBUG for _record in tag_lines
+        ))
+
+    def test_without_summary(self):
+        result, records = self.handle(False, logging.INFO)
+        self.assertEqual(
+            len(records),
+            2 + sum(map(len, result["tag_changes"].values()))
+        )
@@ -0,0 +1,239 @@
+from __future__ import print_function
+from unittest import TestCase
+
+from parameterized import parameterized
+
+from py_tag2domain.exceptions import (
+    AdapterDBError,
+    InconsistentTaxonomyException
+)
+from py_tag2domain.util import parse_timestamp
+from .db_test_classes import create_memory_test_adapter
+from .test_db import (
+    TAXONOMY_IDS,
+    TAXONOMY_NAMES,
+    EXISTING_TAGS,
+    TAG_NAMES,
+    EXISTING_VALUES,
+    VALUE_NAMES,
+    TEST_INSERT_TAGS_INVALID,
+    TEST_INSERT_VALUES_INVALID
+)
+
+TIMESTAMP = parse_timestamp("2020-09-30T12:34:21.9855")
+
+
+class InMemoryAdapterReadTest(TestCase):
+    def setUp(self):
+        self.adapter = create_memory_test_adapter()
+
+    @parameterized.expand(TAXONOMY_IDS)
+    def test_fetch_taxonomy_by_id(
+        self,
+        taxonomy_id,
+        allows_auto_tags,
+        allows_auto_values
+    ):
+        taxonomy = self.adapter.fetch_taxonomy_by_id(taxonomy_id)
+        self.assertEqual(taxonomy["allows_auto_tags"], allows_auto_tags)
+        self.assertEqual(taxonomy["allows_auto_values"], allows_auto_values)
+
+    @parameterized.expand(TAXONOMY_NAMES)
+    def test_fetch_taxonomy_by_name(
+        self,
+        taxonomy_name,
+        id,
+        allows_auto_tags,
+        allows_auto_values
+    ):
+        taxonomy = self.adapter.fetch_taxonomy_by_name(taxonomy_name)
+        self.assertEqual(taxonomy["id"], id)
+        self.assertEqual(taxonomy["allows_auto_tags"], allows_auto_tags)
+        self.assertEqual(taxonomy["allows_auto_values"], allows_auto_values)
+
+    def test_fetch_non_existing_taxonomy(self):
+        self.assertRaises(
+            AdapterDBError, self.adapter.fetch_taxonomy_by_id, 23876975
+        )
+        self.assertRaises(
+            AdapterDBError,
+            self.adapter.fetch_taxonomy_by_name,
+            "non_existing_taxonomy"
+        )
+
+    @parameterized.expand(EXISTING_TAGS)
+    def test_check_tag_ids_exist_on_existing(self, taxonomy_id, tag_id_list):
+        self.adapter.check_tag_ids_exist(taxonomy_id, tag_id_list)
+
+    def test_check_tag_ids_exist_on_non_existing(self):
+        # tag 4 exists, but in taxonomy 3
+        with self.assertRaises(AdapterDBError) as cm:
+            self.adapter.check_tag_ids_exist(1, [1, 198, 4])
+        self.assertListEqual(cm.exception.missing_ids, [198, 4])
+
+    @parameterized.expand(TAG_NAMES)
+    def test_fetch_tag_ids_by_name(
+        self,
+        taxonomy_id,
+        tag_name_list,
+        ids_to_fetch
+    ):
+        tag_ids = self.adapter.fetch_tag_ids_by_name(
+            taxonomy_id, tag_name_list
+        )
+        self.assertDictEqual(tag_ids, dict(zip(tag_name_list, ids_to_fetch)))
+
+    @parameterized.expand(EXISTING_VALUES)
+    def test_check_value_ids_exist_on_existing(self, value_ids):
+        self.adapter.check_value_ids_exist(value_ids)
+
+    def test_check_value_ids_exist_on_non_existing(self):
+        with self.assertRaises(AdapterDBError) as cm:
+            self.adapter.check_value_ids_exist([(1, 1), (198, 172), (4, 1)])
+        self.assertListEqual(cm.exception.missing_ids, [(198, 172), (4, 1)])
+
+    @parameterized.expand(VALUE_NAMES)
+    def test_fetch_value_ids_by_value(self, value_list, ids_to_fetch):
+        value_ids = self.adapter.fetch_value_ids_by_value(value_list)
+        self.assertDictEqual(value_ids, dict(zip(value_list, ids_to_fetch)))
+
+    def test_fetch_duplicate_value_fails(self):
+        self.adapter.add_value(1, "value_1_tag_1")
+        self.assertRaises(
+            InconsistentTaxonomyException,
+            self.adapter.fetch_value_ids_by_value,
+            [(1, "value_1_tag_1")]
+        )
+
+    def test_unknown_tag_type_fails(self):
+        self.assertRaises(
+            AdapterDBError, self.adapter.get_open_tags, 1, "unknown", 1
+        )
+        self.assertRaises(
+            ValueError,
+            self.adapter.insert_intersections,
+            1, TIMESTAMP, [], "unknown", 1
+        )
+
+    def test_get_tag_values_requires_int(self):
+        self.assertRaises(ValueError, self.adapter.get_tag_values, "1")
+
+
+class InMemoryAdapterWriteTest(TestCase):
+    def setUp(self):
+        self.adapter = create_memory_test_adapter()
+
+    @parameterized.expand(TEST_INSERT_TAGS_INVALID)
+    def test_insert_tags_invalid(self, tag_list):
+        self.assertRaises(AdapterDBError, self.adapter.insert_tags, tag_list)
+
+    @parameterized.expand(TEST_INSERT_VALUES_INVALID)
+    def test_insert_values_invalid(self, value_list):
+        self.assertRaises(
+            AdapterDBError, self.adapter.insert_values, value_list
+        )
+
+    def test_insert_duplicate_tag_fails(self):
+        self.assertRaises(
+            AdapterDBError,
+            self.adapter.insert_tags,
+            [{
+                "tag_name": "test_tag_1_tax_1",
+                "tag_description": "duplicate",
+                "taxonomy_id": 1
+            }]
+        )
+
+    @parameterized.expand([("delegation",), ("domain", ), ("intersection", )])
+    def test_prolong_and_end_intersections(self, tag_type):
+        self.adapter.prolong_intersections(
+            1, TIMESTAMP, [{"tag_id": 1, "value_id": 1}], tag_type, 2, "p"
+        )
+        self.adapter.end_intersections(
+            1, TIMESTAMP, [{"tag_id": 2, "value_id": None}], tag_type, 1, "p"
+        )
+        self.adapter.commit()
+
+        tags = self.adapter.get_all_tags(1, tag_type, 2)
+        self.assertEqual(len(tags), 1)
+        self.assertEqual(tags[0]["measured_at"], TIMESTAMP)
+        self.assertIsNone(tags[0]["end_ts"])
+
+        open_tags = self.adapter.get_open_tags(1, tag_type, 1)
+        self.assertListEqual([_tag["tag_id"] for _tag in open_tags], [1])
+        ended = [
+            _row
+            for _row in self.adapter.get_taxonomy_intersections(1, tag_type)
+            if _row["id"] == 1 and _row["tag_id"] == 2
+        ]
+        self.assertEqual(ended[0]["end_ts"], TIMESTAMP)
+        self.assertEqual(ended[0]["end_date"], 20200930)
+        self.assertEqual(ended[0]["producer"], "p")
+
+    def test_rollback(self):
+        tag_ids = self.adapter.insert_tags([{
+            "tag_name": "cat_1::new_tag",
+            "tag_description": "new tag",
+            "taxonomy_id": 1
+        }])
+        self.assertEqual(
+            self.adapter.get_taxonomy_tags(1)[-1]["category"], "cat_1"
+        )
+        self.adapter.insert_intersections(
+            1,
+            TIMESTAMP,
+            [{"tag_id": tag_ids["cat_1::new_tag"], "value_id": None}],
+            "domain",
+            5
+        )
+        self.adapter.end_intersections(
+            1, TIMESTAMP, [{"tag_id": 1, "value_id": None}], "domain", 1
+        )
+        self.adapter.update_change_watermark()
+        self.adapter.rollback()
+
+        self.assertEqual(len(self.adapter.get_taxonomy_tags(1)), 3)
+        self.assertListEqual(self.adapter.get_all_tags(1, "domain", 5), [])
+        self.assertEqual(len(self.adapter.get_open_tags(1, "domain", 1)), 2)
+        self.assertEqual(self.adapter.change_watermark, 0)
+
+        # IDs are not reused, like sequences in the DB
+        tag_ids_2 = self.adapter.insert_tags([{
+            "tag_name": "cat_1::new_tag",
+            "tag_description": "new tag",
+            "taxonomy_id": 1
+        }])
+        self.assertGreater(
+            tag_ids_2["cat_1::new_tag"], tag_ids["cat_1::new_tag"]
+        )
+
+    def test_failed_write_aborts_transaction(self):
+        self.adapter.insert_values([{"value": "new_value", "tag_id": 1}])
+        self.assertRaises(
+            AdapterDBError,
+            self.adapter.insert_values,
+            [{"value": "new_value", "tag_id": 189}]
+        )
+        self.assertRaises(
+            AdapterDBError, self.adapter.get_open_tags, 1, "domain", 1
+        )
+
+        # committing an aborted transaction rolls it back
+        self.adapter.commit()
+        self.assertDictEqual(
+            self.adapter.fetch_value_ids_by_value([(1, "new_value")]),
+            {(1, "new_value"): None}
+        )
+
+    def test_open_tag_counts(self):
+        self.adapter.rebuild_open_tag_counts()
+        self.adapter.commit()
+        self.assertEqual(
+            self.adapter.open_tag_counts[("domain", 1, None, None)], 2
+        )
+        self.assertEqual(self.adapter.open_tag_counts[("domain", 1, 1, 1)], 1)
+
+        self.adapter.update_open_tag_counts(1, "domain", {(1, None): -1})
+        self.assertEqual(self.adapter.open_tag_counts[("domain", 1, 1, None)], 1)
+        self.adapter.rollback()
+        self.assertEqual(self.adapter.open_tag_counts[("domain", 1, 1, None)], 2)
@@ -0,0 +1,93 @@
+import datetime
+from unittest import TestCase
+
+import prometheus_client
+
+from py_tag2domain.msm2tags import MeasurementToTags
+from py_tag2domain.metrics import IngestMetrics, STAGES
+from py_tag2domain.exceptions import (
+    InvalidMeasurementException,
+    StaleMeasurementException
+)
+from .db_test_classes import create_memory_test_adapter
+
+
+def measurement(measured_at, tags):
+    return {
+        "version": "1",
+        "tag_type": "domain",
+        "tagged_id": 1,
+        "taxonomy": "tax_test1",
+        "producer": "test_producer1",
+        "measured_at": measured_at,
+        "tags": tags
+    }
+
+
+class IngestMetricsTest(TestCase):
+    def setUp(self):
+        self.registry = prometheus_client.CollectorRegistry()
+        self.msm_to_tags = MeasurementToTags(
+            create_memory_test_adapter(),
+            metrics=IngestMetrics(registry=self.registry),
+            max_measurement_age=None
+        )
+
+    def get_value(self, name, **labels):
+        return self.registry.get_sample_value(name, labels)
+
+    def test_series_exist_before_first_measurement(self):
+        for _stage in STAGES:
+            self.assertEqual(self.get_value(
+                "tag2domain_ingest_stage_seconds_count", stage=_stage
+            ), 0)
+        self.assertEqual(
+            self.get_value("tag2domain_measurements_total", result="ok"), 0
+        )
+
+    def test_measurements_are_counted(self):
+        # ends tag 1 and prolongs tag 2
+        self.msm_to_tags.handle_measurement(measurement(
+            "2020-10-01T09:00:00",
+            [{"tag": "test_tag_2_tax_1"}, {"tag": "test_tag_3_tax_1"}]
+        ))
+        self.assertRaises(
+            InvalidMeasurementException,
+            self.msm_to_tags.handle_measurement,
+            {"version": "1"}
+        )
+        self.msm_to_tags.max_measurement_age = datetime.timedelta(minutes=1)
+        self.assertRaises(
+            StaleMeasurementException,
+            self.msm_to_tags.handle_measurement,
+            measurement("2020-10-01T09:00:00", [])
+        )
+
+        for _result, _count in [
+            ("ok", 1), ("invalid", 1), ("stale", 1), ("failed", 0)
+        ]:
+            self.assertEqual(self.get_value(
+                "tag2domain_measurements_total", result=_result
+            ), _count)
+        self.assertEqual(
+            self.get_value("tag2domain_ingest_measurement_seconds_count"), 1
+        )
+        for _change, _count in [("insert", 1), ("prolong", 1), ("end", 1)]:
+            self.assertEqual(self.get_value(
+                "tag2domain_intersection_changes_total", change=_change
+            ), _count)
+        for _stage in STAGES:
+            self.assertGreaterEqual(self.get_value(
+                "tag2domain_ingest_stage_seconds_count", stage=_stage
+            ), 1)
+
+    def test_consumer_lag(self):
+        metrics = IngestMetrics(
+            registry=prometheus_client.CollectorRegistry(),
+            namespace="other"
+        )
+        metrics.set_consumer_lag("measurements", 3, 42)
+        self.assertEqual(metrics.registry.get_sample_value(
+            "other_consumer_lag_messages",
+            {"topic": "measurements", "partition": "3"}
+        ), 42)
@@ -16,10 +16,12 @@ from py_tag2domain.exceptions import (
     StaleMeasurementException
 )
 from py_tag2domain.util import parse_timestamp
+from py_tag2domain.db import Psycopg2Adapter
 from tests.util import parse_test_db_config
 from .db_test_classes import (
     PostgresReadOnlyPsycopgAdapterTest,
-    PostgresPsycopgAdapterAutoDBTest
+    PostgresPsycopgAdapterAutoDBTest,
+    InMemoryAdapterTest
 )
 
 FAILING_MEASUREMENTS = [
@@ -1856,7 +1858,8 @@ class HandleMeasurementIntegrationTest(PostgresPsycopgAdapterAutoDBTest):
                 'tag_description': 'some new awesome tag',
                 'tag_id': 5,
                 'tag_name': 'some_new_tag',
-                'taxonomy_id': 2
+                'taxonomy_id': 2,
+                'category': ''
             },
         ]
 
@@ -1995,3 +1998,174 @@ class HandleMeasurementIntegrationTest(PostgresPsycopgAdapterAutoDBTest):
                     intxn_type
                 )
             )
+
+
+class HandleMeasurementChangeWatermarkTest(PostgresPsycopgAdapterAutoDBTest):
+    def setUp(self):
+        super(HandleMeasurementChangeWatermarkTest, self).setUp()
+        self.msm_to_tags = MeasurementToTags(
+            self.adapter,
+            update_change_watermark=True
+        )
+
+    def get_watermark(self):
+        cursor = self.db_connection.cursor()
+        cursor.execute("SELECT counter FROM change_watermark")
+        counter, = cursor.fetchone()
+        return counter
+
+    @parameterized.expand([("delegation",), ("domain", ), ("intersection", )])
+    def test_ending_tags_updates_watermark(self, intxn_type):
+        msm = dict(
+            version="1",
+            tag_type=intxn_type,
+            tagged_id=1,
+            taxonomy=1,
+            producer="test_producer1",
+            measured_at="2020-10-01T09:00:00",
+            tags=[]
+        )
+        self.msm_to_tags.handle_measurement(msm)
+        self.assertEqual(self.get_watermark(), 1)
+
+    @parameterized.expand([("delegation",), ("domain", ), ("intersection", )])
+    def test_prolonging_tags_keeps_watermark(self, intxn_type):
+        msm = dict(
+            version="1",
+            tag_type=intxn_type,
+            tagged_id=1,
+            taxonomy=1,
+            producer="test_producer1",
+            measured_at="2020-10-01T09:00:00",
+            tags=[{"tag": 1}, {"tag": 2}]
+        )
+        self.msm_to_tags.handle_measurement(msm)
+        self.assertEqual(self.get_watermark(), 0)
+
+    @parameterized.expand([("delegation",), ("domain", ), ("intersection", )])
+    def test_disabled_watermark_is_not_updated(self, intxn_type):
+        self.msm_to_tags.update_change_watermark = False
+        msm = dict(
+            version="1",
+            tag_type=intxn_type,
+            tagged_id=1,
+            taxonomy=1,
+            producer="test_producer1",
+            measured_at="2020-10-01T09:00:00",
+            tags=[]
+        )
+        self.msm_to_tags.handle_measurement(msm)
+        self.assertEqual(self.get_watermark(), 0)
+
+
+class HandleMeasurementOpenTagCountsTest(PostgresPsycopgAdapterAutoDBTest):
+    def setUp(self):
+        super(HandleMeasurementOpenTagCountsTest, self).setUp()
+        self.msm_to_tags = MeasurementToTags(
+            self.adapter,
+            maintain_open_tag_counts=True
+        )
+        self.adapter.rebuild_open_tag_counts()
+        self.adapter.commit()
+
+    def get_counts(self):
+        cursor = self.db_connection.cursor()
+        cursor.execute(
+            """
+            SELECT tag_type, taxonomy_id, tag_id, value_id, entity_count
+            FROM open_tag_counts
+            WHERE entity_count != 0
+            """
+        )
+        return set(cursor.fetchall())
+
+    def test_rebuild_counts_open_tags(self):
+        counts = self.get_counts()
+        self.assertGreater(len(counts), 0)
+        for _count in counts:
+            self.assertGreater(_count[4], 0)
+
+    @parameterized.expand([("delegation",), ("domain", ), ("intersection", )])
+    def test_counts_match_rebuild(self, intxn_type):
+        msms = [
+            dict(  # ends all tags
+                tagged_id=1,
+                producer="test_producer1",
+                measured_at="2020-10-01T09:00:00",
+                tags=[]
+            ),
+            dict(  # adds tags to an entity
+                tagged_id=5,
+                producer="test_producer1",
+                measured_at="2020-10-01T09:00:00",
+                tags=[
+                    {"tag": "test_tag_1_tax_1", "value": "value_1_tag_1"},
+                    {"tag": "test_tag_3_tax_1"}
+                ]
+            ),
+            dict(  # changes the value of a tag
+                tagged_id=5,
+                producer="test_producer1",
+                measured_at="2020-10-02T09:00:00",
+                tags=[
+                    {"tag": "test_tag_1_tax_1"},
+                    {"tag": "test_tag_3_tax_1"}
+                ]
+            ),
+        ]
+        for msm in msms:
+            msm.update(dict(
+                version="1",
+                tag_type=intxn_type,
+                taxonomy="tax_test1"
+            ))
+            self.msm_to_tags.handle_measurement(msm)
+
+        maintained_counts = self.get_counts()
+        self.adapter.rebuild_open_tag_counts()
+        self.adapter.commit()
+        self.assertSetEqual(maintained_counts, self.get_counts())
+
+
+class PipelinedHandleMeasurementIntegrationTest(
+    HandleMeasurementIntegrationTest
+):
+    """
+    Runs the integration tests with prepared statements and pipelined writes.
+    """
+    def setUp(self):
+        super(PipelinedHandleMeasurementIntegrationTest, self).setUp()
+        self.adapter = Psycopg2Adapter(
+            self.db_connection,
+            self.__class__.intxn_table_mappings,
+            prepare_statements=True,
+            pipeline_writes=True
+        )
+        self.msm_to_tags = MeasurementToTags(self.adapter)
+
+
+class InMemoryHandleMeasurementTaxonomyModsNoInsertTest(
+    InMemoryAdapterTest,
+    HandleMeasurementTaxonomyModsNoInsertTest
+):
+    def setUp(self):
+        super(InMemoryHandleMeasurementTaxonomyModsNoInsertTest, self).setUp()
+        self.msm_to_tags = MeasurementToTags(self.adapter)
+
+
+class InMemoryHandleMeasurementCalcChangesTest(
+    InMemoryAdapterTest,
+    HandleMeasurementCalcChangesTest
+):
+    def setUp(self):
+        super(InMemoryHandleMeasurementCalcChangesTest, self).setUp()
+        self.msm_to_tags = MeasurementToTags(self.adapter)
+
+
+class InMemoryHandleMeasurementIntegrationTest(
+    InMemoryAdapterTest,
+    HandleMeasurementIntegrationTest
+):
+    def setUp(self):
+        super(InMemoryHandleMeasurementIntegrationTest, self).setUp()
+        self.msm_to_tags = MeasurementToTags(self.adapter)
@@ -0,0 +1,140 @@
+import os
+import json
+import time
+import pstats
+import signal
+import tempfile
+import http.client
+from unittest import TestCase
+
+from py_tag2domain.profiling import ProfilingController
+
+
+class ListLooper(object):
+    def __init__(self):
+        self.handled = []
+        self.msm_handler = self.handle
+
+    def handle(self, msm):
+        time.sleep(0.001)
+        self.handled.append(msm)
+        return True, None
+
+    def loop(self, msms):
+        for msm in msms:
+            self.msm_handler(msm)
+
+
+class ProfilingControllerTest(TestCase):
+    def setUp(self):
+        self.output_dir = tempfile.TemporaryDirectory()
+        self.looper = ListLooper()
+        self.controller = ProfilingController(
+            self.output_dir.name,
+            messages=3,
+            sample_interval=0.001
+        )
+        self.controller.attach(self.looper)
+
+    def tearDown(self):
+        self.controller.finish()
+        self.controller.stop_memory_tracing()
+        signal.signal(signal.SIGUSR1, signal.SIG_DFL)
+        signal.signal(signal.SIGUSR2, signal.SIG_DFL)
+        self.output_dir.cleanup()
+
+    def output_files(self):
+        return sorted(os.listdir(self.output_dir.name))
+
+    def test_handler_is_only_wrapped_while_profiling(self):
+        self.assertEqual(self.looper.msm_handler, self.looper.handle)
+        self.assertTrue(self.controller.start())
+        self.assertNotEqual(self.looper.msm_handler, self.looper.handle)
+        self.assertFalse(self.controller.start())
+
+        self.looper.loop(range(5))
+        self.assertEqual(self.looper.msm_handler, self.looper.handle)
+        self.assertListEqual(self.looper.handled, list(range(5)))
+
+        files = self.output_files()
+        self.assertEqual(len(files), 1)
+        self.assertTrue(files[0].endswith(".prof"))
+        stats = pstats.Stats(os.path.join(self.output_dir.name, files[0]))
+        self.assertTrue(any(
+            _func[2] == "handle" and _stat[0] == 3
+            for _func, _stat in stats.stats.items()
+        ))
+
+    def test_sampling_time_limit(self):
+        self.controller.start(mode="sampling", messages=0, seconds=0.1)
+        t_start = time.time()
+        while self.controller.active and time.time() - t_start < 5:
+            self.looper.loop([None])
+        self.assertFalse(self.controller.active)
+        self.assertEqual(self.looper.msm_handler, self.looper.handle)
+
+        files = self.output_files()
+        self.assertEqual(len(files), 1)
+        with open(os.path.join(self.output_dir.name, files[0])) as f:
+            lines = f.readlines()
+        self.assertGreater(len(lines), 0)
+        self.assertTrue(any("handle" in _line for _line in lines))
+
+    def test_invalid_arguments(self):
+        self.assertRaises(ValueError, self.controller.start, mode="unknown")
+        self.assertRaises(
+            ValueError, self.controller.start, messages=0, seconds=0
+        )
+        self.assertFalse(self.controller.active)
+
+    def test_memory_snapshot(self):
+        self.assertIsNone(self.controller.memory_snapshot())
+        data = [bytearray(1000) for _ in range(100)]
+        path = self.controller.memory_snapshot()
+        self.assertIsNotNone(path)
+        with open(path) as f:
+            self.assertTrue(f.readline().startswith("traced memory"))
+        del data
+
+    def test_signals(self):
+        self.controller.install_signal_handlers()
+        os.kill(os.getpid(), signal.SIGUSR1)
+        self.assertTrue(self.controller.active)
+        os.kill(os.getpid(), signal.SIGUSR1)
+        self.assertFalse(self.controller.active)
+        self.assertEqual(len(self.output_files()), 1)
+
+        os.kill(os.getpid(), signal.SIGUSR2)
+        os.kill(os.getpid(), signal.SIGUSR2)
+        self.assertEqual(len(self.output_files()), 2)
+
+    def test_control_endpoint(self):
+        server = self.controller.start_control_server(0)
+        try:
+            def request(method, path):
+                conn = http.client.HTTPConnection(
+                    "127.0.0.1", server.server_address[1], timeout=5
+                )
+                try:
+                    conn.request(method, path)
+                    response = conn.getresponse()
+                    return response.status, json.loads(response.read())
+                finally:
+                    conn.close()
+
+            status, body = request("POST", "/profile?mode=sampling&seconds=10")
+            self.assertEqual(status, 202)
+            self.assertEqual(body["mode"], "sampling")
+            self.assertEqual(request("POST", "/profile")[0], 409)
+            self.assertTrue(request("GET", "/status")[1]["active"])
+
+            status, body = request("POST", "/profile/stop")
+            self.assertEqual(status, 200)
+            self.assertTrue(os.path.exists(body["path"]))
+            self.assertFalse(request("GET", "/status")[1]["active"])
+
+            self.assertEqual(request("POST", "/profile?mode=unknown")[0], 400)
+            self.assertEqual(request("POST", "/unknown")[0], 404)
+        finally:
+            server.shutdown()
+            server.server_close()
@@ -1,5 +1,8 @@
 from unittest import TestCase
-from py_tag2domain.util import calc_changes
+from py_tag2domain.msm2tags import MeasurementToTags
+from py_tag2domain.util import calc_changes, calc_open_tag_count_deltas
+
+T = MeasurementToTags.TagStateTuple
 
 
 class UtilTests(TestCase):
@@ -11,3 +14,31 @@ class UtilTests(TestCase):
         self.assertSetEqual(set(changes['insert']), set([102, ]))
         self.assertSetEqual(set(changes['prolong']), set([71, ]))
         self.assertSetEqual(set(changes['end']), set([82, ]))
+
+    def test_calc_open_tag_count_deltas_first_tags(self):
+        changes = calc_changes(set(), set([T(1, None), T(2, 5)]))
+        self.assertDictEqual(
+            calc_open_tag_count_deltas(changes),
+            {(None, None): 1, (1, None): 1, (2, None): 1, (2, 5): 1}
+        )
+
+    def test_calc_open_tag_count_deltas_last_tags(self):
+        changes = calc_changes(set([T(1, None), T(2, 5)]), set())
+        self.assertDictEqual(
+            calc_open_tag_count_deltas(changes),
+            {(None, None): -1, (1, None): -1, (2, None): -1, (2, 5): -1}
+        )
+
+    def test_calc_open_tag_count_deltas_value_change(self):
+        changes = calc_changes(
+            set([T(1, None), T(2, 5)]),
+            set([T(1, None), T(2, 6)])
+        )
+        self.assertDictEqual(
+            calc_open_tag_count_deltas(changes),
+            {(2, 5): -1, (2, 6): 1}
+        )
+
+    def test_calc_open_tag_count_deltas_prolong(self):
+        changes = calc_changes(set([T(1, None)]), set([T(1, None)]))
+        self.assertDictEqual(calc_open_tag_count_deltas(changes), {})
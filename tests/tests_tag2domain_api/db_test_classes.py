@@ -1,5 +1,6 @@
 from __future__ import print_function
 
+from tag2domain_api.app.util.config import config as api_config
 from tag2domain_api.app.util.db import set_db
 
 from tests.util import (
@@ -8,6 +9,9 @@ from tests.util import (
     PostgresAutoDBTest
 )
 
+# check the results of the endpoints against their response_model
+api_config['VALIDATE_RESPONSES'] = True
+
 
 class APIReadOnlyTest(PostgresReadOnlyDBTest):
     @classmethod
@@ -3,8 +3,9 @@ from fastapi.testclient import TestClient
 import pprint
 
 from tag2domain_api.app.main import app
+from tag2domain_api.app.util.config import config
 
-from .db_test_classes import APIReadOnlyTest
+from .db_test_classes import APIReadOnlyTest, APIWithAdditionalDBDataTest
 
 pprinter = pprint.PrettyPrinter(indent=4)
 client = TestClient(app)
@@ -32,6 +33,98 @@ class ByDomainEndpointsTest(APIReadOnlyTest):
         assert response.json() == []
 
 
+
+def sort_tags(tags):
+    return sorted(tags, key=lambda tag: (tag["tag_id"], str(tag)))
+
+
+class BatchByDomainEndpointsTest(APIReadOnlyTest):
+    def lookup(self, **body):
+        response = client.post("/api/v1/bydomain/", json=body)
+        pprinter.pprint(response.json())
+        assert response.status_code == 200
+        return response.json()
+
+    def test_open_tags(self):
+        result = self.lookup(domains=["test2.at", "test1.at"])
+        assert result["unknown_domains"] == []
+        assert [
+            _domain["domain_name"] for _domain in result["domains"]
+        ] == ["test2.at", "test1.at"]
+        for _domain in result["domains"]:
+            expected = client.get(
+                "/api/v1/bydomain/%s" % _domain["domain_name"]
+            ).json()
+            assert sort_tags(_domain["tags"]) == sort_tags(expected)
+        assert sort_tags(result["domains"][1]["tags"]) == \
+            sort_tags(DOMAIN_TEST1_OPEN_TAGS)
+
+    def test_at_time(self):
+        at_time = "2020-07-01T12:00:00"
+        result = self.lookup(domains=["test1.at"], at_time=at_time)
+        expected = client.get(
+            "/api/v1/bydomain/test1.at?at_time=%s" % at_time
+        ).json()
+        assert sort_tags(result["domains"][0]["tags"]) == sort_tags(expected)
+
+    def test_taxonomy(self):
+        result = self.lookup(domains=["test1.at"], taxonomy="tax_test1")
+        tags = result["domains"][0]["tags"]
+        assert len(tags) > 0
+        assert sort_tags(tags) == sort_tags([
+            _tag for _tag in DOMAIN_TEST1_OPEN_TAGS
+            if _tag["taxonomy_name"] == "tax_test1"
+        ])
+
+    def test_unknown_domains(self):
+        result = self.lookup(
+            domains=["test_nonexisting.at", "test1.at", "test1.at", "x" * 200]
+        )
+        assert [
+            _domain["domain_name"] for _domain in result["domains"]
+        ] == ["test1.at"]
+        assert result["unknown_domains"] == ["test_nonexisting.at", "x" * 200]
+
+    def test_empty(self):
+        assert self.lookup(domains=[]) == {
+            "domains": [],
+            "unknown_domains": []
+        }
+
+    def test_too_many_domains(self):
+        response = client.post("/api/v1/bydomain/", json={
+            "domains": ["test%i.at" % _i for _i in range(
+                config['BYDOMAIN_MAX_DOMAINS'] + 1
+            )]
+        })
+        assert response.status_code == 400
+
+
+class BatchByDomainDuplicateNamesTest(APIWithAdditionalDBDataTest):
+    def setUp(self):
+        super(BatchByDomainDuplicateNamesTest, self).setUp(
+            "duplicate_domain_names"
+        )
+
+    def test_name_with_two_ids(self):
+        response = client.post(
+            "/api/v1/bydomain/",
+            json={"domains": ["test2.at", "test1.at"]}
+        )
+        assert response.status_code == 200
+        result = response.json()
+        assert result["unknown_domains"] == []
+        assert [
+            (_domain["domain_id"], _domain["domain_name"])
+            for _domain in result["domains"]
+        ] == [(2, "test2.at"), (1, "test1.at"), (1001, "test1.at")]
+        assert sort_tags(result["domains"][1]["tags"]) == \
+            sort_tags(DOMAIN_TEST1_OPEN_TAGS)
+        assert [
+            _tag["tag_id"] for _tag in result["domains"][2]["tags"]
+        ] == [1]
+
+
 DOMAIN_TEST1_OPEN_TAGS = list(sorted([
     {
         'end_time': None,
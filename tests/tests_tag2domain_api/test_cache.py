@@ -0,0 +1,192 @@
+from fastapi.testclient import TestClient
+
+import datetime
+import pprint
+import time
+from unittest import TestCase
+from urllib.parse import urlencode
+
+from tag2domain_api.app.main import app
+from tag2domain_api.app.util.cache import ResultCache
+from tag2domain_api.app.util.db import (
+    check_result_cache,
+    configure_result_cache,
+    get_result_cache
+)
+
+from .db_test_classes import APIWriteTest
+
+pprinter = pprint.PrettyPrinter(indent=4)
+client = TestClient(app)
+
+
+class ResultCacheTest(TestCase):
+    def test_disabled_cache(self):
+        cache = ResultCache(max_entries=0)
+        cache.put("a", 1, watermark=1)
+        self.assertEqual(cache.get("a", 1), (False, None))
+        self.assertEqual(cache.stats()["entries"], 0)
+
+    def test_lru_eviction(self):
+        cache = ResultCache(max_entries=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(cache.get("a"), (True, 1))
+        cache.put("c", 3)
+        self.assertEqual(cache.get("b"), (False, None))
+        self.assertEqual(cache.get("a"), (True, 1))
+        self.assertEqual(cache.get("c"), (True, 3))
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_watermark_invalidation(self):
+        cache = ResultCache(max_entries=10)
+        cache.put("a", 1, watermark=5)
+        self.assertEqual(cache.get("a", 5), (True, 1))
+        self.assertEqual(cache.get("a", 6), (False, None))
+        self.assertEqual(cache.get("a", 5), (False, None))
+        self.assertEqual(cache.stats()["invalidations"], 1)
+
+    def test_ttl(self):
+        cache = ResultCache(max_entries=10, ttl=0.05)
+        cache.put("a", 1, watermark=5)
+        cache.put("b", 2, watermark=5, expires=False)
+        time.sleep(0.1)
+        self.assertEqual(cache.get("a", 5), (False, None))
+        # historic entries do not expire but follow the watermark
+        self.assertEqual(cache.get("b", 5), (True, 2))
+        self.assertEqual(cache.get("b", 6), (False, None))
+
+    def test_is_historic(self):
+        cache = ResultCache(max_entries=10, history_min_age=3600)
+        now = datetime.datetime.utcnow()
+        self.assertFalse(cache.is_historic(None))
+        self.assertFalse(cache.is_historic(now))
+        self.assertTrue(cache.is_historic(now - datetime.timedelta(days=1)))
+        self.assertTrue(cache.is_historic(
+            datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+        ))
+
+    def test_stats(self):
+        cache = ResultCache(max_entries=10)
+        self.assertIsNone(cache.stats()["hit_ratio"])
+        cache.put("a", 1)
+        cache.get("a")
+        cache.get("b")
+        cache.get("a")
+        stats = cache.stats()
+        self.assertEqual(stats["hits"], 2)
+        self.assertEqual(stats["misses"], 1)
+        self.assertAlmostEqual(stats["hit_ratio"], 2 / 3)
+
+
+class CachedEndpointsTest(APIWriteTest):
+    def setUp(self):
+        super(CachedEndpointsTest, self).setUp()
+        configure_result_cache(max_entries=100, watermark_interval=0)
+
+    def tearDown(self):
+        configure_result_cache()
+        super(CachedEndpointsTest, self).tearDown()
+
+    def execute(self, stmt):
+        cursor = self.db_connection.cursor()
+        cursor.execute(stmt)
+        self.db_connection.commit()
+
+    def test_open_results_follow_watermark(self):
+        response = client.get("/api/v1/stats/taxonomies")
+        assert response.status_code == 200
+        expected = [
+            {'count': 2, 'taxonomy_name': 'tax_test1'},
+            {'count': 1, 'taxonomy_name': 'tax_test3'}
+        ]
+        assert response.json() == expected
+
+        # changes that do not move the watermark are not seen
+        self.execute(
+            "UPDATE taxonomy SET name = 'renamed' WHERE name = 'tax_test3'"
+        )
+        response = client.get("/api/v1/stats/taxonomies")
+        assert response.json() == expected
+        assert get_result_cache().stats()["hits"] == 1
+
+        self.execute("UPDATE change_watermark SET counter = counter + 1")
+        response = client.get("/api/v1/stats/taxonomies")
+        assert response.json() == [
+            {'count': 2, 'taxonomy_name': 'tax_test1'},
+            {'count': 1, 'taxonomy_name': 'renamed'}
+        ]
+
+    def test_historic_results_follow_watermark(self):
+        query = {'at_time': '2020-10-01T12:00:00'}
+        url = "/api/v1/stats/taxonomies?%s" % urlencode(query)
+        response = client.get(url)
+        assert response.status_code == 200
+        expected = response.json()
+        assert client.get(url).json() == expected
+        assert get_result_cache().stats()["hits"] == 1
+
+        # a backdated measurement moves the watermark and changes the past
+        self.execute(
+            "UPDATE taxonomy SET name = 'renamed' WHERE name = 'tax_test3'"
+        )
+        self.execute("UPDATE change_watermark SET counter = counter + 1")
+        response = client.get(url)
+        assert response.status_code == 200
+        assert response.json() != expected
+        assert get_result_cache().stats()["invalidations"] == 1
+
+    def test_historic_results_expire_until_watermark_advances(self):
+        configure_result_cache(max_entries=100, ttl=0.2, watermark_interval=0)
+        query = {'at_time': '2020-10-01T12:00:00'}
+        url = "/api/v1/stats/taxonomies?%s" % urlencode(query)
+        client.get(url)
+        time.sleep(0.3)
+        client.get(url)
+        assert get_result_cache().stats()["hits"] == 0
+
+        # once the writers update the watermark, historic results are kept
+        self.execute("UPDATE change_watermark SET counter = counter + 1")
+        client.get(url)
+        time.sleep(0.3)
+        client.get(url)
+        assert get_result_cache().stats()["hits"] == 1
+
+    def test_warns_if_watermark_never_advanced(self):
+        with self.assertLogs("tag2domain_api.app.util.db", "WARNING") as logs:
+            assert check_result_cache() == 0
+        assert "never advanced" in logs.output[0]
+
+        self.execute("UPDATE change_watermark SET counter = counter + 1")
+        assert check_result_cache() == 1
+
+    def test_warns_without_watermark_table(self):
+        self.execute("DROP TABLE change_watermark")
+        with self.assertLogs("tag2domain_api.app.util.db", "WARNING") as logs:
+            assert check_result_cache() is None
+        assert "not available" in logs.output[0]
+
+    def test_nothing_is_cached_without_watermark(self):
+        self.execute("DROP TABLE change_watermark")
+        query = {'at_time': '2020-10-01T12:00:00'}
+        for _url in (
+            "/api/v1/stats/taxonomies?%s" % urlencode(query),
+            "/api/v1/stats/taxonomies"
+        ):
+            for _ in range(2):
+                response = client.get(_url)
+                assert response.status_code == 200
+        assert get_result_cache().stats()["hits"] == 0
+
+    def test_cache_stats_endpoint(self):
+        client.get("/api/v1/meta/taxonomies")
+        client.get("/api/v1/meta/taxonomies")
+        response = client.get("/meta/cache")
+        pprinter.pprint(response.json())
+        assert response.status_code == 200
+        stats = response.json()
+        assert stats["enabled"] is True
+        assert stats["entries"] == 1
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["hit_ratio"] == 0.5
@@ -1,10 +1,12 @@
 from fastapi.testclient import TestClient
 
 import pprint
+import msgpack
 from parameterized import parameterized
 from urllib.parse import urlencode
 
 from tag2domain_api.app.main import app
+from tag2domain_api.app.util.config import config
 
 from .db_test_classes import APIReadOnlyTest, APIWithAdditionalDBDataTest
 
@@ -628,3 +630,182 @@ class DomainsByCategoriesTest(APIWithAdditionalDBDataTest):
         pprinter.pprint(response.json())
         assert response.status_code == 200
         assert response.json() == result
+
+
+class DomainsGroupedInDBTest(APIReadOnlyTest):
+    def setUp(self):
+        super(DomainsGroupedInDBTest, self).setUp()
+        config['DOMAINS_GROUP_IN_DB'] = True
+
+    def tearDown(self):
+        config['DOMAINS_GROUP_IN_DB'] = False
+        super(DomainsGroupedInDBTest, self).tearDown()
+
+    @parameterized.expand(BYTAXONOMY_CASES)
+    def test_bytaxonomy(self, query, result):
+        response = client.get(
+            "/api/v1/domains/bytaxonomy?%s" % urlencode(query)
+        )
+        pprinter.pprint(response.json())
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/json"
+        assert response.json() == result
+
+    @parameterized.expand([
+        ({"taxonomy": "tax_test1"},),
+        ({"taxonomy": "tax_test1", "at_time": "2020-07-01T12:00:00"},),
+        ({"taxonomy": "tax_test1", "filter": "registrar-id=1"},),
+        ({"taxonomy": "some_unknown_taxonomy"},),
+    ])
+    def test_bytaxonomy_matches_python_grouping(self, query):
+        config['DOMAINS_GROUP_IN_DB'] = False
+        expected = client.get(
+            "/api/v1/domains/bytaxonomy?%s" % urlencode(query)
+        ).json()
+        config['DOMAINS_GROUP_IN_DB'] = True
+        response = client.get(
+            "/api/v1/domains/bytaxonomy?%s" % urlencode(query)
+        )
+        assert response.status_code == 200
+        assert response.json() == expected
+
+    @parameterized.expand([
+        ({"taxonomy": "tax_test1"},),
+        ({"taxonomy": "tax_test1", "at_time": "2020-07-01T12:00:00"},),
+        ({"taxonomy": "some_unknown_taxonomy"},),
+    ])
+    def test_bytaxonomy_msgpack(self, query):
+        url = "/api/v1/domains/bytaxonomy?%s" % urlencode(query)
+        headers = {"Accept": "application/msgpack"}
+        config['DOMAINS_GROUP_IN_DB'] = False
+        expected = client.get(url, headers=headers)
+        config['DOMAINS_GROUP_IN_DB'] = True
+        response = client.get(url, headers=headers)
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/msgpack"
+        assert (
+            msgpack.unpackb(response.content, timestamp=3)
+            == msgpack.unpackb(expected.content, timestamp=3)
+        )
+
+    def test_limit_counts_domains(self):
+        query = {"taxonomy": "tax_test1"}
+        domains = client.get(
+            "/api/v1/domains/bytaxonomy?%s" % urlencode(query)
+        ).json()
+        assert len(domains) > 1
+        for _offset, _domain in enumerate(domains):
+            query.update({"limit": 1, "offset": _offset})
+            response = client.get(
+                "/api/v1/domains/bytaxonomy?%s" % urlencode(query)
+            )
+            assert response.status_code == 200
+            assert response.json() == [_domain]
+
+
+class DomainsByCategoriesGroupedInDBTest(DomainsByCategoriesTest):
+    def setUp(self):
+        super(DomainsByCategoriesGroupedInDBTest, self).setUp()
+        config['DOMAINS_GROUP_IN_DB'] = True
+
+    def tearDown(self):
+        config['DOMAINS_GROUP_IN_DB'] = False
+        super(DomainsByCategoriesGroupedInDBTest, self).tearDown()
+
+
+CHANGES_CASES = [
+    ("2020-01-01T00:00:00", "2020-12-31T00:00:00", {}),
+    ("2020-01-01T00:00:00", "2020-04-01T00:00:00", {}),
+    ("2020-05-01T00:00:00", "2020-08-01T00:00:00", {}),
+    # start is exclusive, end is inclusive
+    ("2020-04-25T18:21:00", "2020-07-10T14:20:00", {}),
+    ("2020-03-17T12:53:21", "2020-04-25T18:20:59", {}),
+    ("2020-03-17T12:53:20", "2020-03-17T12:53:21", {}),
+    ("2020-01-01T00:00:00", "2020-12-31T00:00:00", {"taxonomy": "tax_test1"}),
+    (
+        "2020-01-01T00:00:00",
+        "2020-12-31T00:00:00",
+        {"tag": "test_tag_1_tax_1"}
+    ),
+    ("2021-01-01T00:00:00", "2021-01-01T00:00:00", {}),
+]
+
+
+class TagChangesTest(APIReadOnlyTest):
+    def expected_changes(self, since, until, query):
+        # the changes computed from the full history of all domains
+        expected = []
+        for domain_name in ("test1.at", "test2.at"):
+            for _tag in client.get(
+                "/api/v1/bydomain/%s/history" % domain_name
+            ).json():
+                if (
+                    ("taxonomy" in query)
+                    and _tag["taxonomy_name"] != query["taxonomy"]
+                ):
+                    continue
+                if "tag" in query and _tag["tag_name"] != query["tag"]:
+                    continue
+                if (
+                    (since < _tag["start_time"] <= until)
+                    or (
+                        _tag["end_time"] is not None
+                        and since < _tag["end_time"] <= until
+                    )
+                ):
+                    expected.append((
+                        domain_name,
+                        _tag["tag_id"],
+                        _tag["value_id"],
+                        _tag["start_time"],
+                        _tag["end_time"]
+                    ))
+        return sorted(expected, key=str)
+
+    @parameterized.expand(CHANGES_CASES)
+    def test_changes(self, since, until, query):
+        response = client.get("/api/v1/domains/changes?%s" % urlencode(
+            dict(query, since=since, until=until, limit=1000)
+        ))
+        assert response.status_code == 200
+        pprinter.pprint(response.json())
+        changes = sorted([
+            (
+                _tag["domain_name"],
+                _tag["tag_id"],
+                _tag["value_id"],
+                _tag["start_time"],
+                _tag["end_time"]
+            )
+            for _tag in response.json()
+        ], key=str)
+        assert changes == self.expected_changes(
+            since + "+00:00",
+            until + "+00:00",
+            query
+        )
+
+    def test_changes_paging(self):
+        query = {
+            "since": "2020-01-01T00:00:00",
+            "until": "2020-12-31T00:00:00"
+        }
+        all_changes = client.get(
+            "/api/v1/domains/changes?%s" % urlencode(dict(query, limit=1000))
+        ).json()
+        pages = []
+        for offset in range(0, len(all_changes), 4):
+            pages.extend(client.get(
+                "/api/v1/domains/changes?%s" % urlencode(
+                    dict(query, limit=4, offset=offset)
+                )
+            ).json())
+        assert len(all_changes) > 4
+        assert pages == all_changes
+
+    def test_invalid_range(self):
+        response = client.get(
+            "/api/v1/domains/changes?since=2020-12-31T00:00:00"
+            "&until=2020-01-01T00:00:00"
+        )
+        assert response.status_code == 400
@@ -0,0 +1,260 @@
+import io
+import csv
+import copy
+import gzip
+import time
+import asyncio
+import datetime
+from urllib.parse import urlencode
+
+import msgpack
+import pyarrow as pa
+import pyarrow.ipc
+import pyarrow.parquet
+from fastapi.testclient import TestClient
+from parameterized import parameterized
+
+from tag2domain_api.app.main import app
+from tag2domain_api.app.api_v1.endpoints.export import closing_stream
+from tag2domain_api.app.util.db import (
+    configure_replicas,
+    get_replica_pool,
+    execute_db,
+    iter_db_chunks
+)
+from tag2domain_api.app.util.export import (
+    iter_export,
+    iter_snapshot,
+    DOMAINS_BY_TAXONOMY_SCHEMA
+)
+
+from tests.util import DB_CONNECTION
+from .db_test_classes import APIReadOnlyTest
+
+client = TestClient(app)
+
+REPLICA_CONFIG = copy.deepcopy(DB_CONNECTION)
+REPLICA_CONFIG["application_name"] = "tag2domain_api_export_test"
+
+
+def read_table(response, format_):
+    if format_ == "arrow":
+        return pa.ipc.open_stream(response.content).read_all()
+    else:
+        return pa.parquet.read_table(io.BytesIO(response.content))
+
+
+def to_json_rows(rows):
+    return [
+        {
+            _key: (
+                _value.isoformat() if isinstance(_value, datetime.datetime)
+                else _value
+            )
+            for _key, _value in _row.items()
+        }
+        for _row in rows
+    ]
+
+
+class ExportEndpointsTest(APIReadOnlyTest):
+    @parameterized.expand([
+        ("arrow", {"taxonomy": "tax_test1"}),
+        ("parquet", {"taxonomy": "tax_test1"}),
+        ("arrow", {"taxonomy": "tax_test1", "at_time": "2020-07-01T12:00:00"}),
+        ("arrow", {"taxonomy": "tax_test1", "filter": "registrar-id=1"}),
+        ("parquet", {"taxonomy": "some_unknown_taxonomy"}),
+    ])
+    def test_bytaxonomy(self, format_, query):
+        response = client.get(
+            "/api/v1/domains/bytaxonomy?%s" % urlencode(query)
+        )
+        expected = [
+            dict(_tag, domain_id=_domain["domain_id"],
+                 domain_name=_domain["domain_name"])
+            for _domain in response.json()
+            for _tag in _domain["tags"]
+        ]
+
+        response = client.get("/api/v1/export/bytaxonomy?%s" % urlencode(
+            dict(query, format=format_, chunk_size=2)
+        ))
+        assert response.status_code == 200
+        table = read_table(response, format_)
+        assert table.schema.equals(DOMAINS_BY_TAXONOMY_SCHEMA)
+        assert to_json_rows(table.to_pylist()) == expected
+
+    @parameterized.expand([("arrow", ), ("parquet", )])
+    def test_history(self, format_):
+        expected = client.get("/api/v1/bydomain/test1.at/history").json()
+        response = client.get(
+            "/api/v1/export/bydomain/test1.at/history?format=%s" % format_
+        )
+        assert response.status_code == 200
+        assert "test1.at" in response.headers["content-disposition"]
+        assert to_json_rows(
+            read_table(response, format_).to_pylist()
+        ) == expected
+
+    def test_chunks(self):
+        response = client.get(
+            "/api/v1/export/bytaxonomy?taxonomy=tax_test1&chunk_size=2"
+        )
+        batches = list(pa.ipc.open_stream(response.content))
+        assert len(batches) > 1
+        assert all(_batch.num_rows <= 2 for _batch in batches)
+
+    def test_invalid_format(self):
+        response = client.get(
+            "/api/v1/export/bytaxonomy?taxonomy=tax_test1&format=csv"
+        )
+        assert response.status_code == 422
+
+    @parameterized.expand([("arrow", ), ("parquet", )])
+    def test_empty(self, format_):
+        data = b"".join(iter_export([], DOMAINS_BY_TAXONOMY_SCHEMA, format_))
+        if format_ == "arrow":
+            table = pa.ipc.open_stream(data).read_all()
+        else:
+            table = pa.parquet.read_table(io.BytesIO(data))
+        assert table.num_rows == 0
+        assert table.schema.equals(DOMAINS_BY_TAXONOMY_SCHEMA)
+
+
+class ExportConnectionTest(APIReadOnlyTest):
+    def setUp(self):
+        super(ExportConnectionTest, self).setUp()
+        # the test DB stands in for a replica, so that the exports get a
+        # connection of their own
+        configure_replicas([REPLICA_CONFIG])
+
+    def tearDown(self):
+        configure_replicas()
+        super(ExportConnectionTest, self).tearDown()
+
+    def backend_exists(self, pid):
+        rows = execute_db(
+            "SELECT count(*) FROM pg_stat_activity WHERE pid = %s", (pid, )
+        )
+        return rows[0][0] > 0
+
+    def test_export_uses_dedicated_connection(self):
+        shared_pid = execute_db("SELECT pg_backend_pid()")[0][0]
+        chunks = iter_db_chunks(
+            "SELECT pg_backend_pid() FROM generate_series(1, 10)",
+            chunk_size=3
+        )
+        rows = next(chunks)
+        assert rows[0][0] != shared_pid
+        # statements on the shared connection commit while the export runs
+        execute_db("SELECT 1")
+        rows += [_row for _chunk in chunks for _row in _chunk]
+        assert len(rows) == 10
+        assert get_replica_pool().status()[0]["in_use"] == 0
+
+    def test_closing_stream_closes_connection(self):
+        chunks = iter_db_chunks(
+            "SELECT pg_backend_pid() FROM generate_series(1, 10)",
+            chunk_size=1
+        )
+
+        async def read_first_chunk():
+            stream = closing_stream(chunks)
+            try:
+                return await stream.__anext__()
+            finally:
+                await stream.aclose()
+
+        pid = asyncio.run(read_first_chunk())[0][0]
+        assert get_replica_pool().status()[0]["in_use"] == 0
+        # the backend exits shortly after the connection was closed
+        deadline = time.time() + 5
+        while self.backend_exists(pid) and time.time() < deadline:
+            time.sleep(0.05)
+        assert not self.backend_exists(pid)
+
+
+class MsgpackNegotiationTest(APIReadOnlyTest):
+    @parameterized.expand([
+        ("/api/v1/domains/bytag?tag=test_tag_1_tax_1", ),
+        ("/api/v1/bydomain/test1.at/history", ),
+        ("/api/v1/meta/taxonomies", ),
+        ("/api/v1/stats/taxonomies", ),
+    ])
+    def test_msgpack(self, url):
+        expected = client.get(url).json()
+        response = client.get(url, headers={"Accept": "application/msgpack"})
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/msgpack"
+        rows = msgpack.unpackb(response.content, timestamp=3)
+        assert to_json_rows(rows) == expected
+
+    def test_json_preferred(self):
+        response = client.get(
+            "/api/v1/meta/taxonomies",
+            headers={"Accept": "application/json, application/msgpack"}
+        )
+        assert response.headers["content-type"] == "application/json"
+
+
+class SnapshotEndpointTest(APIReadOnlyTest):
+    def snapshot(self, **query):
+        response = client.get(
+            "/api/v1/export/snapshot?%s" % urlencode(query)
+        )
+        assert response.status_code == 200
+        return response
+
+    def csv_rows(self, **query):
+        return list(csv.DictReader(io.StringIO(self.snapshot(**query).text)))
+
+    @parameterized.expand([
+        ({}, ),
+        ({"at_time": "2020-07-01T12:00:00"}, ),
+        ({"filter": "registrar-id=1"}, ),
+    ])
+    def test_csv(self, query):
+        rows = self.csv_rows(taxonomy="tax_test1", **query)
+        expected = [
+            (_domain["domain_id"], _tag["tag_name"], _tag["start_time"])
+            for _domain in client.get(
+                "/api/v1/domains/bytaxonomy?%s" % urlencode(
+                    dict(query, taxonomy="tax_test1")
+                )
+            ).json()
+            for _tag in _domain["tags"]
+        ]
+        assert len(rows) > 0
+        assert all(_row["taxonomy_name"] == "tax_test1" for _row in rows)
+        assert sorted(
+            (
+                int(_row["domain_id"]),
+                _row["tag_name"],
+                datetime.datetime.fromisoformat(
+                    _row["start_time"]
+                ).isoformat()
+            )
+            for _row in rows
+        ) == sorted(expected)
+
+    def test_all_taxonomies(self):
+        rows = self.csv_rows()
+        assert len(set(_row["taxonomy_name"] for _row in rows)) > 1
+        assert len(rows) > len(self.csv_rows(taxonomy="tax_test1"))
+
+    def test_gzip(self):
+        response = self.snapshot(compress="true")
+        assert response.headers["content-type"] == "application/gzip"
+        assert gzip.decompress(response.content) == self.snapshot().content
+
+    def test_binary(self):
+        response = self.snapshot(format="binary", taxonomy="tax_test1")
+        assert response.headers["content-type"] == "application/octet-stream"
+        assert response.content.startswith(b"PGCOPY\n\xff\r\n\x00")
+
+    def test_early_close(self):
+        snapshot = iter_snapshot(format_="csv", max_queued_chunks=1)
+        assert next(snapshot).startswith(b"domain_id,")
+        snapshot.close()
+        # the connection is usable after the COPY was cancelled
+        assert len(self.csv_rows(taxonomy="tax_test1")) > 0
@@ -142,7 +142,7 @@ class MetaEndpointsTest(APIReadOnlyTest):
                     'for_numbers': True,
                     'is_actionable': 1.0,
                     'is_automatically_classifiable': True,
-                    'is_stable': True},
+                    'is_stable': False},
                 'name': 'tax_test1',
                 'url': 'test.at/test_taxonomie_1'
             },
@@ -0,0 +1,45 @@
+from fastapi.testclient import TestClient
+
+from .db_test_classes import APIWriteTest
+
+from tag2domain_api.app.main import app
+
+client = TestClient(app)
+
+
+def get_metric(text, name):
+    for _line in text.splitlines():
+        if _line.startswith(name + " "):
+            return float(_line.split(" ")[1])
+    return None
+
+
+class MetricsEndpointTest(APIWriteTest):
+    def test_get_metrics(self):
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert get_metric(
+            response.text, "tag2domain_result_cache_hits_total"
+        ) is not None
+        assert get_metric(
+            response.text,
+            'tag2domain_ingest_stage_seconds_count{stage="commit"}'
+        ) is not None
+
+    def test_measurements_are_counted(self):
+        name = 'tag2domain_measurements_total{result="ok"}'
+        before = get_metric(client.get("/metrics").text, name)
+
+        response = client.post("/api/v1/msm2tag/", json={
+            "version": "1",
+            "tag_type": "intersection",
+            "tagged_id": 3,
+            "taxonomy": "tax_test1",
+            "producer": "test",
+            "measured_at": "2020-12-22T12:35:32",
+            "tags": [{"tag": "test_tag_3_tax_1"}]
+        })
+        assert response.status_code == 200
+
+        assert get_metric(client.get("/metrics").text, name) == before + 1
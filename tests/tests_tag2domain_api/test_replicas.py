@@ -0,0 +1,241 @@
+import copy
+from unittest import TestCase
+
+import psycopg2.extensions
+from fastapi.testclient import TestClient
+from parameterized import parameterized
+
+from tag2domain_api.app.main import app
+from tag2domain_api.app.util.db import (
+    configure_replicas,
+    get_replica_pool,
+    execute_db,
+    iter_db_chunks,
+    dedicated_db_connection
+)
+from tag2domain_api.app.util.replicas import (
+    SQL_REPLICATION_LAG,
+    ReplicaPool,
+    parse_replica_hosts,
+    replica_db_configs
+)
+
+from tests.util import DB_CONNECTION
+from .db_test_classes import APIReadOnlyTest
+
+client = TestClient(app)
+
+# the test DB is not in recovery, so it can stand in for any number of
+# replicas with a lag of 0
+REPLICA_CONFIG = copy.deepcopy(DB_CONNECTION)
+REPLICA_CONFIG["application_name"] = "tag2domain_api_replica_test"
+
+# nothing listens on port 1, connecting fails immediately
+UNREACHABLE_REPLICA_CONFIG = dict(
+    REPLICA_CONFIG,
+    host="127.0.0.1",
+    port=1,
+    connect_timeout=1
+)
+
+
+class LaggingReplicaPool(ReplicaPool):
+    lag_query = "SELECT 120::float8"
+
+
+def backend_application_name(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT current_setting('application_name')")
+    name = cursor.fetchone()[0]
+    conn.commit()
+    return name
+
+
+class ParseReplicaHostsTest(TestCase):
+    @parameterized.expand([
+        (None, []),
+        ("", []),
+        ("replica1", [("replica1", "5432")]),
+        (
+            "replica1:5433, replica2 ,",
+            [("replica1", "5433"), ("replica2", "5432")]
+        ),
+        ("[::1]:5433", [("[::1]", "5433")]),
+    ])
+    def test_parse(self, hosts, expected):
+        self.assertListEqual(parse_replica_hosts(hosts, 5432), expected)
+
+    def test_replica_db_configs(self):
+        primary = dict(host="primary", port="5432", dbname="db", user="u")
+        replicas = replica_db_configs(primary, [("replica1", "5433")])
+        self.assertEqual(len(replicas), 1)
+        self.assertEqual(replicas[0]["host"], "replica1")
+        self.assertEqual(replicas[0]["port"], "5433")
+        self.assertEqual(replicas[0]["dbname"], "db")
+        self.assertEqual(primary["host"], "primary")
+
+
+class ReplicaPoolTest(APIReadOnlyTest):
+    def tearDown(self):
+        self.pool.close()
+
+    def test_round_robin(self):
+        self.pool = ReplicaPool([REPLICA_CONFIG, REPLICA_CONFIG])
+        acquired = [self.pool.acquire() for _ in range(4)]
+        for _replica in acquired:
+            self.pool.release(_replica)
+        self.assertIs(acquired[0], acquired[2])
+        self.assertIs(acquired[1], acquired[3])
+        self.assertIsNot(acquired[0], acquired[1])
+
+    def test_least_connections(self):
+        self.pool = ReplicaPool(
+            [REPLICA_CONFIG, REPLICA_CONFIG],
+            selection="least_connections"
+        )
+        first = self.pool.acquire()
+        second = self.pool.acquire()
+        self.assertIsNot(first, second)
+        self.pool.release(second)
+        self.assertIs(self.pool.acquire(), second)
+        self.assertListEqual(
+            [_status["in_use"] for _status in self.pool.status()],
+            [1, 1]
+        )
+
+    def test_unreachable_replica(self):
+        self.pool = ReplicaPool([UNREACHABLE_REPLICA_CONFIG, REPLICA_CONFIG])
+        for _ in range(3):
+            replica = self.pool.acquire()
+            self.assertEqual(replica.db_config["port"], REPLICA_CONFIG["port"])
+            self.pool.release(replica)
+        self.assertListEqual(
+            [_status["healthy"] for _status in self.pool.status()],
+            [False, True]
+        )
+
+    def test_max_lag(self):
+        self.pool = LaggingReplicaPool([REPLICA_CONFIG], max_lag=60)
+        self.assertIsNone(self.pool.acquire())
+        self.assertEqual(self.pool.status()[0]["lag"], 120)
+
+        self.pool = LaggingReplicaPool([REPLICA_CONFIG], max_lag=0)
+        self.assertIsNotNone(self.pool.acquire())
+
+    def test_failed_replica_is_checked_again(self):
+        self.pool = ReplicaPool([REPLICA_CONFIG], check_interval=3600)
+        replica = self.pool.acquire()
+        self.pool.release(replica, failed=True)
+        self.assertIsNone(replica.conn)
+        self.assertIsNone(self.pool.acquire())
+
+        self.pool.check_interval = 0
+        replica = self.pool.acquire()
+        self.assertIsNotNone(replica)
+        self.pool.release(replica)
+
+    def test_health_check_uses_own_connection(self):
+        self.pool = ReplicaPool([REPLICA_CONFIG], check_interval=0)
+        replica = self.pool.acquire()
+        replica.conn.cursor().execute("SELECT 1")
+        # the health check does not commit the transaction in flight
+        self.pool.release(self.pool.acquire())
+        self.assertIsNot(replica.check_conn, replica.conn)
+        self.assertEqual(
+            replica.conn.get_transaction_status(),
+            psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+        )
+        replica.conn.rollback()
+        self.pool.release(replica)
+
+    def test_failed_check_keeps_connection_in_use(self):
+        self.pool = ReplicaPool([REPLICA_CONFIG], check_interval=0)
+        replica = self.pool.acquire()
+        conn = replica.conn
+
+        self.pool.lag_query = "SELECT * FROM no_table"
+        self.assertIsNone(self.pool.acquire())
+        self.assertFalse(replica.healthy)
+        self.assertFalse(conn.closed)
+
+        # the connection is closed when the last statement has ended and is
+        # replaced by the next successful health check
+        self.pool.release(replica)
+        self.assertTrue(conn.closed)
+        self.pool.lag_query = SQL_REPLICATION_LAG
+        replica = self.pool.acquire()
+        self.assertIsNotNone(replica)
+        self.assertFalse(replica.conn.closed)
+        self.pool.release(replica)
+
+    def test_failed_statement_keeps_connection_in_use(self):
+        self.pool = ReplicaPool([REPLICA_CONFIG], check_interval=3600)
+        first = self.pool.acquire()
+        second = self.pool.acquire()
+        self.assertIs(first, second)
+        conn = first.conn
+
+        self.pool.release(first, failed=True)
+        self.assertFalse(conn.closed)
+        self.assertIsNone(self.pool.acquire())
+        self.pool.release(second)
+        self.assertTrue(conn.closed)
+        self.assertIsNone(second.conn)
+
+    def test_unknown_selection(self):
+        self.pool = ReplicaPool()
+        self.assertRaises(ValueError, ReplicaPool, selection="random")
+
+
+class ReplicaRoutingTest(APIReadOnlyTest):
+    def tearDown(self):
+        configure_replicas()
+        super(ReplicaRoutingTest, self).tearDown()
+
+    def test_reads_use_replicas(self):
+        configure_replicas([REPLICA_CONFIG])
+        rows = execute_db("SELECT current_setting('application_name')")
+        self.assertEqual(rows[0][0], REPLICA_CONFIG["application_name"])
+        for _chunk in iter_db_chunks(
+            "SELECT current_setting('application_name')"
+        ):
+            self.assertEqual(
+                _chunk[0][0], REPLICA_CONFIG["application_name"]
+            )
+        with dedicated_db_connection() as conn:
+            self.assertEqual(
+                backend_application_name(conn),
+                REPLICA_CONFIG["application_name"]
+            )
+        self.assertEqual(get_replica_pool().status()[0]["in_use"], 0)
+
+    def test_fallback_to_primary(self):
+        configure_replicas([UNREACHABLE_REPLICA_CONFIG])
+        rows = execute_db("SELECT current_setting('application_name')")
+        self.assertEqual(rows[0][0], DB_CONNECTION["application_name"])
+
+    def test_failed_statement_is_repeated_on_primary(self):
+        configure_replicas([REPLICA_CONFIG])
+        replica = get_replica_pool().replicas[0]
+        get_replica_pool().acquire()
+        replica.conn.close()
+        rows = execute_db("SELECT current_setting('application_name')")
+        self.assertEqual(rows[0][0], DB_CONNECTION["application_name"])
+        self.assertFalse(replica.healthy)
+
+    @parameterized.expand([
+        ("/api/v1/domains/bytaxonomy?taxonomy=tax_test1", ),
+        ("/api/v1/bydomain/test1.at", ),
+        ("/api/v1/meta/taxonomies", ),
+        ("/api/v1/stats/taxonomies", ),
+    ])
+    def test_endpoints(self, url):
+        expected = client.get(url).json()
+        configure_replicas([REPLICA_CONFIG, REPLICA_CONFIG])
+        response = client.get(url)
+        assert response.status_code == 200
+        assert response.json() == expected
+        assert all(
+            _status["healthy"] and _status["in_use"] == 0
+            for _status in get_replica_pool().status()
+        )
@@ -0,0 +1,80 @@
+import decimal
+import datetime
+from typing import List
+from unittest import TestCase
+
+import orjson
+from pydantic import ValidationError
+
+from tag2domain_api.app.util.config import config
+from tag2domain_api.app.util.models import StatsTagsResponse, DomainsResponse
+from tag2domain_api.app.util.responses import (
+    fast_response,
+    ResponseContractError
+)
+
+DOMAIN_ROW = {
+    'domain_id': 1,
+    'domain_name': 'test1.at',
+    'tag_type': 'domain',
+    'value': None,
+    'start_time': datetime.datetime(
+        2020, 3, 17, 12, 53, 21, tzinfo=datetime.timezone.utc
+    ),
+    'measured_at': None,
+    'end_time': None
+}
+
+
+class FastResponseTest(TestCase):
+    def setUp(self):
+        self.validate_responses = config['VALIDATE_RESPONSES']
+
+    def tearDown(self):
+        config['VALIDATE_RESPONSES'] = self.validate_responses
+
+    def test_serialization(self):
+        config['VALIDATE_RESPONSES'] = False
+        response = fast_response(
+            [DOMAIN_ROW, {'tag_name': 'tag', 'count': decimal.Decimal(2)}],
+            List[DomainsResponse]
+        )
+        self.assertEqual(response.media_type, "application/json")
+        self.assertEqual(orjson.loads(response.body), [
+            dict(DOMAIN_ROW, start_time='2020-03-17T12:53:21+00:00'),
+            {'tag_name': 'tag', 'count': 2.0}
+        ])
+
+    def test_validation(self):
+        config['VALIDATE_RESPONSES'] = True
+        response = fast_response([DOMAIN_ROW], List[DomainsResponse])
+        self.assertEqual(
+            orjson.loads(response.body)[0]['start_time'],
+            '2020-03-17T12:53:21+00:00'
+        )
+        self.assertRaises(
+            ValidationError,
+            fast_response,
+            [{'tag_name': 'tag'}],
+            List[StatsTagsResponse]
+        )
+
+    def test_validation_detects_differences(self):
+        config['VALIDATE_RESPONSES'] = True
+        for _row in [
+            # column that is not part of the model
+            {'tag_name': 'tag', 'count': 1, 'tag_id': 1},
+            # value that is converted by pydantic
+            {'tag_name': 'tag', 'count': 1.0},
+            # missing optional field
+            {_k: _v for _k, _v in DOMAIN_ROW.items() if _k != 'end_time'}
+        ]:
+            model = List[
+                StatsTagsResponse if 'tag_name' in _row else DomainsResponse
+            ]
+            self.assertRaises(
+                ResponseContractError,
+                fast_response,
+                [_row],
+                model
+            )
@@ -0,0 +1,225 @@
+import asyncio
+import threading
+import time
+from unittest import TestCase
+
+import anyio
+import psycopg2
+from fastapi.testclient import TestClient
+from parameterized import parameterized
+
+from tag2domain_api.app.main import app
+from tag2domain_api.app.util.config import config
+from tag2domain_api.app.util.db import (
+    execute_db,
+    get_db,
+    get_change_watermark,
+    invalidate_result_cache
+)
+from tag2domain_api.app.util.statements import (
+    StatementContext,
+    StatementContextMiddleware,
+    StatementTimeoutError,
+    QueryCancelledError,
+    exclusive_statement,
+    parse_statement_timeouts,
+    statement_timeout_for_path,
+    get_statement_context,
+    set_statement_context,
+    reset_statement_context
+)
+
+from tests.util import DB_CONNECTION
+from .db_test_classes import APIReadOnlyTest
+
+client = TestClient(app)
+
+
+class ParseStatementTimeoutsTest(TestCase):
+    @parameterized.expand([
+        (None, ()),
+        ("", ()),
+        (
+            "/api/v1/domains=30000, /api/v1/domains/bytag=1000,",
+            (("/api/v1/domains/bytag", 1000), ("/api/v1/domains", 30000))
+        ),
+    ])
+    def test_parse(self, timeouts, expected):
+        self.assertTupleEqual(parse_statement_timeouts(timeouts), expected)
+
+    @parameterized.expand([
+        ("/api/v1/domains", ),
+        ("api/v1/domains=10", ),
+        ("/api/v1/domains=abc", ),
+    ])
+    def test_parse_invalid(self, timeouts):
+        self.assertRaises(ValueError, parse_statement_timeouts, timeouts)
+
+    @parameterized.expand([
+        ("/api/v1/domains/bytag", 1000),
+        ("/api/v1/domains/bytag/", 1000),
+        ("/api/v1/domains/bytaxonomy", 30000),
+        ("/api/v1/domainsfoo", 10),
+        ("/api/v1/stats/taxonomies", 10),
+    ])
+    def test_lookup(self, path, expected):
+        timeouts = parse_statement_timeouts(
+            "/api/v1/domains=30000,/api/v1/domains/bytag=1000"
+        )
+        self.assertEqual(
+            statement_timeout_for_path(path, timeouts, default=10),
+            expected
+        )
+
+
+class StatementContextTest(APIReadOnlyTest):
+    def setUp(self):
+        super(StatementContextTest, self).setUp()
+        self.context = None
+        self.token = None
+
+    def tearDown(self):
+        if self.token is not None:
+            reset_statement_context(self.token)
+        super(StatementContextTest, self).tearDown()
+
+    def set_context(self, statement_timeout=0):
+        self.context = StatementContext(statement_timeout)
+        self.token = set_statement_context(self.context)
+        return self.context
+
+    def test_statement_timeout(self):
+        self.set_context(100)
+        start = time.time()
+        self.assertRaises(
+            StatementTimeoutError,
+            execute_db,
+            "SELECT pg_sleep(5)"
+        )
+        self.assertLess(time.time() - start, 2)
+        # the connection is still usable and the timeout was reset
+        self.assertEqual(execute_db("SELECT 1")[0][0], 1)
+        reset_statement_context(self.token)
+        self.token = None
+        self.assertEqual(
+            execute_db("SELECT current_setting('statement_timeout')")[0][0],
+            "0"
+        )
+
+    def test_timeout_is_sent_with_statement(self):
+        self.set_context(1234)
+        self.assertEqual(
+            execute_db("SELECT current_setting('statement_timeout')")[0][0],
+            "1234ms"
+        )
+
+    def test_watermark_waits_for_running_statement(self):
+        invalidate_result_cache()
+        results = []
+        thread = threading.Thread(
+            target=lambda: results.append(get_change_watermark())
+        )
+        with exclusive_statement(get_db()):
+            thread.start()
+            thread.join(0.3)
+            # the watermark is not read while another statement runs
+            self.assertTrue(thread.is_alive())
+            self.assertListEqual(results, [])
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(len(results), 1)
+
+    def test_cancel(self):
+        context = self.set_context()
+        timer = threading.Timer(0.3, context.cancel)
+        timer.start()
+        start = time.time()
+        try:
+            self.assertRaises(
+                QueryCancelledError,
+                execute_db,
+                "SELECT pg_sleep(5)"
+            )
+        finally:
+            timer.cancel()
+        self.assertLess(time.time() - start, 2)
+
+        # all further statements of the request are cancelled
+        self.assertRaises(QueryCancelledError, execute_db, "SELECT 1")
+        reset_statement_context(self.token)
+        self.token = None
+        self.assertEqual(execute_db("SELECT 1")[0][0], 1)
+
+
+class StatementContextMiddlewareTest(APIReadOnlyTest):
+    def run_app(self, disconnect_after):
+        results = {}
+
+        async def inner_app(scope, receive, send):
+            results["timeout"] = get_statement_context().statement_timeout
+            try:
+                await anyio.to_thread.run_sync(
+                    execute_db, "SELECT pg_sleep(5)"
+                )
+            except QueryCancelledError:
+                results["cancelled"] = True
+
+        async def receive():
+            if "request_sent" not in results:
+                results["request_sent"] = True
+                return {"type": "http.request", "body": b""}
+            await asyncio.sleep(disconnect_after)
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            pass
+
+        middleware = StatementContextMiddleware(inner_app, dict(
+            STATEMENT_TIMEOUT=0,
+            STATEMENT_TIMEOUTS=parse_statement_timeouts("/slow=7000"),
+            CANCEL_ON_DISCONNECT=True
+        ))
+        scope = {"type": "http", "path": "/slow/query"}
+        start = time.time()
+        asyncio.run(middleware(scope, receive, send))
+        return results, time.time() - start
+
+    def test_cancel_on_disconnect(self):
+        results, duration = self.run_app(0.3)
+        self.assertEqual(results["timeout"], 7000)
+        self.assertTrue(results.get("cancelled", False))
+        self.assertLess(duration, 2)
+        self.assertIsNone(get_statement_context())
+
+
+class StatementTimeoutEndpointTest(APIReadOnlyTest):
+    @classmethod
+    def setUpClass(cls):
+        super(StatementTimeoutEndpointTest, cls).setUpClass()
+        cls.old_timeouts = config["STATEMENT_TIMEOUTS"]
+
+    def tearDown(self):
+        config["STATEMENT_TIMEOUTS"] = self.old_timeouts
+        super(StatementTimeoutEndpointTest, self).tearDown()
+
+    def test_timeout_response(self):
+        config["STATEMENT_TIMEOUTS"] = parse_statement_timeouts(
+            "/api/v1/meta/taxonomies=200"
+        )
+        # a second connection holds a lock on the taxonomy table, so the
+        # query of the endpoint blocks until it times out
+        conn = psycopg2.connect(**DB_CONNECTION)
+        try:
+            conn.cursor().execute(
+                "LOCK TABLE taxonomy IN ACCESS EXCLUSIVE MODE"
+            )
+            start = time.time()
+            response = client.get("/api/v1/meta/taxonomies?limit=997")
+            assert response.status_code == 503
+            assert time.time() - start < 2
+        finally:
+            conn.rollback()
+            conn.close()
+
+        response = client.get("/api/v1/meta/taxonomies?limit=997")
+        assert response.status_code == 200
@@ -3,9 +3,17 @@ from fastapi.testclient import TestClient
 import pprint
 from urllib.parse import urlencode
 
+from parameterized import parameterized
+
+from py_tag2domain.db import Psycopg2Adapter
 from tag2domain_api.app.main import app
+from tag2domain_api.app.util.config import config
 
-from .db_test_classes import APIReadOnlyTest, APIWithAdditionalDBDataTest
+from .db_test_classes import (
+    APIReadOnlyTest,
+    APIWithAdditionalDBDataTest,
+    APIWriteTest
+)
 
 pprinter = pprint.PrettyPrinter(indent=4)
 client = TestClient(app)
@@ -116,9 +124,9 @@ class StatsEndpointCategoriesTest(APIWithAdditionalDBDataTest):
         pprinter.pprint(response.json())
         assert response.status_code == 200
         assert response.json() == [
-            {'category': 'cat_2', 'count': 1},
             {'category': '', 'count': 1},
-            {'category': 'cat_1', 'count': 1}
+            {'category': 'cat_1', 'count': 1},
+            {'category': 'cat_2', 'count': 1}
         ]
 
 
@@ -282,3 +290,47 @@ class StatsEndpointValuesTest(APIReadOnlyTest):
         pprinter.pprint(response.json())
         assert response.status_code == 200
         assert response.json() == []
+
+
+class StatsEndpointOpenTagCountsTest(APIWriteTest):
+    def setUp(self):
+        super(StatsEndpointOpenTagCountsTest, self).setUp()
+        adapter = Psycopg2Adapter(
+            self.db_connection,
+            self.__class__.intxn_table_mappings
+        )
+        adapter.rebuild_open_tag_counts()
+        adapter.commit()
+
+    def tearDown(self):
+        config['STATS_OPEN_TAG_COUNTS_TAG_TYPE'] = ''
+        super(StatsEndpointOpenTagCountsTest, self).tearDown()
+
+    @parameterized.expand([
+        ("/api/v1/stats/taxonomies",),
+        ("/api/v1/stats/tags?taxonomy=tax_test1",),
+        ("/api/v1/stats/tags?taxonomy=tax_test1&category=",),
+        ("/api/v1/stats/values?taxonomy=tax_test1&tag=test_tag_1_tax_1",),
+    ])
+    def test_counts_match_base_table(self, url):
+        config['STATS_OPEN_TAG_COUNTS_TAG_TYPE'] = ''
+        expected = client.get(url).json()
+        config['STATS_OPEN_TAG_COUNTS_TAG_TYPE'] = 'intersection'
+        response = client.get(url)
+        pprinter.pprint(response.json())
+        assert response.status_code == 200
+        assert response.json() == expected
+
+    def test_counts_not_used_for_filter(self):
+        config['STATS_OPEN_TAG_COUNTS_TAG_TYPE'] = 'intersection'
+        self.db_connection.cursor().execute("DELETE FROM open_tag_counts")
+        self.db_connection.commit()
+        query = {
+            'filter': 'registrar-id=1'
+        }
+        response = client.get("/api/v1/stats/taxonomies?%s" % urlencode(query))
+        assert response.status_code == 200
+        assert response.json() == [
+            {'count': 1, 'taxonomy_name': 'tax_test1'},
+            {'count': 1, 'taxonomy_name': 'tax_test3'}
+        ]
@@ -0,0 +1,154 @@
+import datetime
+import re
+from unittest import TestCase
+
+from fastapi.testclient import TestClient
+
+from tag2domain_api.app.main import app
+from tag2domain_api.app.util.config import config
+from tag2domain_api.app.util.db import (
+    configure_slow_query_log,
+    get_slow_query_log,
+    execute_db,
+    get_db
+)
+from tag2domain_api.app.util.timing import (
+    RequestTiming,
+    SlowQueryLog,
+    set_request_timing,
+    reset_request_timing
+)
+
+from .db_test_classes import APIReadOnlyTest
+
+client = TestClient(app)
+
+RE_SERVER_TIMING = re.compile(
+    r'^db;dur=(?P<db>[0-9.]+);desc="(?P<statements>[0-9]+) statements, '
+    r'(?P<rows>[0-9]+) rows", serialize;dur=(?P<serialize>[0-9.]+), '
+    r'total;dur=(?P<total>[0-9.]+)$'
+)
+
+
+class SlowQueryLogTest(TestCase):
+    def test_disabled_log(self):
+        log = SlowQueryLog(max_entries=0, threshold=0)
+        self.assertFalse(log.record("SELECT 1", None, 10.0, 1))
+        self.assertListEqual(log.entries(), [])
+
+    def test_threshold_and_rotation(self):
+        log = SlowQueryLog(max_entries=2, threshold=100)
+        self.assertFalse(log.record("SELECT 1", None, 0.099, 1))
+        for _i in range(3):
+            self.assertTrue(log.record("SELECT %s", (_i, ), 0.1, 1))
+        self.assertListEqual(
+            [_entry["params"] for _entry in log.entries()],
+            [[2], [1]]
+        )
+        log.clear()
+        self.assertListEqual(log.entries(), [])
+
+    def test_entry(self):
+        log = SlowQueryLog(max_entries=1, threshold=0)
+        timing = RequestTiming("/api/v1/domains/bytag", "tag=a")
+        log.record(
+            "SELECT %(at_time)s, %(domains)s",
+            {
+                "at_time": datetime.datetime(2020, 3, 17, 12, 53, 21),
+                "domains": ("test1.at", "test2.at")
+            },
+            0.5,
+            None,
+            timing=timing
+        )
+        entry = log.entries()[0]
+        self.assertEqual(entry["path"], "/api/v1/domains/bytag")
+        self.assertEqual(entry["query_string"], "tag=a")
+        self.assertEqual(entry["duration_ms"], 500.0)
+        self.assertIsNone(entry["rows"])
+        self.assertEqual(entry["query"], "SELECT %(at_time)s, %(domains)s")
+        self.assertDictEqual(entry["params"], {
+            "at_time": "2020-03-17T12:53:21",
+            "domains": ["test1.at", "test2.at"]
+        })
+
+
+class RequestTimingTest(APIReadOnlyTest):
+    def tearDown(self):
+        configure_slow_query_log()
+        super(RequestTimingTest, self).tearDown()
+
+    def test_statements_are_recorded(self):
+        configure_slow_query_log(max_entries=10, threshold=0)
+        timing = RequestTiming("/test")
+        token = set_request_timing(timing)
+        try:
+            execute_db("SELECT generate_series(1, %s)", (5, ))
+            execute_db("SELECT 1")
+        finally:
+            reset_request_timing(token)
+        self.assertEqual(timing.statements, 2)
+        self.assertEqual(timing.rows, 6)
+        self.assertGreater(timing.db_time, 0)
+
+        entries = get_slow_query_log().entries()
+        self.assertEqual(len(entries), 2)
+        self.assertEqual(entries[1]["query"], "SELECT generate_series(1, %s)")
+        self.assertListEqual(entries[1]["params"], [5])
+        self.assertEqual(entries[1]["rows"], 5)
+        self.assertEqual(entries[1]["path"], "/test")
+
+    def test_failed_statement_is_logged(self):
+        configure_slow_query_log(max_entries=10, threshold=0)
+        self.assertRaises(
+            RuntimeError,
+            execute_db,
+            "SELECT * FROM no_table",
+            handle_failure=False
+        )
+        get_db().rollback()
+        entry = get_slow_query_log().entries()[-1]
+        self.assertEqual(entry["query"], "SELECT * FROM no_table")
+        self.assertIsNone(entry["rows"])
+        self.assertIsNone(entry["path"])
+
+
+class ServerTimingEndpointTest(APIReadOnlyTest):
+    @classmethod
+    def setUpClass(cls):
+        super(ServerTimingEndpointTest, cls).setUpClass()
+        cls.old_server_timing = config["SERVER_TIMING"]
+
+    def tearDown(self):
+        config["SERVER_TIMING"] = self.old_server_timing
+        configure_slow_query_log()
+        super(ServerTimingEndpointTest, self).tearDown()
+
+    def test_server_timing_header(self):
+        config["SERVER_TIMING"] = False
+        response = client.get("/api/v1/bydomain/test1.at")
+        assert response.status_code == 200
+        assert "server-timing" not in response.headers
+
+        config["SERVER_TIMING"] = True
+        response = client.get("/api/v1/bydomain/test1.at")
+        assert response.status_code == 200
+        match = RE_SERVER_TIMING.match(response.headers["server-timing"])
+        assert match is not None
+        assert int(match.group("statements")) >= 1
+        assert int(match.group("rows")) == len(response.json())
+        assert float(match.group("total")) >= float(match.group("db"))
+
+    def test_slow_queries_endpoint(self):
+        response = client.get("/meta/slow-queries")
+        assert response.status_code == 200
+        assert response.json() == []
+
+        configure_slow_query_log(max_entries=10, threshold=0)
+        client.get("/api/v1/bydomain/test1.at?limit=5")
+        response = client.get("/meta/slow-queries")
+        assert response.status_code == 200
+        entries = response.json()
+        assert len(entries) >= 1
+        assert entries[0]["path"] == "/api/v1/bydomain/test1.at"
+        assert entries[0]["query_string"] == "limit=5"